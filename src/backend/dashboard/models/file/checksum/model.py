@@ -4,7 +4,8 @@ from djangofoundry import models
 from .queryset import Manager
 
 class FileChecksum(models.Model):
-	checksum = models.CharField(max_length=64)
+	# 'algorithm:hexdigest', see scripts.lib.checksum
+	checksum = models.CharField(max_length=160)
 	created = models.InsertedNowField()
 	updated = models.UpdatedNowField()
 
@@ -1,11 +1,11 @@
 import errno
-import hashlib
 import os
 import sys
 import shutil
 import subprocess
 import logging
 from typing import Optional
+from scripts.lib.checksum import get_checksum_service
 
 logger = logging.getLogger(__name__)
 
@@ -176,27 +176,21 @@ class SDCards:
 			file_path (str): The path to the file to calculate the checksum of.
 
 		Returns:
-			str: The checksum of the given file.
+			str: The checksum of the given file, labelled with its algorithm.
 
 		Raises:
 			FileNotFoundError: If the file does not exist.
 
 		Examples:
 			>>> calculate_checksum('/home/pi/test.txt')
-			'098f6bcd4621d373cade4e832627b4f6'
+			'sha256:9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08'
 		"""
 		if not os.path.isfile(file_path) or not os.access(file_path, os.R_OK):
 			logger.error('File not accessible: %s', file_path)
 			raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), file_path)
 
 		# We use sha256 because rsync uses MD5, and we want to do both
-		hasher = hashlib.sha256()
-
-		with open(file_path, 'rb') as afile:
-			buf = afile.read()
-			hasher.update(buf)
-
-		return hasher.hexdigest()
+		return get_checksum_service().checksum(file_path, 'sha256')
 
 	def check_sd_path(self, sd_card_path : Optional[str] = None) -> bool:
 		"""
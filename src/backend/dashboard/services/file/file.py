@@ -1,5 +1,5 @@
 import os
-import hashlib
+from scripts.lib.checksum import get_checksum_service, digests_match
 from dashboard.models.file import FileInfo
 
 class FileService:
@@ -11,23 +11,22 @@ class FileService:
 				self.update_file_info(file_path, checksum)
 
 	def calculate_checksum(self, file_path):
-		hasher = hashlib.sha256()
-		with open(file_path, 'rb') as afile:
-			buf = afile.read()
-			hasher.update(buf)
-		return hasher.hexdigest()
+		# Labelled with the algorithm, i.e. 'sha256:9f86d0...'. Streamed, so large videos aren't read into memory.
+		# Always read the file: corruption doesn't change its stat, so a cached digest would hide it.
+		return get_checksum_service().checksum(file_path, 'sha256', use_cache=False)
 
 	def update_file_info(self, file_path, checksum):
 		file, created = FileInfo.objects.get_or_create(path=file_path, defaults={'checksum': checksum})
-		if not created and file.checksum != checksum:
+		if not created and not digests_match(file.checksum, checksum):
 			file.checksum = checksum
 			file.save()
 
 	def checksum_changed(self, file):
-		return file.checksum != self.calculate_checksum(file.path)
+		# Checksums stored before they were labelled are bare sha256 digests, which digests_match understands
+		return not digests_match(file.checksum, self.calculate_checksum(file.path))
 
 	def compare_checksums(self, file1, file2):
-		return file1.checksum == file2.checksum
+		return digests_match(file1.checksum, file2.checksum)
 
 	def calculate_analytics(self):
 		total_files = FileInfo.objects.count()
@@ -0,0 +1,140 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    exif.py                                                                                              *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import argparse
+import itertools
+import logging
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Callable
+import exifread
+
+from scripts import setup_logging
+from scripts.import_sd.exif_reader import read_tags
+from scripts.import_sd.photo import KNOWN_TAGS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTENSIONS = ['arw', 'nef', 'dng', 'jpg']
+
+USAGE_NOTES = """
+Run against a directory of sample RAW and JPG files, ideally on an SD card, i.e.:
+    python -m scripts.benchmarks.exif /media/pi/SD_CARD/DCIM /mnt/p/samples --limit 50
+
+Bytes are what the process read (rchar in /proc/self/io), so they are only reported on linux. Drop the page cache
+between runs (as root) to measure cold reads: sync; echo 3 > /proc/sys/vm/drop_caches
+"""
+
+def full_parse(path : Path) -> dict:
+    with open(path, 'rb') as f:
+        return exifread.process_file(f)
+
+def parse_without_details(path : Path) -> dict:
+    # What Photo did before read_tags
+    with open(path, 'rb') as f:
+        return exifread.process_file(f, details=False)
+
+def header_only(path : Path) -> dict:
+    return read_tags(str(path), KNOWN_TAGS)
+
+READERS : dict[str, Callable[[Path], dict]] = {
+    'full': full_parse,
+    'no details': parse_without_details,
+    'header': header_only,
+}
+
+def bytes_read() -> int | None:
+    try:
+        with open('/proc/self/io', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def collect_files(paths : list[Path], extensions : list[str], limit : int) -> dict[str, list[Path]]:
+    """
+    Returns extension -> up to limit files with that extension.
+    """
+    files : dict[str, list[Path]] = defaultdict(list)
+    for path, extension in itertools.product(paths, extensions):
+        candidates = [path] if path.is_file() else path.rglob('*')
+        for candidate in candidates:
+            if len(files[extension]) >= limit:
+                break
+            if candidate.suffix.lower() == f'.{extension}' and candidate.is_file():
+                files[extension].append(candidate)
+    return files
+
+def time_reader(files : list[Path], reader : Callable[[Path], dict], repeat : int) -> tuple[float, int | None, int]:
+    """
+    Returns the best wall clock time of several runs over all files, the bytes read by one run, and the tags found.
+    """
+    best = float('inf')
+    read = None
+    found = 0
+    for _ in range(repeat):
+        before = bytes_read()
+        start = time.perf_counter()
+        found = sum(len(KNOWN_TAGS & reader(file).keys()) for file in files)
+        best = min(best, time.perf_counter() - start)
+        after = bytes_read()
+        if before is not None and after is not None:
+            read = after - before
+    return best, read, found
+
+def main() -> int:
+    logger = setup_logging()
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark reading the EXIF tags Photo needs, with and without a full parse.',
+        epilog=USAGE_NOTES,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('paths', nargs='+', type=Path, help='Files or directories of sample photos')
+    parser.add_argument('-e', '--extensions', nargs='+', default=DEFAULT_EXTENSIONS, help='File types to compare')
+    parser.add_argument('-l', '--limit', type=int, default=20, help='Maximum number of files of each type')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of runs per reader. The fastest is reported.')
+    args = parser.parse_args()
+
+    files = collect_files(args.paths, [extension.lower() for extension in args.extensions], args.limit)
+    print(f"{'type':<5} {'reader':<11} {'files':>5} {'ms/file':>8} {'KB/file':>8} {'tags':>5}")
+    for extension in args.extensions:
+        samples = files.get(extension.lower())
+        if not samples:
+            logger.warning('No .%s files found', extension)
+            continue
+
+        for name, reader in READERS.items():
+            seconds, read, found = time_reader(samples, reader, args.repeat)
+            kb = f'{read / len(samples) / 1024:.1f}' if read is not None else '-'
+            print(f"{extension:<5} {name:<11} {len(samples):>5} {seconds / len(samples) * 1000:>8.2f} {kb:>8} {found:>5}")
+
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,154 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    hashing.py                                                                                           *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import argparse
+import itertools
+import logging
+import time
+from pathlib import Path
+
+from scripts import setup_logging
+from scripts.lib.hashing import HashingEngine, HashStrategy, TREE_CHUNK_SIZE
+from scripts.lib.mounts import find_mount
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZES = [64 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024]
+DEFAULT_ALGORITHMS = ['xxhash', 'xxh3_128', 'sha256']
+
+USAGE_NOTES = """
+Run once against a local directory and once against a network mount, i.e.:
+    python -m scripts.benchmarks.hashing /mnt/p/Photos/2024/2024-12 /mnt/nas/Photos/2024/2024-12 --limit 20
+
+The first pass over each file warms the page cache, so only the fastest of --repeat runs is reported. To measure cold
+reads on linux, drop the cache between runs (as root): sync; echo 3 > /proc/sys/vm/drop_caches
+"""
+
+def collect_files(paths : list[Path], limit : int) -> list[Path]:
+    files = []
+    for path in paths:
+        if path.is_file():
+            files.append(path)
+            continue
+        files.extend(itertools.islice((f for f in path.rglob('*') if f.is_file()), limit))
+    return files
+
+def time_run(files : list[Path], engine : HashingEngine, algorithm : str, repeat : int, concurrent : bool) -> float:
+    """
+    Returns the best wall clock time of several runs over all files.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if concurrent:
+            engine.hash_many(files, algorithm)
+        else:
+            for file in files:
+                engine.hash_file(file, algorithm)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def time_bundle(files : list[Path], engine : HashingEngine, algorithms : list[str], repeat : int, combined : bool) -> float:
+    """
+    Returns the best wall clock time to get every digest of every file, in one read per file or one read per digest.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for file in files:
+            if combined:
+                engine.hash_file_multi(file, algorithms)
+            else:
+                for algorithm in algorithms:
+                    engine.hash_file(file, algorithm)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def time_tree(files : list[Path], engine : HashingEngine, chunk_size : int, repeat : int, max_workers : int) -> float:
+    """
+    Returns the best wall clock time to tree hash every file, one file at a time, with max_workers chunks at once.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for file in files:
+            engine.hash_tree(file, chunk_size, max_workers=max_workers)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main() -> int:
+    logger = setup_logging()
+
+    parser = argparse.ArgumentParser(
+        description='Benchmark file hashing strategies and chunk sizes.',
+        epilog=USAGE_NOTES,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('paths', nargs='+', type=Path, help='Files or directories to hash. Pass a local and a network path to compare them.')
+    parser.add_argument('-l', '--limit', type=int, default=20, help='Maximum number of files to read from each directory')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Number of runs per combination. The fastest is reported.')
+    parser.add_argument('-a', '--algorithms', nargs='+', default=DEFAULT_ALGORITHMS, help='Hashing algorithms to compare')
+    parser.add_argument('-c', '--chunk-sizes', nargs='+', type=int, default=DEFAULT_CHUNK_SIZES, help='Chunk sizes to compare, in bytes')
+    parser.add_argument('--max-workers', type=int, default=4, help='Number of threads for the hash_many and tree comparisons')
+    parser.add_argument('--tree-chunk-size', type=int, default=TREE_CHUNK_SIZE, help='Chunk size for the tree hash comparison, in bytes')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        files = collect_files([path], args.limit)
+        if not files:
+            logger.warning('No files found in %s', path)
+            continue
+
+        total_mb = sum(f.stat().st_size for f in files) / (1024 * 1024)
+        mount = find_mount(path)
+        print(f"\n{path} ({mount.fstype if mount else 'unknown fs'}): {len(files)} files, {total_mb:.1f} MB")
+        print(f"{'algorithm':<10} {'strategy':<9} {'chunk':>8} {'threads':>7} {'seconds':>8} {'MB/s':>8}")
+
+        for algorithm, strategy, chunk_size in itertools.product(args.algorithms, (HashStrategy.MMAP, HashStrategy.READINTO), args.chunk_sizes):
+            engine = HashingEngine(chunk_size=chunk_size, strategy=strategy, max_workers=args.max_workers)
+            for concurrent in (False, True):
+                seconds = time_run(files, engine, algorithm, args.repeat, concurrent)
+                threads = args.max_workers if concurrent else 1
+                print(f"{algorithm:<10} {strategy.value:<9} {chunk_size // 1024:>7}K {threads:>7} {seconds:>8.3f} {total_mb / seconds:>8.1f}")
+
+        if len(args.algorithms) > 1:
+            engine = HashingEngine(max_workers=args.max_workers)
+            print(f"\nAll of {', '.join(args.algorithms)}:")
+            for combined in (False, True):
+                seconds = time_bundle(files, engine, args.algorithms, args.repeat, combined)
+                label = 'one read' if combined else 'read each'
+                print(f"{label:<10} {seconds:>8.3f} seconds {total_mb / seconds:>8.1f} MB/s")
+
+        # Best on a few large files (i.e. videos), where hash_many has little to run in parallel
+        engine = HashingEngine()
+        print(f"\nxxh3_tree, {args.tree_chunk_size // (1024 * 1024)}MB chunks, one file at a time:")
+        for workers in sorted({1, args.max_workers}):
+            seconds = time_tree(files, engine, args.tree_chunk_size, args.repeat, workers)
+            print(f"{workers:>2} threads {seconds:>8.3f} seconds {total_mb / seconds:>8.1f} MB/s")
+
+    return 0
+
+if __name__ == '__main__':
+    exit(main())
@@ -0,0 +1,40 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    conftest.py                                                                                          *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import pytest
+
+from scripts.lib import checksum, hash_cache, throughput
+
+@pytest.fixture(autouse=True, scope='session')
+def cache_paths(tmp_path_factory):
+    """
+    Keep the persistent hash cache and throughput history the tests create out of the user's real ~/.cache.
+    """
+    directory = tmp_path_factory.mktemp('imageinn')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(hash_cache, 'DEFAULT_HASH_CACHE_PATH', directory / 'hash_cache.db')
+        monkeypatch.setattr(throughput, 'DEFAULT_THROUGHPUT_PATH', directory / 'throughput.json')
+        monkeypatch.setattr(checksum, '_service', None)
+        yield directory
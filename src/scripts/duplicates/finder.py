@@ -0,0 +1,368 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    finder.py                                                                                            *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Iterable, Optional, TextIO
+from alive_progress import alive_bar
+from pydantic import BaseModel, PrivateAttr
+from dotenv import load_dotenv
+
+from scripts import setup_logging
+from scripts.exceptions import ShouldTerminateError
+from scripts.lib.file_manager import FileManager, StrPattern
+from scripts.lib.hashing import PARTIAL_CHUNK_SIZE
+from scripts.lib.types import RESET, BLUE, PURPLE, CYAN
+
+logger = logging.getLogger(__name__)
+
+class DuplicateGroup(BaseModel):
+    """
+    A set of files with identical contents.
+
+    The first file is the one to keep. It comes from the earliest directory passed to find_duplicates().
+    """
+    size : int
+    digest : str
+    files : list[Path]
+
+    @property
+    def keeper(self) -> Path:
+        return self.files[0]
+
+    @property
+    def extras(self) -> list[Path]:
+        return self.files[1:]
+
+    @property
+    def wasted_bytes(self) -> int:
+        return self.size * len(self.extras)
+
+class DuplicateFinder(FileManager):
+    """
+    Find duplicate files across one or more directory trees, reading as little as possible.
+
+    Files are compared in tiers, and each tier only considers the survivors of the last one:
+        1. Size: files with a unique size cannot have a duplicate, and are dropped without being read.
+        2. Partial hash: the first and last 1MB of each remaining file.
+        3. Full hash: only files whose partial hashes collide.
+
+    Digests are stored in the hash cache, so running it again over the same drives reads almost nothing.
+    """
+    hashing_algorithm : str = 'xxhash'
+    min_size : int = 1
+
+    _directory_order : dict[Path, int] = PrivateAttr(default_factory=dict)
+    _trash_managers : dict[Path, FileManager] = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def get_default_filename_pattern(cls) -> StrPattern:
+        # A temporary hack to inject a class attribute into a pydantic model.
+        return r'.*[.](jpe?g|webp|png|heic|dng|arw|nef|psd|tiff?|xmp|mp4|mov|avi|mkv|3gp)'
+
+    @classmethod
+    def get_default_extensions(cls) -> list[str]:
+        # A temporary hack to inject a class attribute into a pydantic model.
+        return ['jpg', 'jpeg', 'webp', 'png', 'heic', 'dng', 'arw', 'nef', 'psd', 'tif', 'tiff', 'xmp', 'mp4', 'avi', 'mov', 'mkv', '3gp']
+
+    @property
+    def files_scanned(self) -> int:
+        return self.get_stat('files_scanned')
+
+    @property
+    def duplicate_groups(self) -> int:
+        return self.get_stat('duplicate_groups')
+
+    @property
+    def duplicate_files(self) -> int:
+        return self.get_stat('duplicate_files')
+
+    def find_duplicates(self, directories : Iterable[Path]) -> list[DuplicateGroup]:
+        """
+        Find groups of duplicate files.
+
+        Hard links (and directories that overlap) are only counted once, since they do not take up any extra space.
+
+        Args:
+            directories: The directories to search. Files in earlier directories are preferred as the one to keep.
+
+        Returns:
+            The duplicate groups, largest wasted space first.
+        """
+        self._directory_order = {Path(directory).absolute(): i for i, directory in enumerate(directories)}
+
+        with alive_bar(title='Finding duplicates', unit='files', dual_line=True, unknown='waves') as self._progress_bar:
+            by_size = self._bucket_by_size()
+            candidates = [files for files in by_size.values() if len(files) > 1]
+            logger.info('%d files share a size with another file, in %d groups.', sum(len(files) for files in candidates), len(candidates))
+
+            # Small files would be hashed in full by the partial hash anyway, so skip straight to the full hash
+            small = [files for files in candidates if self.file_size(files[0]) <= 2 * PARTIAL_CHUNK_SIZE]
+            large = [files for files in candidates if self.file_size(files[0]) > 2 * PARTIAL_CHUNK_SIZE]
+
+            self.progress_message('Comparing partial hashes...')
+            survivors = self._split_by_hash(large, partial=True) + small
+
+            self.progress_message('Comparing full hashes...')
+            duplicates = self._split_by_hash(survivors, partial=False)
+
+        groups = []
+        for files in duplicates:
+            files = sorted(files, key=self._keep_priority)
+            digest = self.hash_file(files[0], hashing_algorithm=self.hashing_algorithm)
+            groups.append(DuplicateGroup(size=self.file_size(files[0]), digest=digest, files=files))
+
+        groups.sort(key=lambda group: group.wasted_bytes, reverse=True)
+
+        self.record_stat('duplicate_groups', len(groups))
+        self.record_stat('duplicate_files', sum(len(group.extras) for group in groups))
+        return groups
+
+    def _bucket_by_size(self) -> dict[int, list[Path]]:
+        by_size : dict[int, list[Path]] = defaultdict(list)
+        seen : set[tuple[int, int]] = set()
+
+        for directory in self._directory_order:
+            self.progress_message(f'Scanning {directory}...')
+            for filepath in self.yield_files(directory):
+                try:
+                    stat = filepath.stat()
+                except FileNotFoundError:
+                    continue
+
+                if (stat.st_dev, stat.st_ino) in seen:
+                    continue
+                seen.add((stat.st_dev, stat.st_ino))
+
+                if stat.st_size < self.min_size:
+                    continue
+
+                by_size[stat.st_size].append(filepath.absolute())
+                self.record_stat('files_scanned')
+                self._progress_bar()
+
+        return by_size
+
+    def _split_by_hash(self, candidates : list[list[Path]], partial : bool) -> list[list[Path]]:
+        """
+        Split each group of candidates by their hash, and drop any file that no longer has a match.
+        """
+        hashes = self.hash_files((f for files in candidates for f in files), partial=partial, hashing_algorithm=self.hashing_algorithm)
+
+        survivors = []
+        for files in candidates:
+            by_hash : dict[str, list[Path]] = defaultdict(list)
+            for filepath in files:
+                if (digest := hashes.get(filepath)):
+                    by_hash[digest].append(filepath)
+            survivors.extend(matches for matches in by_hash.values() if len(matches) > 1)
+
+        return survivors
+
+    def _keep_priority(self, filepath : Path) -> tuple[int, int, str]:
+        # Prefer the earliest directory given, then the shallowest path, then alphabetical order.
+        order = min((i for directory, i in self._directory_order.items() if directory in filepath.parents), default=len(self._directory_order))
+        return order, len(filepath.parts), str(filepath)
+
+    def trash_duplicates(self, groups : list[DuplicateGroup]) -> int:
+        """
+        Move every file except the keeper in each group to the trash.
+
+        Each file is checked against the hash recorded for its group immediately beforehand, so a file that changed
+        since find_duplicates() ran is left alone.
+
+        Args:
+            groups: The duplicate groups to clean up.
+
+        Returns:
+            The number of files moved to the trash.
+        """
+        trashed = 0
+        for group in groups:
+            for filepath in group.extras:
+                try:
+                    if self.hash_file(filepath, hashing_algorithm=self.hashing_algorithm) != group.digest:
+                        logger.warning('File changed since it was found to be a duplicate. Skipping: %s', filepath)
+                        self.record_skip_file()
+                        continue
+
+                    if self._trash_for(filepath).delete_file(filepath, dont_record=True):
+                        self.record_delete_file()
+                        trashed += 1
+                except OSError as ose:
+                    logger.error('Unable to move %s to the trash -> %s', filepath, ose)
+                    self.record_error()
+
+        return trashed
+
+    def _trash_for(self, filepath : Path) -> FileManager:
+        """
+        Files are renamed into the trash, so each drive gets its own trash directory.
+        """
+        if self.trash_directory and self._same_device(self.trash_directory, filepath):
+            return self
+
+        drive_root = self.guess_drive_root(filepath)
+        if drive_root not in self._trash_managers:
+            self._trash_managers[drive_root] = FileManager(directory=drive_root, dry_run=self.dry_run, use_hash_cache=False)
+        return self._trash_managers[drive_root]
+
+    @staticmethod
+    def _same_device(first : Path, second : Path) -> bool:
+        # The trash directory may not have been created yet, so compare its closest existing parent
+        first = next((path for path in (first, *first.absolute().parents) if path.exists()), first)
+        try:
+            return first.stat().st_dev == second.stat().st_dev
+        except OSError:
+            return False
+
+    def write_json(self, groups : list[DuplicateGroup], output : TextIO) -> None:
+        data = [
+            {
+                'size': group.size,
+                'digest': f'{self.hashing_algorithm}:{group.digest}',
+                'keep': str(group.keeper),
+                'duplicates': [str(f) for f in group.extras],
+            }
+            for group in groups
+        ]
+        json.dump(data, output, indent=2)
+        output.write('\n')
+
+    def write_csv(self, groups : list[DuplicateGroup], output : TextIO) -> None:
+        writer = csv.writer(output)
+        writer.writerow(['group', 'digest', 'size', 'path', 'keep'])
+        for i, group in enumerate(groups):
+            for filepath in group.files:
+                writer.writerow([i, f'{self.hashing_algorithm}:{group.digest}', group.size, str(filepath), filepath == group.keeper])
+
+    def report(self, message_prefix : str | None = None) -> str:
+        if message_prefix is None:
+            message_prefix = self._progress_message
+
+        buffer = []
+        if message_prefix:
+            buffer.append(f'{BLUE}{message_prefix[-30:]:31s}{RESET}')
+
+        buffer.append(f'{PURPLE}Files [{self.files_scanned} scanned, {self.duplicate_files} duplicates in {self.duplicate_groups} groups]{RESET}')
+        if self.files_deleted > 0:
+            buffer.append(f'{CYAN}Trashed [{self.files_deleted}]{RESET}')
+        if self.errors > 0:
+            buffer.append(f'Errors [{self.errors}]')
+
+        return ' '.join(buffer)
+
+class ArgsNamespace(argparse.Namespace):
+    directories : list[str]
+    output : Optional[str]
+    format : Optional[str]
+    trash : bool
+    trash_directory : Optional[str]
+    min_size : int
+    algorithm : str
+    glob_pattern : Optional[str]
+    max_threads : int
+    no_hash_cache : bool
+    dry_run : bool
+    verbose : bool
+
+def main() -> int:
+    logger = setup_logging()
+
+    load_dotenv()
+
+    DEFAULT_TRASH = os.getenv('IMAGEINN_ORGANIZE_TRASH', None)
+
+    parser = argparse.ArgumentParser(description='Find duplicate files across one or more directories.')
+    parser.add_argument('directories', nargs='+', help='Directories to search. Files in earlier directories are kept in preference to later ones.')
+    parser.add_argument('-o', '--output', default=None, help='File to write the duplicate groups to (default: stdout)')
+    parser.add_argument('-f', '--format', default=None, choices=['json', 'csv'], help='Output format. Defaults to the extension of --output, or json.')
+    parser.add_argument('--trash', action='store_true', help='Move every duplicate except the one to keep to the trash')
+    parser.add_argument('--trash-directory', default=DEFAULT_TRASH, help='Directory to move duplicates to. Defaults to env variable IMAGEINN_ORGANIZE_TRASH, or .trash/ on each drive')
+    parser.add_argument('--min-size', type=int, default=1, help='Ignore files smaller than this many bytes')
+    parser.add_argument('-a', '--algorithm', default='xxhash', help='Hashing algorithm to use')
+    parser.add_argument('-g', '--glob-pattern', default=None, help='Glob pattern to use when searching for files.')
+    parser.add_argument('--max-threads', type=int, default=0, help='Maximum number of threads to hash with')
+    parser.add_argument('--no-hash-cache', action='store_true', help='Do not read or write the persistent hash cache')
+    parser.add_argument('--dry-run', action='store_true', help='Report what would be moved to the trash without moving anything')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Increase verbosity')
+    args = parser.parse_args(namespace=ArgsNamespace())
+
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+
+    finder = DuplicateFinder(
+        directory       = args.directories[0],
+        glob_pattern    = args.glob_pattern,
+        trash_directory = args.trash_directory,
+        min_size        = args.min_size,
+        hashing_algorithm = args.algorithm,
+        max_threads     = args.max_threads,
+        use_hash_cache  = not args.no_hash_cache,
+        dry_run         = args.dry_run,
+    )
+
+    output_format = args.format or ('csv' if args.output and args.output.lower().endswith('.csv') else 'json')
+
+    try:
+        groups = finder.find_duplicates([Path(directory) for directory in args.directories])
+
+        output = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+        try:
+            if output_format == 'csv':
+                finder.write_csv(groups, output)
+            else:
+                finder.write_json(groups, output)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        wasted = sum(group.wasted_bytes for group in groups)
+        logger.info('Found %d duplicate files in %d groups, using %.1f MB.', finder.duplicate_files, len(groups), wasted / (1024 * 1024))
+
+        if args.trash:
+            trashed = finder.trash_duplicates(groups)
+            logger.info('Moved %d duplicate files to the trash.', trashed)
+    except ShouldTerminateError as e:
+        logger.critical("Critical error: %s", e)
+        logger.info('Before error: %s', finder.report())
+        return 1
+    except KeyboardInterrupt:
+        logger.warning("Operation interrupted by user")
+        logger.info('Before termination: %s', finder.report())
+        return 1
+
+    logger.info(finder.report('Finished'))
+    return 0
+
+if __name__ == "__main__":
+    exit_code = main()
+    sys.exit(exit_code)
@@ -0,0 +1,158 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    exif_reader.py                                                                                       *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import logging
+import os
+from typing import Any, BinaryIO, Iterable
+import exifread
+import exifread.classes
+import exifread.exceptions
+from exifread.tags import DEFAULT_STOP_TAG, EXIF_TAGS
+from exifread.utils import ord_
+
+logger = logging.getLogger(__name__)
+
+# Camera files keep IFD0 and the EXIF sub-IFD near the start. This much is read in one request, and parsed in memory.
+HEADER_WINDOW = 64 * 1024
+# Without these, a photo can't be named, so the full parse is tried before giving up on them
+REQUIRED_TAGS = frozenset({'Image Model', 'EXIF DateTimeOriginal'})
+# IFD0 must be read up to this tag, to find the EXIF sub-IFD
+EXIF_POINTER = 'ExifOffset'
+# Tag name -> tag id, to find the last tag we need in each IFD
+TAG_IDS = {entry[0]: tag_id for tag_id, entry in EXIF_TAGS.items()}
+
+class HeaderWindow:
+	"""
+	A read-only file that serves its first window of bytes from memory.
+
+	exifread seeks back and forth between many small values. On an SD card, each of those is a separate slow request.
+	Reading one window up front turns them into a single request. Anything outside the window is read from the file.
+
+	Attributes:
+		bytes_read: The number of bytes read from the underlying file.
+	"""
+	bytes_read : int
+
+	def __init__(self, file : BinaryIO, window : int = HEADER_WINDOW):
+		self._file = file
+		self._file.seek(0)
+		self._window = file.read(window)
+		self._complete = len(self._window) < window
+		self._position = 0
+		self.bytes_read = len(self._window)
+
+	def seek(self, offset : int, whence : int = os.SEEK_SET) -> int:
+		if whence == os.SEEK_CUR:
+			offset += self._position
+		elif whence == os.SEEK_END:
+			offset += self._size()
+		self._position = max(0, offset)
+		return self._position
+
+	def tell(self) -> int:
+		return self._position
+
+	def read(self, size : int = -1) -> bytes:
+		start = self._position
+		end = self._size() if size is None or size < 0 else start + size
+		if end <= len(self._window) or self._complete:
+			data = self._window[start:end]
+		else:
+			self._file.seek(start)
+			data = self._file.read(end - start)
+			self.bytes_read += len(data)
+		self._position = start + len(data)
+		return data
+
+	def _size(self) -> int:
+		if self._complete:
+			return len(self._window)
+		return os.fstat(self._file.fileno()).st_size
+
+def last_tag(group : str, wanted : Iterable[str], *always : str) -> str:
+	"""
+	The name of the last tag (by id) in an IFD that we need, so dump_ifd can stop there.
+
+	Tags in an IFD are sorted by id, so nothing after it can be one we want.
+	"""
+	names = {tag.split(' ', 1)[1] for tag in wanted if tag.startswith(f'{group} ')} | set(always)
+	ids = [TAG_IDS[name] for name in names if name in TAG_IDS]
+	return EXIF_TAGS[max(ids)][0] if ids else DEFAULT_STOP_TAG
+
+def read_tags(path : str, wanted : Iterable[str], window : int = HEADER_WINDOW) -> dict[str, Any]:
+	"""
+	Read EXIF tags from a photo, reading as little of the file as possible.
+
+	Only IFD0 and its EXIF sub-IFD are parsed, each up to the last tag we want, from a header window read in one go.
+	Thumbnails, MakerNotes and the other IFDs (which in a RAW file describe the image data) are skipped.
+
+	If that fails, or required tags (camera, date) are missing, exifread's full parse is used instead.
+
+	Args:
+		path: The photo.
+		wanted: The tags to read, i.e. 'EXIF ISOSpeedRatings'. Others may be returned too.
+		window: The number of bytes to read up front.
+
+	Returns:
+		tag name -> exifread tag.
+
+	Raises:
+		FileNotFoundError: If the file does not exist.
+	"""
+	wanted = frozenset(str(getattr(tag, 'value', tag)) for tag in wanted)
+	with open(path, 'rb') as image_file:
+		try:
+			tags = read_header(HeaderWindow(image_file, window), wanted)
+		except (exifread.exceptions.ExifNotFound, exifread.exceptions.InvalidExif):
+			# Not a format with EXIF (that exifread knows). A full parse won't find any either.
+			return {}
+		except Exception as e:
+			logger.debug('Unable to read the EXIF header of %s, reading the whole file -> %s', path, e)
+			tags = {}
+
+		if (missing := (wanted & REQUIRED_TAGS) - tags.keys()):
+			logger.debug('%s not found in the EXIF header of %s, reading the whole file', ', '.join(sorted(missing)), path)
+			image_file.seek(0)
+			tags = exifread.process_file(image_file, details=False)
+
+	return tags
+
+def read_header(file : HeaderWindow | BinaryIO, wanted : frozenset[str]) -> dict[str, Any]:
+	"""
+	Parse IFD0 and the EXIF sub-IFD, stopping in each after the last tag we want.
+
+	Raises:
+		ExifNotFound: If the file format is not recognized.
+		InvalidExif: If the file has no valid EXIF data.
+	"""
+	# exifread doesn't expose format detection, so this uses its (private) helper
+	offset, endian, fake_exif = exifread._determine_type(file)
+	header = exifread.classes.ExifHeader(file, chr(ord_(endian[0])), offset, fake_exif, strict=False, detailed=False)
+
+	header.dump_ifd(header.s2n(4, 4), 'Image', stop_tag=last_tag('Image', wanted, EXIF_POINTER))
+	if (exif_offset := header.tags.get(f'Image {EXIF_POINTER}')):
+		header.dump_ifd(exif_offset.values[0], 'EXIF', stop_tag=last_tag('EXIF', wanted))
+
+	return header.tags
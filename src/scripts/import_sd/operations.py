@@ -31,3 +31,5 @@ class CopyOperation(str, Enum):
 	"""
 	RSYNC = 'rsync'
 	TERACOPY = 'teracopy'
+	# Read each file once, and write it to all of its destinations at the same time
+	TEE = 'tee'
@@ -24,36 +24,130 @@ import math
 import os
 import re
 import logging
+from dataclasses import dataclass, field
 from decimal import Decimal
-from typing import Dict, Optional
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional
 import exifread
 import exifread.utils
 import exifread.tags.exif
 import exifread.classes
 from scripts.import_sd.exif import ExifTag
+from scripts.import_sd.exif_reader import read_tags
 from scripts.import_sd.validator import Validator
 from scripts.lib.path import FilePath, Path
 
 logger = logging.getLogger(__name__)
 
+# The tags a Photo can be asked for. Everything else exifread finds is dropped after parsing.
+KNOWN_TAGS = frozenset(tag.value for tag in ExifTag)
+
+TagValue = str | Decimal | int | None
+
+def convert_tag(value: Any) -> TagValue:
+	"""
+	Convert a tag from exifread to a python value.
+
+	Converts from ASCII and Signed Ratio to string and Decimal, to
+	address problems such as "AssertionError: (0x0110) ASCII=ILCE-7RM4 @ 340 != 'ILCE-7MR4'"
+	"""
+	if isinstance(value, exifread.utils.Ratio):
+		return Decimal(value.decimal())
+	if isinstance(value, exifread.classes.IfdTag):
+		# If field type is an int, return an int
+		if value.field_type in [3, 4, 8, 9]:
+			return int(value.values[0])
+		# If field type is a Decimal, return a Decimal
+		if value.field_type in [11, 12]:
+			return Decimal(value.values[0])
+		# If field type is a ratio or signed ratio, perform the division and reeturn a Decimal
+		if value.field_type in [5, 10]:
+			return Decimal(value.values[0].num) / Decimal(value.values[0].den)
+		return value.printable
+	if isinstance(value, bytes):
+		result = value.decode('utf-8')
+		if isinstance(result, float):
+			return Decimal(result)
+		return result
+
+	if value is None:
+		return None
+
+	return exifread.utils.make_string(value)
+
+
+@dataclass(frozen=True, slots=True)
+class PhotoMetadata:
+	"""
+	The EXIF tags of a photo, parsed once and converted to python values.
+
+	Only the tags in ExifTag are kept, so a record is small enough to keep for every photo on a card.
+
+	Examples:
+		>>> metadata = PhotoMetadata.from_file('/media/pi/SD_CARD/DCIM/100MSDCF/JAM_1234.arw')
+		>>> metadata.get(ExifTag.CAMERA)
+		'ILCE-7RM4'
+	"""
+	tags: Mapping[str, TagValue] = field(default_factory=lambda: MappingProxyType({}))
+
+	@classmethod
+	def from_file(cls, path: str) -> PhotoMetadata:
+		"""
+		Read and parse the EXIF tags of a file, reading only as much of it as those tags need. See read_tags.
+
+		Raises:
+			FileNotFoundError: If the file does not exist.
+		"""
+		return cls.from_tags(read_tags(path, KNOWN_TAGS))
+
+	@classmethod
+	def from_tags(cls, tags: Mapping[str, Any]) -> PhotoMetadata:
+		"""
+		Create a record from the tags exifread returns.
+
+		A tag that can't be converted (i.e. an FNumber of 0/0, from a manual lens) is stored as None, so it doesn't
+		cost the photo every other tag.
+		"""
+		return cls(MappingProxyType({ExifTag(key).value: cls._convert(key, value) for key, value in tags.items() if key in KNOWN_TAGS}))
+
+	@staticmethod
+	def _convert(key: str, value: Any) -> TagValue:
+		try:
+			return convert_tag(value)
+		except (ValueError, ArithmeticError) as e:
+			logger.warning('Unable to convert EXIF tag %s (%s) -> %s', key, value, e)
+			return None
+
+	def __contains__(self, key: ExifTag | str) -> bool:
+		return key in self.tags
+
+	def get(self, key: ExifTag | str) -> TagValue:
+		return self.tags.get(key)
+
 
 class Photo(FilePath):
 	"""
 	Allows us to interact with sd cards mounted to the server this code is running on.
+
+	EXIF tags are read from the file the first time a property needs one, and every property after that reads the
+	same PhotoMetadata. If the file changes on disk, call refresh().
 	"""
 	_path: str
 	_number: int
+	_metadata: PhotoMetadata | None = None
 
 	def __init__(self, path: list[str] | str, number: Optional[int] = None):
 		"""
 		Initialise the photo object.
 
 		Args:
-			path (str): The path to the photo.
+			path (str): The path to the photo. If this is a Photo that has already read its tags, they are reused.
 			number (int, optional): The number of the photo. Defaults to None.
 		"""
 		super().__init__(path)
 		self._number = number
+		if isinstance(path, Photo) and path.path == self.path:
+			self._metadata = path._metadata
 
 	@property
 	def path(self) -> str:
@@ -76,6 +170,8 @@ class Photo(FilePath):
 			raise ValueError("The path must be a string or a list of strings")
 
 		self._path = os.path.normpath(joined_path)
+		# A different file may have different tags
+		self._metadata = None
 
 		self.validate()
 
@@ -640,6 +736,28 @@ class Photo(FilePath):
 		"""
 		return Validator.calculate_checksum(self.path)
 
+	@property
+	def metadata(self) -> PhotoMetadata:
+		"""
+		The EXIF tags of the photo. The file is parsed the first time this is used.
+
+		Returns:
+			PhotoMetadata: The parsed tags.
+		"""
+		if self._metadata is None:
+			self._metadata = PhotoMetadata.from_file(self.path)
+		return self._metadata
+
+	def refresh(self) -> PhotoMetadata:
+		"""
+		Parse the EXIF tags again, i.e. after the file has been modified.
+
+		Returns:
+			PhotoMetadata: The new tags.
+		"""
+		self._metadata = None
+		return self.metadata
+
 	def attr(self, key: ExifTag) -> str | Decimal | int | None:
 		"""
 		Get the EXIF data from the given file.
@@ -651,44 +769,17 @@ class Photo(FilePath):
 			str | Decimal | int: The EXIF data.
 
 		Examples:
-			>>> get_exif_data(ExifTag.EXPOSURE_TIME)
-			{'EXIF ExposureTime': (1, 100)}
+			>>> photo.attr(ExifTag.EXPOSURE_TIME)
+			Decimal('0.01')
 		"""
-		try:
-			with open(self.path, 'rb') as image_file:
-				tags = exifread.process_file(image_file, details=False)
-
-			# Convert from ASCII and Signed Ratio to string and Decimal
-			# address problems such as "AssertionError: (0x0110) ASCII=ILCE-7RM4 @ 340 != 'ILCE-7MR4'"
-			value = tags[key]
-			if isinstance(value, exifread.utils.Ratio):
-				return Decimal(value.decimal())
-			if isinstance(value, exifread.classes.IfdTag):
-				# If field type is an int, return an int
-				if value.field_type in [3, 4, 8, 9]:
-					return int(value.values[0])
-				# If field type is a Decimal, return a Decimal
-				if value.field_type in [11, 12]:
-					return Decimal(value.values[0])
-				# If field type is a ratio or signed ratio, perform the division and reeturn a Decimal
-				if value.field_type in [5, 10]:
-					return Decimal(value.values[0].num) / Decimal(value.values[0].den)
-				return value.printable
-			if isinstance(value, bytes):
-				result = value.decode('utf-8')
-				if isinstance(result, float):
-					return Decimal(result)
-				return result
-
-			if value is None:
-				return None
-
-			return exifread.utils.make_string(value)
-		except KeyError:
+		metadata = self.metadata
+		if key not in metadata:
 			logger.warning('Unable to find attribute %s in %s', key, self.path)
-			logger.warning('Tags are %s', tags)
+			logger.debug('Tags are %s', dict(metadata.tags))
 			return None
 
+		return metadata.get(key)
+
 	def is_jpg(self) -> bool:
 		"""
 		Checks if the given file is a JPG.
@@ -796,6 +887,13 @@ class FakePhoto(Photo):
 		"""
 		return Decimal(2.8)
 
+	@property
+	def metadata(self) -> PhotoMetadata:
+		"""
+		No tags, since the file may not exist.
+		"""
+		return PhotoMetadata()
+
 	def attr(self, key: ExifTag) -> str:
 		"""
 		Get fake EXIF data.
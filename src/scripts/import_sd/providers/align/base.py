@@ -20,12 +20,12 @@
 
 from __future__ import annotations
 from abc import ABC, abstractmethod
-from concurrent.futures import ThreadPoolExecutor
 from typing import List, TypeVar
 import logging
 
 from tqdm import tqdm
 import concurrent.futures
+from scripts.lib.scheduler import DeviceScheduler
 from scripts.import_sd.providers.base import Provider
 from scripts.import_sd.photo import Photo
 
@@ -61,8 +61,9 @@ class AlignmentProvider(Provider, ABC):
 		if isinstance(brackets[0], Photo):
 			return self._next_bracket(brackets)
 
-		with ThreadPoolExecutor(max_workers=MAX_THREADS) as executor:
-			futures = [executor.submit(self._next_bracket, bracket) for bracket in brackets]
+		# Limit the number of brackets read from (and written to) each device at once
+		with DeviceScheduler(default_limit=MAX_THREADS, max_workers=MAX_THREADS, thread_name_prefix='align') as scheduler:
+			futures = [scheduler.submit(self._next_bracket, bracket, paths=[photo.path for photo in bracket]) for bracket in brackets]
 			results = []
 			for future in tqdm(concurrent.futures.as_completed(futures), desc="Aligning multiple brackets...", total=len(brackets), ncols=100):
 				try:
@@ -84,7 +84,7 @@ class HuginProvider(AlignmentProvider):
 		for photo, aligned in tqdm(results.items(), desc="Copying exif data to aligned images...", ncols=100):
 			# Copy EXIF data using ExifTool
 			logger.debug('Copying exif data from %s to %s', photo, aligned)
-			self.subprocess(['exiftool', '-TagsFromFile', photo.path, '-all', aligned.path])
+			self.exiftool.copy_tags(photo.path, aligned.path)
 
 			# Create a new file named {photo.filename}_aligned.{ext}
 			final_path = photo.change_extension('tif', '_aligned')
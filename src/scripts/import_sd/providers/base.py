@@ -23,6 +23,7 @@ from typing import Any, Optional
 import subprocess
 import logging
 from scripts.lib.path import DirPath
+from scripts.lib.exiftool import ExifToolPool, get_exiftool_pool
 
 logger = logging.getLogger(__name__)
 
@@ -31,6 +32,14 @@ class Provider(ABC):
 	"""
 	Represents a provider of a service, such as a photo alignment provider, or a photo merging provider.
 	"""
+	# Persistent exiftool processes to copy tags with. Defaults to the pool shared by the whole process.
+	exiftool_pool: Optional[ExifToolPool] = None
+
+	@property
+	def exiftool(self) -> ExifToolPool:
+		if self.exiftool_pool is None:
+			return get_exiftool_pool()
+		return self.exiftool_pool
 
 	@abstractmethod
 	def run(self, *args, **kwargs) -> Any:
@@ -23,66 +23,92 @@ import os
 import logging
 import time
 from scripts.lib.path import FilePath
+from scripts.lib.scheduler import DeviceScheduler
 from scripts.import_sd.config import MAX_RETRIES
 from scripts.import_sd.providers.base import Provider
 from scripts.import_sd.photo import Photo
 
 logger = logging.getLogger(__name__)
 
+MAX_THREADS = 4
+
 
 class TiffProvider(Provider, ABC):
 	"""
 	Convert raw photos to TIFF files.
 	"""
+	# Conversions to run at once, across all devices, and on any one device.
+	max_workers: int = MAX_THREADS
+	device_limit: int = MAX_THREADS
 
 	def run(self, files: dict[Photo, FilePath]) -> dict[Photo, Photo]:
 		"""
 		Convert a list of raw photos to TIFF files.
 
+		Conversions run in parallel, limited per device by a DeviceScheduler, so a slow SD card isn't read by more
+		converters than it can keep up with.
+
 		Args:
 			files (dict[Photo, FilePath]): A dictionary of raw photos and the paths to the TIFF files to create.
 
 		Returns:
 			dict[Photo, Photo]: A dictionary of raw photos and the converted TIFF files.
 		"""
-		results = {}
+		with DeviceScheduler(default_limit=self.device_limit, max_workers=self.max_workers, thread_name_prefix='tiff') as scheduler:
+			futures = {
+				photo: scheduler.submit(self._convert, photo, tiff_path, paths=(photo.path, tiff_path.path))
+				for photo, tiff_path in files.items()
+			}
 
-		for photo, tiff_path in files.items():
-			for i in range(MAX_RETRIES):
-				# Add _tmp to the end of the file name until we get a successful conversion
-				tmp_path = tiff_path.append_suffix('_tmp')
-
-				tiff = self.next(photo, tmp_path)
+		results = {}
+		for photo, future in futures.items():
+			if (tiff := future.result()):
+				results[photo] = tiff
 
-				if not tiff:
-					# Wait a few seconds, then try again.
-					# Sleep a little longer each time, up to a maximum time.
-					sleep_time = min(60, 5 * (i + 1))
-					logger.info('Waiting %d seconds and trying again. (%d/%d)', sleep_time, i + 1, MAX_RETRIES)
-					time.sleep(sleep_time)
-					continue
+		return results
 
-				# Ensure the TIFF file exists
-				if not tiff.exists():
-					logger.error('Tiff file %s does not exist after conversion.', tiff.path)
-					continue
+	def _convert(self, photo: Photo, tiff_path: FilePath) -> Photo | None:
+		"""
+		Convert a single raw photo, retrying on expected errors.
 
-				# Copy EXIF data using ExifTool
-				logger.debug('Copying exif data from %s to %s', photo.path, tiff.path)
-				self.subprocess(['exiftool', '-TagsFromFile', photo.path, '-all', tiff.path])
+		Args:
+			photo (Photo): The photo to convert.
+			tiff_path (FilePath): The path to the TIFF file to create.
 
-				# Rename the file to remove the _tmp suffix
-				self.rename(tiff, tiff_path)
-				results[photo] = Photo(tiff_path)
+		Returns:
+			Photo: The converted photo, or None if the maximum retries were exceeded.
+		"""
+		for i in range(MAX_RETRIES):
+			# Add _tmp to the end of the file name until we get a successful conversion
+			tmp_path = tiff_path.append_suffix('_tmp')
 
-				# Done! No need to loop more
-				break
+			tiff = self.next(photo, tmp_path)
 
 			if not tiff:
-				logger.error('Maximum retries exceeded for %s', photo.path)
+				# Wait a few seconds, then try again.
+				# Sleep a little longer each time, up to a maximum time.
+				sleep_time = min(60, 5 * (i + 1))
+				logger.info('Waiting %d seconds and trying again. (%d/%d)', sleep_time, i + 1, MAX_RETRIES)
+				time.sleep(sleep_time)
 				continue
 
-		return results
+			# Ensure the TIFF file exists
+			if not tiff.exists():
+				logger.error('Tiff file %s does not exist after conversion.', tiff.path)
+				continue
+
+			# Copy EXIF data using ExifTool
+			logger.debug('Copying exif data from %s to %s', photo.path, tiff.path)
+			self.exiftool.copy_tags(photo.path, tiff.path)
+
+			# Rename the file to remove the _tmp suffix
+			self.rename(tiff, tiff_path)
+
+			# Done! No need to loop more
+			return Photo(tiff_path)
+
+		logger.error('Maximum retries exceeded for %s', photo.path)
+		return None
 
 	@abstractmethod
 	def next(self, photo: Photo, tiff_path: FilePath) -> Photo | None:
@@ -32,6 +32,8 @@ class DarktableProvider(TiffProvider):
 	Converts raw photos to TIFF files using darktable.
 	"""
 	command: str = 'darktable-cli'
+	# darktable locks its library database, so only one darktable-cli process can run at a time
+	max_workers: int = 1
 
 	def next(self, photo: Photo, tiff_path: FilePath) -> Photo | None:
 		"""
@@ -18,11 +18,13 @@
 		Copyright (c) 2023 Jess Mann
 """
 from __future__ import annotations
-from typing import Optional
+from typing import Iterable, Optional
 from datetime import datetime
+import os
 import logging
 
 from scripts.lib.path import FilePath
+from scripts.lib.scheduler import DeviceScheduler
 from scripts.import_sd.photo import Photo
 
 logger = logging.getLogger(__name__)
@@ -49,12 +51,15 @@ class Queue:
 	_skipped: list[Photo]
 	_mismatched: dict[Photo, FilePath]
 	_checksums: dict[FilePath, str]
+	# Checksums by path, so a photo queued for several destinations is only read once
+	_digests: dict[str, str]
 
 	def __init__(self):
 		self._queue = {}
 		self._skipped = []
 		self._mismatched = {}
 		self._checksums = {}
+		self._digests = {}
 
 	def append(self, photo: Photo, destination: FilePath | str) -> bool:
 		"""
@@ -80,13 +85,16 @@ class Queue:
 		if photo.extension != destination.extension:
 			raise ValueError(f"Photo and destination have different extensions: {photo.extension} and {destination.extension}")
 
-		# Calculate checksums for both files
-		checksums = self.calculate_checksums([photo, destination])
+		# Calculate checksums for both files. A destination of a different size can't match, so it isn't read.
+		candidates = [photo]
+		if destination.exists() and self.same_size(photo, destination):
+			candidates.append(destination)
+		checksums = self.calculate_checksums(candidates)
 
 		# Check if something already exists at the destination path
 		if destination.exists():
 			# If checksums are the same, do not append to queue
-			if checksums[photo] == checksums[destination]:
+			if destination in checksums and checksums.get(photo) == checksums[destination]:
 				self.skip(photo)
 				return False
 			# If checksums are different, flag as mismatched and append to queue
@@ -150,10 +158,91 @@ class Queue:
 		Returns:
 			str: The checksum of the photo.
 		"""
-		checksum = photo.checksum
+		checksum = self.digest(photo)
 		self.append_checksum(photo, checksum)
 		return checksum
 
+	def digest(self, path: FilePath) -> str:
+		"""
+		Calculates the checksum of a file, reading it only the first time it is asked for.
+
+		Args:
+			path (FilePath): The file.
+
+		Returns:
+			str: The checksum of the file, or an empty string if it does not exist.
+		"""
+		if (checksum := self._digests.get(path.path)) is not None:
+			return checksum
+
+		checksum = path.checksum
+		# A file that doesn't exist yet may be copied later, so don't remember that
+		if checksum:
+			self._digests[path.path] = checksum
+		return checksum
+
+	def prefetch_checksums(self, paths: Iterable[FilePath], scheduler: DeviceScheduler) -> int:
+		"""
+		Calculates the checksums of many files in parallel, before they are appended, so append() doesn't wait on them.
+
+		The scheduler limits how many files are read at once from each device, so an SD card isn't read by more
+		threads than it can keep up with.
+
+		Args:
+			paths (Iterable[FilePath]): The files to read.
+			scheduler (DeviceScheduler): Runs the reads.
+
+		Returns:
+			int: The number of files that were read.
+		"""
+		futures = {}
+		for path in paths:
+			if path.path in self._digests or path.path in futures:
+				continue
+			futures[path.path] = scheduler.submit(self.digest, path, paths=(path.path,))
+
+		for filepath, future in futures.items():
+			try:
+				future.result()
+			except FileNotFoundError:
+				logger.debug(f"File not found, cannot calculate checksum: {filepath}")
+
+		return len(futures)
+
+	def matches(self, photo: FilePath, path: FilePath) -> bool:
+		"""
+		Whether a file exists with the same contents as the photo, without reading it unless it is the same size.
+
+		Args:
+			photo (Photo): The photo.
+			path (FilePath): The file to compare it to.
+
+		Returns:
+			bool: True if the file exists and matches the photo, False otherwise.
+		"""
+		if not path.exists() or not self.same_size(photo, path):
+			return False
+
+		return self.digest(photo) == self.digest(path)
+
+	@staticmethod
+	def same_size(photo: FilePath, path: FilePath) -> bool:
+		"""
+		Whether two files could have the same contents, judging by their size.
+
+		Args:
+			photo (Photo): The photo.
+			path (FilePath): The file to compare it to.
+
+		Returns:
+			bool: False if both files exist and their sizes differ, True otherwise.
+		"""
+		try:
+			return os.path.getsize(photo.path) == os.path.getsize(path.path)
+		except OSError:
+			# Can't rule it out without reading them
+			return True
+
 	def calculate_checksums(self, photos: list[FilePath]) -> dict[str, str]:
 		"""
 		Calculates checksums for all photos and saves them to the checksums list.
@@ -20,14 +20,20 @@
 from __future__ import annotations
 import argparse
 import errno
+import hashlib
 import os
 import sys
 import subprocess
 import logging
 import time
+from pathlib import Path
 from typing import Optional
 
-from scripts.lib.path import DirPath
+from scripts.lib.path import DirPath, FilePath
+from scripts.lib.checksum import ChecksumService, get_checksum_service
+from scripts.lib.copy_engine import CopyEngine, DeviceVerifier
+from scripts.lib.hashing import HashingEngine
+from scripts.lib.scheduler import DeviceScheduler
 from scripts.import_sd.config import MAX_RETRIES
 from scripts.import_sd.operations import CopyOperation
 from scripts.import_sd.validator import Validator
@@ -50,6 +56,13 @@ class CopyWorkflow(Workflow):
 	_bucket_path: DirPath = None
 	raw_extension: str
 	dry_run: bool = False
+	# Streams each file from the card once, to every destination it is queued for
+	copy_engine: CopyEngine
+	# The file on the card each verified copy was made from, so renamed copies can still be validated
+	copied_from: dict[str, str]
+	# Checksums to calculate at once while queueing, across all devices, and on the SD card (which thrashes with more)
+	checksum_workers: int = 8
+	sd_card_readers: int = 2
 
 	def __init__(self, base_path: str, jpg_path: str, backup_path: str, raw_extension: str = 'arw', sd_card: Optional[str | SDCard] = None, dry_run: bool = False):
 		"""
@@ -74,6 +87,8 @@ class CopyWorkflow(Workflow):
 		self.backup_path = backup_path
 		self.raw_extension = raw_extension
 		self.dry_run = dry_run
+		self.copy_engine = CopyEngine(drop_cache=True)
+		self.copied_from = {}
 
 		# If no sd_path is provided, try to find it
 		if sd_card is not None:
@@ -180,22 +195,22 @@ class CopyWorkflow(Workflow):
 		if not self._bucket_path:
 			# Create an "Import Bucket" folder in the base_path
 			self._bucket_path = DirPath([self.base_path, 'Import Bucket'])
-			if not self._bucket_path.exists():
-				os.makedirs(self._bucket_path, exist_ok=True)
+			# Use .path: a DirPath built from parts isn't a usable str (or os.PathLike) on its own
+			self._bucket_path.ensure_exists()
 
-			if not Validator.is_writeable(self._bucket_path):
+			if not Validator.is_writeable(self._bucket_path.path):
 				logger.error(f'Unable to write to temporary storage location: {self._bucket_path}')
 				raise PermissionError(errno.EACCES, os.strerror(errno.EACCES), self._bucket_path)
 
 		return self._bucket_path
 
-	def run(self, operation: CopyOperation = CopyOperation.TERACOPY) -> bool:
+	def run(self, operation: CopyOperation = CopyOperation.TEE) -> bool:
 		"""
 		Copy the SD card to several different network locations, and verify checksums after copy.
 
 		Args:
 			operation (CopyOperation):
-				The copy operation to use. Defaults to Teracopy.
+				The copy operation to use. Defaults to a tee, which reads each file from the card only once.
 
 		Returns:
 			bool: True if the copy was successful, False otherwise.
@@ -219,16 +234,21 @@ class CopyWorkflow(Workflow):
 		# Create a list of files that need to be copied
 		queue = self.queue_files()
 
-		# Copy files to each destination path
-		for destination, files in queue.get_queue():
-			# Write the queue to a file, so we have a path to pass teracopy
-			list_path = queue.write(destination)
+		if operation == CopyOperation.TEE:
+			# Copy each file to all of its destinations at once
+			if not self.tee_from_queue(queue):
+				errors.append('Copy operation failed')
+		else:
+			# Copy files to each destination path
+			for destination, files in queue.get_queue():
+				# Write the queue to a file, so we have a path to pass teracopy
+				list_path = queue.write(destination)
 
-			# Begin copying
-			result = self.copy_from_list(list_path, destination, queue.get_checksums(), operation)
+				# Begin copying
+				result = self.copy_from_list(list_path, destination, queue.get_checksums(), operation)
 
-			if not result:
-				errors.append(f'Copy operation failed to {destination}')
+				if not result:
+					errors.append(f'Copy operation failed to {destination}')
 
 		# Organize files in the base_path
 		results = self.organize_files(self.bucket_path)
@@ -240,8 +260,11 @@ class CopyWorkflow(Workflow):
 		# Map the temp_paths in results to the original sd_card paths
 		files = {}
 		for temp_file, network_file in results.items():
-			filename = os.path.basename(temp_file)
-			filepath = os.path.join(self.sd_card.path, filename)
+			# Copies remember their source, even if they were renamed to avoid overwriting a different version
+			filepath = self.copied_from.get(os.path.normpath(temp_file))
+			if filepath is None:
+				filename = os.path.basename(temp_file)
+				filepath = os.path.join(self.sd_card.path, filename)
 			files[filepath] = network_file
 
 		# Validate checksums after teracopy
@@ -310,6 +333,106 @@ class CopyWorkflow(Workflow):
 
 		return success
 
+	def tee_from_queue(self, queue: Queue) -> bool:
+		"""
+		Copy every queued file to all of its destinations, reading each file from the SD card only once.
+
+		Each file is streamed through CopyEngine.tee, which hashes it as it is read. The digest is compared to the
+		checksum taken when the file was queued (so a bad read from the card is caught), and then each destination is
+		read back from its device and compared to it. Verified digests are cached, so validating them again later is free.
+
+		Files that already exist at a destination with different contents (see Queue.flag) are copied alongside them,
+		with a numbered suffix.
+
+		Args:
+			queue (Queue): The files to copy, and where to copy them.
+
+		Raises:
+			KeyboardInterrupt: If errors occur during copy and the user chooses to abort.
+
+		Returns:
+			bool: True if every file was copied and verified, False otherwise.
+		"""
+		# The destinations of each photo, across every destination directory
+		destinations: dict[Photo, list[FilePath]] = {}
+		for directory, photos in queue.get_queue().items():
+			for photo in photos:
+				destinations.setdefault(photo, []).append(FilePath([directory, photo.filename]))
+
+		if self.dry_run:
+			for photo, paths in destinations.items():
+				logger.info('Would copy %s ----> %s', photo.path, ', '.join(path.path for path in paths))
+			return True
+
+		verifier = DeviceVerifier(HashingEngine(), 'sha256')
+		checksum_service = get_checksum_service()
+		failures: list[str] = []
+		copied: dict[Path, str] = {}
+
+		for photo, paths in destinations.items():
+			try:
+				paths = [Path(self._unique_destination(path).path) for path in paths]
+				for path in paths:
+					path.parent.mkdir(parents=True, exist_ok=True)
+				digest = self.copy_engine.tee(photo.path, paths, hashlib.sha256())
+			except OSError as e:
+				logger.critical('Unable to copy %s -> %s', photo.path, e)
+				failures.append(f'{photo.path}: {e}')
+				continue
+
+			# The card returned different data than when the file was queued
+			expected = queue.get_checksum(photo)
+			if expected is not None and expected != f'sha256:{digest}':
+				logger.critical('Checksum of %s changed while copying: %s != sha256:%s', photo.path, expected, digest)
+				failures.append(f'{photo.path}: checksum changed while copying')
+				for path in paths:
+					path.unlink(missing_ok=True)
+				continue
+
+			for path in paths:
+				copied[path] = digest
+				self.copied_from[os.path.normpath(path)] = photo.path
+				for verified, result in verifier.add(path, digest).items():
+					self._record_verification(verified, result, checksum_service, failures)
+
+		for verified, result in verifier.flush().items():
+			self._record_verification(verified, result, checksum_service, failures)
+
+		logger.info('Made %d copies of %d files (%d errors)', len(copied), len(destinations), len(failures))
+
+		if failures:
+			self.ask_user_continue('Copy failed', failures)
+			return False
+
+		return True
+
+	def _record_verification(self, path: Path, result: str | None, checksum_service: ChecksumService, failures: list[str]) -> None:
+		"""
+		Cache the digest of a destination that matched its source, or remove it if it didn't.
+		"""
+		if result is None:
+			failures.append(f'{path}: does not match its source')
+			self.copied_from.pop(os.path.normpath(path), None)
+			path.unlink(missing_ok=True)
+			return
+
+		checksum_service.store(path, os.stat(path), 'sha256', False, result)
+
+	@staticmethod
+	def _unique_destination(path: FilePath) -> FilePath:
+		"""
+		Number a destination that already exists (i.e. with different contents), so both versions are kept.
+		"""
+		if not path.exists():
+			return path
+
+		for i in range(1, 1000):
+			numbered = path.append_suffix(f'_{i}')
+			if not numbered.exists():
+				return numbered
+
+		raise FileExistsError(errno.EEXIST, 'Cannot create a unique name for', path.path)
+
 	@classmethod
 	def rsync(cls, source_path: str, destination_path: str) -> bool:
 		"""
@@ -454,6 +577,8 @@ class CopyWorkflow(Workflow):
 		# Get a list of files that need to be copied
 		files = Queue()
 
+		# List the card first, without reading any files, so they can all be hashed in parallel
+		planned: list[tuple[Photo, Optional[FilePath], list[FilePath]]] = []
 		for root, _, filenames in os.walk(self.sd_card.path):
 			for filename in filenames:
 				filepath = os.path.join(root, filename)
@@ -461,19 +586,41 @@ class CopyWorkflow(Workflow):
 				photo = Photo(filepath)
 
 				# Add RAW extensions to the base_path, jpg extensions to the jpg_path, and all files to the backup_path
+				final_path = None
 				if photo.extension == self.raw_extension:
 					# Only append the RAW file if it doesn't exist (or mismatches) the FINAL location it will end up in, after it is organized.
 					final_path = self.generate_path(photo)
-					if not os.path.exists(final_path) or not photo.matches(final_path):
-						files.append_parts(photo, [self.bucket_path, folder, filename])
+					destination = FilePath([self.bucket_path, folder, filename])
 				elif photo.is_jpg():
-					files.append_parts(photo, [self.jpg_path, folder, filename])
+					destination = FilePath([self.jpg_path, folder, filename])
 				else:
 					logger.warning('Unknown file type %s', filename)
 					continue
 
 				# Add ALL files to the backup path
-				files.append_parts(photo, [self.backup_path, folder, filename])
+				planned.append((photo, final_path, [destination, FilePath([self.backup_path, folder, filename])]))
+
+		# Hash every photo, and any existing file that could be a copy of one (i.e. the same size)
+		to_hash: list[FilePath] = []
+		for photo, final_path, destinations in planned:
+			to_hash.append(photo)
+			for path in ([final_path] if final_path else []) + destinations:
+				if path.exists() and files.same_size(photo, path):
+					to_hash.append(path)
+
+		with DeviceScheduler(
+			default_limit=self.checksum_workers,
+			limits={self.sd_card.path: self.sd_card_readers},
+			max_workers=self.checksum_workers,
+			thread_name_prefix='checksum'
+		) as scheduler:
+			read = files.prefetch_checksums(to_hash, scheduler)
+		logger.debug('Calculated checksums for %d files', read)
+
+		for photo, final_path, (destination, backup) in planned:
+			if final_path is None or not files.matches(photo, final_path):
+				files.append(photo, destination)
+			files.append(photo, backup)
 
 		logger.info('Queueing %d files to copy', files.count())
 		return files
@@ -592,6 +739,7 @@ def main():
 	parser.add_argument('--extension', '-e', default="arw", type=str, help='The extension to use for RAW files.')
 	parser.add_argument('--backup-path', '-b', default="S:/SD Backup/", type=str, help='The path to the backup network location to copy the SD card to.')
 	parser.add_argument('--dry-run', action='store_true', help='Whether to do a dry run, where no files are actually changed.')
+	parser.add_argument('--operation', '-o', default=CopyOperation.TEE.value, choices=[operation.value for operation in CopyOperation], help='How to copy files. "tee" reads each file from the SD card once, for every destination.')
 	args = parser.parse_args()
 
 	# Set up logging
@@ -600,7 +748,7 @@ def main():
 
 	# Copy the SD card
 	workflow = CopyWorkflow(args.base_path, args.jpg_path, args.backup_path, args.extension, args.sd_path, args.dry_run)
-	result = workflow.run()
+	result = workflow.run(CopyOperation(args.operation))
 
 	# Exit with the appropriate code
 	if result:
@@ -0,0 +1,409 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    checksum.py                                                                                          *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import hashlib
+import os
+import threading
+import logging
+from pathlib import Path
+from typing import Iterable
+from cachetools import LRUCache
+
+from scripts.lib.hash_cache import HashCache
+from scripts.lib.hashing import ALGORITHMS, HashingEngine, TreeDigest, TREE_ALGORITHM, TREE_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+# What checksums are calculated with when the caller doesn't say. sha256 digests can be checked by common tools.
+DEFAULT_ALGORITHM = 'sha256'
+# Digests without an algorithm prefix were all created with sha256, by the tools that predate the prefix
+LEGACY_ALGORITHM = 'sha256'
+# Every digest the tools use: FileManager (xxhash), Validator and the dashboard (sha256), Immich deduplication (sha1).
+# Calculating them together reads each file once, and caches all three for whichever tool needs them next.
+DEFAULT_BUNDLE = ('xxhash', 'sha256', 'sha1')
+
+# Names that refer to the same algorithm as a name in ALGORITHMS. Digests are always labelled with the canonical name.
+ALIASES = {
+    'xxh64': 'xxhash',
+    'sha-256': 'sha256',
+    'sha-1': 'sha1',
+}
+# The chunk digests of a tree digest are cached under this name, alongside its root (cached as TREE_ALGORITHM)
+TREE_CHUNKS = f'{TREE_ALGORITHM}.chunks'
+
+def canonical_algorithm(algorithm : str) -> str:
+    """
+    Get the name a digest created with an algorithm is labelled (and cached) with.
+
+    Raises:
+        ValueError: If the algorithm is not supported.
+    """
+    name = algorithm.lower()
+    name = ALIASES.get(name, name)
+    if name not in ALGORITHMS and name != TREE_ALGORITHM and name not in hashlib.algorithms_available:
+        raise ValueError(f'Unsupported checksum algorithm: {algorithm}')
+    return name
+
+def format_digest(algorithm : str, hexdigest : str) -> str:
+    """
+    Label a hexdigest with its algorithm, i.e. 'sha256:9f86d0...'.
+    """
+    return f'{canonical_algorithm(algorithm)}:{hexdigest}'
+
+def parse_digest(digest : str, default_algorithm : str = LEGACY_ALGORITHM) -> tuple[str, str]:
+    """
+    Split a digest into (algorithm, hexdigest).
+
+    Args:
+        digest: A labelled digest ('sha256:9f86d0...'), or a bare hexdigest.
+        default_algorithm: The algorithm a bare hexdigest is assumed to have been created with.
+
+    Raises:
+        ValueError: If the algorithm is not supported.
+    """
+    algorithm, separator, hexdigest = digest.partition(':')
+    if not separator:
+        return canonical_algorithm(default_algorithm), digest.lower()
+    return canonical_algorithm(algorithm), hexdigest.lower()
+
+def digests_match(first : str, second : str, default_algorithm : str = LEGACY_ALGORITHM) -> bool:
+    """
+    Compare two digests, labelled or bare.
+
+    Raises:
+        ValueError: If the digests were created with different algorithms, so they can't be compared.
+    """
+    first_algorithm, first_hex = parse_digest(first, default_algorithm)
+    second_algorithm, second_hex = parse_digest(second, default_algorithm)
+    if first_algorithm != second_algorithm:
+        raise ValueError(f'Cannot compare a {first_algorithm} digest with a {second_algorithm} digest')
+    return first_hex == second_hex
+
+class ChecksumService:
+    """
+    The one place file checksums are calculated.
+
+    Files are streamed through the HashingEngine (mmap for local files, a fixed buffer for network mounts), so memory
+    use does not grow with the size of the file. Every digest is cached in memory, and in the persistent hash cache if
+    one is given, keyed by the stat fingerprint of the file and the canonical name of the algorithm. Any tool using
+    the same hash cache can reuse a digest another tool calculated, as long as the file hasn't changed.
+
+    checksum() returns labelled digests ('sha256:9f86d0...'), so a stored digest always says how to verify it.
+    hexdigest() returns the bare hexdigest, for callers that store the algorithm elsewhere.
+
+    Bit rot and silent corruption don't change a file's stat, so a cached digest can't detect them. Integrity checks
+    pass use_cache=False, which always reads the file (and replaces the cached digest with what was read).
+
+    The 'xxh3_tree' algorithm hashes large files in parallel chunks (see HashingEngine.hash_tree). Its chunk digests
+    are cached too, unless store_tree_chunks is False, so a mismatch can later be narrowed down without rehashing.
+
+    Example:
+        >>> service = ChecksumService(hash_cache=HashCache())
+        >>> service.checksum(Path('/mnt/d/DCIM/JAM_1234.arw'))
+        'sha256:9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08'
+        >>> service.verify(Path('/mnt/p/JAM_1234.arw'), 'sha256:9f86d0...')
+        True
+    """
+    engine : HashingEngine
+    hash_cache : HashCache | None
+    store_tree_chunks : bool
+
+    def __init__(self, engine : HashingEngine | None = None, hash_cache : HashCache | None = None, memory_cache_size : int = 10000, store_tree_chunks : bool = True):
+        self.engine = engine or HashingEngine()
+        self.hash_cache = hash_cache
+        self.store_tree_chunks = store_tree_chunks
+        self._memory : LRUCache = LRUCache(maxsize=memory_cache_size)
+        self._lock = threading.Lock()
+
+    def lookup(self, stat : os.stat_result, algorithm : str, partial : bool = False, path : Path | None = None) -> str | None:
+        """
+        Find the hexdigest of a version of a file, without reading it.
+
+        Args:
+            path: Where the file is now, so the hash cache can follow renames.
+        """
+        return self._lookup(stat, canonical_algorithm(algorithm), partial, path)
+
+    def _lookup(self, stat : os.stat_result, algorithm : str, partial : bool, path : Path | None = None) -> str | None:
+        key = (HashCache.fingerprint(stat), algorithm, partial)
+
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+
+        if not self.hash_cache or not (result := self.hash_cache.get(stat, algorithm, partial, path)):
+            return None
+
+        with self._lock:
+            self._memory[key] = result
+        return result
+
+    def store(self, path : Path, stat : os.stat_result, algorithm : str, partial : bool, hexdigest : str) -> None:
+        """
+        Remember the hexdigest of a version of a file, i.e. one calculated while copying it.
+        """
+        self._store(path, stat, canonical_algorithm(algorithm), partial, hexdigest)
+
+    def _store(self, path : Path, stat : os.stat_result, algorithm : str, partial : bool, hexdigest : str) -> None:
+        with self._lock:
+            self._memory[(HashCache.fingerprint(stat), algorithm, partial)] = hexdigest
+
+        if self.hash_cache:
+            self.hash_cache.set(path, stat, algorithm, partial, hexdigest)
+
+    def lookup_many(self, stat : os.stat_result, algorithms : Iterable[str], partial : bool = False, path : Path | None = None) -> dict[str, str]:
+        """
+        Find the hexdigests of a version of a file for several algorithms, without reading it.
+
+        Args:
+            path: Where the file is now, so the hash cache can follow renames.
+
+        Returns:
+            canonical algorithm -> hexdigest, for each algorithm that has one.
+        """
+        algorithms = [canonical_algorithm(algorithm) for algorithm in algorithms]
+        fingerprint = HashCache.fingerprint(stat)
+
+        results = {}
+        with self._lock:
+            for algorithm in algorithms:
+                if (result := self._memory.get((fingerprint, algorithm, partial))):
+                    results[algorithm] = result
+
+        missing = [algorithm for algorithm in algorithms if algorithm not in results]
+        if missing and self.hash_cache and (found := self.hash_cache.get_many(stat, missing, partial, path)):
+            with self._lock:
+                for algorithm, result in found.items():
+                    self._memory[(fingerprint, algorithm, partial)] = result
+            results.update(found)
+
+        return results
+
+    def store_many(self, path : Path, stat : os.stat_result, partial : bool, hexdigests : dict[str, str]) -> None:
+        """
+        Remember a bundle of hexdigests for a version of a file, in one write to the hash cache.
+        """
+        hexdigests = {canonical_algorithm(algorithm): result for algorithm, result in hexdigests.items()}
+        fingerprint = HashCache.fingerprint(stat)
+
+        with self._lock:
+            for algorithm, result in hexdigests.items():
+                self._memory[(fingerprint, algorithm, partial)] = result
+
+        if self.hash_cache:
+            self.hash_cache.set_many(path, stat, partial, hexdigests)
+
+    def hexdigest(self, path : Path | str, algorithm : str = DEFAULT_ALGORITHM, *, partial : bool = False, stat : os.stat_result | None = None, use_cache : bool = True) -> str:
+        """
+        Get the hexdigest of a file, reading it only if it has changed since it was last hashed.
+
+        Args:
+            path: The file.
+            algorithm: The algorithm to use.
+            partial: If True, only hash the first and last 1MB of the file.
+            stat: The stat of the file, if the caller already has it.
+            use_cache: If False, always read the file, i.e. to check it for corruption.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        path = Path(path)
+        if stat is None:
+            stat = path.stat()
+
+        if use_cache and (result := self.lookup(stat, algorithm, partial, path)):
+            return result
+
+        if canonical_algorithm(algorithm) == TREE_ALGORITHM and not partial:
+            return self.tree(path, stat=stat, use_cache=use_cache).root
+
+        result = self.engine.hash_file(path, canonical_algorithm(algorithm), partial)
+        self.store(path, stat, algorithm, partial, result)
+        return result
+
+    def tree(self, path : Path | str, chunk_size : int = TREE_CHUNK_SIZE, *, stat : os.stat_result | None = None, use_cache : bool = True) -> TreeDigest:
+        """
+        Get the tree digest of a file, with the digest of every chunk. See HashingEngine.hash_tree.
+
+        Args:
+            path: The file.
+            chunk_size: The size of each chunk. Cached chunk digests of another size are not reused.
+            stat: The stat of the file, if the caller already has it.
+            use_cache: If False, always read the file.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        path = Path(path)
+        if stat is None:
+            stat = path.stat()
+
+        if use_cache and (tree := self.lookup_tree(stat, chunk_size, path)):
+            return tree
+
+        tree = self.engine.hash_tree(path, chunk_size)
+        self.store_tree(path, stat, tree)
+        return tree
+
+    def lookup_tree(self, stat : os.stat_result, chunk_size : int = TREE_CHUNK_SIZE, path : Path | None = None) -> TreeDigest | None:
+        """
+        Find the tree digest of a version of a file, with the digest of every chunk, without reading it.
+
+        Args:
+            chunk_size: Cached chunk digests of another size are not returned.
+            path: Where the file is now, so the hash cache can follow renames.
+        """
+        if not (stored := self._lookup(stat, TREE_CHUNKS, False, path)):
+            return None
+        try:
+            if (tree := TreeDigest.from_string(stored)).chunk_size == chunk_size:
+                return tree
+        except ValueError as ve:
+            logger.warning('Ignoring invalid chunk digests for %s -> %s', path, ve)
+        return None
+
+    def store_tree(self, path : Path, stat : os.stat_result, tree : TreeDigest) -> None:
+        """
+        Remember the tree digest of a version of a file, i.e. one calculated while copying it (see TreeHasher).
+        """
+        self._store(path, stat, TREE_ALGORITHM, False, tree.root)
+        if self.store_tree_chunks:
+            self._store(path, stat, TREE_CHUNKS, False, tree.to_string())
+
+    def hexdigest_many(self, paths : Iterable[Path | str], algorithm : str = DEFAULT_ALGORITHM, *, partial : bool = False) -> dict[Path, str]:
+        """
+        Get the hexdigests of several files, hashing the ones that aren't cached concurrently.
+
+        Files that don't exist, or can't be read, are logged and left out of the result.
+        """
+        results : dict[Path, str] = {}
+        stats : dict[Path, os.stat_result] = {}
+        for path in paths:
+            path = Path(path)
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                logger.warning('File not found to hash: %s', path)
+                continue
+
+            if (result := self.lookup(stat, algorithm, partial, path)):
+                results[path] = result
+            else:
+                stats[path] = stat
+
+        if canonical_algorithm(algorithm) == TREE_ALGORITHM and not partial:
+            # Each file is already hashed in parallel, so they are hashed one after another
+            for path, stat in stats.items():
+                try:
+                    results[path] = self.tree(path, stat=stat).root
+                except OSError as ose:
+                    logger.warning('Unable to hash %s -> %s', path, ose)
+            return results
+
+        for path, result in self.engine.hash_many(stats.keys(), canonical_algorithm(algorithm), partial).items():
+            self.store(path, stats[path], algorithm, partial, result)
+            results[path] = result
+
+        return results
+
+    def hexdigests(self, path : Path | str, algorithms : Iterable[str] = DEFAULT_BUNDLE, *, partial : bool = False, stat : os.stat_result | None = None) -> dict[str, str]:
+        """
+        Get the hexdigests of a file for several algorithms. Any that aren't cached are calculated together, in one read.
+
+        Args:
+            path: The file.
+            algorithms: The algorithms to use.
+            partial: If True, only hash the first and last 1MB of the file.
+            stat: The stat of the file, if the caller already has it.
+
+        Returns:
+            canonical algorithm -> hexdigest, in the order the algorithms were given.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            ValueError: If a partial tree digest is requested. Tree digests always cover the whole file.
+        """
+        algorithms = list(dict.fromkeys(canonical_algorithm(algorithm) for algorithm in algorithms))
+        if partial and TREE_ALGORITHM in algorithms:
+            raise ValueError(f'{TREE_ALGORITHM} digests always cover the whole file, so they have no partial form')
+
+        path = Path(path)
+        if stat is None:
+            stat = path.stat()
+
+        results = self.lookup_many(stat, algorithms, partial, path)
+
+        if TREE_ALGORITHM in algorithms and TREE_ALGORITHM not in results:
+            # Tree digests are calculated in parallel chunks, rather than in the shared read
+            results[TREE_ALGORITHM] = self.tree(path, stat=stat).root
+
+        if (missing := [algorithm for algorithm in algorithms if algorithm not in results]):
+            calculated = self.engine.hash_file_multi(path, missing, partial)
+            self.store_many(path, stat, partial, calculated)
+            results.update(calculated)
+
+        return {algorithm: results[algorithm] for algorithm in algorithms}
+
+    def checksums(self, path : Path | str, algorithms : Iterable[str] = DEFAULT_BUNDLE) -> dict[str, str]:
+        """
+        Get labelled digests of a file for several algorithms, reading it at most once.
+
+        Example:
+            >>> service.checksums(Path('JAM_1234.arw'), ('xxhash', 'sha256'))
+            {'xxhash': 'xxhash:a1b2c3d4e5f6a7b8', 'sha256': 'sha256:9f86d0...'}
+        """
+        return {algorithm: format_digest(algorithm, result) for algorithm, result in self.hexdigests(path, algorithms).items()}
+
+    def checksum(self, path : Path | str, algorithm : str = DEFAULT_ALGORITHM, *, use_cache : bool = True) -> str:
+        """
+        Get the labelled digest of a file, i.e. 'sha256:9f86d0...'.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        return format_digest(algorithm, self.hexdigest(path, algorithm, use_cache=use_cache))
+
+    def checksum_many(self, paths : Iterable[Path | str], algorithm : str = DEFAULT_ALGORITHM) -> dict[Path, str]:
+        return {path: format_digest(algorithm, result) for path, result in self.hexdigest_many(paths, algorithm).items()}
+
+    def verify(self, path : Path | str, digest : str, *, use_cache : bool = True) -> bool:
+        """
+        Check a file against a digest, using whichever algorithm the digest was created with.
+        """
+        algorithm, expected = parse_digest(digest)
+        return self.hexdigest(path, algorithm, use_cache=use_cache) == expected
+
+_service : ChecksumService | None = None
+_service_lock = threading.Lock()
+
+def get_checksum_service() -> ChecksumService:
+    """
+    The checksum service shared by the tools in this process, backed by the default persistent hash cache.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ChecksumService(hash_cache=HashCache())
+        return _service
@@ -0,0 +1,526 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    copy_engine.py                                                                                       *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import contextlib
+import errno
+import os
+import queue
+import shutil
+import threading
+import logging
+from enum import Enum
+from pathlib import Path
+from typing import Iterable
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+from scripts.lib.hashing import Hasher, HashingEngine, HashStrategy
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 8 * 1024 * 1024  # 8MB
+# _IOW(0x94, 9, int) from linux/fs.h. Shares the source's extents with the destination (btrfs, XFS, ZFS 2.2+, bcachefs).
+FICLONE = 0x40049409
+# errnos that mean "this filesystem can't clone at all", so it isn't worth trying again for other files on it
+CLONE_UNSUPPORTED_ERRNOS = frozenset({errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOTTY})
+# errnos that mean "this pair of files can't be cloned" (i.e. across filesystems, or unaligned), though others may be
+CLONE_REFUSED_ERRNOS = frozenset({errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF})
+DEFAULT_VERIFY_BATCH_SIZE = 32
+# Buffers in flight between the reader and the writers of a tee. Writers can fall this many chunks behind the reader.
+DEFAULT_TEE_DEPTH = 4
+
+class CloneResult(Enum):
+    CLONED = 'cloned'
+    # This file wasn't cloned, but others on the same filesystem might be
+    REFUSED = 'refused'
+    # The filesystem doesn't support cloning
+    UNSUPPORTED = 'unsupported'
+
+    def __bool__(self) -> bool:
+        return self is CloneResult.CLONED
+
+def fadvise(fd : int, advice : str, offset : int = 0, length : int = 0) -> None:
+    """
+    Give the kernel a hint about how a file will be read (see posix_fadvise(2)). A length of 0 means the whole file.
+
+    Hints are best effort: on platforms (or filesystems) without posix_fadvise, this does nothing.
+
+    Args:
+        fd: An open file descriptor.
+        advice: SEQUENTIAL, WILLNEED or DONTNEED.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(fd, offset, length, getattr(os, f'POSIX_FADV_{advice}'))
+    except OSError as ose:
+        logger.debug('posix_fadvise %s failed -> %s', advice, ose)
+
+class CopyEngine:
+    """
+    Copies files by streaming the source exactly once.
+
+    When a hasher is supplied, every chunk is fed to it as it is written, so the source digest is available when the copy
+    finishes, without a separate read of the source. When no hasher is needed, the kernel copies the data directly
+    (copy_file_range, then sendfile), and nothing passes through python at all.
+
+    Each thread reuses a single buffer, so copying thousands of files does not allocate a new bytes object per chunk.
+
+    The kernel is told each source will be read sequentially, so it reads ahead aggressively. With drop_cache, both
+    files are dropped from the page cache once copied (which also starts writeback of the destination), so streaming
+    hundreds of GB from a card doesn't evict everything else the machine had cached.
+
+    Example:
+        >>> engine = CopyEngine(drop_cache=True)
+        >>> engine.copy(Path('/mnt/d/DCIM/JAM_1234.arw'), Path('/mnt/p/JAM_1234.arw'), xxhash.xxh64())
+        'a1b2c3d4e5f6a7b8'
+    """
+    buffer_size : int
+    drop_cache : bool
+
+    def __init__(self, buffer_size : int = DEFAULT_BUFFER_SIZE, *, drop_cache : bool = False):
+        self.buffer_size = buffer_size
+        self.drop_cache = drop_cache
+        self._local = threading.local()
+
+    @property
+    def buffer(self) -> memoryview:
+        """
+        A reusable buffer for the current thread.
+        """
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = memoryview(bytearray(self.buffer_size))
+            self._local.buffer = buffer
+        return buffer
+
+    def copy(self, source_path : Path, destination_path : Path, hasher : Hasher | None = None) -> str | None:
+        """
+        Copy a file, along with its metadata (like shutil.copy2).
+
+        If the copy fails part way through, the partial destination file is removed.
+
+        Args:
+            source_path: The file to copy.
+            destination_path: The path to copy it to. This must not already exist.
+            hasher: An optional hasher, which is updated with the contents of the source as it is copied.
+
+        Returns:
+            The hexdigest of the source, if a hasher was provided. Otherwise None.
+
+        Raises:
+            FileExistsError: If the destination already exists.
+            OSError: If the copy fails.
+        """
+        try:
+            with open(source_path, 'rb') as source, open(destination_path, 'xb') as destination:
+                fadvise(source.fileno(), 'SEQUENTIAL')
+                fadvise(source.fileno(), 'WILLNEED')
+
+                if hasher is None:
+                    self._copy_kernel(source.fileno(), destination.fileno(), os.fstat(source.fileno()).st_size)
+                else:
+                    self._copy_hashing(source, destination, hasher)
+
+                if self.drop_cache:
+                    destination.flush()
+                    fadvise(source.fileno(), 'DONTNEED')
+                    # Dirty pages can't be dropped yet, but this starts writing them back, and drops the rest
+                    fadvise(destination.fileno(), 'DONTNEED')
+        except FileExistsError:
+            raise
+        except BaseException:
+            # Don't leave a truncated file behind that looks like a successful copy
+            destination_path.unlink(missing_ok=True)
+            raise
+
+        shutil.copystat(source_path, destination_path)
+
+        return hasher.hexdigest() if hasher is not None else None
+
+    def tee(self, source_path : Path, destination_paths : Iterable[Path], hasher : Hasher | None = None, *, depth : int = DEFAULT_TEE_DEPTH) -> str | None:
+        """
+        Copy a file to several destinations, reading the source only once.
+
+        Chunks are read into a ring of depth buffers, and a thread for each destination writes them in order. A buffer is
+        only refilled once every destination has written it, so a slow destination holds up the read, but never the
+        other writers until the ring is full. The hasher is fed each chunk as it is read.
+
+        If any destination fails, every partial destination is removed, so a file is either copied everywhere or
+        nowhere.
+
+        Args:
+            source_path: The file to copy.
+            destination_paths: The paths to copy it to. None of these may already exist.
+            hasher: An optional hasher, which is updated with the contents of the source as it is read.
+            depth: The number of buffers in the ring.
+
+        Returns:
+            The hexdigest of the source, if a hasher was provided. Otherwise None.
+
+        Raises:
+            FileExistsError: If a destination already exists.
+            OSError: If reading the source, or writing any destination, fails.
+        """
+        destination_paths = list(dict.fromkeys(Path(path) for path in destination_paths))
+        ring = self._ring(depth)
+        # Released once all writers are done with a buffer
+        free = threading.Semaphore(len(ring))
+        remaining = [0] * len(ring)
+        lock = threading.Lock()
+        errors : list[BaseException] = []
+        queues : list[queue.SimpleQueue] = [queue.SimpleQueue() for _ in destination_paths]
+        created : list[Path] = []
+
+        def write(destination, chunks : queue.SimpleQueue) -> None:
+            while (item := chunks.get()) is not None:
+                slot, length = item
+                try:
+                    if not errors:
+                        view = ring[slot][:length]
+                        written = 0
+                        while written < length:
+                            written += destination.write(view[written:])
+                except BaseException as e:
+                    with lock:
+                        errors.append(e)
+                finally:
+                    with lock:
+                        remaining[slot] -= 1
+                        done = remaining[slot] == 0
+                    if done:
+                        free.release()
+
+        try:
+            with open(source_path, 'rb') as source, contextlib.ExitStack() as stack:
+                fadvise(source.fileno(), 'SEQUENTIAL')
+                fadvise(source.fileno(), 'WILLNEED')
+
+                destinations = []
+                for path in destination_paths:
+                    destinations.append(stack.enter_context(open(path, 'xb', buffering=0)))
+                    created.append(path)
+
+                writers = [
+                    threading.Thread(target=write, args=(destination, chunks), name=f'tee-{index}', daemon=True)
+                    for index, (destination, chunks) in enumerate(zip(destinations, queues))
+                ]
+                for writer in writers:
+                    writer.start()
+
+                try:
+                    slot = 0
+                    while not errors:
+                        free.acquire()
+                        read = source.readinto(ring[slot])
+                        if not read:
+                            free.release()
+                            break
+                        if hasher is not None:
+                            hasher.update(ring[slot][:read])
+                        remaining[slot] = len(queues)
+                        for chunks in queues:
+                            chunks.put((slot, read))
+                        slot = (slot + 1) % len(ring)
+                finally:
+                    for chunks in queues:
+                        chunks.put(None)
+                    for writer in writers:
+                        writer.join()
+
+                if errors:
+                    raise errors[0]
+
+                if self.drop_cache:
+                    fadvise(source.fileno(), 'DONTNEED')
+                    for destination in destinations:
+                        fadvise(destination.fileno(), 'DONTNEED')
+        except BaseException:
+            # Don't leave truncated files behind that look like successful copies
+            for path in created:
+                path.unlink(missing_ok=True)
+            raise
+
+        for path in destination_paths:
+            shutil.copystat(source_path, path)
+
+        return hasher.hexdigest() if hasher is not None else None
+
+    def copy_range(self, source_path : Path, destination_path : Path, offset : int, length : int) -> None:
+        """
+        Copy one region of a file over the same region of an existing copy, i.e. to repair a chunk that didn't verify.
+
+        Metadata is copied again afterwards, since writing changes the destination's mtime.
+
+        Raises:
+            OSError: If the copy fails.
+        """
+        with open(source_path, 'rb') as source, open(destination_path, 'r+b') as destination:
+            source.seek(offset)
+            destination.seek(offset)
+            buffer = self.buffer
+            remaining = length
+            while remaining and (read := source.readinto(buffer[:min(remaining, len(buffer))])):
+                destination.write(buffer[:read])
+                remaining -= read
+
+        shutil.copystat(source_path, destination_path)
+
+    def clone(self, source_path : Path, destination_path : Path) -> CloneResult:
+        """
+        Clone a file with the FICLONE ioctl, so the destination shares the source's data blocks (copy on write).
+
+        This takes the same (short) time regardless of file size, and uses no extra space. It only works when both
+        paths are on the same CoW-capable filesystem.
+
+        Args:
+            source_path: The file to clone.
+            destination_path: The path to clone it to. This must not already exist.
+
+        Returns:
+            CLONED if the file was cloned (the only truthy result). Otherwise nothing is left behind, and the result says
+            whether cloning was refused for this file only (REFUSED), or is not supported by the filesystem (UNSUPPORTED).
+
+        Raises:
+            FileExistsError: If the destination already exists.
+            OSError: If cloning fails for any other reason.
+        """
+        if fcntl is None:
+            return CloneResult.UNSUPPORTED
+
+        try:
+            with open(source_path, 'rb') as source, open(destination_path, 'xb') as destination:
+                fcntl.ioctl(destination.fileno(), FICLONE, source.fileno())
+        except FileExistsError:
+            raise
+        except OSError as ose:
+            destination_path.unlink(missing_ok=True)
+            if ose.errno in CLONE_UNSUPPORTED_ERRNOS:
+                logger.debug('Unable to clone %s -> %s', source_path, ose)
+                return CloneResult.UNSUPPORTED
+            if ose.errno in CLONE_REFUSED_ERRNOS:
+                logger.debug('Unable to clone %s, copying it instead -> %s', source_path, ose)
+                return CloneResult.REFUSED
+            raise
+        except BaseException:
+            destination_path.unlink(missing_ok=True)
+            raise
+
+        shutil.copystat(source_path, destination_path)
+        return CloneResult.CLONED
+
+    def _ring(self, depth : int) -> list[memoryview]:
+        """
+        Reusable buffers for the current thread's tees.
+        """
+        ring = getattr(self._local, 'ring', None)
+        if ring is None or len(ring) != depth:
+            ring = [memoryview(bytearray(self.buffer_size)) for _ in range(depth)]
+            self._local.ring = ring
+        return ring
+
+    def _copy_hashing(self, source, destination, hasher : Hasher) -> None:
+        """
+        Copy through the reusable buffer, feeding each chunk to the hasher.
+        """
+        buffer = self.buffer
+        while (read := source.readinto(buffer)):
+            chunk = buffer[:read]
+            hasher.update(chunk)
+            destination.write(chunk)
+
+    def _copy_kernel(self, source_fd : int, destination_fd : int, size : int) -> None:
+        """
+        Copy without passing the data through python, falling back to the buffer if the kernel refuses.
+        """
+        offset = 0
+        for method in (self._copy_file_range, self._sendfile):
+            try:
+                offset = method(source_fd, destination_fd, offset, size)
+                if offset >= size:
+                    return
+            except OSError as ose:
+                # Cross-device, unsupported filesystem, etc. Try the next method from where this one stopped.
+                if ose.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF):
+                    raise
+                logger.debug('Kernel copy with %s failed, falling back -> %s', method.__name__, ose)
+
+        # Python-level copy for whatever remains
+        os.lseek(source_fd, offset, os.SEEK_SET)
+        os.lseek(destination_fd, offset, os.SEEK_SET)
+        buffer = self.buffer
+        while (read := os.readv(source_fd, [buffer])):
+            written = 0
+            while written < read:
+                written += os.write(destination_fd, buffer[written:read])
+
+    def _copy_file_range(self, source_fd : int, destination_fd : int, offset : int, size : int) -> int:
+        if not hasattr(os, 'copy_file_range'):
+            raise OSError(errno.ENOSYS, 'copy_file_range is not available')
+
+        while offset < size:
+            copied = os.copy_file_range(source_fd, destination_fd, size - offset, offset, offset)
+            if not copied:
+                break
+            offset += copied
+        return offset
+
+    def _sendfile(self, source_fd : int, destination_fd : int, offset : int, size : int) -> int:
+        if not hasattr(os, 'sendfile'):
+            raise OSError(errno.ENOSYS, 'sendfile is not available')
+
+        os.lseek(destination_fd, offset, os.SEEK_SET)
+        while offset < size:
+            sent = os.sendfile(destination_fd, source_fd, offset, min(size - offset, self.buffer_size))
+            if not sent:
+                break
+            offset += sent
+        return offset
+
+class DeviceVerifier:
+    """
+    Verifies copies against what reached the device, rather than what is still in the page cache.
+
+    Hashing a file straight after writing it reads it back from memory, which proves nothing about the disk. Here each
+    destination is fsynced, its pages are dropped from the page cache, and then it is read again, so the digest is of
+    the data on the device.
+
+    fsync is the expensive part, so files can be queued with add() and verified in batches: the whole batch is synced,
+    then dropped, then re-read. By then the kernel has usually already written most of it back.
+
+    Example:
+        >>> verifier = DeviceVerifier(HashingEngine(), batch_size=32)
+        >>> verifier.verify(Path('/mnt/p/JAM_1234.arw'), 'a1b2c3d4e5f6a7b8')
+        True
+        >>> verifier.add(Path('/mnt/p/JAM_1235.arw'), 'b2c3d4e5f6a7b8c9')
+        {}
+        >>> verifier.flush()
+        {PosixPath('/mnt/p/JAM_1235.arw'): 'b2c3d4e5f6a7b8c9'}
+    """
+    engine : HashingEngine
+    algorithm : str
+    batch_size : int
+
+    def __init__(self, engine : HashingEngine, algorithm : str = 'xxhash', batch_size : int = DEFAULT_VERIFY_BATCH_SIZE):
+        self.engine = engine
+        self.algorithm = algorithm
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._pending : dict[Path, str] = {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def verify(self, path : Path, expected : str) -> bool:
+        """
+        Verify a single file now.
+        """
+        return self._verify_batch({path: expected})[path] is not None
+
+    def add(self, path : Path, expected : str) -> dict[Path, str | None]:
+        """
+        Queue a file to be verified. When the queue reaches batch_size, the whole batch is verified.
+
+        Returns:
+            The results of the batch, if one was verified. Otherwise, an empty dict.
+        """
+        with self._lock:
+            self._pending[path] = expected
+            if len(self._pending) < self.batch_size:
+                return {}
+            batch, self._pending = self._pending, {}
+        return self._verify_batch(batch)
+
+    def flush(self) -> dict[Path, str | None]:
+        """
+        Verify every queued file.
+
+        Returns:
+            path -> its digest if it matched, or None if it did not. A file that can't be read counts as a mismatch.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        return self._verify_batch(batch) if batch else {}
+
+    def settle(self, paths : Iterable[Path]) -> list[Path]:
+        """
+        Write files to the device, and drop them from the page cache, so that reading them next reads the device.
+
+        Returns:
+            The files that couldn't be opened.
+        """
+        missing = []
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError as ose:
+                logger.error('Unable to open %s to verify it -> %s', path, ose)
+                missing.append(path)
+                continue
+            try:
+                os.fsync(fd)
+                fadvise(fd, 'DONTNEED')
+            finally:
+                os.close(fd)
+        return missing
+
+    def _verify_batch(self, batch : dict[Path, str]) -> dict[Path, str | None]:
+        results : dict[Path, str | None] = dict.fromkeys(self.settle(batch))
+
+        for path, expected in batch.items():
+            if path in results:
+                continue
+            try:
+                # Read with a plain buffer, rather than mmap, so the pages can be dropped again afterwards
+                actual = self.engine.hash_file(path, self.algorithm, strategy=HashStrategy.READINTO)
+            except OSError as ose:
+                logger.error('Unable to read %s to verify it -> %s', path, ose)
+                results[path] = None
+                continue
+            results[path] = actual if actual == expected else None
+            if results[path] is None:
+                logger.critical('%s does not match its source on the device: %s != %s', path, actual, expected)
+            self._drop(path)
+
+        return results
+
+    @staticmethod
+    def _drop(path : Path) -> None:
+        """
+        Drop a file we just read from the page cache, so verifying doesn't fill it up again.
+        """
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            fadvise(fd, 'DONTNEED')
+        finally:
+            os.close(fd)
@@ -0,0 +1,300 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    discovery.py                                                                                         *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import os
+import re
+import threading
+import logging
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from scripts.lib.mounts import find_mount
+
+logger = logging.getLogger(__name__)
+
+# Never descend into our own trash, no matter what should_ignore_directory says
+ALWAYS_PRUNE = frozenset({'.trash'})
+
+type WalkStep = tuple[Path, list[os.DirEntry], list[os.DirEntry]]
+
+def parse_mount_limits(values : Iterable[str] | None) -> dict[str, int]:
+    """
+    Parse mount concurrency limits from the command line, i.e. ['/mnt/nas=8', '/mnt/i=2'].
+
+    Raises:
+        ValueError: If a value is not in the form MOUNT=N.
+    """
+    limits = {}
+    for value in values or []:
+        mountpoint, _, limit = value.rpartition('=')
+        if not mountpoint or not limit.isdigit() or int(limit) < 1:
+            raise ValueError(f'Invalid mount limit "{value}". Expected MOUNT=N, i.e. /mnt/nas=8')
+        limits[os.path.abspath(mountpoint)] = int(limit)
+    return limits
+
+def translate_glob(pattern : str) -> str:
+    """
+    Translate a glob pattern into a regex. Unlike fnmatch.translate(), wildcards never match a path separator.
+    """
+    result = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == '*':
+            result.append('[^/]*')
+        elif char == '?':
+            result.append('[^/]')
+        elif char == '[' and (end := pattern.find(']', i + 1 if pattern[i:i + 1] in ('!', ']') else i)) != -1:
+            body = pattern[i:end].replace('\\', '\\\\')
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            result.append(f'[{body}]')
+            i = end + 1
+        else:
+            result.append(re.escape(char))
+    return ''.join(result)
+
+def compile_globs(patterns : Iterable[str]) -> re.Pattern | None:
+    """
+    Combine several glob patterns into one case-insensitive regex, so each name is tested once.
+
+    Like Path.match(), patterns are matched against the end of the path, a component at a time. So '*.jpg' matches
+    any jpg in any directory, and 'DCIM/*.jpg' only matches jpgs directly inside a DCIM directory.
+
+    Args:
+        patterns: The glob patterns, i.e. ['*.jpg', '*.arw', 'DCIM/*.mp4']
+
+    Returns:
+        The compiled regex, or None if there are no patterns (which matches nothing).
+    """
+    alternatives = ['(?:^|/)' + translate_glob(pattern.replace('\\', '/')) for pattern in patterns]
+    if not alternatives:
+        return None
+
+    return re.compile(f"(?:{'|'.join(alternatives)})\\Z", re.IGNORECASE)
+
+class FileDiscovery:
+    """
+    Find files matching a set of glob patterns, listing every directory exactly once.
+
+    Path.rglob walks the whole tree once per pattern. This walks it once with os.scandir, tests every name against a
+    single compiled regex, and prunes ignored directories before descending into them.
+
+    On high latency mounts (SMB, 9P), listing a directory is a round trip, so with walk_threads > 1, sibling directories
+    are listed concurrently. Results then arrive in whatever order the listings finish, unless ordered is set, in
+    which case they are yielded in the same order as a serial walk (listings are still prefetched in parallel).
+
+    Example:
+        >>> discovery = FileDiscovery(['*.jpg', '*.arw'], should_ignore_directory=lambda name: name.startswith('.'))
+        >>> [entry.name for entry in discovery.iter_files(Path('/mnt/p/DCIM'))]
+        ['JAM_1234.arw', 'JAM_1234.jpg']
+    """
+    patterns : list[str]
+
+    def __init__(self,
+                 patterns : Iterable[str],
+                 *,
+                 should_ignore_directory : Callable[[str], bool] | None = None,
+                 on_entry : Callable[[os.DirEntry], None] | None = None,
+                 walk_threads : int = 1,
+                 mount_limits : dict[str, int] | None = None,
+                 ordered : bool = False):
+        """
+        Args:
+            patterns: The glob patterns files must match (any one of them).
+            should_ignore_directory: Called with a directory name. Return True to skip the directory and everything in it.
+            on_entry: Called with every DirEntry that is listed (i.e. to fill a stat cache). Must be thread safe if
+                walk_threads > 1.
+            walk_threads: The number of directories to list at once. 1 walks serially.
+            mount_limits: The maximum number of concurrent listings per mountpoint, i.e. {'/mnt/nas': 8}. Mounts that
+                are not listed are limited only by walk_threads.
+            ordered: Yield results in the same order as a serial walk, with entries sorted by name.
+        """
+        self.walk_threads = max(1, walk_threads)
+        self.mount_limits = mount_limits or {}
+        self.ordered = ordered
+        self._mount_semaphores : dict[str, threading.Semaphore] = {}
+        self._semaphore_lock = threading.Lock()
+        self.patterns = list(patterns)
+        self.regex = compile_globs(self.patterns)
+        self.should_ignore_directory = should_ignore_directory
+        self.on_entry = on_entry
+        # Patterns with a separator need the path, not just the name
+        self._match_paths = any('/' in pattern.replace('\\', '/') for pattern in self.patterns)
+
+    def matches(self, path : str | Path) -> bool:
+        """
+        Check if a path matches any of the glob patterns.
+        """
+        if self.regex is None:
+            return False
+        text = Path(path).as_posix() if self._match_paths else os.path.basename(path)
+        return self.regex.search(text) is not None
+
+    def prune(self, name : str, should_ignore_directory : Callable[[str], bool] | None = None) -> bool:
+        """
+        Check if a directory should be skipped, along with everything beneath it.
+        """
+        if name in ALWAYS_PRUNE:
+            return True
+        should_ignore_directory = should_ignore_directory or self.should_ignore_directory
+        return bool(should_ignore_directory and should_ignore_directory(name))
+
+    def walk(self, directory : Path, *, recursive : bool = True, should_ignore_directory : Callable[[str], bool] | None = None) -> Iterator[WalkStep]:
+        """
+        Walk a directory tree top down, like os.walk, but yield the DirEntry objects from os.scandir.
+
+        Ignored subdirectories are removed before they are yielded. Symlinks to directories are listed, but not
+        followed (like os.walk). Callers may prune the subdirectory list further, in place, to avoid descending into
+        them, except in an unordered parallel walk, where subdirectories are submitted before the step is yielded.
+
+        Args:
+            directory: The directory to walk.
+            recursive: Whether to descend into subdirectories.
+            should_ignore_directory: Overrides the rule given to the constructor, for this walk only.
+
+        Yields:
+            A tuple of (directory, subdirectory entries, file entries)
+        """
+        if self.walk_threads > 1:
+            yield from self._walk_parallel(directory, recursive, should_ignore_directory)
+            return
+
+        stack = [directory]
+        while stack:
+            current = stack.pop()
+            if (step := self._list(current, should_ignore_directory)) is None:
+                continue
+
+            yield step
+
+            if recursive:
+                # Reversed, so the stack pops them in listing order
+                stack.extend(self._descend(step))
+
+    def _walk_parallel(self, directory : Path, recursive : bool, should_ignore_directory : Callable[[str], bool] | None) -> Iterator[WalkStep]:
+        executor = ThreadPoolExecutor(max_workers=self.walk_threads, thread_name_prefix='walk')
+        try:
+            if self.ordered:
+                # Depth first, like the serial walk, but every subdirectory is submitted as soon as it is found
+                stack : list[Future] = [executor.submit(self._list_limited, directory, should_ignore_directory)]
+                while stack:
+                    if (step := stack.pop().result()) is None:
+                        continue
+                    yield step
+                    if recursive:
+                        stack.extend(executor.submit(self._list_limited, subdir, should_ignore_directory) for subdir in self._descend(step))
+                return
+
+            pending : set[Future] = {executor.submit(self._list_limited, directory, should_ignore_directory)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if (step := future.result()) is None:
+                        continue
+                    if recursive:
+                        pending.update(executor.submit(self._list_limited, subdir, should_ignore_directory) for subdir in self._descend(step))
+                    yield step
+        finally:
+            # If the caller stopped early, don't finish listing the rest of the tree
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def _descend(step : WalkStep) -> list[Path]:
+        """
+        The subdirectories to walk next, in reverse listing order (for a stack). Symlinks are not followed.
+        """
+        _, subdirs, _ = step
+        return [Path(entry.path) for entry in reversed(subdirs) if not entry.is_symlink()]
+
+    def _semaphore_for(self, directory : Path) -> threading.Semaphore | None:
+        if not self.mount_limits or not (mount := find_mount(directory)):
+            return None
+
+        mountpoint = str(mount.mountpoint)
+        if mountpoint not in self.mount_limits:
+            return None
+
+        with self._semaphore_lock:
+            if mountpoint not in self._mount_semaphores:
+                self._mount_semaphores[mountpoint] = threading.Semaphore(self.mount_limits[mountpoint])
+            return self._mount_semaphores[mountpoint]
+
+    def _list_limited(self, directory : Path, should_ignore_directory : Callable[[str], bool] | None) -> WalkStep | None:
+        if (semaphore := self._semaphore_for(directory)) is None:
+            return self._list(directory, should_ignore_directory)
+        with semaphore:
+            return self._list(directory, should_ignore_directory)
+
+    def _list(self, directory : Path, should_ignore_directory : Callable[[str], bool] | None) -> WalkStep | None:
+        """
+        List a single directory, splitting it into subdirectories and files.
+
+        Returns:
+            The walk step, or None if the directory could not be listed.
+        """
+        subdirs : list[os.DirEntry] = []
+        files : list[os.DirEntry] = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if self.on_entry:
+                        self.on_entry(entry)
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+
+                    if not is_dir:
+                        files.append(entry)
+                    elif not self.prune(entry.name, should_ignore_directory):
+                        subdirs.append(entry)
+        except OSError as ose:
+            logger.debug('Unable to list directory %s -> %s', directory, ose)
+            return None
+
+        if self.ordered:
+            subdirs.sort(key=lambda entry: entry.name)
+            files.sort(key=lambda entry: entry.name)
+
+        return directory, subdirs, files
+
+    def iter_files(self, directory : Path, *, recursive : bool = True) -> Iterator[os.DirEntry]:
+        """
+        Yield every file beneath a directory that matches the glob patterns.
+
+        Args:
+            directory: The directory to search.
+            recursive: Whether to search subdirectories.
+
+        Yields:
+            The DirEntry for each matching file.
+        """
+        for _, _, files in self.walk(directory, recursive=recursive):
+            for entry in files:
+                if self.matches(entry.path):
+                    yield entry
@@ -0,0 +1,384 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    exiftool.py                                                                                          *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import atexit
+import itertools
+import json
+import queue
+import subprocess
+import threading
+import logging
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Processes to keep open. Each one is a perl interpreter (~20MB), and requests are mostly waiting on disk.
+DEFAULT_POOL_SIZE = 4
+
+# Seconds to wait for exiftool to exit after asking it to stop, before killing it.
+CLOSE_TIMEOUT = 5
+
+class ExifToolError(RuntimeError):
+    """
+    exiftool reported an error for a request, or the process exited while handling one.
+    """
+    def __init__(self, args : Iterable[str], message : str):
+        self.args_ = tuple(args)
+        self.message = message
+        super().__init__(f'exiftool {" ".join(self.args_)} -> {message}')
+
+class ExifToolProcess:
+    """
+    A single long-lived `exiftool -stay_open True -@ -` process.
+
+    Arguments are written to stdin one per line, and each request ends with `-execute{n}`. exiftool prints `{ready{n}}`
+    on stdout once it is finished, and `-echo4` prints the same marker on stderr, so both streams can be read up to the
+    end of the request without waiting for the process to exit.
+
+    stderr is drained by a thread of its own as it is written. Otherwise a request that warns about more than a pipe's
+    worth (64KB) would block exiftool on stderr, while stdout is waiting for its marker.
+
+    Not thread-safe on its own: requests are serialized with a lock, but callers should use an ExifToolPool.
+    """
+    def __init__(self, executable : str = 'exiftool', common_args : Iterable[str] = ()):
+        self.executable = executable
+        self.common_args = tuple(common_args)
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+        command = [executable, '-stay_open', 'True', '-@', '-']
+        if self.common_args:
+            command += ['-common_args', *self.common_args]
+        self._process = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+        )
+        self._stderr : queue.SimpleQueue[str | None] = queue.SimpleQueue()
+        self._stderr_thread = threading.Thread(
+            target=self._drain,
+            args=(self._process.stderr, self._stderr),
+            name=f'exiftool-stderr-{self._process.pid}',
+            daemon=True,
+        )
+        self._stderr_thread.start()
+        logger.debug('Started exiftool (pid %d)', self._process.pid)
+
+    @property
+    def alive(self) -> bool:
+        return self._process.poll() is None
+
+    def execute(self, *args : str | Path) -> tuple[str, str]:
+        """
+        Run one exiftool command in this process.
+
+        Args:
+            *args: Command line arguments, as they would be passed to exiftool.
+
+        Returns:
+            The stdout and stderr of the command.
+
+        Raises:
+            ExifToolError: If the process has exited, or exits before finishing the request.
+        """
+        args = tuple(str(arg) for arg in args)
+        if any('\n' in arg for arg in args):
+            raise ValueError(f'exiftool arguments cannot contain newlines: {args}')
+
+        with self._lock:
+            if not self.alive:
+                raise ExifToolError(args, f'process exited with status {self._process.returncode}')
+
+            number = next(self._counter)
+            marker = f'{{ready{number}}}'
+            try:
+                self._process.stdin.write(''.join(f'{arg}\n' for arg in args))
+                self._process.stdin.write(f'-echo4\n{marker}\n-execute{number}\n')
+                self._process.stdin.flush()
+                stdout = self._read_until(self._process.stdout.readline, marker)
+                stderr = self._read_until(lambda: self._stderr.get() or '', marker)
+            except (BrokenPipeError, EOFError) as e:
+                # Make sure it's gone, so the pool replaces it
+                self._process.kill()
+                self._process.wait()
+                raise ExifToolError(args, f'process exited while handling the request: {e}') from e
+
+        return stdout, stderr
+
+    def close(self) -> None:
+        """
+        Ask exiftool to exit, killing it if it doesn't.
+        """
+        with self._lock:
+            if self.alive:
+                try:
+                    self._process.stdin.write('-stay_open\nFalse\n')
+                    self._process.stdin.flush()
+                except (BrokenPipeError, ValueError):
+                    pass
+            try:
+                # Not communicate(), which would read stderr alongside the drain thread
+                self._process.wait(timeout=CLOSE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                logger.warning('exiftool (pid %d) did not exit, killing it', self._process.pid)
+                self._process.kill()
+                self._process.wait()
+
+            for stream in (self._process.stdin, self._process.stdout):
+                try:
+                    stream.close()
+                except (BrokenPipeError, OSError):
+                    pass
+            self._stderr_thread.join(timeout=CLOSE_TIMEOUT)
+
+    @staticmethod
+    def _drain(stream, lines : queue.SimpleQueue[str | None]) -> None:
+        """
+        Queue each line of stream as it is written, and None once it ends.
+        """
+        try:
+            for line in stream:
+                lines.put(line)
+        except (OSError, ValueError):
+            # Closed while reading
+            pass
+        finally:
+            lines.put(None)
+
+    @staticmethod
+    def _read_until(readline : Callable[[], str], marker : str) -> str:
+        """
+        Read lines up to the marker, with readline returning '' at the end of the stream.
+        """
+        lines = []
+        while True:
+            line = readline()
+            if not line:
+                raise EOFError('unexpected end of output')
+            if line.rstrip('\r\n').endswith(marker):
+                lines.append(line.rstrip('\r\n')[:-len(marker)])
+                return ''.join(lines)
+            lines.append(line)
+
+class ExifToolPool:
+    """
+    A pool of persistent exiftool processes, shared between threads.
+
+    exiftool is a perl program, and takes around 200ms to start. Spawning it for every photo costs more than the work it
+    does, so processes are started as they are needed (up to size), and reused for every later request. A request waits
+    for an idle process when they are all busy.
+
+    Example:
+        >>> with ExifToolPool(size=2) as exiftool:
+        >>>     exiftool.copy_tags(raw_path, tiff_path)
+        >>>     exiftool.execute_json('-GPSLatitude', '-GPSLongitude', photo_path)
+    """
+    def __init__(self, size : int = DEFAULT_POOL_SIZE, executable : str = 'exiftool', common_args : Iterable[str] = ()):
+        if size < 1:
+            raise ValueError(f'Invalid exiftool pool size: {size}')
+
+        self.size = size
+        self.executable = executable
+        self.common_args = tuple(common_args)
+        self._idle : queue.LifoQueue = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._processes : list[ExifToolProcess] = []
+        self._closed = False
+
+    def __enter__(self) -> ExifToolPool:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """
+        The number of processes currently running.
+        """
+        return len(self._processes)
+
+    def execute(self, *args : str | Path) -> str:
+        """
+        Run an exiftool command on the next idle process.
+
+        Args:
+            *args: Command line arguments, as they would be passed to exiftool.
+
+        Returns:
+            The stdout of the command.
+
+        Raises:
+            ExifToolError: If exiftool reports an error, or the process exits while handling the request.
+        """
+        process = self._acquire()
+        try:
+            stdout, stderr = process.execute(*args)
+        finally:
+            self._release(process)
+
+        errors = [line for line in stderr.splitlines() if line.startswith('Error')]
+        if errors:
+            raise ExifToolError(args, '\n'.join(errors))
+        if stderr.strip():
+            logger.debug('exiftool %s -> %s', args, stderr.strip())
+
+        return stdout
+
+    def execute_json(self, *args : str | Path) -> list[dict[str, Any]]:
+        """
+        Run an exiftool command with -j, and parse its output.
+
+        Returns:
+            One dictionary of tags for each file.
+        """
+        output = self.execute('-j', *args)
+        if not output.strip():
+            return []
+        return json.loads(output)
+
+    def copy_tags(self, source : str | Path, destination : str | Path) -> str:
+        """
+        Copy every tag from source to destination (i.e. from a raw file to the TIFF made from it).
+        """
+        return self.execute('-TagsFromFile', source, '-all', destination)
+
+    def close(self) -> None:
+        """
+        Stop every process. Requests after closing raise a RuntimeError.
+        """
+        with self._lock:
+            self._closed = True
+            processes, self._processes = self._processes, []
+
+        for process in processes:
+            process.close()
+            self._idle.put(None)
+
+    def _spawn(self) -> ExifToolProcess:
+        return ExifToolProcess(self.executable, self.common_args)
+
+    def _acquire(self) -> ExifToolProcess:
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError('exiftool pool is closed')
+                try:
+                    process = self._idle.get_nowait()
+                    while process is None:
+                        process = self._idle.get_nowait()
+                except queue.Empty:
+                    if len(self._processes) < self.size:
+                        process = self._spawn()
+                        self._processes.append(process)
+                        return process
+                    process = None
+
+            if process is None:
+                process = self._idle.get()
+            # None wakes waiters when a process is discarded, or the pool is closed
+            if process is None:
+                continue
+            if process.alive and process in self._processes:
+                return process
+            self._discard(process)
+
+    def _release(self, process : ExifToolProcess) -> None:
+        if not process.alive:
+            logger.warning('exiftool exited, it will be restarted on the next request')
+            self._discard(process)
+            return
+
+        with self._lock:
+            closed = self._closed
+        if closed:
+            process.close()
+        else:
+            self._idle.put(process)
+
+    def _discard(self, process : ExifToolProcess) -> None:
+        with self._lock:
+            if process in self._processes:
+                self._processes.remove(process)
+        process.close()
+        self._idle.put(None)
+
+class FakeExifToolProcess:
+    """
+    Stands in for an ExifToolProcess in tests, without starting exiftool.
+    """
+    def __init__(self, pool : FakeExifToolPool):
+        self.pool = pool
+        self.alive = True
+
+    def execute(self, *args : str | Path) -> tuple[str, str]:
+        args = tuple(str(arg) for arg in args)
+        with self.pool._lock:
+            self.pool.calls.append(args)
+        response = self.pool.handler(args)
+        if isinstance(response, tuple):
+            return response
+        return response, ''
+
+    def close(self) -> None:
+        self.alive = False
+
+class FakeExifToolPool(ExifToolPool):
+    """
+    An ExifToolPool that records requests instead of running exiftool.
+
+    Args:
+        handler: Returns the stdout (or a tuple of stdout and stderr) for the arguments of each request.
+
+    Example:
+        >>> exiftool = FakeExifToolPool(lambda args: '[{"GPSLatitude": 41.7}]')
+        >>> exiftool.execute_json('-GPSLatitude', 'photo.arw')
+        >>> exiftool.calls
+        [('-j', '-GPSLatitude', 'photo.arw')]
+    """
+    def __init__(self, handler : Callable[[tuple[str, ...]], str | tuple[str, str]] | None = None, size : int = DEFAULT_POOL_SIZE):
+        super().__init__(size=size, executable='fake-exiftool')
+        self.handler = handler or (lambda args: '')
+        self.calls : list[tuple[str, ...]] = []
+
+    def _spawn(self) -> ExifToolProcess:
+        return FakeExifToolProcess(self)
+
+_shared_pool : ExifToolPool | None = None
+_shared_lock = threading.Lock()
+
+def get_exiftool_pool() -> ExifToolPool:
+    """
+    The pool shared by everything in this process, which is closed when the interpreter exits.
+    """
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = ExifToolPool()
+            atexit.register(_shared_pool.close)
+        return _shared_pool
@@ -31,7 +31,8 @@ import subprocess
 import sys
 import threading
 import time
-from typing import Iterator, Literal
+from contextlib import contextmanager, nullcontext
+from typing import Iterable, Iterator, Literal
 
 from alive_progress import alive_bar
 
@@ -41,16 +42,24 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 import logging
 from collections import defaultdict
 from pathlib import Path
-from functools import lru_cache
-import hashlib
-import xxhash
 import shutil
-from cachetools import LRUCache
 from threading import Lock
 from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, field_validator
 from scripts.logging import setup_logging
-from scripts.exceptions import ShouldTerminateError, ChecksumMismatchError, UnexpectedStateError
+from scripts.exceptions import AppError, ShouldTerminateError, ChecksumMismatchError, UnexpectedStateError
 from scripts.lib.script import Script
+from scripts.lib.hash_cache import HashCache
+from scripts.lib.checksum import ChecksumService, format_digest
+from scripts.lib.copy_engine import CloneResult, CopyEngine, DeviceVerifier, DEFAULT_VERIFY_BATCH_SIZE
+from scripts.lib.hashing import HashingEngine, Hasher, TreeHasher, get_hasher, TREE_ALGORITHM
+from scripts.lib.stat_cache import StatCache
+from scripts.lib.discovery import FileDiscovery
+from scripts.lib.journal import OperationJournal, JournalEntry, JournalOperation, JournalState
+from scripts.lib.metrics import METRICS
+from scripts.lib.rsync_batch import RsyncBatch, RsyncResult
+from scripts.lib.scheduler import DeviceScheduler
+from scripts.lib.throughput import ThroughputModel, get_throughput_model
+from scripts.lib.trash import TrashStore
 from scripts.lib.types import YELLOW, RESET, GREEN
 
 logger = logging.getLogger(__name__)
@@ -85,8 +94,9 @@ PATTERNS = {
     'windows_drive': re.compile(r'[A-Za-z]:[\\/]')
 }
 
-# Tool options (rsync, shutil, teracopy)
+# Tool options (native, rsync, shutil, teracopy)
 class CopyTools(Enum):
+    NATIVE = 'native'
     RSYNC = 'rsync'
     SHUTIL = 'shutil'
     TERACOPY = 'teracopy'
@@ -100,14 +110,52 @@ class FileManager(Script):
     extensions : list[str] = Field(default=None, validate_default=True)
     filename_pattern : re.Pattern = Field(default=None, validate_default=True)
     skip_mtime_compare : bool = False
+    use_hash_cache : bool = True
+    hash_cache_path : Path | None = None
+    # The native engine reads the source once, and doesn't spawn a process per file. None detects an external tool.
+    copy_method : CopyTools | None = CopyTools.NATIVE
+    # Clone files (copy on write) instead of copying them, when the source and destination share a filesystem that allows it.
+    use_reflink : bool = True
+    # Drop copied files from the page cache, so bulk transfers don't evict everything else the machine had cached.
+    drop_page_cache : bool = True
+    # Verify native copies by re-reading them from the device (after fsync), instead of from the page cache. Slower.
+    verify_on_device : bool = False
+    # Copies are synced and re-read together in batches of this many. Moves are verified one at a time.
+    verify_batch_size : int = DEFAULT_VERIFY_BATCH_SIZE
+    # Files at least this many bytes are fully hashed as a tree of chunks, in parallel (i.e. large videos). None disables it.
+    tree_hash_threshold : int | None = None
+    # Directories to list at once while searching for files. Helps on high latency (SMB, 9P) mounts.
+    walk_threads : int = 1
+    walk_mount_limits : dict[str, int] = Field(default_factory=dict)
+    walk_ordered : bool = False
+    # Learn transfer speeds per device across runs, to set timeouts. When disabled, speeds are only kept for this run.
+    use_throughput_model : bool = True
+    throughput_path : Path | None = None
+    # Concurrent tasks per device, keyed by any path on the device (i.e. its mountpoint). Others get max_threads.
+    device_limits : dict[str, int] = Field(default_factory=dict)
+    # Log every move, copy and delete here before it starts, so an interrupted run can be repaired. None disables it.
+    journal_path : Path | None = None
 
     _stats : dict[str, int] = PrivateAttr(default_factory=lambda: defaultdict(int))
     _stats_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
-    _hash_cache: LRUCache = PrivateAttr(default_factory=lambda: LRUCache(maxsize=10000))
     _cache_lock: Lock = PrivateAttr(default_factory=Lock)
+    _persistent_hash_cache : HashCache | None = PrivateAttr(default=None)
     _glob_patterns : list[str] = PrivateAttr(default_factory=list)
-    _trash_subdir : Path | None = None
+    _trash_store : TrashStore | None = PrivateAttr(default=None)
     _copy_tool : str | None = None
+    _copy_engine : CopyEngine | None = PrivateAttr(default=None)
+    _device_verifier : DeviceVerifier | None = PrivateAttr(default=None)
+    # Queued copies that failed verification in a batch, reported by flush_verification
+    _verification_failures : list[Path] = PrivateAttr(default_factory=list)
+    # Filesystems (st_dev) where cloning has been refused, so it isn't attempted for every file
+    _reflink_unsupported : set[int] = PrivateAttr(default_factory=set)
+    _hashing_engine : HashingEngine | None = PrivateAttr(default=None)
+    _checksums : ChecksumService | None = PrivateAttr(default=None)
+    _stat_cache : StatCache = PrivateAttr(default_factory=StatCache)
+    _discovery : FileDiscovery | None = PrivateAttr(default=None)
+    _throughput : ThroughputModel | None = PrivateAttr(default=None)
+    _journal : OperationJournal | None = PrivateAttr(default=None)
+    _journal_lock : Lock = PrivateAttr(default_factory=Lock)
 
     _sony_clip_pattern : re.Pattern | None = None
 
@@ -182,11 +230,78 @@ class FileManager(Script):
             self._sony_clip_pattern = re.compile(r'.*/M4ROOT/CLIP/\w+[.](xml|XML)$')
         return self._sony_clip_pattern
 
+    @property
+    def hash_cache(self) -> HashCache | None:
+        """
+        The persistent hash cache, shared across runs. None if use_hash_cache is disabled.
+        """
+        if not self.use_hash_cache:
+            return None
+
+        with self._cache_lock:
+            if not self._persistent_hash_cache:
+                self._persistent_hash_cache = HashCache(self.hash_cache_path)
+        return self._persistent_hash_cache
+
+    @property
+    def throughput(self) -> ThroughputModel:
+        """
+        Observed transfer speeds per device and endpoint, used to derive timeouts.
+        """
+        with self._cache_lock:
+            if not self._throughput:
+                if self.use_throughput_model:
+                    self._throughput = get_throughput_model(self.throughput_path)
+                else:
+                    self._throughput = ThroughputModel('')
+        return self._throughput
+
+    @property
+    def journal(self) -> OperationJournal | None:
+        """
+        The operation journal, or None if journal_path is not set.
+
+        Opening it repairs whatever the previous run left unfinished. See recover_journal.
+        """
+        if not self.journal_path:
+            return None
+
+        with self._journal_lock:
+            if self._journal is None:
+                # Recover before publishing it, so nothing is journaled over an unfinished operation
+                journal = OperationJournal(self.journal_path)
+                self.recover_journal(journal)
+                self._journal = journal
+            return self._journal
+
+    def share_journal(self, other : FileManager) -> None:
+        """
+        Journal to the journal another FileManager already has open, rather than opening the same file again (the two
+        would hand out the same entry ids).
+        """
+        with self._journal_lock:
+            self._journal = other.journal
+
+    @property
+    def discovery(self) -> FileDiscovery:
+        if not self._discovery:
+            self._discovery = FileDiscovery(
+                self.get_glob_patterns(),
+                should_ignore_directory = self.should_ignore_directory,
+                on_entry                = self._stat_cache.add_entry,
+                walk_threads            = self.walk_threads,
+                mount_limits            = self.walk_mount_limits,
+                ordered                 = self.walk_ordered,
+            )
+        return self._discovery
+
     @property
     def copy_tool(self) -> str:
         if not self._copy_tool:
+            if self.copy_method:
+                self._copy_tool = self.copy_method.value
             # Check if rsync is available
-            if shutil.which('rsync'):
+            elif shutil.which('rsync'):
                 self._copy_tool = CopyTools.RSYNC.value
             elif shutil.which('teracopy'):
                 self._copy_tool = CopyTools.TERACOPY.value
@@ -194,6 +309,17 @@ class FileManager(Script):
                 self._copy_tool = CopyTools.SHUTIL.value
         return self._copy_tool
 
+    def create_scheduler(self, **kwargs) -> DeviceScheduler:
+        """
+        Create a scheduler that runs up to max_threads tasks at once per device, or the limit in device_limits.
+
+        Use it as a context manager, so it waits for every task before closing.
+        """
+        kwargs.setdefault('default_limit', self.max_threads or 1)
+        kwargs.setdefault('limits', self.device_limits)
+        kwargs.setdefault('device_of', self.get_filesystem)
+        return DeviceScheduler(**kwargs)
+
     @classmethod
     def get_default_glob_pattern(cls) -> str:
         # A temporary hack to inject a class attribute into a pydantic model.
@@ -261,7 +387,7 @@ class FileManager(Script):
         """
         Get the root trash directory. This is where all trash subdirectories will be created.
 
-        NOTE: You should typically call self.get_trash_directory() instead of this method in most situations.
+        NOTE: Files are not put here directly. Use self.trash, which shards them into numbered subdirectories.
 
         Returns:
             Path: The root trash directory.
@@ -274,32 +400,22 @@ class FileManager(Script):
 
         return self.trash_directory
 
-    def get_trash_directory(self) -> Path:
+    @property
+    def trash(self) -> TrashStore:
         """
-        Get the trash directory, including an appropriate subdir within the root trash directory, based on the number of
-        files that have been deleted so far.
-
-        Returns:
-            Path: The full path to the trash directory.
-        """
-        # Create a new subdir every thousand files
-        # -- this relieves disk I/O pressure to iterate over a large number of files to check for naming conflicts
-        i = self.get_stat('files_deleted') // 1000
-        subdir_name = f'{i:04d}'
-        if self._trash_subdir and self._trash_subdir.name == subdir_name:
-            # Already cached
-            return self._trash_subdir
-        
-        # Create the subdir directory for (presumably) first-use
-        subdir = self.get_trash_root() / subdir_name
-        self.mkdir(subdir)
-        
-        # Return the newly created dir
-        return subdir
+        The trash store in the root trash directory. Deleted files are sharded, and recorded in its manifest.
+        """
+        with self._cache_lock:
+            if not self._trash_store:
+                self._trash_store = TrashStore(self.get_trash_root())
+        return self._trash_store
 
     def get_stats(self) -> dict[str, int]:
         return self._stats.copy()
 
+    def get_metric_stats(self) -> dict[str, int]:
+        return self.get_stats()
+
     def get_stat(self, key: str) -> int:
         with self._stats_lock:
             return self._stats[key]
@@ -337,7 +453,39 @@ class FileManager(Script):
         # A temporary hack to inject a class attribute into a pydantic model.
         return '.*'
 
-    def get_hasher(self, hasher : str = 'md5') -> hashlib._Hash:
+    @property
+    def hashing_engine(self) -> HashingEngine:
+        if self._hashing_engine is None:
+            self._hashing_engine = HashingEngine(max_workers=self.max_threads or 1)
+        return self._hashing_engine
+
+    @property
+    def copy_engine(self) -> CopyEngine:
+        if self._copy_engine is None:
+            self._copy_engine = CopyEngine(drop_cache=self.drop_page_cache)
+        return self._copy_engine
+
+    @property
+    def device_verifier(self) -> DeviceVerifier:
+        engine = self.hashing_engine
+        # Worker threads share one queue, so only one verifier can ever be created
+        with self._cache_lock:
+            if self._device_verifier is None:
+                self._device_verifier = DeviceVerifier(engine, batch_size=self.verify_batch_size)
+        return self._device_verifier
+
+    @property
+    def checksums(self) -> ChecksumService:
+        """
+        Calculates and caches every digest this FileManager needs, sharing the persistent hash cache with other tools.
+        """
+        hash_cache = self.hash_cache
+        with self._cache_lock:
+            if self._checksums is None:
+                self._checksums = ChecksumService(self.hashing_engine, hash_cache)
+        return self._checksums
+
+    def get_hasher(self, hasher : str = 'md5') -> Hasher:
         """
         Get a hasher object for a given algorithm.
 
@@ -350,17 +498,7 @@ class FileManager(Script):
         Raises:
             ValueError: If the hasher is not supported.
         """
-        match hasher.lower():
-            case 'md5':
-                return hashlib.md5()
-            case 'sha1':
-                return hashlib.sha1()
-            case 'sha256':
-                return hashlib.sha256()
-            case 'xxhash':
-                return xxhash.xxh64()
-            case _:
-                return hashlib.new(hasher)
+        return get_hasher(hasher)
 
     def filename_match(self, filename: str | Path) -> re.Match[str] | Literal[False]:
         """
@@ -378,6 +516,9 @@ class FileManager(Script):
         """
         Calculate the hash of a file. Optionally perform partial hashing.
 
+        Digests are cached in memory, and in the persistent hash cache, keyed by the stat fingerprint of the file.
+        The file is only read again if its fingerprint (device, inode, size, mtime) has changed.
+
         Args:
             filename: The path to the file to hash.
             partial: If True, only hash the first and last 1MB of the file.
@@ -386,44 +527,103 @@ class FileManager(Script):
         Returns:
             The hash of the file.
         """
-        cache_key = (str(filename), partial)
+        filepath = self._absolute_path(filename)
+        return self.checksums.hexdigest(filepath, hashing_algorithm, partial=partial, stat=self._stat_for_hash(filepath))
 
-        with self._cache_lock:
-            if cache_key in self._hash_cache:
-                return self._hash_cache[cache_key]
+    def checksum(self, filename: str | Path, hashing_algorithm : str = 'xxhash') -> str:
+        """
+        Get the full digest of a file, labelled with its algorithm (i.e. 'xxhash:a1b2c3d4e5f6a7b8').
+
+        Use this for digests that are stored or shared with other tools. See scripts.lib.checksum.
+        """
+        return format_digest(hashing_algorithm, self.hash_file(filename, hashing_algorithm=hashing_algorithm))
+
+    def hash_files(self, filenames: Iterable[str | Path], partial: bool = False, hashing_algorithm : str = 'xxhash') -> dict[Path, str]:
+        """
+        Calculate the hashes of several files at once, reusing cached digests where possible.
+
+        Files that cannot be read are left out of the result.
+
+        Args:
+            filenames: The paths to the files to hash.
+            partial: If True, only hash the first and last 1MB of each file.
+            hashing_algorithm: The hashing algorithm to use.
+
+        Returns:
+            A dict of absolute path -> hash.
+        """
+        filepaths = [self._absolute_path(filename) for filename in filenames]
+        return self.checksums.hexdigest_many(filepaths, hashing_algorithm, partial=partial)
+
+    def get_cached_hash(self, filename: str | Path, partial: bool = False, hashing_algorithm : str = 'xxhash') -> str | None:
+        """
+        Look up the hash of a file without reading it.
+
+        Args:
+            filename: The path to the file.
+            partial: Whether to look up the partial hash.
+            hashing_algorithm: The hashing algorithm the digest was created with.
+
+        Returns:
+            The hash, or None if the file has not been hashed since it last changed.
+        """
+        filepath = self._absolute_path(filename)
+        try:
+            stat = filepath.stat()
+        except FileNotFoundError:
+            return None
 
+        return self._lookup_hash(filepath, stat, partial, hashing_algorithm)
+
+    def full_hash_algorithm(self, size : int) -> str:
+        """
+        The algorithm used to fully hash a file of this size when comparing or verifying it. See tree_hash_threshold.
+        """
+        if self.tree_hash_threshold is not None and size >= self.tree_hash_threshold:
+            return TREE_ALGORITHM
+        return 'xxhash'
+
+    def _absolute_path(self, filename: str | Path) -> Path:
         filepath = Path(filename)
         if not filepath.is_absolute():
             filepath = self.directory / filepath
+        return filepath
 
-        if not filepath.exists():
-            raise FileNotFoundError(f"File not found to hash: {filepath}")
-
-        hasher = self.get_hasher(hashing_algorithm)
+    def _stat_for_hash(self, filepath: Path) -> os.stat_result:
+        try:
+            return filepath.stat()
+        except FileNotFoundError as fnfe:
+            raise FileNotFoundError(f"File not found to hash: {filepath}") from fnfe
 
-        file_size = self.file_size(filepath)
+    def _lookup_hash(self, filepath: Path, stat: os.stat_result, partial: bool, hashing_algorithm: str) -> str | None:
+        """
+        Look up a digest in the in-memory cache, then the persistent hash cache.
+        """
+        return self.checksums.lookup(stat, hashing_algorithm, partial, Path(filepath))
 
-        # Define the size of the chunks to read
-        chunk_size = 1024 * 1024  # 1MB
+    def _store_hash(self, filepath: Path, stat: os.stat_result, partial: bool, hashing_algorithm: str, digest: str) -> None:
+        """
+        Save a digest to the in-memory cache and the persistent hash cache.
+        """
+        self.checksums.store(filepath, stat, hashing_algorithm, partial, digest)
 
-        with open(filepath, "rb") as f:
-            if partial and file_size > 2 * chunk_size:
-                # Read the first chunk_size bytes
-                hasher.update(f.read(chunk_size))
-                # Seek to the last chunk_size bytes
-                f.seek(-chunk_size, os.SEEK_END)
-                hasher.update(f.read(chunk_size))
-            else:
-                # File is small, read the whole file
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hasher.update(chunk)
+    def prune_hash_cache(self, max_age_days : float | None = None) -> int:
+        """
+        Remove hash cache entries for files that no longer exist (or have changed), and reclaim the space.
 
-        result = hasher.hexdigest()
+        Args:
+            max_age_days: Also remove entries for files that can't be checked (i.e. on an unmounted drive), if they
+                haven't been seen for this many days. None keeps them.
 
-        with self._cache_lock:
-            self._hash_cache[cache_key] = result
+        Returns:
+            The number of entries removed.
+        """
+        if not self.hash_cache:
+            return 0
 
-        return result
+        removed = self.hash_cache.evict_missing(None if max_age_days is None else max_age_days * 24 * 60 * 60)
+        self.hash_cache.vacuum()
+        return removed
 
     def should_ignore_directory(self, directory: Path | str, *, allow_hidden : bool = False) -> bool:
         """
@@ -488,17 +688,15 @@ class FileManager(Script):
 
         logger.debug('Searching %s for directories.', directory.absolute())
 
-        for dirpath, dirnames, _ in os.walk(directory):
-            dirpath_obj = Path(dirpath)
-            
-            # Skip hidden directories if not allowed
-            if self.should_ignore_directory(dirpath_obj, allow_hidden=allow_hidden):
+        def should_ignore(name : str) -> bool:
+            return self.should_ignore_directory(name, allow_hidden=allow_hidden)
+
+        for dirpath, _, _ in self.discovery.walk(directory, should_ignore_directory=should_ignore):
+            # Subdirectories are pruned by the walk, but the starting directory is not
+            if self.should_ignore_directory(dirpath, allow_hidden=allow_hidden):
                 continue
-            
-            # Skip ignored directories
-            dirnames[:] = [d for d in dirnames if not self.should_ignore_directory(d, allow_hidden=allow_hidden)]
 
-            yield dirpath_obj
+            yield dirpath
 
     def get_all_directories(self, directory: Path, *, recursive: bool = True, allow_hidden : bool = False) -> list[Path]:
         """
@@ -518,30 +716,22 @@ class FileManager(Script):
         """
         Yield files in a directory.
 
+        The tree is walked once, no matter how many glob patterns we have, and ignored directories (including .trash)
+        are never descended into. See FileDiscovery.
+
         Args:
             directory: The directory to search. Defaults to self.directory.
 
         Yields:
             The next file in the directory.
         """
-        if recursive or len(self.get_glob_patterns()) <= 2:
-            # Recursive always requires rglob
-            # OR Small number of patterns, so use glob to avoid manual pruning
-            yield from self.glob(directory, recursive=recursive)
-        else:
-            # Hopefully get better performance from manually iterating over files
-            yield from self.iterfiles(directory)
+        yield from self.iterfiles(directory, recursive=recursive)
             
     def glob(self, directory : Path | None = None, recursive : bool = True) -> Iterator[Path]:
         """
-        Yield files in a directory using rglob for each glob pattern.
-
-        In theory, this should be faster than using iterdir or os.walk if:
-        - We have a small number of glob patterns
-        - We have a large number of files
-        - We are recursing into subdirs that are deeply nested
+        Yield files in a directory matching any of our glob patterns.
 
-        Therefore, this is used within methods like yield_files() when recursive is True.
+        Kept for compatibility. This is the same as yield_files().
 
         Args:
             directory: The directory to search. Defaults to self.directory.
@@ -549,42 +739,25 @@ class FileManager(Script):
         Yields:
             The next file in the directory.
         """
-        directory = directory or self.directory
-
-        if recursive:
-            fn = directory.rglob
-        else:
-            fn = directory.glob
+        yield from self.iterfiles(directory, recursive=recursive)
 
-        globs = self.get_glob_patterns()
-        for glob in globs:
-            logger.debug('Searching %s for files matching %s', directory, glob)
-            self.progress_message(f'Searching for {glob}...')
-            for filepath in fn(glob, case_sensitive=False):
-                if self.should_include_file(filepath):
-                    yield filepath
-
-    def iterfiles(self, directory : Path | None = None) -> Iterator[Path]:
+    def iterfiles(self, directory : Path | None = None, *, recursive : bool = False) -> Iterator[Path]:
         """
-        Yield files in a directory, manually matching our glob criteria.
-
-        In theory, this should be faster than using Path.glob() for every glob pattern if:
-        - We have a large number of glob patterns
-        - We have a small number of files
-        - We are not recursing into subdirs
-
-        Therefore, this is used within methods like yield_files() when recursive is False.
+        Yield files in a directory, matching our glob criteria with a single walk.
 
         Args:
             directory: The directory to search. Defaults to self.directory.
+            recursive: Whether to search subdirectories.
 
         Yields:
             The next file in the directory.
         """
         directory = directory or self.directory
-        
-        for filepath in directory.iterdir():
-            if self.file_matches_globs(filepath) and self.should_include_file(filepath):
+        logger.debug('Searching %s for files matching %s', directory, self.get_glob_patterns())
+
+        for entry in self.discovery.iter_files(directory, recursive=recursive):
+            filepath = Path(entry.path)
+            if self.should_include_file(filepath):
                 yield filepath
 
     def get_all_files(self, directory : Path | None = None, *, recursive : bool = True) -> list[Path]:
@@ -609,10 +782,7 @@ class FileManager(Script):
         Returns:
             True if the file matches at least 1 glob pattern, False otherwise.
         """
-        for glob in self.get_glob_patterns():
-            if file_path.match(glob):
-                return True
-        return False
+        return self.discovery.matches(file_path)
 
     def should_include_file(self, item: Path) -> bool:
         """
@@ -625,7 +795,7 @@ class FileManager(Script):
             True if the file should be included, False otherwise.
         """
         # Only files, not dirs
-        if not item.is_file():
+        if not self._stat_cache.is_file(item):
             return False
 
         # Allow for pattern matching, based on init attributes
@@ -679,12 +849,11 @@ class FileManager(Script):
         """
         return self.get_last_modified_time(source_path) == self.get_last_modified_time(destination_path)
 
-    @lru_cache(maxsize=128)
     def file_stat(self, filepath: Path) -> os.stat_result:
         """
         Get the stat information for a file.
 
-        This function is cached to avoid repeated stat calls for the same file.
+        This is served from the stat cache, which directory walks have usually already filled.
 
         Args:
             file_path: The file to get the stat information for.
@@ -692,9 +861,8 @@ class FileManager(Script):
         Returns:
             The stat information for the file.
         """
-        return filepath.stat()
+        return self._stat_cache.stat(filepath)
 
-    @lru_cache(maxsize=128)
     def file_size(self, filepath : Path) -> int:
         """
         Get the size of the file at the given path, and cache it.
@@ -718,6 +886,15 @@ class FileManager(Script):
         Returns:
             True if the file hashes match, False otherwise.
         """
+        algorithm = self.full_hash_algorithm(self.file_stat(source_path).st_size)
+
+        # If both full hashes are already known, there is no need to read either file
+        for cached_algorithm in dict.fromkeys(('xxhash', algorithm)):
+            source_full_hash = self.get_cached_hash(source_path, hashing_algorithm=cached_algorithm)
+            destination_full_hash = self.get_cached_hash(destination_path, hashing_algorithm=cached_algorithm)
+            if source_full_hash and destination_full_hash:
+                return source_full_hash == destination_full_hash
+
         # Perform partial hashing
         source_hash = self.hash_file(source_path, partial=True)
         destination_hash = self.hash_file(destination_path, partial=True)
@@ -726,8 +903,8 @@ class FileManager(Script):
             return False
 
         # As a final check, if partial hashes match, perform full hash
-        source_full_hash = self.hash_file(source_path, partial=False)
-        destination_full_hash = self.hash_file(destination_path, partial=False)
+        source_full_hash = self.hash_file(source_path, partial=False, hashing_algorithm=algorithm)
+        destination_full_hash = self.hash_file(destination_path, partial=False, hashing_algorithm=algorithm)
 
         return source_full_hash == destination_full_hash
 
@@ -796,7 +973,9 @@ class FileManager(Script):
             The directory path.
         """
         if not self.check_dry_run(f'creating directory {directory}'):
-            directory.mkdir(parents=parents, exist_ok=exist_ok)
+            with METRICS.time('mkdir'):
+                directory.mkdir(parents=parents, exist_ok=exist_ok)
+            self._stat_cache.invalidate(directory)
 
         self.record_create_directory()
 
@@ -817,14 +996,17 @@ class FileManager(Script):
             OneFileException: If an error occurs while deleting the file.
         """
         if use_trash:
-            trash_file_path = self._find_trash_name(file_path)
-            trash_dir = trash_file_path.parent
-
-            if not self.check_dry_run(f'moving {file_path} to trash {trash_dir}'):
-                file_path.rename(trash_file_path)
+            if not self.check_dry_run(f'moving {file_path} to trash {self.get_trash_root()}'):
+                # Deletes that finish a move are covered by the move's own journal entry
+                with self.journaled(JournalOperation.DELETE, file_path) if not dont_record else nullcontext():
+                    # Record the digest in the manifest, if we already have it. Don't read the file just for that.
+                    entry = self.trash.put(file_path, digest=self.get_cached_hash(file_path))
+                self._stat_cache.invalidate(file_path, entry.trash_path)
         else:
             if not self.check_dry_run(f'deleting file {file_path}'):
-                file_path.unlink()
+                with self.journaled(JournalOperation.DELETE, file_path) if not dont_record else nullcontext():
+                    file_path.unlink()
+                self._stat_cache.invalidate(file_path)
 
         if not file_path.exists():
             if not dont_record:
@@ -833,9 +1015,252 @@ class FileManager(Script):
 
         return False
 
+    def restore_from_trash(self, directory : Path | None = None) -> int:
+        """
+        Restore every file that was deleted from within a directory, using the trash manifest.
+
+        Files whose original path is taken again are left in the trash.
+
+        Args:
+            directory: The directory the files were deleted from. Defaults to self.directory.
+
+        Returns:
+            The number of files restored.
+        """
+        restored = 0
+        for entry in self.trash.find(directory or self.directory, recursive=True):
+            if self.check_dry_run(f'restoring {entry.original_path} from trash'):
+                continue
+            try:
+                self.trash.restore(entry)
+                self._stat_cache.invalidate(entry.original_path)
+                restored += 1
+            except OSError as ose:
+                logger.error('Unable to restore %s -> %s', entry.original_path, ose)
+                self.record_error()
+        return restored
+
+    def purge_trash(self, days : float) -> int:
+        """
+        Permanently delete files that have been in the trash for more than the given number of days.
+
+        Returns:
+            The number of files deleted.
+        """
+        if self.check_dry_run(f'purging files older than {days} days from trash {self.get_trash_root()}'):
+            return 0
+        return self.trash.purge_older_than(days * 24 * 60 * 60)
+
+    @contextmanager
+    def journaled(self, operation : JournalOperation, source_path : Path, destination_path : Path | None = None) -> Iterator[JournalEntry | None]:
+        """
+        Record an operation in the journal before the enclosed block runs, and its outcome afterwards.
+
+        An exception marks the entry as failed. If the block is interrupted (KeyboardInterrupt, or the process dies),
+        the entry is left unfinished, for recover_journal to repair. The block can call journal.fail() itself if the
+        operation failed without raising.
+
+        Yields:
+            The journal entry, or None if there is no journal.
+        """
+        if (journal := self.journal) is None:
+            yield None
+            return
+
+        entry = journal.plan(operation, source_path, destination_path)
+        try:
+            yield entry
+        except Exception as e:
+            journal.fail(entry, e)
+            raise
+
+        if not entry.finished:
+            self._complete_journal_entry(journal, entry)
+
+    def _complete_journal_entry(self, journal : OperationJournal, entry : JournalEntry) -> None:
+        """
+        Mark an entry as done, with the fingerprint of each file that still exists, and its digest if it is already known.
+        """
+        details = {}
+        for name, path in (('source', entry.source), ('destination', entry.destination)):
+            if path is None:
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            details[f'{name}_fingerprint'] = HashCache.fingerprint(stat)
+            details[f'{name}_digest'] = self._lookup_hash(path, stat, False, 'xxhash')
+
+        journal.complete(entry, **details)
+
+    def recover_journal(self, journal : OperationJournal | None = None) -> dict[str, int]:
+        """
+        Repair the operations the journal shows were started but never finished, i.e. because the last run was killed.
+
+        - A delete is done if the file is gone, and rolled back (nothing to do) if it is still there.
+        - A move or copy whose destination doesn't exist never happened, so it is rolled back.
+        - A move whose source is gone has finished, and is marked done.
+        - If both files exist, they are compared. If they match, a move is finished by deleting the source. If they
+          don't, the destination is a partial copy, and is deleted.
+
+        Leftover rsync temporary files are removed. Only these few files are ever read; finished operations are trusted,
+        and the digests they recorded are put back in the hash cache, so the files are not hashed again.
+
+        Args:
+            journal: The journal to recover. Defaults to the one that is open.
+
+        Returns:
+            The number of entries replayed (finished), rolled back, failed, and of digests restored.
+        """
+        counts = {'replayed': 0, 'rolled_back': 0, 'failed': 0, 'restored_digests': 0}
+        if (journal := journal or self._journal) is None:
+            return counts
+
+        if (incomplete := journal.incomplete()):
+            logger.warning('Recovering %d unfinished operations from the journal at %s', len(incomplete), journal.path)
+
+        for entry in incomplete:
+            if self.check_dry_run(f'recovering {entry.operation.value} {entry.source} -> {entry.destination}'):
+                continue
+            try:
+                state = self._recover_journal_entry(journal, entry)
+            except (OSError, AppError) as e:
+                # One entry that can't be recovered shouldn't stop the rest, or the run that follows
+                logger.error('Unable to recover %s of %s -> %s', entry.operation.value, entry.source, e)
+                journal.fail(entry, e)
+                state = JournalState.FAILED
+
+            match state:
+                case JournalState.DONE:
+                    counts['replayed'] += 1
+                case JournalState.ROLLED_BACK:
+                    counts['rolled_back'] += 1
+                case _:
+                    counts['failed'] += 1
+
+        for entry in journal.completed():
+            for path, digest, fingerprint in (
+                (entry.source, entry.source_digest, entry.source_fingerprint),
+                (entry.destination, entry.destination_digest, entry.destination_fingerprint),
+            ):
+                if not (path and digest and fingerprint):
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                if HashCache.fingerprint(stat) == fingerprint:
+                    self._store_hash(path, stat, False, 'xxhash', digest)
+                    counts['restored_digests'] += 1
+
+        if incomplete:
+            logger.info('Journal recovery: %d replayed, %d rolled back, %d failed', counts['replayed'], counts['rolled_back'], counts['failed'])
+        return counts
+
+    def _recover_journal_entry(self, journal : OperationJournal, entry : JournalEntry) -> JournalState:
+        source_path, destination_path = entry.source, entry.destination
+
+        if entry.operation == JournalOperation.DELETE or destination_path is None:
+            if source_path.exists():
+                journal.roll_back(entry)
+                return JournalState.ROLLED_BACK
+            self._complete_journal_entry(journal, entry)
+            return JournalState.DONE
+
+        # rsync writes to a temporary file (.name.XXXXXX) next to the destination, and renames it when it finishes
+        for partial in destination_path.parent.glob(f'.{destination_path.name}.??????'):
+            logger.info('Removing partial transfer %s', partial)
+            partial.unlink(missing_ok=True)
+
+        self._stat_cache.invalidate(source_path, destination_path)
+        source_exists, destination_exists = source_path.exists(), destination_path.exists()
+
+        if not destination_exists:
+            if source_exists:
+                journal.roll_back(entry)
+                return JournalState.ROLLED_BACK
+            journal.fail(entry, 'Neither the source nor the destination exist')
+            return JournalState.FAILED
+
+        if not source_exists:
+            if entry.operation == JournalOperation.MOVE:
+                self._complete_journal_entry(journal, entry)
+                return JournalState.DONE
+            journal.fail(entry, 'The source of the copy no longer exists, so the destination cannot be verified')
+            return JournalState.FAILED
+
+        if self.file_sizes_match(source_path, destination_path) and self.file_hashes_match(source_path, destination_path):
+            if entry.operation == JournalOperation.MOVE:
+                logger.info('Finishing interrupted move of %s -> %s', source_path, destination_path)
+                # The base delete, as subclasses may refuse to delete in some modes (i.e. FileOrganizer with --copy),
+                # and the checksums have just been compared anyway
+                FileManager.delete_file(self, source_path, dont_record=True)
+            self._complete_journal_entry(journal, entry)
+            return JournalState.DONE
+
+        logger.info('Removing partial copy %s of %s', destination_path, source_path)
+        destination_path.unlink()
+        self._stat_cache.invalidate(destination_path)
+        journal.roll_back(entry)
+        return JournalState.ROLLED_BACK
+
+    def flush_verification(self) -> None:
+        """
+        Verify every copy still queued with the device verifier. Call this once all copies have been made.
+
+        Raises:
+            ChecksumMismatchError: If any copy did not match its source. Those copies are deleted.
+        """
+        if self._device_verifier is not None:
+            self._verification_failures.extend(self._handle_verification(self._device_verifier.flush()))
+
+        failed, self._verification_failures = self._verification_failures, []
+        if failed:
+            raise ChecksumMismatchError(f"{len(failed)} copies did not match their source on the device, and were deleted: {', '.join(str(path) for path in failed)}")
+
+    def _handle_verification(self, results : dict[Path, str | None]) -> list[Path]:
+        """
+        Act on the results of a device verification: cache the digest of each good copy, and delete each bad one.
+
+        Args:
+            results: destination -> its digest if it matched the source, or None if it did not.
+
+        Returns:
+            The copies that did not match, which have been deleted.
+        """
+        failed = []
+        for path, digest in results.items():
+            self._stat_cache.invalidate(path)
+            if digest is not None:
+                self._store_hash(path, self._stat_for_hash(path), False, self.device_verifier.algorithm, digest)
+                continue
+            failed.append(path)
+            path.unlink(missing_ok=True)
+            self.record_stat('verification_failed')
+
+        return failed
+
+    def close_journal(self, *, checkpoint : bool = True) -> None:
+        """
+        Flush the journal at the end of a run.
+
+        Args:
+            checkpoint: Also drop every finished entry. Pass False if the run was interrupted, so the digests it recorded
+                are still available to the next run.
+        """
+        if self._journal is None:
+            return
+        if checkpoint:
+            self._journal.checkpoint()
+        self._journal.close()
+
     def delete_empty_directories(self, directory: Path | None = None) -> None:
         """
-        Delete empty directories.
+        Delete empty directories, in a single bottom-up pass.
+
+        Each directory is listed once. Its subdirectories are visited first (post-order), so by the time it is visited,
+        we already know which of them were deleted, and it is empty if they all were, and it contains only junk files.
         """
         directory = directory or self.directory
 
@@ -846,8 +1271,20 @@ class FileManager(Script):
         with alive_bar(title=f"Organizing {str(directory)[-25:]}/", unit='dirs', dual_line=True, unknown='waves') as self._progress_bar:
             count = 0
             skipped = 0
-            for dirpath in self.yield_directories(directory, recursive=True):
-                if self.delete_directory_if_empty(dirpath):
+            # Subdirectories that were deleted, until their parent is visited
+            deleted : set[Path] = set()
+            for dirpath, subdirs, files in self.yield_directories_bottom_up(directory):
+                remaining = [subdir for subdir in subdirs if subdir not in deleted]
+                deleted.difference_update(subdirs)
+
+                try:
+                    removed = not remaining and self._delete_directory_with_junk(dirpath, files)
+                except PermissionError as e:
+                    logger.error('Permission denied deleting directory: %s -> %s', dirpath, e)
+                    removed = False
+
+                if removed:
+                    deleted.add(dirpath)
                     count += 1
                 else:
                     skipped += 1
@@ -864,6 +1301,84 @@ class FileManager(Script):
             
         logger.info('Cleaned up %d empty directories. %d remain.', count, skipped)
 
+    def yield_directories_bottom_up(self, directory: Path) -> Iterator[tuple[Path, list[Path], list[os.DirEntry]]]:
+        """
+        Walk a directory tree in post-order (children before their parent), listing each directory exactly once.
+
+        Symlinks are not followed. Directories that cannot be listed are logged and skipped.
+
+        Yields:
+            (directory, subdirectories, file entries)
+        """
+        # Each directory is pushed twice: once to be listed, and again (with its listing) to be yielded
+        stack : list[tuple[Path, tuple[list[Path], list[os.DirEntry]] | None]] = [(directory, None)]
+        while stack:
+            dirpath, listing = stack.pop()
+            if listing is not None:
+                yield dirpath, *listing
+                continue
+
+            try:
+                with os.scandir(dirpath) as entries:
+                    subdirs, files = [], []
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(Path(entry.path))
+                        else:
+                            files.append(entry)
+                            self._stat_cache.add_entry(entry)
+            except OSError as ose:
+                logger.error('Unable to list directory: %s -> %s', dirpath, ose)
+                continue
+
+            stack.append((dirpath, (subdirs, files)))
+            stack.extend((subdir, None) for subdir in subdirs)
+
+    def _delete_directory_with_junk(self, directory: Path, files: Iterable[os.DirEntry | Path], cleanup : bool = True) -> bool:
+        """
+        Delete a directory that has no subdirectories left, if every file in it is junk.
+
+        Args:
+            directory: The directory to delete.
+            files: The files in the directory.
+            cleanup: Whether to remove junk files. If False, any file keeps the directory.
+
+        Returns:
+            True if the directory was deleted.
+        """
+        junk_files = []
+        for f in files:
+            f = Path(f)
+            # Remove files we don't care about that stall this process.
+            if cleanup and self.is_junk(f):
+                # Don't remove junk files unless the rest of the dir is empty
+                junk_files.append(f)
+                continue
+
+            # something was found, so it's not empty
+            logger.debug('Directory not empty: Found file="%s" in dir="%s".', f, directory.absolute())
+            return False
+
+        # Nothing found except junk files... time to remove them.
+        for junk in junk_files:
+            logger.debug('Deleting file="%s" in directory="%s"', junk, directory)
+            if not self.delete_file(junk, use_trash=False):
+                logger.error('Unable to delete junk file: %s', junk)
+                return False
+
+        # Nothing was found
+        if not self.check_dry_run(f'deleting empty directory {directory}'):
+            try:
+                # use absolute to avoid Path('.').rmdir(), which generates an OSError
+                directory.absolute().rmdir()
+                self._stat_cache.invalidate_tree(directory)
+            except OSError as ose:
+                logger.error('Unable to delete directory: %s -> %s', directory, ose)
+                return False
+
+        self.record_delete_directory()
+        return True
+
     def delete_directory_if_empty(self, directory: Path, recursive : bool = True, cleanup : bool = True) -> bool:
         """
         Delete an empty directory, or return False.
@@ -877,45 +1392,19 @@ class FileManager(Script):
             if not directory.exists():
                 return True
             
-            junk_files = []
+            files = []
             for f in directory.iterdir():
                 if f.is_dir():
-                    if recursive and self.delete_directory_if_empty(f):
+                    if recursive and self.delete_directory_if_empty(f, cleanup=cleanup):
                         # subdir is now deleted, so it doesnt count
                         continue
 
                     # A directory exists and we can't remove it...
                     return False
 
-                if cleanup:
-                    # Remove files we don't care about that stall this process.
-                    if self.is_junk(f):
-                        # Don't remove junk files unless the rest of the dir is empty
-                        junk_files.append(f)
-                        continue
-
-                # something was found, so it's not empty
-                logger.debug('Directory not empty: Found file="%s" in dir="%s".', f, directory.absolute())
-                return False
-
-            # Nothing found except junk files... time to remove them.
-            for junk in junk_files:
-                logger.debug('Deleting file="%s" in directory="%s"', junk, directory)
-                if not self.delete_file(junk, use_trash=False):
-                    logger.error('Unable to delete junk file: %s', junk)
-                    return False
-
-            # Nothing was found
-            if not self.check_dry_run(f'deleting empty directory {directory}'):
-                try:
-                    # use absolute to avoid Path('.').rmdir(), which generates an OSError
-                    directory.absolute().rmdir()
-                except OSError as ose:
-                    logger.error('Unable to delete directory: %s -> %s', directory, ose)
-                    return False
+                files.append(f)
 
-            self.record_delete_directory()
-            return True
+            return self._delete_directory_with_junk(directory, files, cleanup)
 
         except PermissionError as e:
             logger.error('Permission denied deleting directory: %s -> %s', directory, e)
@@ -1059,28 +1548,16 @@ class FileManager(Script):
         # Reached the root without finding an existing path
         raise FileNotFoundError(f"Cannot get stat for any ancestors of: {filepath.resolve()}")
 
-    def _find_trash_name(self, file_path: Path) -> Path:
+    @staticmethod
+    def collision_names(name : str, max_attempts : int = 1000) -> Iterator[str]:
         """
-        Find a unique name for a file in the trash directory.
-
-        Args:
-            file_path: The file to move to the trash.
-
-        Returns:
-            The path to the file in the trash directory.
+        The names to try, in order, when a file named name collides with another: "name_0.ext", "name_1.ext", ...
         """
-        trash_dir = self.get_trash_directory()
-
-        trash_file_path = trash_dir / file_path.name
-        for i in range(9000):
-            if not trash_file_path.exists():
-                return trash_file_path
-
-            trash_file_path = trash_dir / f"{file_path.stem}_{i}{file_path.suffix}"
+        stem, suffix = Path(name).stem, Path(name).suffix
+        for i in range(max_attempts):
+            yield f"{stem}_{i}{suffix}"
 
-        raise FileExistsError(f"Unable to find unique trash name for file: {file_path}")
-
-    def move_file(self, source_path: Path, destination_path: Path, *, rename_on_collision : bool = False) -> Path:
+    def move_file(self, source_path: Path, destination_path: Path, *, rename_on_collision : bool = False, same_filesystem : bool | None = None) -> Path:
         """
         Move a file to a new location.
 
@@ -1094,6 +1571,8 @@ class FileManager(Script):
                 If None, verify will be set to True if the source and destination are on different drives.
                 The rationale is that moving files to the same drive just modifies the pointer, and the file data should not change,
                 however, moving files to a different drive will require a full copy, so the file data should be verified.
+            same_filesystem:
+                Whether the source and destination are on the same filesystem, if the caller already knows.
 
         Returns:
             The destination path.
@@ -1120,14 +1599,35 @@ class FileManager(Script):
             destination_path = destination_path.with_name(f"{destination_path.stem}_{collision_count}{destination_path.suffix}")
             logger.debug('Collision detected, using new destination path: Source %s -> Destination %s', source_path, destination_path)
 
+        return self.move_planned_file(source_path, destination_path, same_filesystem=same_filesystem)
+
+    def move_planned_file(self, source_path : Path, destination_path : Path, *, same_filesystem : bool | None = None, sidecar : bool | None = None) -> Path:
+        """
+        Move a file to a destination that has already been checked, i.e. by a TransferPlan.
+
+        Unlike move_file, this doesn't look at the destination at all before moving, so the caller must already know
+        that the destination is an absolute, free file name (and that the sidecar's name is free too).
+
+        Args:
+            source_path: The source file to move.
+            destination_path: The full, absolute destination path.
+            same_filesystem: Whether the source and destination are on the same filesystem, if the caller already knows.
+            sidecar: Whether the source has an XMP sidecar to move alongside it, if the caller already knows.
+
+        Returns:
+            The destination path.
+
+        Raises:
+            FileNotFoundError: If the file could not be moved.
+        """
         # Move XMP files alongside photos
-        source_xmp_path : Path | None = source_path.with_suffix('.xmp')
-        destination_xmp_path : Path | None = destination_path.with_suffix('.xmp')
+        source_xmp_path = source_path.with_suffix('.xmp')
+        destination_xmp_path = destination_path.with_suffix('.xmp')
 
         destination_dir = destination_path.parent
         if not self.check_dry_run(f'moving {source_path} to {destination_dir}'):
             # This verifies the destination path and compares checksums
-            if not self._move_file(source_path, destination_path):
+            if not self._move_file(source_path, destination_path, same_filesystem=same_filesystem):
                 logger.error('Unable to move file: %s -> %s', source_path, destination_path)
                 raise FileNotFoundError(f'Unable to move file: {source_path} -> {destination_path}')
             
@@ -1136,14 +1636,16 @@ class FileManager(Script):
             # Copy xmp files after verification, so errors don't interfere.
             # ... do not verify xmp files, as they are not critical
             try:
-                if source_xmp_path.exists(follow_symlinks=False):
-                    self._move_file(source_xmp_path, destination_xmp_path)
+                if sidecar is None:
+                    sidecar = source_path.suffix.lower() != '.xmp' and source_xmp_path.exists(follow_symlinks=False)
+                if sidecar:
+                    self._move_file(source_xmp_path, destination_xmp_path, same_filesystem=same_filesystem)
             except OSError as ose:
                 logger.warning('Error moving XMP file: %s', ose)
 
         return destination_path
 
-    def _move_file(self, source_path : Path, destination_path : Path) -> bool:
+    def _move_file(self, source_path : Path, destination_path : Path, *, same_filesystem : bool | None = None) -> bool:
         """
         Move a file to a new location.
 
@@ -1152,6 +1654,8 @@ class FileManager(Script):
                 The source file to move.
             destination: 
                 The destination path.
+            same_filesystem:
+                Whether the source and destination are on the same filesystem, if the caller already knows.
 
         Returns:
             bool: True if the file was moved, False otherwise.
@@ -1163,20 +1667,30 @@ class FileManager(Script):
         """
         # If the drive is the same, then simply rename it to avoid "actually" copying the file.
         # ... this is faster and eliminates corruption while copying the data.
-        if self.is_same_filesystem(source_path, destination_path):
-            source_path.rename(destination_path)
-            return destination_path.exists()
-        
-        # If the drives are different, try using rsync
-        logger.debug('Drives are different, so moving file with rsync: %s -> %s', source_path, destination_path)
-        # hashes are checked during this command. May raise ValueError
-        result = self._copy_with_rsync(source_path, destination_path)
+        if same_filesystem is None:
+            same_filesystem = self.is_same_filesystem(source_path, destination_path)
+
+        with self.journaled(JournalOperation.MOVE, source_path, destination_path) as entry:
+            if same_filesystem:
+                with METRICS.time('move', kind='rename'):
+                    source_path.rename(destination_path)
+                self._stat_cache.invalidate(source_path, destination_path)
+                result = destination_path.exists()
+            else:
+                # If the drives are different, copy the file and then delete the source
+                logger.debug('Drives are different, so moving file with %s: %s -> %s', self.copy_tool, source_path, destination_path)
+                with METRICS.time('move', kind='copy'):
+                    # hashes are checked during this command. May raise ValueError
+                    result = self._copy(source_path, destination_path)
+
+                    # We know hashes match, so delete the source file
+                    if result:
+                        # It was really a move, not a copy and delete, so don't record the deletion as a deletion.
+                        logger.debug('Deleting source file after successful move: %s', source_path)
+                        self.delete_file(source_path, dont_record=True)
 
-        # We know hashes match, so delete the source file
-        if result:
-            # It was really a move, not a copy and delete, so don't record the deletion as a deletion.
-            logger.debug('Deleting source file after successful move: %s', source_path)
-            self.delete_file(source_path, dont_record=True)
+            if entry and not result:
+                self.journal.fail(entry, 'The destination was not created')
 
         logger.debug('File move %s: %s -> %s', 'succeeded' if result else 'failed', source_path, destination_path)
         return result
@@ -1213,13 +1727,10 @@ class FileManager(Script):
 
         if not self.check_dry_run(f'copying {source_path} to {destination_path}'):
             try:
-                # This verifies the file checksum after copy.
-                if self.copy_tool == CopyTools.RSYNC.value:
-                    self._copy_with_rsync(source_path, destination_path)
-                elif self.copy_tool == CopyTools.TERACOPY.value:
-                    self._copy_with_teracopy(source_path, destination_path)
-                else:
-                    self._copy_with_shutil(source_path, destination_path)
+                with self.journaled(JournalOperation.COPY, source_path, destination_path) as entry:
+                    # This verifies the file checksum after copy.
+                    if not self._copy(source_path, destination_path, defer_verification=True) and entry:
+                        self.journal.fail(entry, 'The destination was not created')
             except PermissionError as pe:
                 if 'Operation not permitted' in str(pe) and destination_path.exists():
                     logger.warning('WARNING: Permission error (likely due to copying metadata). source_path="%s", destination_path="%s" -> %s', source_path.absolute(), destination_path.absolute(), pe)
@@ -1233,6 +1744,219 @@ class FileManager(Script):
         self.record_copy_file()
         return destination_path
 
+    def _copy(self, source_path : Path, destination_path : Path, *, defer_verification : bool = False) -> bool:
+        """
+        Copy a file with the configured copy tool, and verify the checksum afterwards.
+
+        If the destination is on the same CoW-capable filesystem, the file is cloned instead. See _copy_with_reflink.
+
+        Args:
+            source_path: The source file to copy.
+            destination_path: The destination path.
+            defer_verification: With verify_on_device, queue the copy to be verified in a batch, rather than now. Never
+                pass this if the source is about to be deleted. See flush_verification.
+
+        Returns:
+            True on success
+        """
+        try:
+            started = time.monotonic()
+            if self._copy_with_reflink(source_path, destination_path):
+                # No data is read or written by a clone, so only its latency is recorded
+                METRICS.observe('copy', time.monotonic() - started, tool='reflink')
+                return True
+
+            started = time.monotonic()
+            match self.copy_tool:
+                case CopyTools.NATIVE.value:
+                    result = self._copy_with_native(source_path, destination_path, defer_verification=defer_verification)
+                case CopyTools.RSYNC.value:
+                    result = self._copy_with_rsync(source_path, destination_path)
+                case CopyTools.TERACOPY.value:
+                    result = self._copy_with_teracopy(source_path, destination_path)
+                case _:
+                    result = self._copy_with_shutil(source_path, destination_path)
+
+            elapsed = time.monotonic() - started
+            METRICS.observe('copy', elapsed, tool=self.copy_tool)
+            if result:
+                self.record_transfer(source_path, destination_path, elapsed)
+                self._record_copied_bytes(source_path, destination_path)
+            return result
+        finally:
+            # The destination was created (or removed again, if verification failed)
+            self._stat_cache.invalidate(destination_path)
+
+    def _record_copied_bytes(self, source_path : Path, destination_path : Path) -> None:
+        """
+        Count the bytes read from the source device, and written to the destination device, by a copy.
+        """
+        try:
+            source_stat = self.file_stat(source_path)
+            destination_device = self.get_filesystem(destination_path)
+        except OSError:
+            return
+        METRICS.record_read(source_stat.st_dev, source_stat.st_size)
+        METRICS.record_write(destination_device, source_stat.st_size)
+
+    def can_reflink(self, source_path : Path, destination_path : Path) -> bool:
+        """
+        Whether a copy from source to destination might be made by cloning.
+
+        This is only known for certain once it has been tried. Filesystems that refuse are remembered, and not tried again.
+        """
+        if not self.use_reflink:
+            return False
+
+        device = self.get_filesystem(source_path)
+        return device not in self._reflink_unsupported and device == self.get_filesystem(destination_path.parent)
+
+    def _copy_with_reflink(self, source_path : Path, destination_path : Path) -> bool:
+        """
+        Clone a file on a CoW filesystem (btrfs, XFS, ZFS), which is near-instant and uses no extra space.
+
+        A clone shares the source's data blocks, so there are no new bytes that could have been corrupted in transit.
+        Verification is therefore a metadata check (the size matches), rather than hashing both files.
+
+        Args:
+            source_path: The source file to copy.
+            destination_path: The destination path.
+
+        Returns:
+            True if the file was cloned. False if cloning is not possible, and the file should be copied normally.
+
+        Raises:
+            FileNotFoundError: If the file is not found after cloning.
+            ChecksumMismatchError: If the clone is not the same size as the source.
+        """
+        if not self.can_reflink(source_path, destination_path):
+            return False
+
+        if not (result := self.copy_engine.clone(source_path, destination_path)):
+            # A refusal only applies to this file (i.e. EINVAL for an unaligned range), so others are still tried
+            if result is CloneResult.UNSUPPORTED:
+                self._reflink_unsupported.add(self.get_filesystem(source_path))
+            return False
+
+        source_stat = source_path.stat()
+        try:
+            destination_stat = destination_path.stat()
+        except FileNotFoundError as fnf:
+            raise FileNotFoundError(f"Unable to find file after clone: {destination_path}") from fnf
+
+        if source_stat.st_size != destination_stat.st_size:
+            logger.critical(f"Size mismatch after cloning {source_path} to {destination_path}")
+            destination_path.unlink(missing_ok=True)
+            raise ChecksumMismatchError(f"Size mismatch after cloning {source_path} to {destination_path}")
+
+        # The contents are identical, so any digest we already have for the source applies to the clone
+        if (digest := self._lookup_hash(source_path, source_stat, False, 'xxhash')):
+            self._store_hash(destination_path, destination_stat, False, 'xxhash', digest)
+
+        logger.debug('Cloned %s -> %s', source_path, destination_path)
+        return True
+
+    def _copy_with_native(self, source_path : Path, destination_path : Path, hashing_algorithm : str = 'xxhash', *, defer_verification : bool = False) -> bool:
+        """
+        Copy a file to a new location in a single pass over the source, using our CopyEngine.
+
+        If the source digest is not already known, it is calculated while the file is copied. Otherwise, the kernel
+        copies the file directly. Either way, the destination is hashed afterwards to verify the copy.
+
+        With verify_on_device, the destination is synced and dropped from the page cache before it is hashed, so the
+        digest is of what is on the disk. See DeviceVerifier.
+
+        Args:
+            source_path: The source file to copy.
+            destination_path: The destination path.
+            hashing_algorithm: The hashing algorithm to verify the copy with.
+            defer_verification: With verify_on_device, queue the destination to be verified with the next batch.
+
+        Returns:
+            True on success
+
+        Raises:
+            FileNotFoundError: If the file is not found after copying.
+            ChecksumMismatchError: If the checksums do not match after copying.
+        """
+        source_stat = self._stat_for_hash(source_path)
+        if hashing_algorithm == 'xxhash' and self.full_hash_algorithm(source_stat.st_size) == TREE_ALGORITHM:
+            return self._copy_with_tree_verification(source_path, destination_path, source_stat)
+
+        source_hash = self._lookup_hash(source_path, source_stat, False, hashing_algorithm)
+
+        hasher = None if source_hash else self.get_hasher(hashing_algorithm)
+        if (digest := self.copy_engine.copy(source_path, destination_path, hasher)):
+            source_hash = digest
+            self._store_hash(source_path, source_stat, False, hashing_algorithm, digest)
+
+        if not destination_path.exists():
+            raise FileNotFoundError(f"Unable to find file after copy: {destination_path}")
+
+        if self.verify_on_device and hashing_algorithm == self.device_verifier.algorithm:
+            if defer_verification:
+                # A bad copy in the batch isn't necessarily this one, so failures are raised by flush_verification
+                self._verification_failures.extend(self._handle_verification(self.device_verifier.add(destination_path, source_hash)))
+                return True
+
+            # The source may be about to be deleted, so this can't wait for a batch
+            matched = self.device_verifier.verify(destination_path, source_hash)
+            if self._handle_verification({destination_path: source_hash if matched else None}):
+                raise ChecksumMismatchError(f"Checksum mismatch on the device after copying {source_path} to {destination_path}")
+            return True
+
+        destination_hash = self.hash_file(destination_path, hashing_algorithm=hashing_algorithm)
+        if source_hash != destination_hash:
+            logger.critical(f"Checksum mismatch after copying {source_path} to {destination_path}")
+            destination_path.unlink(missing_ok=True)
+            raise ChecksumMismatchError(f"Checksum mismatch after copying {source_path} to {destination_path}")
+
+        return True
+
+    def _copy_with_tree_verification(self, source_path : Path, destination_path : Path, source_stat : os.stat_result) -> bool:
+        """
+        Copy a large file, and verify it with tree digests, so each file is hashed in parallel chunks.
+
+        If only some chunks of the copy don't match, those chunks are copied again and verified again, instead of
+        the whole file.
+
+        Raises:
+            FileNotFoundError: If the file is not found after copying.
+            ChecksumMismatchError: If the copy still does not match after repairing it.
+        """
+        if (source_tree := self.checksums.lookup_tree(source_stat, path=source_path)):
+            self.copy_engine.copy(source_path, destination_path)
+        else:
+            # Hash the source as it is copied, rather than reading it twice
+            hasher = TreeHasher()
+            self.copy_engine.copy(source_path, destination_path, hasher)
+            source_tree = hasher.tree()
+            self.checksums.store_tree(source_path, source_stat, source_tree)
+
+        if not destination_path.exists():
+            raise FileNotFoundError(f"Unable to find file after copy: {destination_path}")
+
+        if self.verify_on_device:
+            self.device_verifier.settle([destination_path])
+        damaged = self.hashing_engine.verify_tree(destination_path, source_tree)
+
+        if damaged and destination_path.stat().st_size == source_tree.size:
+            logger.warning('%d of %d chunks of %s do not match %s. Copying them again.', len(damaged), len(source_tree.chunks), destination_path, source_path)
+            for index in damaged:
+                self.copy_engine.copy_range(source_path, destination_path, *source_tree.chunk_range(index))
+            if self.verify_on_device:
+                self.device_verifier.settle([destination_path])
+            damaged = self.hashing_engine.verify_tree(destination_path, source_tree, damaged)
+
+        self._stat_cache.invalidate(destination_path)
+        if damaged:
+            logger.critical(f"Checksum mismatch after copying {source_path} to {destination_path}")
+            destination_path.unlink(missing_ok=True)
+            raise ChecksumMismatchError(f"Checksum mismatch in {len(damaged)} chunks after copying {source_path} to {destination_path}")
+
+        self._store_hash(destination_path, self._stat_for_hash(destination_path), False, TREE_ALGORITHM, source_tree.root)
+        return True
+
     def _copy_with_shutil(self, source_path : Path, destination_path : Path) -> bool:
         """
         Copy a file to a new location using shutil.
@@ -1317,7 +2041,7 @@ class FileManager(Script):
             FileNotFoundError: If the file is not found after copying.
             ValueError: If the checksums do not match after copying, or if the timeout is invalid.
         """
-        timeout = self._calculate_timeout(source_path, timeout)    
+        timeout = self._calculate_timeout(source_path, timeout, destination_path)
         source_hash = self.hash_file(source_path)
 
         attempts = max(1, retries + 1)
@@ -1349,25 +2073,87 @@ class FileManager(Script):
         # If we somehow get here (which should not happen if final_attempt logic is correct), raise an error
         raise UnexpectedStateError("Unexpected flow in _copy_with_rsync. This should never happen.")
 
-    def _calculate_timeout(self, source_path: Path, requested_timeout : int = 0) -> float:
+    def transfer_files_with_rsync(self, pairs : Iterable[tuple[Path, Path]], *, move : bool = False, record : bool = True) -> list[RsyncResult]:
+        """
+        Copy (or move) many files at once, with one rsync process per source and destination directory.
+
+        Every file is verified by checksum afterwards, and any that fail are retried individually. See RsyncBatch.
+
+        Args:
+            pairs: (source, destination) pairs. Each destination is the full path of the file, not its directory.
+            move: Delete each source once its destination has been verified.
+            record: Record the moves, copies and errors in the stats. Pass False if the caller counts them itself.
+
+        Returns:
+            One result per transfer. Failures are recorded on the result (and as errors in the stats), rather than raised.
+        """
+        pairs = list(pairs)
+        batch = RsyncBatch(self, move=move)
+        batch.extend(pairs)
+        if not batch or self.check_dry_run(f'{"moving" if move else "copying"} {len(batch)} files with rsync'):
+            return []
+
+        entries : dict[tuple[Path, Path], JournalEntry] = {}
+        if (journal := self.journal) is not None:
+            operation = JournalOperation.MOVE if move else JournalOperation.COPY
+            entries = {
+                (source.absolute(), destination.absolute()): journal.plan(operation, source.absolute(), destination.absolute())
+                for source, destination in pairs
+            }
+
+        results = batch.run()
+
+        for result in results:
+            if (entry := entries.get((result.source, result.destination))):
+                if result.ok:
+                    self._complete_journal_entry(journal, entry)
+                else:
+                    journal.fail(entry, result.error or 'rsync failed')
+
+        if not record:
+            return results
+
+        succeeded = sum(1 for result in results if result.ok)
+        if move:
+            self.record_move_file(succeeded)
+        else:
+            self.record_copy_file(succeeded)
+        if (failed := len(results) - succeeded):
+            self.record_error(failed)
+
+        return results
+
+    def record_transfer(self, source_path : Path, destination_path : Path, seconds : float) -> None:
+        """
+        Record how long a copy took, against the devices of both the source and the destination.
+        """
+        try:
+            size = self.file_size(destination_path)
+            for path in (source_path, destination_path):
+                self.throughput.record(self.throughput.key_for_path(path), size, seconds)
+        except OSError as ose:
+            logger.debug('Unable to record transfer of %s -> %s', source_path, ose)
+
+    def _calculate_timeout(self, source_path: Path, requested_timeout : int = 0, destination_path : Path | None = None) -> float:
         """
-        Calculate the subprocess timeout based on file size.
+        Calculate the subprocess timeout based on file size, and the speeds previously seen on each device involved.
 
-        As of 2024 - calculates a minimum of 60 seconds, plus 10 seconds per MB. This may change in future versions.
+        With enough history, this is the p99 duration for a file of this size, plus a margin (see ThroughputModel).
+        Otherwise, it is a minimum of 60 seconds, plus 10 seconds per MB.
 
         Args:
             source_path (Path): Path to the source file.
             requested_timeout (int): If provided, overrides the timeout calculation.
+            destination_path (Path): Path to the destination, if known. The slower of the two devices sets the timeout.
 
         Returns:
             The calculated timeout.
         """
         timeout = requested_timeout
         if not timeout:
-            # Timeout is a minimum of 60 seconds, plus 10 seconds per MB
             file_size = self.file_size(source_path)
-            extra_timeout = (file_size / (1024 * 1024)) * 10
-            timeout = 60 + extra_timeout
+            paths = [source_path] if destination_path is None else [source_path, destination_path]
+            timeout = max(self.throughput.timeout(self.throughput.key_for_path(path), file_size) for path in paths)
 
         if timeout < 0:
             raise ValueError(f"Invalid timeout: {timeout}")
@@ -28,8 +28,6 @@ import math
 import shutil
 import logging
 import sqlite3
-import subprocess
-import json
 import re
 import argparse
 import colorlog
@@ -43,6 +41,7 @@ from alive_progress import alive_bar
 
 from scripts.lib.types import ProgressBar, RESET, RED, GREEN, YELLOW, BLUE, PURPLE, CYAN, WHITE, BLACK, BOLD, UNDERLINE, DIM
 from scripts.lib.db import ImagesDatabase
+from scripts.lib.exiftool import ExifToolError, ExifToolPool, get_exiftool_pool
 
 # Set up module-level logger
 logger = logging.getLogger(__name__)
@@ -52,26 +51,26 @@ PROJECT_ROOT = Path(__file__).resolve().parent
 class ExifDataExtractor:
     """Class to extract and parse GPS data from image files."""
 
-    def __init__(self):
-        if not shutil.which('exiftool'):
-            logger.error("ExifTool is not installed. Please install ExifTool to proceed.")
-            sys.exit(1)
-        logger.debug("ExifTool is installed and ready to use.")
+    def __init__(self, exiftool: Optional[ExifToolPool] = None):
+        if exiftool is None:
+            if not shutil.which('exiftool'):
+                logger.error("ExifTool is not installed. Please install ExifTool to proceed.")
+                sys.exit(1)
+            logger.debug("ExifTool is installed and ready to use.")
+            exiftool = get_exiftool_pool()
+
+        # Persistent exiftool processes, so each photo doesn't pay for starting perl
+        self.exiftool = exiftool
 
     def get_gps_data(self, file_path: Path) -> Tuple[Optional[Decimal], Optional[Decimal]]:
         """Extract GPS data from image file using ExifTool."""
         try:
-            output = subprocess.check_output(
-                ['exiftool', '-GPSLatitude', '-GPSLongitude', '-GPSPosition', '-j', str(file_path)],
-                stderr=subprocess.STDOUT
-            )
-            data = json.loads(output.decode('utf-8'))[0]
-        except subprocess.CalledProcessError as e:
-            logger.error(f"ExifTool error on file {file_path}: {e}")
+            data = self.exiftool.execute_json('-GPSLatitude', '-GPSLongitude', '-GPSPosition', str(file_path))[0]
+        except ExifToolError as e:
+            logger.error(f"ExifTool error on file {file_path}: {e.message}")
             return None, None
         except Exception as e:
             logger.error(f"Error extracting GPS data from {file_path}: {e}")
-            logger.error(f"Output: {output.decode('utf-8')}")
             return None, None
 
         if not isinstance(data, dict):
@@ -0,0 +1,302 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    hash_cache.py                                                                                        *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HASH_CACHE_PATH = Path(os.getenv('IMAGEINN_HASH_CACHE', Path.home() / '.cache' / 'imageinn' / 'hash_cache.db'))
+
+# How often a cache hit refreshes the updated time of its entry (without a rename, which always does)
+REFRESH_INTERVAL = 24 * 60 * 60
+
+type Fingerprint = tuple[int, int, int, int]
+
+class HashCache:
+    """
+    A persistent store of file digests, keyed by the stat fingerprint of the file.
+
+    The fingerprint is (st_dev, st_ino, st_size, st_mtime_ns). As long as a file keeps the same fingerprint, its digest
+    is reused across runs without reading the file again. A changed fingerprint simply misses the cache, so stale
+    entries are never returned; they are removed later by evict_missing().
+
+    Each entry also records the last path it was seen at, and when (updated). A rename keeps the fingerprint, so a hit
+    given the file's current path moves the entry to it; otherwise evict_missing() would find the old path gone.
+
+    The database uses SQLite in WAL mode, so multiple threads (and processes) can read while one writes. Each thread
+    gets its own connection.
+
+    Example:
+        >>> cache = HashCache()
+        >>> stat = Path('photo.arw').stat()
+        >>> cache.get(stat, 'xxhash', partial=False)
+        None
+        >>> cache.set(Path('photo.arw'), stat, 'xxhash', False, 'a1b2c3d4e5f6a7b8')
+        >>> cache.get(stat, 'xxhash', partial=False)
+        'a1b2c3d4e5f6a7b8'
+    """
+    db_path : Path
+
+    def __init__(self, db_path : Path | str | None = None):
+        self.db_path = Path(db_path or DEFAULT_HASH_CACHE_PATH)
+        self._local = threading.local()
+        self._create_table()
+
+    @staticmethod
+    def fingerprint(stat : os.stat_result) -> Fingerprint:
+        """
+        Get the fingerprint that identifies a specific version of a file.
+
+        Args:
+            stat: The stat result for the file.
+
+        Returns:
+            A tuple of (st_dev, st_ino, st_size, st_mtime_ns).
+        """
+        return (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Get the sqlite connection for the current thread, creating it on first use.
+        """
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = conn
+        return conn
+
+    def _create_table(self) -> None:
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connection as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS hashes
+                            (device INTEGER NOT NULL, inode INTEGER NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+                             algorithm TEXT NOT NULL, partial INTEGER NOT NULL, digest TEXT NOT NULL,
+                             path TEXT NOT NULL, updated REAL NOT NULL,
+                             PRIMARY KEY (device, inode, size, mtime_ns, algorithm, partial))''')
+            conn.execute('CREATE INDEX IF NOT EXISTS hashes_path ON hashes (path)')
+        logger.debug("Hash cache is ready at %s", self.db_path)
+
+    def get(self, stat : os.stat_result, algorithm : str, partial : bool = False, path : Path | None = None) -> str | None:
+        """
+        Look up a digest for a file.
+
+        Args:
+            stat: The current stat result for the file.
+            algorithm: The hashing algorithm the digest was created with.
+            partial: Whether the digest is a partial (first and last 1MB) hash.
+            path: The current path of the file, to record where it was seen (see touch).
+
+        Returns:
+            The digest, or None if the file has not been hashed since it last changed.
+        """
+        row = self.connection.execute(
+            'SELECT digest, path, updated FROM hashes WHERE device=? AND inode=? AND size=? AND mtime_ns=? AND algorithm=? AND partial=?',
+            (*self.fingerprint(stat), algorithm, int(partial))
+        ).fetchone()
+        if not row:
+            return None
+
+        digest, stored_path, updated = row
+        if path is not None:
+            self.touch(path, stat, stored_path, updated)
+        return digest
+
+    def touch(self, path : Path, stat : os.stat_result, stored_path : str | None = None, updated : float = 0) -> None:
+        """
+        Record that the file with this fingerprint was seen at path, now.
+
+        To keep hits from costing a write each, nothing is written if the stored path is the same, and was updated
+        within REFRESH_INTERVAL.
+
+        Args:
+            path: The current path of the file.
+            stat: The current stat result for the file.
+            stored_path: The path the entry has, if the caller already read it.
+            updated: When the entry was last updated, if the caller already read it.
+        """
+        path_str = str(path.absolute())
+        now = time.time()
+        if stored_path == path_str and now - updated < REFRESH_INTERVAL:
+            return
+
+        try:
+            with self.connection as conn:
+                conn.execute(
+                    'UPDATE hashes SET path=?, updated=? WHERE device=? AND inode=? AND size=? AND mtime_ns=?',
+                    (path_str, now, *self.fingerprint(stat))
+                )
+        except sqlite3.OperationalError as oe:
+            # i.e. another process holds the write lock for too long. The entry is still valid, just not refreshed.
+            logger.debug('Unable to update the hash cache entry for %s -> %s', path, oe)
+
+    def set(self, path : Path, stat : os.stat_result, algorithm : str, partial : bool, digest : str) -> None:
+        """
+        Store a digest for a file.
+
+        Args:
+            path: The path of the file. This is only used to find entries that can be evicted later.
+            stat: The stat result for the file, taken before it was read.
+            algorithm: The hashing algorithm the digest was created with.
+            partial: Whether the digest is a partial (first and last 1MB) hash.
+            digest: The digest to store.
+        """
+        with self.connection as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO hashes (device, inode, size, mtime_ns, algorithm, partial, digest, path, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (*self.fingerprint(stat), algorithm, int(partial), digest, str(path.absolute()), time.time())
+            )
+
+    def get_many(self, stat : os.stat_result, algorithms : Iterable[str], partial : bool = False, path : Path | None = None) -> dict[str, str]:
+        """
+        Look up the digests of a file for several algorithms at once.
+
+        Args:
+            path: The current path of the file, to record where it was seen (see touch).
+
+        Returns:
+            algorithm -> digest, for each algorithm that has a digest for the current version of the file.
+        """
+        algorithms = list(algorithms)
+        if not algorithms:
+            return {}
+        placeholders = ', '.join('?' * len(algorithms))
+        rows = self.connection.execute(
+            f'SELECT algorithm, digest, path, updated FROM hashes WHERE device=? AND inode=? AND size=? AND mtime_ns=? AND partial=? AND algorithm IN ({placeholders})',
+            (*self.fingerprint(stat), int(partial), *algorithms)
+        ).fetchall()
+        if rows and path is not None:
+            _, _, stored_path, updated = min(rows, key=lambda row: row[3])
+            self.touch(path, stat, stored_path, updated)
+        return {algorithm: digest for algorithm, digest, _, _ in rows}
+
+    def set_many(self, path : Path, stat : os.stat_result, partial : bool, digests : dict[str, str]) -> None:
+        """
+        Store the digests of a file for several algorithms (i.e. from one read, see HashingEngine.hash_file_multi).
+        """
+        now = time.time()
+        with self.connection as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO hashes (device, inode, size, mtime_ns, algorithm, partial, digest, path, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(*self.fingerprint(stat), algorithm, int(partial), digest, str(path.absolute()), now) for algorithm, digest in digests.items()]
+            )
+
+    def count(self) -> int:
+        """
+        Count the number of digests stored in the cache.
+        """
+        return self.connection.execute('SELECT COUNT(*) FROM hashes').fetchone()[0]
+
+    def _yield_entries(self) -> Iterator[tuple[str, Fingerprint, float]]:
+        rows = self.connection.execute('SELECT path, device, inode, size, mtime_ns, MAX(updated) FROM hashes GROUP BY path, device, inode, size, mtime_ns').fetchall()
+        for path, device, inode, size, mtime_ns, updated in rows:
+            yield path, (device, inode, size, mtime_ns), updated
+
+    def evict_missing(self, max_age : float | None = None) -> int:
+        """
+        Remove entries for files that no longer exist, or have changed since they were hashed.
+
+        This costs one stat call per cached file (plus one per directory, for files that are missing). No files are read.
+
+        A missing file only counts as gone if the filesystem it was on is still there. A path on a drive that isn't
+        mounted also raises FileNotFoundError, so the nearest directory that does exist must be on the same device as
+        the file was. Otherwise, the file can't be checked.
+
+        Args:
+            max_age: Entries for files that can't be checked (i.e. on a drive that isn't mounted) are kept, unless they
+                haven't been seen for this many seconds. None keeps them regardless.
+
+        Returns:
+            The number of entries removed.
+        """
+        stale : list[tuple[str, Fingerprint]] = []
+        now = time.time()
+        devices : dict[str, int | None] = {}
+        for path, fingerprint, updated in self._yield_entries():
+            try:
+                if self.fingerprint(os.stat(path)) == fingerprint:
+                    continue
+                reachable = True
+            except FileNotFoundError:
+                reachable = self._nearest_device(os.path.dirname(path), devices) == fingerprint[0]
+            except OSError:
+                reachable = False
+
+            # Don't throw away the entries of a drive that isn't mounted (for a while)
+            if not reachable and (max_age is None or now - updated < max_age):
+                logger.debug('Unable to check cached file, keeping its entry: %s', path)
+                continue
+            stale.append((path, fingerprint))
+
+        with self.connection as conn:
+            conn.executemany(
+                'DELETE FROM hashes WHERE path=? AND device=? AND inode=? AND size=? AND mtime_ns=?',
+                [(path, *fingerprint) for path, fingerprint in stale]
+            )
+
+        logger.info('Evicted %d stale entries from the hash cache.', len(stale))
+        return len(stale)
+
+    @staticmethod
+    def _nearest_device(directory : str, devices : dict[str, int | None]) -> int | None:
+        """
+        The st_dev of the nearest directory that exists, at or above this one. Remembered per directory in devices.
+        """
+        if directory in devices:
+            return devices[directory]
+        try:
+            device = os.stat(directory).st_dev
+        except FileNotFoundError:
+            parent = os.path.dirname(directory)
+            device = None if parent == directory else HashCache._nearest_device(parent, devices)
+        except OSError:
+            device = None
+        devices[directory] = device
+        return device
+
+    def vacuum(self) -> None:
+        """
+        Reclaim disk space after entries have been evicted.
+        """
+        conn = self.connection
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.execute('VACUUM')
+
+    def close(self) -> None:
+        """
+        Close the connection for the current thread.
+        """
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None:
+            conn.close()
+            self._local.connection = None
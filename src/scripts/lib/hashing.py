@@ -0,0 +1,464 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    hashing.py                                                                                           *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from enum import Enum
+from pathlib import Path
+from typing import Callable, Iterable, Protocol
+import xxhash
+
+from scripts.lib.metrics import METRICS
+from scripts.lib.mounts import is_network_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB
+# When one chunk is fed to several hashers, it is kept small enough to still be in the CPU cache for the second and third
+MULTI_CHUNK_SIZE = 256 * 1024  # 256KB
+PARTIAL_CHUNK_SIZE = 1024 * 1024  # 1MB, hashed from each end of the file for partial hashes
+DEFAULT_MAX_WORKERS = 4
+# Tree digests hash fixed-size chunks of a file in parallel, then hash the list of chunk digests
+TREE_ALGORITHM = 'xxh3_tree'
+TREE_CHUNK_SIZE = 64 * 1024 * 1024  # 64MB
+
+class Hasher(Protocol):
+    def update(self, data : bytes | memoryview) -> None:
+        ...
+
+    def hexdigest(self) -> str:
+        ...
+
+# 'xxhash' is the name we have always used for xxh64, and is kept so existing digests stay valid.
+ALGORITHMS : dict[str, Callable[[], Hasher]] = {
+    'xxhash': xxhash.xxh64,
+    'xxh64': xxhash.xxh64,
+    'xxh3_64': xxhash.xxh3_64,
+    'xxh3_128': xxhash.xxh3_128,
+    'md5': hashlib.md5,
+    'sha1': hashlib.sha1,
+    'sha256': hashlib.sha256,
+}
+
+def get_hasher(algorithm : str = 'xxhash') -> Hasher:
+    """
+    Get a new hasher for a given algorithm.
+
+    Args:
+        algorithm: The name of the algorithm. Anything hashlib supports is accepted, in addition to the xxhash family.
+
+    Returns:
+        A hasher object.
+
+    Raises:
+        ValueError: If the algorithm is not supported.
+    """
+    if (factory := ALGORITHMS.get(algorithm.lower())):
+        return factory()
+    return hashlib.new(algorithm)
+
+class MultiHasher:
+    """
+    Feeds every chunk to several hashers, so a single read of a file produces a digest for each algorithm.
+    """
+    def __init__(self, algorithms : Iterable[str]):
+        self.hashers = {algorithm: get_hasher(algorithm) for algorithm in algorithms}
+
+    def update(self, data : bytes | memoryview) -> None:
+        for hasher in self.hashers.values():
+            hasher.update(data)
+
+    def hexdigests(self) -> dict[str, str]:
+        return {algorithm: hasher.hexdigest() for algorithm, hasher in self.hashers.items()}
+
+    def __len__(self) -> int:
+        return len(self.hashers)
+
+@dataclass(frozen=True, slots=True)
+class TreeDigest:
+    """
+    The digest of a file as a list of xxh3_128 digests, one for each chunk_size chunk, plus a root digest of the list.
+
+    Two files with the same root have the same contents. When the roots differ, comparing the chunks shows which
+    regions differ, so only those need to be copied (and verified) again.
+    """
+    size : int
+    chunk_size : int
+    chunks : tuple[str, ...]
+
+    @property
+    def root(self) -> str:
+        hasher = xxhash.xxh3_128(struct.pack('<QQ', self.size, self.chunk_size))
+        for chunk in self.chunks:
+            hasher.update(bytes.fromhex(chunk))
+        return hasher.hexdigest()
+
+    @staticmethod
+    def chunk_count(size : int, chunk_size : int) -> int:
+        return -(-size // chunk_size)
+
+    def chunk_range(self, index : int) -> tuple[int, int]:
+        """
+        The (offset, length) of a chunk in the file.
+        """
+        offset = index * self.chunk_size
+        return offset, min(self.chunk_size, self.size - offset)
+
+    def damaged_chunks(self, other : TreeDigest) -> list[int]:
+        """
+        The indexes of the chunks that differ between two versions of a file.
+
+        Raises:
+            ValueError: If the files are different sizes, or were hashed with different chunk sizes.
+        """
+        if (self.size, self.chunk_size) != (other.size, other.chunk_size):
+            raise ValueError(f'Tree digests are not comparable: {self.size=} {other.size=} {self.chunk_size=} {other.chunk_size=}')
+        return [index for index, (mine, theirs) in enumerate(zip(self.chunks, other.chunks)) if mine != theirs]
+
+    def to_string(self) -> str:
+        """
+        Serialize to a string, i.e. to store in the hash cache.
+        """
+        return f"{self.size}:{self.chunk_size}:{''.join(self.chunks)}"
+
+    @classmethod
+    def from_string(cls, value : str) -> TreeDigest:
+        """
+        Raises:
+            ValueError: If the string is not a serialized TreeDigest.
+        """
+        size, chunk_size, digests = value.split(':', 2)
+        size, chunk_size = int(size), int(chunk_size)
+        if len(digests) != cls.chunk_count(size, chunk_size) * 32:
+            raise ValueError(f'Expected {cls.chunk_count(size, chunk_size)} chunk digests in {value[:64]}...')
+        return cls(size, chunk_size, tuple(digests[i:i + 32] for i in range(0, len(digests), 32)))
+
+class TreeHasher:
+    """
+    Builds a TreeDigest from data fed to it in order, i.e. by CopyEngine as it copies, so the file isn't read again.
+
+    Example:
+        >>> hasher = TreeHasher()
+        >>> copy_engine.copy(source, destination, hasher)
+        >>> hasher.tree().root == engine.hash_tree(source).root
+        True
+    """
+    def __init__(self, chunk_size : int = TREE_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.size = 0
+        self._chunks : list[str] = []
+        self._current = xxhash.xxh3_128()
+        self._filled = 0
+
+    def update(self, data : bytes | memoryview) -> None:
+        view = memoryview(data).cast('B')
+        while view:
+            take = min(len(view), self.chunk_size - self._filled)
+            self._current.update(view[:take])
+            self._filled += take
+            self.size += take
+            view = view[take:]
+            if self._filled == self.chunk_size:
+                self._chunks.append(self._current.hexdigest())
+                self._current = xxhash.xxh3_128()
+                self._filled = 0
+
+    def tree(self) -> TreeDigest:
+        """
+        The tree digest of everything fed so far.
+        """
+        chunks = [*self._chunks, self._current.hexdigest()] if self._filled else self._chunks
+        return TreeDigest(self.size, self.chunk_size, tuple(chunks))
+
+    def hexdigest(self) -> str:
+        return self.tree().root
+
+class HashStrategy(Enum):
+    # mmap for local files, readinto for network mounts
+    AUTO = 'auto'
+    # Map the file into memory, and let the kernel page it in. Fastest for local disks.
+    MMAP = 'mmap'
+    # Read into a preallocated buffer. Large sequential reads suit network mounts, where mmap faults are round trips.
+    READINTO = 'readinto'
+
+class HashingEngine:
+    """
+    Hashes files without allocating a new bytes object for every chunk.
+
+    xxhash and hashlib both release the GIL while hashing, so hash_many can hash several files at once on a thread pool.
+
+    Example:
+        >>> engine = HashingEngine()
+        >>> engine.hash_file(Path('/mnt/p/JAM_1234.arw'), 'xxh3_128')
+        '9f8e7d6c5b4a39281706f5e4d3c2b1a0'
+        >>> engine.hash_many([Path('a.arw'), Path('b.arw')])
+        {PosixPath('a.arw'): '...', PosixPath('b.arw'): '...'}
+    """
+    chunk_size : int
+    strategy : HashStrategy
+    max_workers : int
+
+    def __init__(self, chunk_size : int = DEFAULT_CHUNK_SIZE, strategy : HashStrategy = HashStrategy.AUTO, max_workers : int = DEFAULT_MAX_WORKERS):
+        self.chunk_size = chunk_size
+        self.strategy = strategy
+        self.max_workers = max(1, max_workers)
+        self._local = threading.local()
+
+    @property
+    def buffer(self) -> memoryview:
+        """
+        A reusable buffer for the current thread.
+        """
+        buffer = getattr(self._local, 'buffer', None)
+        if buffer is None:
+            buffer = memoryview(bytearray(self.chunk_size))
+            self._local.buffer = buffer
+        return buffer
+
+    def choose_strategy(self, path : Path) -> HashStrategy:
+        if self.strategy != HashStrategy.AUTO:
+            return self.strategy
+        if is_network_path(path):
+            return HashStrategy.READINTO
+        return HashStrategy.MMAP
+
+    def hash_file(self, path : Path, algorithm : str = 'xxhash', partial : bool = False, strategy : HashStrategy | None = None) -> str:
+        """
+        Calculate the hash of a file.
+
+        Args:
+            path: The file to hash.
+            algorithm: The hashing algorithm to use.
+            partial: If True, only hash the first and last 1MB of the file.
+            strategy: Override the strategy the engine would choose for this file.
+
+        Returns:
+            The hexdigest of the file.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        if algorithm.lower() == TREE_ALGORITHM:
+            if partial:
+                raise ValueError('Tree digests always cover the whole file')
+            return self.hash_tree(path, strategy=strategy).root
+
+        hasher = get_hasher(algorithm)
+        self._hash(path, hasher, partial, strategy, self.chunk_size)
+        return hasher.hexdigest()
+
+    def hash_tree(self, path : Path, chunk_size : int = TREE_CHUNK_SIZE, strategy : HashStrategy | None = None, max_workers : int | None = None) -> TreeDigest:
+        """
+        Calculate the tree digest of a file, hashing its chunks in parallel.
+
+        A single xxhash stream is limited to one core. Large video files hash several times faster this way on fast
+        (NVMe) storage, while a slow disk is no worse off than before.
+
+        Args:
+            path: The file to hash.
+            chunk_size: The size of each chunk.
+            strategy: Override the strategy the engine would choose for this file.
+            max_workers: The number of chunks to hash at once. Defaults to the engine's max_workers.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        size = Path(path).stat().st_size
+        chunks = self.hash_chunks(path, range(TreeDigest.chunk_count(size, chunk_size)), chunk_size, strategy, max_workers)
+        return TreeDigest(size, chunk_size, tuple(chunks[index] for index in sorted(chunks)))
+
+    def verify_tree(self, path : Path, expected : TreeDigest, indexes : Iterable[int] | None = None, strategy : HashStrategy | None = None) -> list[int]:
+        """
+        Check a file against a tree digest, i.e. after copying it, or after repairing the chunks that didn't match.
+
+        Args:
+            path: The file to check.
+            expected: The tree digest of the source.
+            indexes: Only check these chunks. Defaults to all of them.
+
+        Returns:
+            The indexes of the chunks that don't match. If the file is a different size, every chunk.
+        """
+        chunk_count = TreeDigest.chunk_count(expected.size, expected.chunk_size)
+        indexes = range(chunk_count) if indexes is None else sorted(set(indexes))
+        if Path(path).stat().st_size != expected.size:
+            return list(indexes)
+        actual = self.hash_chunks(path, indexes, expected.chunk_size, strategy)
+        return [index for index in indexes if actual[index] != expected.chunks[index]]
+
+    def hash_chunks(self, path : Path, indexes : Iterable[int], chunk_size : int = TREE_CHUNK_SIZE, strategy : HashStrategy | None = None, max_workers : int | None = None) -> dict[int, str]:
+        """
+        Calculate the xxh3_128 digests of some chunks of a file, in parallel.
+
+        Returns:
+            chunk index -> hexdigest.
+        """
+        indexes = list(indexes)
+        if not indexes:
+            return {}
+
+        if strategy is None or strategy == HashStrategy.AUTO:
+            strategy = self.choose_strategy(path)
+
+        with METRICS.time('hash', kind='tree'), open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            workers = min(max_workers or self.max_workers, len(indexes))
+
+            if strategy == HashStrategy.MMAP and stat.st_size > 0:
+                # Every thread hashes its own slice of one shared mapping
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        def hash_slice(index : int) -> str:
+                            return xxhash.xxh3_128(view[index * chunk_size:(index + 1) * chunk_size]).hexdigest()
+                        with ThreadPoolExecutor(max_workers=workers) as executor:
+                            results = dict(zip(indexes, executor.map(hash_slice, indexes)))
+                    finally:
+                        view.release()
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = dict(zip(indexes, executor.map(lambda index: self._hash_chunk(path, index, chunk_size), indexes)))
+
+        METRICS.record_read(stat.st_dev, sum(min(chunk_size, max(0, stat.st_size - index * chunk_size)) for index in indexes))
+        return results
+
+    def _hash_chunk(self, path : Path, index : int, chunk_size : int) -> str:
+        """
+        Hash one chunk through this thread's buffer, with a file handle of its own so the reads can overlap.
+        """
+        hasher = xxhash.xxh3_128()
+        buffer = self.buffer
+        with open(path, 'rb') as f:
+            f.seek(index * chunk_size)
+            remaining = chunk_size
+            while remaining and (read := f.readinto(buffer[:min(remaining, len(buffer))])):
+                hasher.update(buffer[:read])
+                remaining -= read
+        return hasher.hexdigest()
+
+    def hash_file_multi(self, path : Path, algorithms : Iterable[str], partial : bool = False, strategy : HashStrategy | None = None) -> dict[str, str]:
+        """
+        Calculate several digests of a file, reading it only once.
+
+        Args:
+            path: The file to hash.
+            algorithms: The hashing algorithms to use.
+            partial: If True, only hash the first and last 1MB of the file.
+            strategy: Override the strategy the engine would choose for this file.
+
+        Returns:
+            A dict of algorithm -> hexdigest.
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        hasher = MultiHasher(algorithms)
+        chunk_size = self.chunk_size if len(hasher) == 1 else min(self.chunk_size, MULTI_CHUNK_SIZE)
+        self._hash(path, hasher, partial, strategy, chunk_size)
+        return hasher.hexdigests()
+
+    def _hash(self, path : Path, hasher : Hasher | MultiHasher, partial : bool, strategy : HashStrategy | None, chunk_size : int) -> None:
+        with METRICS.time('hash', kind='partial' if partial else 'full'), open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            file_size = stat.st_size
+
+            if partial and file_size > 2 * PARTIAL_CHUNK_SIZE:
+                self._update_partial(f, hasher)
+                file_size = 2 * PARTIAL_CHUNK_SIZE
+            elif file_size > 0:
+                if strategy is None or strategy == HashStrategy.AUTO:
+                    strategy = self.choose_strategy(path)
+
+                if strategy == HashStrategy.MMAP:
+                    self._update_mmap(f, hasher, chunk_size)
+                else:
+                    self._update_readinto(f, hasher, chunk_size)
+
+        METRICS.record_read(stat.st_dev, file_size)
+
+    def hash_many(self, paths : Iterable[Path], algorithm : str = 'xxhash', partial : bool = False, max_workers : int | None = None) -> dict[Path, str]:
+        """
+        Hash several files concurrently.
+
+        Files that cannot be read (i.e. they were deleted after being listed) are logged and left out of the result.
+
+        Args:
+            paths: The files to hash.
+            algorithm: The hashing algorithm to use.
+            partial: If True, only hash the first and last 1MB of each file.
+            max_workers: The number of files to hash at once. Defaults to the engine's max_workers.
+
+        Returns:
+            A dict of path -> hexdigest.
+        """
+        results : dict[Path, str] = {}
+        with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+            futures = {executor.submit(self.hash_file, path, algorithm, partial): path for path in paths}
+            for future, path in futures.items():
+                try:
+                    results[path] = future.result()
+                except OSError as ose:
+                    logger.warning('Unable to hash %s -> %s', path, ose)
+        return results
+
+    def _update_partial(self, f, hasher : Hasher | MultiHasher) -> None:
+        # Each end is read in full, even when the buffer (chunk_size) is smaller than PARTIAL_CHUNK_SIZE
+        self._update_range(f, hasher, PARTIAL_CHUNK_SIZE)
+        f.seek(-PARTIAL_CHUNK_SIZE, os.SEEK_END)
+        self._update_range(f, hasher, PARTIAL_CHUNK_SIZE)
+
+    def _update_range(self, f, hasher : Hasher | MultiHasher, length : int) -> None:
+        """
+        Hash the next length bytes of f (or up to the end), through this thread's buffer.
+        """
+        buffer = self.buffer
+        remaining = length
+        while remaining and (read := f.readinto(buffer[:min(remaining, len(buffer))])):
+            hasher.update(buffer[:read])
+            remaining -= read
+
+    def _update_mmap(self, f, hasher : Hasher | MultiHasher, chunk_size : int) -> None:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), chunk_size):
+                    hasher.update(view[offset:offset + chunk_size])
+            finally:
+                view.release()
+
+    def _update_readinto(self, f, hasher : Hasher | MultiHasher, chunk_size : int) -> None:
+        # Reads stay large (they may be network round trips), even when the hashers are fed smaller chunks
+        buffer = self.buffer
+        while (read := f.readinto(buffer)):
+            for offset in range(0, read, chunk_size):
+                hasher.update(buffer[offset:min(offset + chunk_size, read)])
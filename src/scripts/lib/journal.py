@@ -0,0 +1,279 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    journal.py                                                                                           *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+import logging
+from dataclasses import dataclass, field
+from enum import Enum
+from pathlib import Path
+from typing import IO, Iterator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYNC_EVERY = 64
+
+type Fingerprint = tuple[int, int, int, int]
+
+class JournalState(Enum):
+    PLANNED = 'planned'
+    DONE = 'done'
+    FAILED = 'failed'
+    ROLLED_BACK = 'rolled_back'
+
+class JournalOperation(Enum):
+    MOVE = 'move'
+    COPY = 'copy'
+    DELETE = 'delete'
+
+@dataclass(slots=True)
+class JournalEntry:
+    id : int
+    operation : JournalOperation
+    source : Path
+    destination : Path | None = None
+    state : JournalState = JournalState.PLANNED
+    source_digest : str | None = None
+    destination_digest : str | None = None
+    # (st_dev, st_ino, st_size, st_mtime_ns) after the operation, so the digests can be trusted without reading again
+    source_fingerprint : Fingerprint | None = None
+    destination_fingerprint : Fingerprint | None = None
+    error : str | None = None
+    planned_at : float = field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.state != JournalState.PLANNED
+
+class OperationJournal:
+    """
+    An append-only log (JSON lines) of file operations, written before each operation starts and again when it ends.
+
+    If a run is interrupted (Ctrl-C, a dropped network mount, a crash), the operations that were planned but never
+    finished are exactly the ones that may have left something half done: a partial copy, or a copied file whose source
+    was never deleted. The next run reads the journal, and only has to repair those (see FileManager.recover_journal),
+    instead of walking and re-hashing everything. Finished operations record the digests and fingerprints of their
+    files, so those can be trusted without reading the files again.
+
+    Each line is either a new entry, or an update to an earlier one (by id). Lines are flushed as they are written, and
+    fsynced every sync_every lines. A torn final line, from a crash mid-write, is ignored.
+
+    Example:
+        >>> journal = OperationJournal(Path('~/.cache/imageinn/organize.journal').expanduser())
+        >>> entry = journal.plan(JournalOperation.MOVE, source, destination)
+        >>> source.rename(destination)
+        >>> journal.complete(entry, destination_fingerprint=HashCache.fingerprint(destination.stat()))
+        >>> journal.incomplete()
+        []
+    """
+    path : Path
+    sync_every : int
+
+    def __init__(self, path : Path | str, sync_every : int = DEFAULT_SYNC_EVERY):
+        self.path = Path(path)
+        self.sync_every = sync_every
+        self._lock = threading.Lock()
+        self._entries : dict[int, JournalEntry] = {}
+        self._next_id = 1
+        self._unsynced = 0
+        self._file : IO[str] | None = None
+        self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+
+        for number, line in enumerate(lines, start=1):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning('Ignoring unreadable line %d in journal %s', number, self.path)
+                continue
+            self._apply(record)
+
+        if self._entries:
+            self._next_id = max(self._entries) + 1
+        logger.debug('Loaded %d entries from journal %s', len(self._entries), self.path)
+
+    def _apply(self, record : dict) -> None:
+        entry_id = record['id']
+        if (entry := self._entries.get(entry_id)) is None:
+            entry = self._entries[entry_id] = JournalEntry(
+                id=entry_id,
+                operation=JournalOperation(record['operation']),
+                source=Path(record['source']),
+                destination=Path(record['destination']) if record.get('destination') else None,
+                planned_at=record.get('planned_at', 0),
+            )
+
+        entry.state = JournalState(record['state'])
+        for key in ('source_digest', 'destination_digest', 'error'):
+            if key in record:
+                setattr(entry, key, record[key])
+        for key in ('source_fingerprint', 'destination_fingerprint'):
+            if record.get(key):
+                setattr(entry, key, tuple(record[key]))
+
+    def _write(self, record : dict) -> None:
+        """
+        Append a record. Must be called with the lock held.
+        """
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._file.flush()
+
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def plan(self, operation : JournalOperation, source : Path, destination : Path | None = None) -> JournalEntry:
+        """
+        Record an operation that is about to start.
+        """
+        with self._lock:
+            entry = JournalEntry(id=self._next_id, operation=operation, source=Path(source), destination=Path(destination) if destination else None)
+            self._next_id += 1
+            self._entries[entry.id] = entry
+            self._write({
+                'id': entry.id,
+                'state': entry.state.value,
+                'operation': operation.value,
+                'source': str(entry.source),
+                'destination': str(entry.destination) if entry.destination else None,
+                'planned_at': entry.planned_at,
+            })
+        return entry
+
+    def complete(self, entry : JournalEntry, *,
+                 source_digest : str | None = None,
+                 destination_digest : str | None = None,
+                 source_fingerprint : Fingerprint | None = None,
+                 destination_fingerprint : Fingerprint | None = None) -> None:
+        """
+        Record that an operation finished, along with whatever is known about the files it left behind.
+        """
+        record = {'id': entry.id, 'state': JournalState.DONE.value}
+        for key, value in (
+            ('source_digest', source_digest),
+            ('destination_digest', destination_digest),
+            ('source_fingerprint', source_fingerprint),
+            ('destination_fingerprint', destination_fingerprint),
+        ):
+            if value is not None:
+                record[key] = value
+        self._update(entry, record)
+
+    def fail(self, entry : JournalEntry, error : str | BaseException) -> None:
+        self._update(entry, {'id': entry.id, 'state': JournalState.FAILED.value, 'error': str(error)})
+
+    def roll_back(self, entry : JournalEntry) -> None:
+        self._update(entry, {'id': entry.id, 'state': JournalState.ROLLED_BACK.value})
+
+    def _update(self, entry : JournalEntry, record : dict) -> None:
+        with self._lock:
+            self._apply(record)
+            self._write(record)
+
+    def get(self, entry_id : int) -> JournalEntry | None:
+        with self._lock:
+            return self._entries.get(entry_id)
+
+    def entries(self) -> Iterator[JournalEntry]:
+        with self._lock:
+            entries = list(self._entries.values())
+        yield from entries
+
+    def incomplete(self) -> list[JournalEntry]:
+        """
+        Operations that were planned, but never recorded as finished.
+        """
+        return [entry for entry in self.entries() if not entry.finished]
+
+    def completed(self) -> list[JournalEntry]:
+        return [entry for entry in self.entries() if entry.state == JournalState.DONE]
+
+    def checkpoint(self) -> int:
+        """
+        Drop every finished entry, rewriting the journal with only the unfinished ones (usually none).
+
+        Call this when a run ends cleanly, so the journal doesn't grow across runs.
+
+        Returns:
+            The number of entries dropped.
+        """
+        with self._lock:
+            self._close_file()
+            unfinished = {entry_id: entry for entry_id, entry in self._entries.items() if not entry.finished}
+            dropped = len(self._entries) - len(unfinished)
+
+            temporary = self.path.with_name(f'.{self.path.name}.tmp')
+            with open(temporary, 'w', encoding='utf-8') as f:
+                for entry in unfinished.values():
+                    f.write(json.dumps({
+                        'id': entry.id,
+                        'state': entry.state.value,
+                        'operation': entry.operation.value,
+                        'source': str(entry.source),
+                        'destination': str(entry.destination) if entry.destination else None,
+                        'planned_at': entry.planned_at,
+                    }, separators=(',', ':')) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.path)
+            self._entries = unfinished
+
+        logger.debug('Dropped %d finished entries from journal %s', dropped, self.path)
+        return dropped
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._unsynced = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_file()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __enter__(self) -> OperationJournal:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,97 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    mounts.py                                                                                            *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import os
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROC_MOUNTS = Path('/proc/mounts')
+
+# Filesystems where every read is a round trip over the network (or through a VM boundary, such as WSL's drvfs).
+NETWORK_FILESYSTEMS = frozenset({
+    'nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', 'afs', 'ncpfs', '9p', 'drvfs',
+    'fuse.sshfs', 'fuse.rclone', 'fuse.s3fs', 'fuse.gcsfuse', 'davfs', 'fuse.davfs2',
+})
+
+@dataclass(frozen=True, slots=True)
+class Mount:
+    device : str
+    mountpoint : Path
+    fstype : str
+
+    @property
+    def is_network(self) -> bool:
+        return self.fstype.lower() in NETWORK_FILESYSTEMS
+
+@lru_cache(maxsize=1)
+def get_mounts() -> tuple[Mount, ...]:
+    """
+    Read the mount table, longest mountpoint first, so the first match for a path is its mount.
+
+    Returns:
+        The mounts, or an empty tuple if the mount table isn't available (i.e. on Windows).
+    """
+    try:
+        lines = PROC_MOUNTS.read_text(encoding='utf-8').splitlines()
+    except OSError:
+        logger.debug('Unable to read the mount table at %s', PROC_MOUNTS)
+        return ()
+
+    mounts = []
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        # Spaces in mountpoints are escaped as octal
+        mountpoint = parts[1].replace('\\040', ' ').replace('\\011', '\t')
+        mounts.append(Mount(parts[0], Path(mountpoint), parts[2]))
+
+    return tuple(sorted(mounts, key=lambda mount: len(mount.mountpoint.parts), reverse=True))
+
+def find_mount(path : str | Path) -> Mount | None:
+    """
+    Find the mount that a path lives on.
+
+    Args:
+        path: The path to look up. It does not need to exist.
+
+    Returns:
+        The mount, or None if it cannot be determined.
+    """
+    path = Path(os.path.abspath(path))
+    for mount in get_mounts():
+        if path == mount.mountpoint or mount.mountpoint in path.parents:
+            return mount
+    return None
+
+def is_network_path(path : str | Path) -> bool:
+    """
+    Determine if a path lives on a network filesystem. Unknown mounts are treated as local.
+    """
+    return bool((mount := find_mount(path)) and mount.is_network)
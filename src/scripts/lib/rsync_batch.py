@@ -0,0 +1,249 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    rsync_batch.py                                                                                       *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import os
+import subprocess
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterable
+
+from scripts.exceptions import ChecksumMismatchError
+
+if TYPE_CHECKING:
+    from scripts.lib.file_manager import FileManager
+
+logger = logging.getLogger(__name__)
+
+# rsync exit codes that still leave some files transferred: partial transfer due to error, and vanished source files.
+PARTIAL_EXIT_CODES = frozenset({23, 24})
+
+@dataclass(slots=True)
+class RsyncResult:
+    source : Path
+    destination : Path
+    # The rsync itemize string (i.e. ">f+++++++++"), if rsync reported the file in the batch run
+    itemized : str | None = None
+    # True if the file had to be retried on its own, after the batch run
+    retried : bool = False
+    error : Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+class RsyncBatch:
+    """
+    Transfers many files with one rsync process per (source directory, destination directory) pair, instead of one per file.
+
+    Each group is passed to "rsync --files-from", and the itemized output is parsed for per-file results. Afterwards,
+    the source and destination digests of every file are calculated in parallel. Any file that rsync did not transfer,
+    or whose digests do not match, is retried on its own with FileManager._copy_with_rsync.
+
+    Files whose destination name differs from the source name can't be expressed in a files-from list, so they are
+    always transferred individually.
+
+    Statistics are not recorded here; the caller records them from the results.
+
+    Example:
+        >>> batch = RsyncBatch(file_manager, move=True)
+        >>> batch.add(Path('/mnt/d/DCIM/JAM_1234.arw'), Path('/mnt/p/2024/2024-12-25/JAM_1234.arw'))
+        >>> [result for result in batch.run() if not result.ok]
+        []
+    """
+    def __init__(self, file_manager : FileManager, *, move : bool = False, retries : int = 3, hashing_algorithm : str = 'xxhash'):
+        """
+        Args:
+            file_manager: Runs rsync, hashes files, and performs individual retries.
+            move: Delete each source after its destination has been verified.
+            retries: The number of times to retry a failed file individually.
+            hashing_algorithm: The algorithm used to verify each transfer.
+        """
+        self.file_manager = file_manager
+        self.move = move
+        self.retries = retries
+        self.hashing_algorithm = hashing_algorithm
+        self._pairs : list[tuple[Path, Path]] = []
+
+    def __len__(self) -> int:
+        return len(self._pairs)
+
+    def add(self, source : Path, destination : Path) -> None:
+        """
+        Add a transfer to the batch. The destination is the full path of the file, not its directory.
+        """
+        self._pairs.append((source.absolute(), destination.absolute()))
+
+    def extend(self, pairs : Iterable[tuple[Path, Path]]) -> None:
+        for source, destination in pairs:
+            self.add(source, destination)
+
+    def groups(self) -> tuple[dict[tuple[Path, Path], list[RsyncResult]], list[RsyncResult]]:
+        """
+        Group the transfers by (source root, destination root).
+
+        Returns:
+            The groups, and a list of transfers that must be performed individually (because they are renamed).
+        """
+        groups : dict[tuple[Path, Path], list[RsyncResult]] = defaultdict(list)
+        individual : list[RsyncResult] = []
+        for source, destination in self._pairs:
+            result = RsyncResult(source, destination)
+            if source.name == destination.name:
+                groups[(source.parent, destination.parent)].append(result)
+            else:
+                individual.append(result)
+        return groups, individual
+
+    def run(self) -> list[RsyncResult]:
+        """
+        Perform every transfer in the batch.
+
+        Failures are recorded on each result, rather than raised.
+
+        Returns:
+            One result per transfer.
+        """
+        groups, individual = self.groups()
+        batched : list[RsyncResult] = []
+
+        for (source_root, destination_root), group in groups.items():
+            try:
+                itemized = self._run_group(source_root, destination_root, group)
+            except (subprocess.SubprocessError, OSError) as e:
+                # Nothing can be trusted from this run. Every file in it will be verified, and retried individually.
+                logger.error('Batch rsync failed: %s -> %s: %s', source_root, destination_root, e)
+                itemized = {}
+
+            for result in group:
+                result.itemized = itemized.get(result.source.name)
+            batched.extend(group)
+
+        for result in (*individual, *self._verify(batched)):
+            self._retry(result)
+
+        results = [*batched, *individual]
+        if self.move:
+            for result in results:
+                if result.ok:
+                    self._delete_source(result)
+
+        return results
+
+    def _run_group(self, source_root : Path, destination_root : Path, group : list[RsyncResult]) -> dict[str, str]:
+        """
+        Run a single rsync process for every file in the group.
+
+        Returns:
+            A dict of filename -> itemize string, for each file rsync reported transferring.
+        """
+        # Timeout is the sum of what each file would get on its own
+        timeout = sum(self.file_manager._calculate_timeout(result.source, destination_path=result.destination) for result in group)
+        names = '\0'.join(result.source.name for result in group)
+
+        self.file_manager.mkdir(destination_root)
+        completed = self.file_manager.subprocess(
+            ['rsync', '-a', '--times', '--itemize-changes', '--from0', '--files-from=-', f'{source_root}/', f'{destination_root}/'],
+            input=names, capture_output=True, text=True, check=False, timeout=timeout
+        )
+        if completed.returncode and completed.returncode not in PARTIAL_EXIT_CODES:
+            raise subprocess.CalledProcessError(completed.returncode, completed.args, completed.stdout, completed.stderr)
+        if completed.returncode:
+            logger.warning('Batch rsync partially failed (%d): %s -> %s: %s', completed.returncode, source_root, destination_root, completed.stderr.strip())
+
+        return self.parse_itemized(completed.stdout)
+
+    @staticmethod
+    def parse_itemized(output : str) -> dict[str, str]:
+        """
+        Parse the output of "rsync --itemize-changes" into a dict of filename -> itemize string.
+
+        Only regular files are included. Lines look like ">f+++++++++ JAM_1234.arw".
+        """
+        itemized : dict[str, str] = {}
+        for line in output.splitlines():
+            changes, _, name = line.partition(' ')
+            if len(changes) != 11 or not name or changes[1] != 'f':
+                continue
+            itemized[name] = changes
+        return itemized
+
+    def _verify(self, results : list[RsyncResult]) -> list[RsyncResult]:
+        """
+        Compare source and destination digests of every transfer in parallel.
+
+        Returns:
+            The results that failed verification.
+        """
+        self.file_manager._stat_cache.invalidate(*(result.destination for result in results))
+        paths = [path for result in results for path in (result.source, result.destination)]
+        digests = self.file_manager.hash_files(paths, hashing_algorithm=self.hashing_algorithm)
+
+        failed : list[RsyncResult] = []
+        for result in results:
+            source_hash = digests.get(result.source)
+            destination_hash = digests.get(result.destination)
+            if source_hash is None or destination_hash is None:
+                logger.debug('Batch rsync did not transfer %s', result.source)
+                failed.append(result)
+            elif source_hash != destination_hash:
+                logger.error('Checksum mismatch after batch rsync: %s -> %s', result.source, result.destination)
+                self._quarantine(result.destination)
+                failed.append(result)
+        return failed
+
+    def _quarantine(self, destination : Path) -> None:
+        """
+        Rename a corrupt destination out of the way (by appending -corrupt), as _copy_with_rsync does.
+
+        rsync's quick check would otherwise consider a corrupt file with the right size and mtime to be up to date.
+        """
+        corrupt_path = destination.with_name(f'{destination.stem}-corrupt{destination.suffix}')
+        count = 0
+        while corrupt_path.exists():
+            count += 1
+            corrupt_path = destination.with_name(f'{destination.stem}-corrupt_{count}{destination.suffix}')
+        destination.rename(corrupt_path)
+        self.file_manager._stat_cache.invalidate(destination, corrupt_path)
+
+    def _retry(self, result : RsyncResult) -> None:
+        result.retried = True
+        try:
+            self.file_manager.mkdir(result.destination.parent)
+            self.file_manager._copy_with_rsync(result.source, result.destination, retries=self.retries)
+        except (subprocess.SubprocessError, OSError, ChecksumMismatchError) as e:
+            logger.error('Error copying file with rsync: %s -> %s: %s', result.source, result.destination, e)
+            result.error = e
+        finally:
+            self.file_manager._stat_cache.invalidate(result.destination)
+
+    def _delete_source(self, result : RsyncResult) -> None:
+        # It was really a move, not a copy and delete, so don't record the deletion as a deletion.
+        try:
+            self.file_manager.delete_file(result.source, dont_record=True)
+        except OSError as ose:
+            logger.error('Unable to delete source after move: %s -> %s', result.source, ose)
+            result.error = ose
@@ -0,0 +1,234 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    scheduler.py                                                                                         *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import os
+import threading
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait as wait_for
+from pathlib import Path
+from typing import Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on threads across every device. Threads are only started as work is dispatched, so this is rarely reached.
+DEFAULT_MAX_WORKERS = 32
+
+def get_device(path : Path | str) -> int:
+    """
+    The st_dev of the nearest existing ancestor of a path (destinations often don't exist yet).
+    """
+    path = Path(path)
+    for ancestor in (path, *path.parents):
+        try:
+            return os.stat(ancestor).st_dev
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(f'Cannot get stat for any ancestors of: {path}')
+
+class DeviceScheduler:
+    """
+    Runs tasks on a thread pool, limiting how many run at once on each device (st_dev) they touch.
+
+    A single global thread count is wrong for almost every job: an SD card thrashes with more than 2 readers, while an
+    NVMe SSD or a NAS share is underused with 4. Each task names the paths it reads or writes. It is only started when
+    every device those paths live on has a free slot, so an import can read an SD card with 2 workers, while writing to
+    an SSD with 8, and a NAS with 4.
+
+    Tasks waiting for a busy device never occupy a thread, so they don't hold up tasks for other devices. Finding the
+    devices of a task's paths (a stat, which can be slow on a network mount) happens on the pool too, not in submit.
+
+    Example:
+        >>> with DeviceScheduler(default_limit=4, limits={'/mnt/d': 2, '/mnt/nas': 4}) as scheduler:
+        >>>     futures = [scheduler.submit(organizer.process_file, path, paths=[path, target]) for path in files]
+    """
+    def __init__(self,
+                 default_limit : int = 4,
+                 limits : dict[str, int] | None = None,
+                 *,
+                 max_workers : int | None = None,
+                 device_of : Callable[[Path], int] = get_device,
+                 thread_name_prefix : str = 'device'):
+        """
+        Args:
+            default_limit: The number of tasks to run at once on a device without a configured limit.
+            limits: Limits for particular devices, keyed by any path on the device (i.e. its mountpoint).
+            max_workers: The number of tasks to run at once across all devices.
+            device_of: Returns the device of a path. Defaults to the st_dev of its nearest existing ancestor.
+        """
+        if default_limit < 1:
+            raise ValueError(f'Invalid device limit: {default_limit}')
+
+        self.default_limit = default_limit
+        self.max_workers = max_workers or DEFAULT_MAX_WORKERS
+        self.device_of = device_of
+        self._limits : dict[int, int] = {}
+        for path, limit in (limits or {}).items():
+            try:
+                self._limits[device_of(Path(path))] = limit
+            except OSError as ose:
+                logger.warning('Ignoring device limit for %s -> %s', path, ose)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=thread_name_prefix)
+        self._lock = threading.Lock()
+        self._resolved = threading.Condition(self._lock)
+        self._active : dict[int, int] = {}
+        self._running = 0
+        # Tasks whose devices are still being looked up
+        self._resolving = 0
+        self._cancelled = False
+        # Waiting tasks, queued by the set of devices they need
+        self._pending : dict[tuple[int, ...], deque[tuple[Future, Callable, tuple, dict]]] = {}
+
+    def limit_for(self, device : int) -> int:
+        return self._limits.get(device, self.default_limit)
+
+    def devices_for(self, paths : Iterable[Path | str]) -> tuple[int, ...]:
+        return tuple(sorted({self.device_of(Path(path)) for path in paths}))
+
+    def submit(self, fn : Callable[..., Any], /, *args, paths : Iterable[Path | str] = (), **kwargs) -> Future:
+        """
+        Schedule fn(*args, **kwargs) to run once every device in paths has a free slot.
+
+        Args:
+            fn: The task.
+            paths: The files (or directories) the task reads or writes. With no paths, only max_workers applies.
+
+        Returns:
+            A future for the result of the task.
+        """
+        future : Future = Future()
+        if not (paths := tuple(paths)):
+            with self._lock:
+                self._enqueue((), future, fn, args, kwargs)
+            return future
+
+        with self._lock:
+            self._resolving += 1
+        self._executor.submit(self._resolve, paths, future, fn, args, kwargs)
+        return future
+
+    def _resolve(self, paths : tuple[Path | str, ...], future : Future, fn : Callable, args : tuple, kwargs : dict) -> None:
+        """
+        Look up the devices a task needs, then queue it for them.
+        """
+        try:
+            devices = self.devices_for(paths)
+        except BaseException as e:
+            with self._lock:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+                self._resolving -= 1
+                self._resolved.notify_all()
+            return
+
+        with self._lock:
+            if self._cancelled:
+                future.cancel()
+            else:
+                self._enqueue(devices, future, fn, args, kwargs)
+            self._resolving -= 1
+            self._resolved.notify_all()
+
+    def _enqueue(self, devices : tuple[int, ...], future : Future, fn : Callable, args : tuple, kwargs : dict) -> None:
+        """
+        Queue a task for its devices, and start it if they have a free slot. Must be called with the lock held.
+        """
+        self._pending.setdefault(devices, deque()).append((future, fn, args, kwargs))
+        self._dispatch()
+
+    def map(self, fn : Callable[[Any], Any], items : Iterable[Any], paths : Callable[[Any], Iterable[Path | str]]) -> list[Future]:
+        """
+        Submit fn(item) for each item, with the paths for each item given by paths(item).
+        """
+        return [self.submit(fn, item, paths=paths(item)) for item in items]
+
+    def _has_capacity(self, devices : tuple[int, ...]) -> bool:
+        return all(self._active.get(device, 0) < self.limit_for(device) for device in devices)
+
+    def _dispatch(self) -> None:
+        """
+        Start every waiting task whose devices have a free slot. Must be called with the lock held.
+        """
+        for devices in list(self._pending):
+            queue = self._pending[devices]
+            while queue and self._running < self.max_workers and self._has_capacity(devices):
+                future, fn, args, kwargs = queue.popleft()
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                for device in devices:
+                    self._active[device] = self._active.get(device, 0) + 1
+                self._running += 1
+                self._executor.submit(self._run, devices, future, fn, args, kwargs)
+
+            if not queue:
+                del self._pending[devices]
+
+    def _run(self, devices : tuple[int, ...], future : Future, fn : Callable, args : tuple, kwargs : dict) -> None:
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                for device in devices:
+                    self._active[device] -= 1
+                self._running -= 1
+                self._dispatch()
+
+    def shutdown(self, wait : bool = True, *, cancel_futures : bool = False) -> None:
+        """
+        Stop the scheduler. With wait, block until every submitted task has finished (including those still waiting).
+        """
+        if cancel_futures:
+            with self._lock:
+                self._cancelled = True
+                for queue in self._pending.values():
+                    for future, *_ in queue:
+                        future.cancel()
+                self._pending.clear()
+
+        if wait:
+            while True:
+                with self._lock:
+                    # Tasks still being looked up will be queued (or cancelled) once they are
+                    self._resolved.wait_for(lambda: not self._resolving)
+                    self._dispatch()
+                    waiting = [future for queue in self._pending.values() for future, *_ in queue if not future.cancelled()]
+                if not waiting:
+                    break
+                # Waiting tasks are dispatched as running tasks finish
+                wait_for([waiting[-1]])
+
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self) -> DeviceScheduler:
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.shutdown(wait=True, cancel_futures=exc_type is not None)
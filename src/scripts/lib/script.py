@@ -28,9 +28,11 @@ import os
 import subprocess
 import shutil
 import logging
+from pathlib import Path
 from pydantic import BaseModel, ConfigDict, Field, PrivateAttr, field_validator
 from alive_progress import alive_it, alive_bar
 from scripts.lib.types import ProgressBar
+from scripts.lib.metrics import METRICS, MetricsRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +40,8 @@ class Script(BaseModel, ABC):
 
     model_config = ConfigDict(arbitrary_types_allowed=True)
     max_threads : int = 0
+    metrics_json : Path | None = None
+    metrics_textfile : Path | None = None
     _progress_bar : ProgressBar | None = PrivateAttr(default=None)
     _progress_message : str | None = PrivateAttr(default=None)
 
@@ -47,11 +51,16 @@ class Script(BaseModel, ABC):
             self._progress_bar = alive_bar(title="Running", unknown='waves')
         return self._progress_bar
 
+    @property
+    def metrics(self) -> MetricsRegistry:
+        return METRICS
+
     @field_validator("max_threads", mode="before")
     def validate_max_threads(cls, value):
         # Sensible default
         if not value:
-            # default is between 1-4 threads. More than 4 presumptively stresses the HDD non-optimally.
+            # default is between 1-4 threads (per device, where work is scheduled with a DeviceScheduler).
+            # More than 4 presumptively stresses the HDD non-optimally. Faster devices can be given more with device_limits.
             return max(1, min(4, round(os.cpu_count() / 2)))
             
         if value < 1:
@@ -72,17 +81,18 @@ class Script(BaseModel, ABC):
         if isinstance(command, str):
             command = command.split()
 
-        try:
-            return subprocess.run(command, **kwargs)
-        except FileNotFoundError as e:
-            logger.debug("Command '%s' not found. Trying to locate it with shutil.", command)
+        with METRICS.time('subprocess', command=os.path.basename(command[0])):
+            try:
+                return subprocess.run(command, **kwargs)
+            except FileNotFoundError as e:
+                logger.debug("Command '%s' not found. Trying to locate it with shutil.", command)
 
-            # Try to locate the command with shutil
-            if not (exe := shutil.which(command[0])):
-                raise FileNotFoundError(f"Command '{command[0]}' not found.") from e
+                # Try to locate the command with shutil
+                if not (exe := shutil.which(command[0])):
+                    raise FileNotFoundError(f"Command '{command[0]}' not found.") from e
 
-        command[0] = exe
-        return subprocess.run(command, **kwargs)
+            command[0] = exe
+            return subprocess.run(command, **kwargs)
 
 
     @classmethod
@@ -185,4 +195,31 @@ class Script(BaseModel, ABC):
         Returns:
             The report string.
         """
-        raise NotImplementedError(f"Subclass {self.__class__.__name__} does not implement 'report' method.")
\ No newline at end of file
+        raise NotImplementedError(f"Subclass {self.__class__.__name__} does not implement 'report' method.")
+
+    def get_metric_stats(self) -> dict[str, int]:
+        """
+        Counters specific to this script, to include alongside the shared metrics when they are dumped.
+        """
+        return {}
+
+    def dump_metrics(self, json_path : Path | None = None, textfile_path : Path | None = None) -> None:
+        """
+        Write the metrics collected during the run, as JSON and/or as a Prometheus textfile.
+
+        Args:
+            json_path: Where to write the JSON snapshot. Defaults to metrics_json.
+            textfile_path: Where to write the textfile (for node_exporter's textfile collector). Defaults to metrics_textfile.
+        """
+        json_path = json_path or self.metrics_json
+        textfile_path = textfile_path or self.metrics_textfile
+        stats = self.get_metric_stats()
+
+        try:
+            if json_path:
+                self.metrics.write_json(Path(json_path), stats)
+            if textfile_path:
+                self.metrics.write_prometheus(Path(textfile_path), stats)
+        except OSError as ose:
+            # Never fail a finished run because the metrics couldn't be written
+            logger.error('Unable to write metrics -> %s', ose)
\ No newline at end of file
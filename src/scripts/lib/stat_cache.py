@@ -0,0 +1,146 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    stat_cache.py                                                                                        *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import os
+import stat as stat_module
+import threading
+import logging
+from pathlib import Path
+from cachetools import LRUCache
+from scripts.lib.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAXSIZE = 100_000
+
+class StatCache:
+    """
+    A bounded, thread-safe cache of file metadata, keyed by absolute path.
+
+    Directory walks feed it the DirEntry objects that os.scandir() returns. Those already know whether they are a file
+    or a directory (without a syscall on linux), and only stat the file the first time the full stat is needed
+    (on Windows, scandir includes the stat, so it is free). Paths that weren't seen by a walk are stat'd on demand.
+
+    Anything that changes the filesystem (move, copy, delete, mkdir) must invalidate the paths it touched.
+
+    Example:
+        >>> cache = StatCache()
+        >>> with os.scandir('/mnt/p/DCIM') as entries:
+        ...     for entry in entries:
+        ...         cache.add_entry(entry)
+        >>> cache.stat(Path('/mnt/p/DCIM/JAM_1234.arw')).st_size  # no extra stat() for the walk that listed it
+        61234567
+    """
+    def __init__(self, maxsize : int = DEFAULT_MAXSIZE):
+        self._entries : LRUCache[str, os.DirEntry | os.stat_result] = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path : str | Path | os.DirEntry) -> str:
+        # abspath does not touch the filesystem, unlike Path.resolve()
+        return os.path.abspath(path)
+
+    def add_entry(self, entry : os.DirEntry) -> None:
+        """
+        Remember a DirEntry from os.scandir(), so later lookups for its path do not need to stat the file.
+        """
+        with self._lock:
+            self._entries[self._key(entry.path)] = entry
+
+    def stat(self, path : str | Path) -> os.stat_result:
+        """
+        Get the stat result for a path, following symlinks.
+
+        Raises:
+            FileNotFoundError: If the path does not exist.
+        """
+        key = self._key(path)
+        with self._lock:
+            cached = self._entries.get(key)
+
+        if isinstance(cached, os.stat_result):
+            return cached
+
+        if cached is not None:
+            # DirEntry caches its own stat, but we replace it anyway, so the entry can be released
+            result = cached.stat()
+        else:
+            # Only real stat calls are timed. Cache hits are (deliberately) too cheap to be worth measuring.
+            with METRICS.time('stat'):
+                result = os.stat(key)
+
+        with self._lock:
+            self._entries[key] = result
+        return result
+
+    def is_file(self, path : str | Path) -> bool:
+        key = self._key(path)
+        with self._lock:
+            cached = self._entries.get(key)
+
+        try:
+            if isinstance(cached, os.DirEntry):
+                return cached.is_file()
+            return stat_module.S_ISREG(self.stat(key).st_mode)
+        except OSError:
+            return False
+
+    def is_dir(self, path : str | Path) -> bool:
+        key = self._key(path)
+        with self._lock:
+            cached = self._entries.get(key)
+
+        try:
+            if isinstance(cached, os.DirEntry):
+                return cached.is_dir()
+            return stat_module.S_ISDIR(self.stat(key).st_mode)
+        except OSError:
+            return False
+
+    def invalidate(self, *paths : str | Path) -> None:
+        """
+        Forget everything known about the given paths. Call after the files are moved, copied over, or deleted.
+        """
+        with self._lock:
+            for path in paths:
+                self._entries.pop(self._key(path), None)
+
+    def invalidate_tree(self, directory : str | Path) -> None:
+        """
+        Forget a directory and everything beneath it.
+        """
+        prefix = self._key(directory)
+        children = prefix.rstrip(os.sep) + os.sep
+        with self._lock:
+            for key in [key for key in self._entries if key == prefix or key.startswith(children)]:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
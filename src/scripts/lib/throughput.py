@@ -0,0 +1,380 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    throughput.py                                                                                        *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import atexit
+import json
+import math
+import os
+import threading
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+
+from scripts.lib.mounts import find_mount
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THROUGHPUT_PATH = Path(os.getenv('IMAGEINN_THROUGHPUT', Path.home() / '.cache' / 'imageinn' / 'throughput.json'))
+
+# Samples kept per device or endpoint. Older samples age out, so the model follows a link that gets faster or slower.
+MAX_SAMPLES = 200
+# Below this many samples, there isn't enough history to trust, and the fixed defaults apply.
+MIN_SAMPLES = 5
+# Transfers at or below this size are assumed to be dominated by latency, when there is nothing else to go on.
+SMALL_TRANSFER = 256 * 1024
+MB = 1024 * 1024
+
+@dataclass(slots=True)
+class Sample:
+    size : int
+    seconds : float
+
+@dataclass(slots=True)
+class Session:
+    """
+    Transfers recorded for one key during this run.
+    """
+    started : float
+    size : int = 0
+
+@dataclass(slots=True)
+class LinkStats:
+    """
+    Recent transfers for one device or endpoint, modelled as: seconds = latency + size / rate.
+    """
+    samples : deque[Sample] = field(default_factory=lambda: deque(maxlen=MAX_SAMPLES))
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @property
+    def latency(self) -> float:
+        """
+        Seconds of overhead per transfer, regardless of size.
+
+        This is the intercept of a least squares fit of seconds against size. If every transfer was the same size, there
+        is nothing to fit, so small transfers are assumed to be all latency, and large ones none.
+        """
+        count = len(self.samples)
+        mean_size = sum(sample.size for sample in self.samples) / count
+        mean_seconds = sum(sample.seconds for sample in self.samples) / count
+        variance = sum((sample.size - mean_size) ** 2 for sample in self.samples)
+        if variance > 0:
+            slope = sum((sample.size - mean_size) * (sample.seconds - mean_seconds) for sample in self.samples) / variance
+            if slope > 0:
+                return min(max(0.0, mean_seconds - slope * mean_size), min(sample.seconds for sample in self.samples))
+
+        if mean_size <= SMALL_TRANSFER:
+            seconds = sorted(sample.seconds for sample in self.samples)
+            return seconds[count // 2]
+        return 0.0
+
+    @property
+    def rate(self) -> float:
+        """
+        Bytes per second, once a transfer is under way.
+        """
+        latency = self.latency
+        size = sum(sample.size for sample in self.samples)
+        seconds = sum(max(sample.seconds - latency, 1e-3) for sample in self.samples)
+        return size / seconds
+
+    def expected(self, size : int) -> float:
+        return self.latency + size / self.rate
+
+    def percentile_slowdown(self, percentile : float) -> float:
+        """
+        How much slower than expected the given percentile of transfers were, i.e. 1.8 if p99 took 80% longer.
+        """
+        latency, rate = self.latency, self.rate
+        # The fit can put latency at 0, so a tiny sample could be expected to take no time at all
+        ratios = sorted(sample.seconds / max(latency + sample.size / rate, 1e-3) for sample in self.samples)
+        index = min(len(ratios) - 1, math.ceil(percentile / 100 * len(ratios)) - 1)
+        return max(1.0, ratios[index])
+
+class ThroughputModel:
+    """
+    Tracks observed transfer speed and latency per device (mountpoint) and per remote endpoint, across runs.
+
+    Fixed timeouts are wrong in both directions: "60 seconds + 10 seconds per MB" stalls a worker for minutes on a dead
+    link, and times out large files on a slow one. From recent history, this derives:
+        - a timeout for a transfer of a given size (expected time at the p99 slowdown, times a safety margin)
+        - a retry delay that grows with the latency of the link
+        - a suggested number of concurrent transfers, which is higher where latency dominates transfer time
+
+    Until a key has MIN_SAMPLES transfers, the previous fixed defaults are used.
+
+    Example:
+        >>> model = ThroughputModel()
+        >>> key = model.key_for_url('https://immich.example.com')
+        >>> model.record(key, 25 * 1024 * 1024, 2.1)
+        >>> model.timeout(key, 30 * 1024 * 1024)
+        360.0
+    """
+    def __init__(self,
+                 path : Path | str | None = None,
+                 *,
+                 percentile : float = 99,
+                 margin : float = 2.0,
+                 min_timeout : float = 30,
+                 save_every : int = 25):
+        """
+        Args:
+            path: The JSON file history is kept in. None for the default. Pass an empty string to keep it in memory only.
+            percentile: The percentile of slowdown the timeout has to allow for.
+            margin: The timeout is this many times the expected duration at the percentile.
+            min_timeout: Timeouts are never shorter than this, to allow for hiccups on a link with little history.
+            save_every: Save after this many new transfers (as well as on exit).
+        """
+        self.path = None if path == '' else Path(path or DEFAULT_THROUGHPUT_PATH)
+        self.percentile = percentile
+        self.margin = margin
+        self.min_timeout = min_timeout
+        self.save_every = save_every
+        self._lock = threading.Lock()
+        self._links : dict[str, LinkStats] = {}
+        self._sessions : dict[str, Session] = {}
+        # Samples recorded since the last save, to be merged into whatever other models have saved since
+        self._pending : dict[str, list[Sample]] = {}
+        self._unsaved = 0
+        self._load()
+        if self.path:
+            atexit.register(self.save)
+
+    @staticmethod
+    def key_for_path(path : Path | str) -> str:
+        """
+        The key for a local path: the mountpoint of the filesystem it is on (st_dev is not stable across reboots).
+        """
+        mount = find_mount(path)
+        return f'mount:{mount.mountpoint if mount else os.path.abspath(path)}'
+
+    @staticmethod
+    def key_for_url(url : str) -> str:
+        parts = urlsplit(url)
+        return f'url:{parts.scheme}://{parts.netloc}' if parts.netloc else f'url:{url}'
+
+    def stats(self, key : str) -> LinkStats | None:
+        """
+        The history for a key, if there is enough of it to trust.
+        """
+        with self._lock:
+            stats = self._links.get(key)
+            if stats is None or len(stats) < MIN_SAMPLES:
+                return None
+            # A copy, so it can be read without holding the lock
+            return LinkStats(deque(stats.samples, maxlen=MAX_SAMPLES))
+
+    def record(self, key : str, size : int, seconds : float) -> None:
+        """
+        Record a completed transfer.
+
+        Args:
+            key: The device or endpoint (see key_for_path and key_for_url).
+            size: The number of bytes transferred.
+            seconds: How long it took.
+        """
+        # An empty file says nothing about the rate, and would be expected to take no time at all
+        if seconds <= 0 or size <= 0:
+            return
+
+        with self._lock:
+            sample = Sample(size, seconds)
+            self._links.setdefault(key, LinkStats()).samples.append(sample)
+            if self.path:
+                self._pending.setdefault(key, []).append(sample)
+            session = self._sessions.setdefault(key, Session(started=time.monotonic() - seconds))
+            session.size += size
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+
+        if should_save:
+            self.save()
+
+    def rate(self, key : str) -> float | None:
+        """
+        Bytes per second, from history. None if there isn't enough history.
+        """
+        return stats.rate if (stats := self.stats(key)) else None
+
+    def latency(self, key : str) -> float | None:
+        return stats.latency if (stats := self.stats(key)) else None
+
+    def session_rate(self, key : str) -> float:
+        """
+        Bytes per second transferred for a key during this run, over wall time (so concurrent transfers add up).
+        """
+        with self._lock:
+            if not (session := self._sessions.get(key)):
+                return 0
+            return session.size / max(time.monotonic() - session.started, 1e-3)
+
+    def timeout(self, key : str, size : int) -> float:
+        """
+        A timeout for transferring size bytes: the expected duration at the p99 slowdown, plus a margin.
+
+        Without enough history, this is 60 seconds plus 10 seconds per MB.
+        """
+        if not (stats := self.stats(key)):
+            return 60 + size / MB * 10
+
+        expected = stats.expected(size) * stats.percentile_slowdown(self.percentile)
+        return max(self.min_timeout, expected * self.margin)
+
+    def retry_delay(self, key : str, attempt : int, default : float = 10) -> float:
+        """
+        Seconds to wait before retry number attempt (starting at 0). Grows exponentially from the link's latency.
+        """
+        if (latency := self.latency(key)) is None:
+            return default
+        return min(60.0, max(1.0, latency * 4) * 2 ** attempt)
+
+    def suggest_concurrency(self, key : str, default : int, maximum : int, typical_size : int | None = None) -> int:
+        """
+        Suggest how many transfers to run at once.
+
+        Latency can be hidden by running transfers in parallel, bandwidth can't. So the suggestion is the ratio of total
+        time to time spent actually transferring, for a typical file: about 1 on a local disk, more on a distant server.
+
+        Args:
+            key: The device or endpoint.
+            default: Returned when there isn't enough history.
+            maximum: Never suggest more than this.
+            typical_size: The size of a typical file. Defaults to the median of the history.
+        """
+        if not (stats := self.stats(key)):
+            return default
+
+        if typical_size is None:
+            sizes = sorted(sample.size for sample in stats.samples)
+            typical_size = sizes[len(sizes) // 2]
+
+        transferring = max(typical_size / stats.rate, 1e-3)
+        return max(1, min(maximum, math.ceil((stats.latency + transferring) / transferring)))
+
+    def _read(self) -> dict[str, LinkStats]:
+        """
+        The history saved on disk, or nothing if there is none (or it can't be read).
+        """
+        if not self.path or not self.path.exists():
+            return {}
+
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError) as e:
+            logger.warning('Ignoring unreadable throughput history %s -> %s', self.path, e)
+            return {}
+
+        return {
+            key: LinkStats(deque((Sample(size, seconds) for size, seconds in samples), maxlen=MAX_SAMPLES))
+            for key, samples in data.get('links', {}).items()
+        }
+
+    def _load(self) -> None:
+        self._links.update(self._read())
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """
+        Hold an exclusive lock on the history across processes, while it is read, merged and written.
+        """
+        if fcntl is None:
+            yield
+            return
+
+        with open(self.path.with_name(f'{self.path.name}.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def save(self) -> None:
+        """
+        Add the transfers recorded since the last save to the history on disk, replacing the file atomically.
+
+        The file is re-read under a lock first, so models in other processes (or other models in this one) that saved
+        in the meantime don't lose their samples.
+        """
+        if not self.path:
+            return
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._unsaved = 0
+
+        if not pending:
+            return
+
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self._file_lock():
+                links = self._read()
+                for key, samples in pending.items():
+                    links.setdefault(key, LinkStats()).samples.extend(samples)
+
+                data = {'links': {key: [[sample.size, sample.seconds] for sample in stats.samples] for key, stats in links.items()}}
+                temporary = self.path.with_name(f'{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+                temporary.write_text(json.dumps(data), encoding='utf-8')
+                os.replace(temporary, self.path)
+        except OSError as ose:
+            logger.warning('Unable to save throughput history to %s -> %s', self.path, ose)
+            with self._lock:
+                for key, samples in pending.items():
+                    self._pending[key] = samples + self._pending.get(key, [])
+            return
+
+        with self._lock:
+            # Pick up what others saved, keeping anything recorded while the file was being written
+            for key, stats in links.items():
+                stats.samples.extend(self._pending.get(key, []))
+                self._links[key] = stats
+
+_models : dict[Path, ThroughputModel] = {}
+_models_lock = threading.Lock()
+
+def get_throughput_model(path : Path | str | None = None) -> ThroughputModel:
+    """
+    The throughput model shared by everything in this process that keeps its history in the given file.
+
+    Args:
+        path: The JSON file history is kept in. None for the default.
+    """
+    resolved = Path(path or DEFAULT_THROUGHPUT_PATH).absolute()
+    with _models_lock:
+        if resolved not in _models:
+            _models[resolved] = ThroughputModel(resolved)
+        return _models[resolved]
@@ -0,0 +1,365 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    transfer_plan.py                                                                                     *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import json
+import os
+import threading
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import Enum
+from itertools import chain
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable
+
+if TYPE_CHECKING:
+    from scripts.lib.file_manager import FileManager
+
+logger = logging.getLogger(__name__)
+
+class TransferAction(Enum):
+    MOVE = 'move'
+    COPY = 'copy'
+    # An identical file is already at the destination
+    DUPLICATE = 'duplicate'
+    # The destination is taken and renaming was not allowed, or the source is already at its destination
+    SKIP = 'skip'
+
+@dataclass(slots=True)
+class PlannedTransfer:
+    source : Path
+    destination : Path
+    action : TransferAction
+    renamed : bool = False
+    error : str | None = None
+
+    def to_dict(self) -> dict[str, str | bool | None]:
+        return {
+            'source': str(self.source),
+            'destination': str(self.destination),
+            'action': self.action.value,
+            'renamed': self.renamed,
+            'error': self.error,
+        }
+
+@dataclass(slots=True)
+class DirectorySnapshot:
+    """
+    The names in a destination directory, taken from a single listing, plus any names the plan has reserved since.
+    """
+    path : Path
+    exists : bool
+    device : int | None = None
+    # casefolded, so a plan never relies on the case sensitivity of the destination filesystem
+    names : set[str] = field(default_factory=set)
+
+    def is_taken(self, name : str) -> bool:
+        return name.casefold() in self.names
+
+    def reserve(self, name : str) -> None:
+        self.names.add(name.casefold())
+
+class TransferPlan:
+    """
+    Plan a batch of moves or copies, touching each destination directory as few times as possible.
+
+    Moving files one at a time costs several metadata calls per file (exists, is_dir, mkdir, and one exists per name
+    tried on a collision). On a network mount each of those is a round trip. A plan lists each destination directory
+    once, resolves collisions against that listing in memory, creates each missing directory once, and then performs
+    the transfers grouped by destination directory.
+
+    The listing is a snapshot. Another process writing to the same directories while the plan runs can still collide,
+    in which case that transfer fails (and is reported) rather than overwriting anything, where the copy tool allows.
+
+    Example:
+        >>> plan = TransferPlan(file_manager)
+        >>> plan.add(Path('/mnt/d/DCIM/JAM_1234.arw'), Path('/mnt/p/2024/2024-12-25/JAM_1234.arw'))
+        >>> plan.build()
+        >>> print(plan.to_json())
+        >>> plan.execute()
+    """
+    def __init__(self,
+                 file_manager : FileManager,
+                 *,
+                 copy : bool = False,
+                 rename_on_collision : bool = True,
+                 is_duplicate : Callable[[Path, Path], bool] | None = None,
+                 delete_duplicates : bool = False):
+        """
+        Args:
+            file_manager: Performs the transfers, and records stats.
+            copy: Copy files instead of moving them.
+            rename_on_collision: If the destination name is taken (by a file that is not a duplicate), use the first
+                free name of the form "name_0.ext", as FileOrganizer.handle_collision would. Otherwise, skip the file.
+            is_duplicate: Called with (source, existing destination) on a collision. Return True if they are the same file.
+            delete_duplicates: Delete the source of a duplicate, instead of leaving it in place.
+        """
+        self.file_manager = file_manager
+        self.copy = copy
+        self.rename_on_collision = rename_on_collision
+        self.is_duplicate = is_duplicate
+        self.delete_duplicates = delete_duplicates
+        self._requested : list[tuple[Path, Path]] = []
+        self._snapshots : dict[Path, DirectorySnapshot] = {}
+        # Groups are executed on several threads, and each can list its source directory (for sidecars)
+        self._snapshots_lock = threading.Lock()
+        self.transfers : list[PlannedTransfer] = []
+
+    def add(self, source : Path, destination : Path) -> None:
+        """
+        Add a transfer to the plan. The destination is the full path of the file, not its directory.
+        """
+        self._requested.append((source, destination))
+
+    def extend(self, pairs : Iterable[tuple[Path, Path]]) -> None:
+        self._requested.extend(pairs)
+
+    @property
+    def directories_to_create(self) -> list[Path]:
+        with self._snapshots_lock:
+            return sorted(snapshot.path for snapshot in self._snapshots.values() if not snapshot.exists)
+
+    def snapshot(self, directory : Path) -> DirectorySnapshot:
+        """
+        List a destination directory, once.
+        """
+        directory = Path(os.path.abspath(directory))
+        with self._snapshots_lock:
+            if directory in self._snapshots:
+                return self._snapshots[directory]
+
+        snapshot = DirectorySnapshot(directory, exists=False)
+        try:
+            with os.scandir(directory) as entries:
+                snapshot.names = {entry.name.casefold() for entry in entries}
+            snapshot.exists = True
+        except FileNotFoundError:
+            pass
+
+        # Another thread may have listed it in the meantime. Keep the first, as names may already be reserved in it.
+        with self._snapshots_lock:
+            return self._snapshots.setdefault(directory, snapshot)
+
+    def build(self) -> list[PlannedTransfer]:
+        """
+        Decide the final destination and action for every transfer that was added.
+
+        XMP sidecars whose photo is also in the plan are left out, because they travel with their photo (under the
+        photo's final name). Planning them on their own would reserve the sidecar's name before the photo was planned,
+        or try to transfer a sidecar the photo already took along.
+
+        Returns:
+            The planned transfers, in the order they were added.
+        """
+        photos = {
+            Path(os.path.abspath(source.with_suffix('.xmp'))).as_posix().casefold()
+            for source, _destination in self._requested
+            if source.suffix.lower() != '.xmp'
+        }
+        self.transfers = [
+            self._plan_one(source, destination)
+            for source, destination in self._requested
+            if source.suffix.lower() != '.xmp' or Path(os.path.abspath(source)).as_posix().casefold() not in photos
+        ]
+        return self.transfers
+
+    def _plan_one(self, source : Path, destination : Path) -> PlannedTransfer:
+        snapshot = self.snapshot(destination.parent)
+        action = TransferAction.COPY if self.copy else TransferAction.MOVE
+
+        if Path(os.path.abspath(source)) == snapshot.path / destination.name:
+            return PlannedTransfer(source, destination, TransferAction.SKIP)
+
+        for candidate in chain([destination.name], self.file_manager.collision_names(destination.name)):
+            if self._is_free(snapshot, source, candidate):
+                break
+
+            existing = snapshot.path / candidate
+            if snapshot.is_taken(candidate) and self.is_duplicate and self.is_duplicate(source, existing):
+                return PlannedTransfer(source, existing, TransferAction.DUPLICATE)
+
+            if not self.rename_on_collision:
+                return PlannedTransfer(source, existing, TransferAction.SKIP)
+        else:
+            return PlannedTransfer(source, destination, TransferAction.SKIP, error='No free name found')
+
+        renamed = candidate != destination.name
+        snapshot.reserve(candidate)
+        if self._has_sidecar(source):
+            snapshot.reserve(Path(candidate).with_suffix('.xmp').name)
+
+        return PlannedTransfer(source, snapshot.path / candidate, action, renamed=renamed)
+
+    def _is_free(self, snapshot : DirectorySnapshot, source : Path, name : str) -> bool:
+        if snapshot.is_taken(name):
+            return False
+        # XMP sidecars travel with their photo, so the sidecar's name must be free too
+        return not (source.suffix.lower() != '.xmp' and snapshot.is_taken(Path(name).with_suffix('.xmp').name))
+
+    def _has_sidecar(self, source : Path) -> bool:
+        # Source directories are listed once too, rather than checking for a sidecar file by file
+        return source.suffix.lower() != '.xmp' and self.snapshot(source.parent).is_taken(source.with_suffix('.xmp').name)
+
+    def to_json(self, indent : int = 2) -> str:
+        """
+        Describe the plan, i.e. for a dry run.
+        """
+        return json.dumps({
+            'action': 'copy' if self.copy else 'move',
+            'directories_to_create': [str(directory) for directory in self.directories_to_create],
+            'transfers': [transfer.to_dict() for transfer in self.transfers],
+        }, indent=indent)
+
+    def execute(self, max_workers : int | None = None, on_complete : Callable[[PlannedTransfer], None] | None = None) -> list[PlannedTransfer]:
+        """
+        Create the missing directories, and perform the transfers, grouped by destination directory.
+
+        Failures are recorded on each transfer (and as errors in the file manager stats), rather than raised.
+
+        Args:
+            max_workers: The number of destination directories to work on at once. Defaults to the file manager's max_threads.
+            on_complete: Called after each transfer finishes (or fails), i.e. to advance a progress bar.
+
+        Returns:
+            The transfers, with any errors filled in.
+        """
+        if not self.transfers:
+            self.build()
+
+        if self.file_manager.check_dry_run(f'executing a plan of {len(self.transfers)} transfers'):
+            return self.transfers
+
+        for directory in self.directories_to_create:
+            self.file_manager.mkdir(directory)
+            self.snapshot(directory).exists = True
+
+        groups : dict[Path, list[PlannedTransfer]] = defaultdict(list)
+        for transfer in self.transfers:
+            groups[transfer.destination.parent].append(transfer)
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.file_manager.max_threads or 1) as executor:
+            for _ in executor.map(lambda group: self._execute_group(group, on_complete), groups.items()):
+                pass
+
+        return self.transfers
+
+    def _execute_group(self, group : tuple[Path, list[PlannedTransfer]], on_complete : Callable[[PlannedTransfer], None] | None) -> None:
+        directory, transfers = group
+        snapshot = self.snapshot(directory)
+        if snapshot.device is None:
+            snapshot.device = self.file_manager.get_filesystem(directory)
+
+        batched : list[PlannedTransfer] = []
+        for transfer in transfers:
+            if self._should_batch(transfer, snapshot):
+                batched.append(transfer)
+                continue
+
+            try:
+                self._execute_one(transfer, snapshot)
+            except Exception as e:
+                logger.error('Transfer failed: %s -> %s: %s', transfer.source, transfer.destination, e)
+                transfer.error = str(e)
+                self.file_manager.record_error()
+
+            if on_complete:
+                on_complete(transfer)
+
+        if batched:
+            self._execute_batch(batched, on_complete)
+
+    def _should_batch(self, transfer : PlannedTransfer, snapshot : DirectorySnapshot) -> bool:
+        """
+        Whether the transfer should be sent to rsync alongside the rest of its directory, instead of on its own.
+        """
+        if self.file_manager.copy_tool != 'rsync':
+            return False
+        if transfer.action == TransferAction.COPY:
+            # A clone is faster than anything rsync can do
+            return not self.file_manager.can_reflink(transfer.source, transfer.destination)
+        # Moves on the same filesystem are a rename, which rsync can't improve on
+        return transfer.action == TransferAction.MOVE and self.file_manager.file_stat(transfer.source).st_dev != snapshot.device
+
+    def _execute_batch(self, transfers : list[PlannedTransfer], on_complete : Callable[[PlannedTransfer], None] | None) -> None:
+        file_manager = self.file_manager
+        move = not self.copy
+        by_pair = {(transfer.source.absolute(), transfer.destination.absolute()): transfer for transfer in transfers}
+        # Sidecars go in the same batch as their photo, but aren't counted as transfers of their own
+        sidecars = {
+            (transfer.source.with_suffix('.xmp').absolute(), transfer.destination.with_suffix('.xmp').absolute()): transfer
+            for transfer in transfers if self._has_sidecar(transfer.source)
+        }
+
+        # Through the file manager, so every pair (sidecars included) is journaled
+        results = file_manager.transfer_files_with_rsync(chain(by_pair.keys(), sidecars.keys()), move=move, record=False)
+        for result in results:
+            if (transfer := sidecars.get((result.source, result.destination))) is not None:
+                if not result.ok:
+                    logger.warning('Error transferring XMP file: %s -> %s', transfer.source.with_suffix('.xmp'), result.error)
+                continue
+
+            transfer = by_pair[(result.source, result.destination)]
+            if not result.ok:
+                logger.error('Transfer failed: %s -> %s: %s', transfer.source, transfer.destination, result.error)
+                transfer.error = str(result.error)
+                file_manager.record_error()
+            elif move:
+                file_manager.record_move_file()
+            else:
+                file_manager.record_copy_file()
+
+            if on_complete:
+                on_complete(transfer)
+
+    def _execute_one(self, transfer : PlannedTransfer, snapshot : DirectorySnapshot) -> None:
+        file_manager = self.file_manager
+        match transfer.action:
+            case TransferAction.SKIP:
+                file_manager.record_skip_file()
+            case TransferAction.DUPLICATE:
+                file_manager.record_stat('duplicate_file')
+                if self.delete_duplicates:
+                    file_manager.delete_file(transfer.source)
+                    if self._has_sidecar(transfer.source):
+                        file_manager.delete_file(transfer.source.with_suffix('.xmp'))
+            case TransferAction.COPY:
+                # Raises FileExistsError, rather than overwriting, if something else took the name since the listing
+                file_manager.copy_file(transfer.source, transfer.destination)
+                if self._has_sidecar(transfer.source):
+                    try:
+                        file_manager.copy_file(transfer.source.with_suffix('.xmp'), transfer.destination.with_suffix('.xmp'))
+                    except OSError as ose:
+                        logger.warning('Error copying XMP file: %s -> %s', transfer.source.with_suffix('.xmp'), ose)
+            case TransferAction.MOVE:
+                # The walk that found the source usually cached its stat already, and the plan already knows the
+                # destination is free and whether there is a sidecar, so nothing is probed here
+                same_filesystem = file_manager.file_stat(transfer.source).st_dev == snapshot.device
+                file_manager.move_planned_file(
+                    transfer.source,
+                    transfer.destination,
+                    same_filesystem=same_filesystem,
+                    sidecar=self._has_sidecar(transfer.source),
+                )
@@ -0,0 +1,255 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    trash.py                                                                                             *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import os
+import sqlite3
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.db'
+DEFAULT_SHARD_SIZE = 1000
+
+@dataclass(slots=True, frozen=True)
+class TrashEntry:
+    id : int
+    trash_path : Path
+    original_path : Path
+    size : int
+    digest : str | None
+    deleted_at : float
+
+class TrashStore:
+    """
+    A trash directory that shards itself, names files without probing, and remembers where each file came from.
+
+    Every file put in the trash is given the next number from a counter in the manifest. Its name in the trash is that
+    number, plus its original name (i.e. 00012345_JAM_1234.arw), so names never collide and nothing has to be checked
+    before the move. Files are written to numbered shards of shard_size files each (0000/, 0001/, ...), so no single
+    directory grows large enough to be slow to list.
+
+    The manifest (a SQLite database in the trash root) records where each file is in the trash (relative to the root,
+    so reopening it with a different shard_size still finds every file), its original path, size, digest (if known)
+    and the time of deletion. Restoring a file, or purging files older than a certain age, is a lookup in the
+    manifest rather than a walk of the trash.
+
+    Example:
+        >>> trash = TrashStore(Path('/mnt/d/.trash'))
+        >>> entry = trash.put(Path('/mnt/d/DCIM/JAM_1234.arw'))
+        >>> entry.trash_path
+        PosixPath('/mnt/d/.trash/0012/00012345_JAM_1234.arw')
+        >>> trash.restore(entry)
+        PosixPath('/mnt/d/DCIM/JAM_1234.arw')
+        >>> trash.purge_older_than(30 * 24 * 60 * 60)
+        0
+    """
+    root : Path
+    shard_size : int
+
+    def __init__(self, root : Path | str, shard_size : int = DEFAULT_SHARD_SIZE):
+        self.root = Path(root)
+        self.shard_size = shard_size
+        self._local = threading.local()
+        self._shards_lock = threading.Lock()
+        self._shards : set[Path] = set()
+        self._create_table()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Get the sqlite connection for the current thread, creating it on first use.
+        """
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.root / MANIFEST_NAME, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = conn
+        return conn
+
+    def _create_table(self) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self.connection as conn:
+            # AUTOINCREMENT, so numbers are never reused after entries are purged
+            conn.execute('''CREATE TABLE IF NOT EXISTS trash
+                            (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL DEFAULT '',
+                             original_path TEXT NOT NULL, size INTEGER NOT NULL, digest TEXT, deleted_at REAL NOT NULL)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS trash_original_path ON trash (original_path)')
+            conn.execute('CREATE INDEX IF NOT EXISTS trash_deleted_at ON trash (deleted_at)')
+            # The path of each file in the trash, relative to the root. Shards depend on shard_size, which can change.
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(trash)')}
+            if 'path' not in columns:
+                conn.execute('ALTER TABLE trash ADD COLUMN path TEXT')
+
+    def shard_for(self, entry_id : int) -> Path:
+        return self.root / f'{entry_id // self.shard_size:04d}'
+
+    def _entry(self, row : tuple) -> TrashEntry:
+        entry_id, name, path, original_path, size, digest, deleted_at = row
+        # Entries from before paths were recorded can only be found with the current shard_size
+        trash_path = self.root / path if path else self.shard_for(entry_id) / name
+        return TrashEntry(entry_id, trash_path, Path(original_path), size, digest, deleted_at)
+
+    def _ensure_shard(self, shard : Path) -> None:
+        with self._shards_lock:
+            if shard in self._shards:
+                return
+            shard.mkdir(exist_ok=True)
+            self._shards.add(shard)
+
+    def put(self, file_path : Path, digest : str | None = None) -> TrashEntry:
+        """
+        Move a file into the trash. The trash must be on the same filesystem as the file.
+
+        Args:
+            file_path: The file to delete.
+            digest: The hash of the file, if it is already known. It is stored in the manifest, to verify a restore.
+
+        Returns:
+            The manifest entry for the file.
+
+        Raises:
+            OSError: If the file can't be moved. The manifest is left unchanged.
+        """
+        original_path = file_path.absolute()
+        size = original_path.stat().st_size
+
+        with self.connection as conn:
+            entry_id = conn.execute(
+                'INSERT INTO trash (original_path, size, digest, deleted_at) VALUES (?, ?, ?, ?)',
+                (str(original_path), size, digest, time.time())
+            ).lastrowid
+            name = f'{entry_id:08d}_{original_path.name}'
+            shard = self.shard_for(entry_id)
+            trash_path = shard / name
+            conn.execute('UPDATE trash SET name=?, path=? WHERE id=?', (name, str(trash_path.relative_to(self.root)), entry_id))
+        try:
+            self._ensure_shard(shard)
+            os.rename(original_path, trash_path)
+        except OSError:
+            with self.connection as conn:
+                conn.execute('DELETE FROM trash WHERE id=?', (entry_id,))
+            raise
+
+        return self.get(entry_id)
+
+    def get(self, entry_id : int) -> TrashEntry:
+        row = self.connection.execute('SELECT id, name, path, original_path, size, digest, deleted_at FROM trash WHERE id=?', (entry_id,)).fetchone()
+        if row is None:
+            raise KeyError(f'No entry {entry_id} in the trash at {self.root}')
+        return self._entry(row)
+
+    def find(self, original_path : Path | str, *, recursive : bool = False) -> list[TrashEntry]:
+        """
+        Find the entries for a file by its original path, newest first.
+
+        Args:
+            original_path: The path the file was deleted from.
+            recursive: Treat original_path as a directory, and find everything deleted from within it.
+        """
+        path = os.path.abspath(original_path)
+        if recursive:
+            # GLOB is case sensitive (unlike LIKE), and uses the index for a prefix. Escape its special characters.
+            prefix = ''.join(f'[{c}]' if c in '*?[' else c for c in path.rstrip(os.sep) + os.sep)
+            query, params = 'original_path GLOB ?', (f'{prefix}*',)
+        else:
+            query, params = 'original_path=?', (path,)
+
+        rows = self.connection.execute(
+            f'SELECT id, name, path, original_path, size, digest, deleted_at FROM trash WHERE {query} ORDER BY id DESC', params
+        ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def entries(self) -> Iterator[TrashEntry]:
+        for row in self.connection.execute('SELECT id, name, path, original_path, size, digest, deleted_at FROM trash ORDER BY id').fetchall():
+            yield self._entry(row)
+
+    def count(self) -> int:
+        return self.connection.execute('SELECT COUNT(*) FROM trash').fetchone()[0]
+
+    def restore(self, entry : TrashEntry, destination : Path | None = None) -> Path:
+        """
+        Move a file out of the trash, back to where it was deleted from (or to destination).
+
+        Raises:
+            FileExistsError: If there is already a file at the destination.
+            FileNotFoundError: If the file is no longer in the trash.
+        """
+        destination = destination or entry.original_path
+        if destination.exists():
+            raise FileExistsError(f'Cannot restore {entry.trash_path}, because {destination} already exists')
+
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        os.rename(entry.trash_path, destination)
+        with self.connection as conn:
+            conn.execute('DELETE FROM trash WHERE id=?', (entry.id,))
+
+        logger.debug('Restored %s -> %s', entry.trash_path, destination)
+        return destination
+
+    def purge_older_than(self, seconds : float) -> int:
+        """
+        Permanently delete files that were put in the trash more than this many seconds ago.
+
+        Returns:
+            The number of files deleted.
+        """
+        cutoff = time.time() - seconds
+        rows = self.connection.execute(
+            'SELECT id, name, path, original_path, size, digest, deleted_at FROM trash WHERE deleted_at < ?', (cutoff,)
+        ).fetchall()
+
+        purged : list[int] = []
+        for row in rows:
+            entry = self._entry(row)
+            try:
+                entry.trash_path.unlink()
+            except FileNotFoundError:
+                # Nothing left to delete, so the entry is still removed
+                logger.warning('%s was already missing from the trash', entry.trash_path)
+            except OSError as ose:
+                logger.error('Unable to purge %s from the trash -> %s', entry.trash_path, ose)
+                continue
+            purged.append(entry.id)
+
+        with self.connection as conn:
+            conn.executemany('DELETE FROM trash WHERE id=?', [(entry_id,) for entry_id in purged])
+
+        logger.info('Purged %d files from the trash at %s', len(purged), self.root)
+        return len(purged)
+
+    def close(self) -> None:
+        """
+        Close the connection for the current thread.
+        """
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None:
+            conn.close()
+            self._local.connection = None
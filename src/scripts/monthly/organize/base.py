@@ -59,7 +59,7 @@
 *                                                                                                                      *
 *********************************************************************************************************************"""
 from __future__ import annotations
-from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 import datetime
 from ftplib import FTP
 import re
@@ -74,7 +74,7 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 from pathlib import Path
 import logging
 import argparse
-from typing import Any, Literal, Optional, Protocol
+from typing import Any, Iterable, Literal, Optional, Protocol
 from alive_progress import alive_it, alive_bar
 from pydantic import Field, PrivateAttr, field_validator
 from dotenv import load_dotenv
@@ -84,6 +84,8 @@ from scripts.exceptions import ShouldTerminateError
 from scripts.lib.file_manager import StrPattern
 from scripts.monthly.exceptions import OneFileException, DuplicationHandledException
 from scripts.lib.file_manager import FileManager
+from scripts.lib.discovery import parse_mount_limits
+from scripts.lib.transfer_plan import TransferPlan
 
 logger = logging.getLogger(__name__)
 
@@ -107,6 +109,9 @@ class FileOrganizer(FileManager):
     target_directory : Path | None = None
     copy_mode : bool = False
     keep_duplicates : bool = False
+    # Plan every transfer up front, listing each destination directory once. See TransferPlan.
+    use_plan : bool = False
+    plan_output : Path | None = None
 
     _progress_bar : ProgressBar | None = PrivateAttr(default=None)
 
@@ -264,6 +269,10 @@ class FileOrganizer(FileManager):
         """
         Organize files into subdirectories based on their date.
         """
+        if self.use_plan:
+            self.organize_files_with_plan(cleanup=cleanup)
+            return
+
         if self.check_dry_run(f'organizing files with {self.glob_pattern=} in {self.directory.absolute()}'):
             return
 
@@ -272,20 +281,23 @@ class FileOrganizer(FileManager):
         with alive_bar(title=f"{BLUE2}Organize{RESET} {self._shortpath(self.directory.absolute())}", unit='files', dual_line=True, unknown='waves') as self._progress_bar:
             self.progress_message('Searching...')
 
-            with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
-                futures = []
+            # Limit concurrency per device (i.e. 2 readers on an SD card), rather than globally
+            target_directory = self.get_target_directory()
+            with self.create_scheduler(thread_name_prefix='organize') as scheduler:
+                futures : set[Future] = set()
                 for filepath in self.yield_files():
-                    submit_result = executor.submit(self.process_file_threadsafe, filepath)
-                    futures.append(submit_result)
-                    
-                    if len(futures) >= self.max_threads * 2:
-                        # Wait for the first batch to complete
-                        self.handle_futures(futures[:self.max_threads])
-                        futures = futures[self.max_threads:]
+                    futures.add(scheduler.submit(self.process_file_threadsafe, filepath, paths=(filepath, target_directory)))
+
+                    # The scheduler applies the per-device limits. This only keeps the backlog from growing unbounded.
+                    if len(futures) >= scheduler.max_workers:
+                        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                        self.handle_futures(list(done))
 
                 if futures:
-                    self.handle_futures(futures)
+                    self.handle_futures(list(futures))
 
+        # Copies may still be queued to be verified on the device
+        self.flush_verification()
         self.report('Moving files complete')
 
         # After organization, cleanup empty directories
@@ -294,6 +306,64 @@ class FileOrganizer(FileManager):
 
         logger.info(self.report('Finished organizing.'))
 
+    def organize_files_with_plan(self, *, cleanup : bool = True) -> TransferPlan:
+        """
+        Organize files into subdirectories based on their date, planning every transfer before moving anything.
+
+        In a dry run, the plan is still built (and written to plan_output), but not executed.
+
+        Returns:
+            The plan, with the outcome of each transfer.
+        """
+        print(f'{RESET}Planning files in {BLUE}{self.directory.absolute()}{RESET} to {GREEN}{self.get_target_directory().absolute()}{RESET} with {self.max_threads} threads.')
+
+        with alive_bar(title=f"{BLUE2}Organize{RESET} {self._shortpath(self.directory.absolute())}", unit='files', dual_line=True, unknown='waves') as self._progress_bar:
+            self.progress_message('Planning...')
+            plan = self.create_plan(self.yield_files())
+
+            if self.plan_output:
+                self.plan_output.write_text(plan.to_json(), encoding='utf-8')
+                logger.info('Wrote a plan of %d transfers to %s', len(plan.transfers), self.plan_output)
+
+            self.progress_message(f'{len(plan.transfers)} files planned')
+            plan.execute(on_complete=lambda transfer: self.progress_advance(self._shortpath(transfer.destination.parent)))
+
+        self.flush_verification()
+        if cleanup and not self.copy_mode and not self.dry_run:
+            self.delete_empty_directories()
+
+        logger.info(self.report('Finished organizing.'))
+        return plan
+
+    def create_plan(self, files : Iterable[Path]) -> TransferPlan:
+        """
+        Plan the transfer of each file to its dated subdirectory. Nothing is created or moved.
+
+        Args:
+            files: The files to organize.
+
+        Returns:
+            The built plan.
+        """
+        is_duplicate = None
+        if not self.skip_collision:
+            is_duplicate = lambda source, destination: self.files_match(source, destination, skip_hash=self.skip_hash)
+
+        plan = TransferPlan(
+            self,
+            copy                = self.copy_mode,
+            rename_on_collision = not self.skip_collision,
+            is_duplicate        = is_duplicate,
+            delete_duplicates   = not self.keep_duplicates and not self.copy_mode and not self.skip_hash,
+        )
+
+        target_directory = self.get_target_directory()
+        for filepath in files:
+            plan.add(filepath, target_directory / self.find_subdir(filepath) / filepath.name)
+
+        plan.build()
+        return plan
+
     def handle_futures(self, futures : list[Future]) -> tuple[int, int]:
         """
         Handle the results of a list of futures.
@@ -513,7 +583,7 @@ class FileOrganizer(FileManager):
         else:
             try:
                 # Get the created date from the filepath
-                file_stat = filepath.stat()
+                file_stat = self.file_stat(filepath)
                 created_time = datetime.datetime.fromtimestamp(file_stat.st_ctime)
 
                 # Extract the year and month
@@ -632,12 +702,9 @@ class FileOrganizer(FileManager):
             return viable_path
 
         # Files differ; find a new filename
-        base = source_file.stem  # Filename without extension
-        ext = source_file.suffix  # File extension including the dot
-
         new_target_file : Path | None = None
-        for i in range(max_attempts):
-            new_target_file = target_file.parent / f"{base}_{i}{ext}"
+        for name in self.collision_names(source_file.name, max_attempts):
+            new_target_file = target_file.parent / name
 
             if (viable_path := self.handle_single_conflict(source_file, new_target_file)):
                 return viable_path
@@ -784,7 +851,28 @@ def autopilot(organizer : FileOrganizer) -> None:
             keep_duplicates = organizer.keep_duplicates,
             trash_directory = organizer.trash_directory,
             max_threads     = organizer.max_threads,
+            use_hash_cache  = organizer.use_hash_cache,
+            hash_cache_path = organizer.hash_cache_path,
+            walk_threads    = organizer.walk_threads,
+            walk_mount_limits = organizer.walk_mount_limits,
+            device_limits   = organizer.device_limits,
+            drop_page_cache = organizer.drop_page_cache,
+            verify_on_device= organizer.verify_on_device,
+            verify_batch_size = organizer.verify_batch_size,
+            use_reflink     = organizer.use_reflink,
+            walk_ordered    = organizer.walk_ordered,
+            # Mostly large videos, which hash much faster in parallel chunks
+            tree_hash_threshold = organizer.tree_hash_threshold,
+            use_throughput_model = organizer.use_throughput_model,
+            throughput_path = organizer.throughput_path,
+            journal_path    = organizer.journal_path,
+            # Metrics are collected for the whole process, and written once by the outer organizer
+            metrics_json    = organizer.metrics_json,
+            metrics_textfile= organizer.metrics_textfile,
+            # plan_output is left out, as each glob would overwrite the last one's plan
+            use_plan        = organizer.use_plan,
         )
+        glob_organizer.share_journal(organizer)
         glob_organizer.organize_files(cleanup=False)
 
     organizer.delete_empty_directories()
@@ -799,10 +887,24 @@ class ArgsNamespace(argparse.Namespace):
     verbose: bool
     action: str
     trash: str
+    older_than: float
+    max_age: float | None
     skip_collision: bool
     skip_hash: bool
     dry_run: bool
     max_threads : int
+    no_hash_cache : bool
+    walk_threads : int
+    walk_mount_limit : Optional[list[str]]
+    device_limit : Optional[list[str]]
+    plan : bool
+    plan_output : Optional[str]
+    metrics_json : Optional[str]
+    metrics_textfile : Optional[str]
+    journal : Optional[str]
+    verify_on_device : bool
+    keep_page_cache : bool
+    tree_hash_threshold : Optional[float]
     ftp_host: str
     ftp_user: str
     ftp_pass: str
@@ -815,6 +917,7 @@ def main() -> int:
     
     DEFAULT_TARGET = os.getenv('IMAGEINN_ORGANIZE_TARGET', '.')
     DEFAULT_TRASH = os.getenv('IMAGEINN_ORGANIZE_TRASH', None)
+    DEFAULT_JOURNAL = os.getenv('IMAGEINN_JOURNAL', None)
 
     # Set up argument parser
     parser = argparse.ArgumentParser(description='Organize files into monthly directories.')
@@ -825,12 +928,26 @@ def main() -> int:
     parser.add_argument('-k', '--keep-duplicates', action='store_true', help="Keep duplicate files in the source directory (don't delete)")
     parser.add_argument('-l', '--limit', type=int, default=-1, help='Limit the number of files to process')
     parser.add_argument('-v', '--verbose', action='store_true', help='Increase verbosity')
-    parser.add_argument('--action', default='organize', choices=['organize', 'cleanup', 'auto'], help='Action to perform')
+    parser.add_argument('--action', default='organize', choices=['organize', 'cleanup', 'auto', 'prune-cache', 'restore-trash', 'purge-trash'], help='Action to perform')
     parser.add_argument('--trash', default=DEFAULT_TRASH, help='Directory to move deleted files to. Defaults to env variable ORGANIZE_IMAGE_TRASH, which is "{DEFAULT_TRASH}", or ./.trash/')
+    parser.add_argument('--older-than', type=float, default=30, help='With --action purge-trash, delete files that have been in the trash for more than this many days (default 30)')
+    parser.add_argument('--max-age', type=float, default=None, metavar='DAYS', help="With --action prune-cache, also remove entries for files that can't be checked (i.e. on a drive that isn't mounted) if they haven't been seen for this many days. By default they are kept.")
     parser.add_argument('--skip-collision', action='store_true', help='Skip moving files on collision')
     parser.add_argument('--skip-hash', action='store_true', help='Skip verifying file hashes')
     parser.add_argument('--max-threads', type=int, default=0, help='Maximum number of threads to use')
+    parser.add_argument('--no-hash-cache', action='store_true', help='Do not read or write the persistent hash cache')
+    parser.add_argument('--walk-threads', type=int, default=1, help='Number of directories to list at once while searching for files. Helps on network mounts.')
+    parser.add_argument('--walk-mount-limit', action='append', metavar='MOUNT=N', help='Limit concurrent directory listings on a mount, i.e. /mnt/nas=8. May be repeated.')
+    parser.add_argument('--device-limit', action='append', metavar='PATH=N', help='Number of files to process at once on the device holding PATH, i.e. /mnt/d=2. Others use --max-threads. May be repeated.')
     parser.add_argument('--dry-run', action='store_true', help='Simulate the file organization without moving files')
+    parser.add_argument('--plan', action='store_true', help='Plan every transfer before moving anything, listing each destination directory once')
+    parser.add_argument('--plan-output', default=None, help='Write the transfer plan to this file as JSON (implies --plan). Combine with --dry-run to review it first.')
+    parser.add_argument('--journal', default=DEFAULT_JOURNAL, help='Log every move, copy and delete to this file, so an interrupted run is repaired (and not re-hashed) by the next one. Defaults to env var IMAGEINN_JOURNAL.')
+    parser.add_argument('--verify-on-device', action='store_true', help='Verify copies by syncing them to disk and re-reading them, rather than reading them back from memory. Slower, but catches bad writes.')
+    parser.add_argument('--keep-page-cache', action='store_true', help="Leave copied files in the page cache. By default they are dropped, so large transfers don't push everything else out of memory.")
+    parser.add_argument('--tree-hash-threshold', type=float, default=None, metavar='MB', help='Hash files of at least this many MB in parallel chunks, i.e. large videos. Disabled by default.')
+    parser.add_argument('--metrics-json', default=None, help='Write timings and byte counts for the run to this file as JSON')
+    parser.add_argument('--metrics-textfile', default=None, help='Write timings and byte counts for the run to this file, for the Prometheus node_exporter textfile collector')
     parser.add_argument('--ftp-host', help='FTP host to connect to')
     parser.add_argument('--ftp-user', help='FTP username')
     parser.add_argument('--ftp-pass', help='FTP password')
@@ -839,6 +956,12 @@ def main() -> int:
     if args.verbose:
         logger.setLevel(logging.DEBUG)
 
+    try:
+        walk_mount_limits = parse_mount_limits(args.walk_mount_limit)
+        device_limits = parse_mount_limits(args.device_limit)
+    except ValueError as ve:
+        parser.error(str(ve))
+
     organizer = FileOrganizer(
         directory       = args.directory,
         target_directory= args.target,
@@ -851,9 +974,25 @@ def main() -> int:
         keep_duplicates = args.keep_duplicates,
         trash_directory = args.trash,
         max_threads     = args.max_threads,
+        use_hash_cache  = not args.no_hash_cache,
+        walk_threads    = args.walk_threads,
+        walk_mount_limits = walk_mount_limits,
+        device_limits   = device_limits,
+        use_plan        = args.plan or bool(args.plan_output),
+        plan_output     = args.plan_output,
+        metrics_json    = args.metrics_json,
+        metrics_textfile= args.metrics_textfile,
+        journal_path    = args.journal,
+        verify_on_device= args.verify_on_device,
+        drop_page_cache = not args.keep_page_cache,
+        tree_hash_threshold = int(args.tree_hash_threshold * 1024 * 1024) if args.tree_hash_threshold is not None else None,
     )
 
     try:
+        # Opening the journal repairs anything the last run left unfinished
+        if organizer.journal is not None:
+            logger.debug('Journaling operations to %s', organizer.journal.path)
+
         match str(args.action).lower():
             case 'organize':
                 if args.ftp_host:
@@ -864,9 +1003,20 @@ def main() -> int:
                 organizer.delete_empty_directories()
             case 'auto':
                 autopilot(organizer)
+            case 'prune-cache':
+                removed = organizer.prune_hash_cache(args.max_age)
+                logger.info('Removed %d stale entries from the hash cache.', removed)
+            case 'restore-trash':
+                restored = organizer.restore_from_trash()
+                logger.info('Restored %d files deleted from %s.', restored, organizer.directory)
+            case 'purge-trash':
+                purged = organizer.purge_trash(args.older_than)
+                logger.info('Purged %d files from the trash.', purged)
             case _:
                 logger.error("Invalid action: %s", args.action)
                 return 1
+
+        organizer.close_journal()
     except ShouldTerminateError as e:
         logger.critical("Critical error: %s", e)
         logger.info('Before error: %s', organizer.report())
@@ -879,6 +1029,10 @@ def main() -> int:
         logger.error('Uncaught error: %s', e)
         logger.info(organizer.report('Before error'))
         raise
+    finally:
+        # Keep finished entries if the run was interrupted, so the next run can trust their digests
+        organizer.close_journal(checkpoint=False)
+        organizer.dump_metrics()
         
     return 0
 
@@ -0,0 +1,144 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_checksum.py                                                                                     *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import xxhash
+
+from scripts.lib.checksum import ChecksumService, canonical_algorithm, format_digest, parse_digest, digests_match
+from scripts.lib.file_manager import FileManager
+from scripts.lib.hash_cache import HashCache
+from scripts.import_sd.validator import Validator
+
+class TestDigestFormat(unittest.TestCase):
+    def test_canonical_algorithm(self):
+        self.assertEqual(canonical_algorithm('SHA256'), 'sha256')
+        self.assertEqual(canonical_algorithm('xxh64'), 'xxhash')
+        with self.assertRaises(ValueError):
+            canonical_algorithm('crc-nonsense')
+
+    def test_format_and_parse(self):
+        digest = format_digest('xxh64', 'ABC123')
+        self.assertEqual(digest, 'xxhash:ABC123')
+        self.assertEqual(parse_digest(digest), ('xxhash', 'abc123'))
+        # Bare digests predate the prefix, and were all sha256
+        self.assertEqual(parse_digest('abc123'), ('sha256', 'abc123'))
+
+    def test_digests_match(self):
+        self.assertTrue(digests_match('sha256:abc', 'abc'))
+        self.assertFalse(digests_match('sha256:abc', 'sha256:abd'))
+        with self.assertRaises(ValueError):
+            digests_match('sha256:abc', 'xxhash:abc')
+
+class TestChecksumService(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.cache = HashCache(self.temp_dir / 'hash_cache.db')
+        self.service = ChecksumService(hash_cache=self.cache)
+        self.path = self.temp_dir / 'JAM_1234.arw'
+        self.data = b'photo' * 1000
+        self.path.write_bytes(self.data)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_checksum(self):
+        self.assertEqual(self.service.checksum(self.path), f'sha256:{hashlib.sha256(self.data).hexdigest()}')
+        self.assertEqual(self.service.checksum(self.path, 'xxh64'), f'xxhash:{xxhash.xxh64(self.data).hexdigest()}')
+
+    def test_verify(self):
+        self.assertTrue(self.service.verify(self.path, format_digest('md5', hashlib.md5(self.data).hexdigest())))
+        self.assertTrue(self.service.verify(self.path, hashlib.sha256(self.data).hexdigest()))
+        self.assertFalse(self.service.verify(self.path, 'sha256:0000'))
+
+    def test_digest_is_shared_through_hash_cache(self):
+        digest = self.service.checksum(self.path)
+
+        other = ChecksumService(hash_cache=self.cache)
+        with patch.object(other.engine, 'hash_file', side_effect=AssertionError('re-hashed')):
+            self.assertEqual(other.checksum(self.path), digest)
+
+    def test_aliases_share_cache_entries(self):
+        self.service.hexdigest(self.path, 'xxhash')
+        with patch.object(self.service.engine, 'hash_file', side_effect=AssertionError('re-hashed')):
+            self.service.hexdigest(self.path, 'xxh64')
+
+    def test_large_files_are_streamed(self):
+        with patch('pathlib.Path.read_bytes', side_effect=AssertionError('read into memory')):
+            self.service.checksum(self.path)
+
+    def test_corruption_detected_without_cache(self):
+        digest = self.service.checksum(self.path)
+        stat = self.path.stat()
+
+        # Flip a byte in place, without changing the inode, size or mtime
+        with open(self.path, 'r+b') as file:
+            file.seek(100)
+            byte = file.read(1)
+            file.seek(100)
+            file.write(bytes([byte[0] ^ 0xFF]))
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        self.assertEqual(HashCache.fingerprint(self.path.stat()), HashCache.fingerprint(stat))
+
+        # The cache can't see the change, but reading the file does
+        self.assertTrue(self.service.verify(self.path, digest))
+        self.assertFalse(self.service.verify(self.path, digest, use_cache=False))
+        self.assertNotEqual(self.service.checksum(self.path, use_cache=False), digest)
+
+    def test_checksum_many_skips_missing(self):
+        results = self.service.checksum_many([self.path, self.temp_dir / 'missing.arw'])
+        self.assertEqual(list(results), [self.path])
+
+class TestChecksumCallers(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.path = self.temp_dir / 'JAM_1234.arw'
+        self.path.write_bytes(b'photo')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_validator_and_file_manager_agree(self):
+        service = ChecksumService()
+        file_manager = FileManager(directory=self.temp_dir, use_hash_cache=False)
+        with patch('scripts.import_sd.validator.get_checksum_service', return_value=service), \
+             patch.object(service, 'checksums', wraps=service.checksums) as checksums:
+            validator_digest = Validator.calculate_checksum(str(self.path))
+
+        # Only the digest it returns
+        checksums.assert_called_once_with(str(self.path), ('sha256',))
+
+        self.assertEqual(validator_digest, f'sha256:{hashlib.sha256(b"photo").hexdigest()}')
+        self.assertEqual(file_manager.checksum(self.path, 'sha256'), validator_digest)
+        self.assertEqual(file_manager.checksum(self.path), f'xxhash:{file_manager.hash_file(self.path)}')
+
+if __name__ == '__main__':
+    unittest.main()
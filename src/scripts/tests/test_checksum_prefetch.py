@@ -0,0 +1,128 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_checksum_prefetch.py                                                                            *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import os
+import tempfile
+import unittest
+from collections import Counter
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.lib.path import FilePath
+from scripts.lib.scheduler import DeviceScheduler
+from scripts.import_sd.photo import Photo
+from scripts.import_sd.queue import Queue
+from scripts.import_sd.validator import Validator
+from scripts.import_sd.workflows.copy import CopyWorkflow
+
+class TestChecksumPrefetch(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.TemporaryDirectory()
+		self.root = Path(self.temp_dir.name)
+		for name in ('sd/DCIM/100MSDCF', 'network', 'jpgs/100MSDCF', 'backup/100MSDCF'):
+			(self.root / name).mkdir(parents=True)
+		# Anything written to a relative path lands in the temporary directory, not the working tree
+		self.addCleanup(os.chdir, os.getcwd())
+		os.chdir(self.root)
+		self.card = self.root / 'sd/DCIM/100MSDCF'
+		self.contents = {'JAM_0001.jpg': b'first', 'JAM_0002.jpg': b'second', 'JAM_0003.arw': b'raw data'}
+		for name, data in self.contents.items():
+			(self.card / name).write_bytes(data)
+
+		self.workflow = CopyWorkflow(str(self.root / 'network'), str(self.root / 'jpgs'), str(self.root / 'backup'), 'arw', str(self.root / 'sd'))
+		self.final_path = FilePath([str(self.root / 'network'), 'JAM_0003.arw'])
+
+		# Count every read, by path
+		self.reads = Counter()
+		original = Validator.calculate_checksum.__func__
+
+		def calculate_checksum(cls, file_path):
+			self.reads[str(file_path)] += 1
+			return original(cls, file_path)
+
+		self.patches = [
+			patch.object(Validator, 'calculate_checksum', classmethod(calculate_checksum)),
+			patch.object(CopyWorkflow, 'generate_path', return_value=self.final_path),
+		]
+		for p in self.patches:
+			p.start()
+
+	def tearDown(self):
+		for p in self.patches:
+			p.stop()
+		self.temp_dir.cleanup()
+
+	def test_each_photo_read_once(self):
+		queue = self.workflow.queue_files()
+
+		# Every photo goes to two destinations, but is only read once
+		self.assertEqual(queue.count(), 6)
+		self.assertIn(os.path.join(self.root, 'network', 'Import Bucket', '100MSDCF', ''), [directory.path for directory in queue.get_queue()])
+		self.assertFalse((self.root / '[').exists())
+		self.assertEqual(self.reads, Counter({str(self.card / name): 1 for name in self.contents}))
+
+	def test_size_prefilter(self):
+		# Same size, but different contents
+		(self.root / 'jpgs/100MSDCF/JAM_0001.jpg').write_bytes(b'FIRST')
+		# A different size can't be a copy, so it is never read
+		(self.root / 'backup/100MSDCF/JAM_0001.jpg').write_bytes(b'much longer')
+		# An identical copy
+		(self.root / 'backup/100MSDCF/JAM_0002.jpg').write_bytes(b'second')
+
+		queue = self.workflow.queue_files()
+
+		self.assertEqual(self.reads[str(self.root / 'jpgs/100MSDCF/JAM_0001.jpg')], 1)
+		self.assertNotIn(str(self.root / 'backup/100MSDCF/JAM_0001.jpg'), self.reads)
+		self.assertEqual(self.reads[str(self.root / 'backup/100MSDCF/JAM_0002.jpg')], 1)
+		self.assertEqual(len(queue.get_mismatched()), 1)
+		self.assertEqual([photo.path for photo in queue.get_skipped()], [str(self.card / 'JAM_0002.jpg')])
+
+	def test_already_organized(self):
+		Path(self.final_path.path).write_bytes(b'raw data')
+		queue = self.workflow.queue_files()
+
+		# The raw file isn't copied to the bucket again, but is still backed up
+		self.assertEqual(queue.get(self.workflow.bucket_path), [])
+		self.assertEqual(queue.count(), 5)
+		self.assertEqual(self.reads[self.final_path.path], 1)
+
+	def test_prefetch_limited_per_device(self):
+		queue = Queue()
+		photos = [Photo(str(self.card / name)) for name in self.contents]
+
+		with DeviceScheduler(default_limit=1) as scheduler, patch.object(scheduler, 'submit', wraps=scheduler.submit) as submit:
+			# Duplicates are only read once
+			self.assertEqual(queue.prefetch_checksums(photos + photos, scheduler), 3)
+
+		for call, photo in zip(submit.call_args_list, photos):
+			self.assertEqual(call.kwargs['paths'], (photo.path,))
+		with DeviceScheduler() as scheduler:
+			self.assertEqual(queue.prefetch_checksums(photos, scheduler), 0)
+		self.assertEqual(queue.get_checksums(), {})
+		self.assertEqual(queue.calculate_checksum(photos[0]), Validator.calculate_checksum(photos[0].path))
+		self.assertEqual(self.reads[photos[0].path], 2)
+
+if __name__ == '__main__':
+	unittest.main()
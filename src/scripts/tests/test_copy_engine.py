@@ -0,0 +1,185 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_copy_engine.py                                                                                  *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import errno
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import PropertyMock, patch
+
+import xxhash
+
+from scripts.lib.copy_engine import CloneResult, CopyEngine
+from scripts.lib.file_manager import FileManager, CopyTools
+from scripts.exceptions import ChecksumMismatchError
+
+class TestCopyEngine(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source = self.temp_dir / 'source.arw'
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+        self.source.write_bytes(self.data)
+        # A small buffer, so the copy takes several chunks
+        self.engine = CopyEngine(buffer_size=1024 * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_copy_with_hasher(self):
+        destination = self.temp_dir / 'destination.arw'
+        digest = self.engine.copy(self.source, destination, xxhash.xxh64())
+
+        self.assertEqual(digest, xxhash.xxh64(self.data).hexdigest())
+        self.assertEqual(destination.read_bytes(), self.data)
+        self.assertEqual(destination.stat().st_mtime_ns, self.source.stat().st_mtime_ns)
+
+    def test_copy_kernel(self):
+        destination = self.temp_dir / 'destination.arw'
+        self.assertIsNone(self.engine.copy(self.source, destination))
+        self.assertEqual(destination.read_bytes(), self.data)
+
+    def test_copy_kernel_fallback(self):
+        destination = self.temp_dir / 'destination.arw'
+        with patch.object(CopyEngine, '_copy_file_range', autospec=True, side_effect=OSError(errno.EXDEV, 'cross device')), \
+             patch.object(CopyEngine, '_sendfile', autospec=True, side_effect=OSError(errno.ENOSYS, 'not available')):
+            self.engine.copy(self.source, destination)
+        self.assertEqual(destination.read_bytes(), self.data)
+
+    def test_existing_destination_is_untouched(self):
+        destination = self.temp_dir / 'destination.arw'
+        destination.write_bytes(b'existing')
+        with self.assertRaises(FileExistsError):
+            self.engine.copy(self.source, destination)
+        self.assertEqual(destination.read_bytes(), b'existing')
+
+    def test_failed_copy_removes_destination(self):
+        destination = self.temp_dir / 'destination.arw'
+        with patch.object(CopyEngine, '_copy_hashing', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.engine.copy(self.source, destination, xxhash.xxh64())
+        self.assertFalse(destination.exists())
+
+class TestFileManagerNativeCopy(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source = self.temp_dir / 'source.arw'
+        self.source.write_bytes(os.urandom(1024))
+        # Cloning would skip the native copy entirely on a CoW filesystem
+        self.file_manager = FileManager(hash_cache_path=self.temp_dir / 'hashes.db', use_reflink=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_native_is_default(self):
+        self.assertEqual(self.file_manager.copy_tool, CopyTools.NATIVE.value)
+
+    def test_copy_file_records_source_hash(self):
+        destination = self.temp_dir / 'destination.arw'
+        self.assertTrue(self.file_manager.copy_file(self.source, destination))
+        self.assertEqual(destination.read_bytes(), self.source.read_bytes())
+        self.assertEqual(
+            self.file_manager.get_cached_hash(self.source),
+            xxhash.xxh64(self.source.read_bytes()).hexdigest()
+        )
+
+    def test_mismatch_removes_destination(self):
+        destination = self.temp_dir / 'destination.arw'
+        with patch.object(FileManager, 'hash_file', return_value='0000'):
+            with self.assertRaises(ChecksumMismatchError):
+                self.file_manager._copy_with_native(self.source, destination)
+        self.assertFalse(destination.exists())
+
+def fake_ficlone(destination_fd, request, source_fd):
+    """
+    Stands in for the FICLONE ioctl on filesystems that don't support it, by copying the data.
+    """
+    os.lseek(source_fd, 0, os.SEEK_SET)
+    os.write(destination_fd, os.read(source_fd, 1024 * 1024))
+
+class TestReflink(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source = self.temp_dir / 'source.arw'
+        self.destination = self.temp_dir / 'destination.arw'
+        self.source.write_bytes(os.urandom(1024))
+        self.file_manager = FileManager(use_hash_cache=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_clone_unsupported(self):
+        with patch('scripts.lib.copy_engine.fcntl.ioctl', side_effect=OSError(errno.EOPNOTSUPP, 'not supported')):
+            self.assertFalse(CopyEngine().clone(self.source, self.destination))
+        self.assertFalse(self.destination.exists())
+
+    def test_clone_error(self):
+        with patch('scripts.lib.copy_engine.fcntl.ioctl', side_effect=OSError(errno.EIO, 'io error')):
+            with self.assertRaises(OSError):
+                CopyEngine().clone(self.source, self.destination)
+        self.assertFalse(self.destination.exists())
+
+    def test_clone_skips_hashing(self):
+        self.file_manager.hash_file(self.source)
+        with patch('scripts.lib.copy_engine.fcntl.ioctl', side_effect=fake_ficlone), \
+             patch.object(FileManager, '_copy_with_native', autospec=True) as native, \
+             patch.object(FileManager, 'hashing_engine', new_callable=PropertyMock) as engine:
+            self.file_manager.copy_file(self.source, self.destination)
+
+        native.assert_not_called()
+        engine.return_value.hash_file.assert_not_called()
+        self.assertEqual(self.destination.read_bytes(), self.source.read_bytes())
+        self.assertEqual(self.file_manager.files_copied, 1)
+        # The source digest carries over to the clone
+        self.assertEqual(self.file_manager.get_cached_hash(self.destination), self.file_manager.get_cached_hash(self.source))
+
+    def test_clone_refused(self):
+        with patch('scripts.lib.copy_engine.fcntl.ioctl', side_effect=OSError(errno.EINVAL, 'invalid argument')):
+            self.assertIs(CopyEngine().clone(self.source, self.destination), CloneResult.REFUSED)
+        self.assertFalse(self.destination.exists())
+
+    def test_refusal_is_not_remembered(self):
+        with patch.object(CopyEngine, 'clone', autospec=True, return_value=CloneResult.REFUSED) as clone:
+            self.file_manager.copy_file(self.source, self.destination)
+            self.file_manager.copy_file(self.source, self.temp_dir / 'another.arw')
+
+        self.assertEqual(clone.call_count, 2)
+        self.assertTrue(self.file_manager.can_reflink(self.source, self.destination))
+
+    def test_fallback_is_remembered(self):
+        with patch.object(CopyEngine, 'clone', autospec=True, return_value=CloneResult.UNSUPPORTED) as clone:
+            self.file_manager.copy_file(self.source, self.destination)
+            self.file_manager.copy_file(self.source, self.temp_dir / 'another.arw')
+
+        self.assertEqual(clone.call_count, 1)
+        self.assertEqual(self.destination.read_bytes(), self.source.read_bytes())
+        self.assertFalse(self.file_manager.can_reflink(self.source, self.destination))
+
+    def test_different_filesystem(self):
+        with patch.object(FileManager, 'get_filesystem', side_effect=[1, 2]):
+            self.assertFalse(self.file_manager.can_reflink(self.source, self.destination))
+
+if __name__ == '__main__':
+    unittest.main()
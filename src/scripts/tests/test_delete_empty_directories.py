@@ -0,0 +1,89 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_delete_empty_directories.py                                                                     *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.lib.file_manager import FileManager
+
+class TestDeleteEmptyDirectories(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.root = self.temp_dir / 'Photos'
+        # Empty all the way down
+        (self.root / '2024' / '2024-01' / 'a' / 'b').mkdir(parents=True)
+        # Only junk
+        (self.root / '2024' / '2024-02').mkdir()
+        (self.root / '2024' / '2024-02' / '.DS_Store').write_bytes(b'junk')
+        (self.root / '2024' / '2024-02' / 'Thumbs.db').write_bytes(b'junk')
+        # A photo, and an empty subdirectory
+        (self.root / '2024' / '2024-03' / 'empty').mkdir(parents=True)
+        (self.root / '2024' / '2024-03' / 'JAM_0001.arw').write_bytes(b'photo')
+
+        self.file_manager = FileManager(directory=self.root, use_hash_cache=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def remaining(self) -> list[str]:
+        return sorted(str(path.relative_to(self.root)) for path in self.root.rglob('*'))
+
+    def test_bottom_up(self):
+        visited = [dirpath.name for dirpath, _, _ in self.file_manager.yield_directories_bottom_up(self.root)]
+        self.assertLess(visited.index('b'), visited.index('a'))
+        self.assertLess(visited.index('a'), visited.index('2024-01'))
+        self.assertEqual(visited[-1], 'Photos')
+        self.assertEqual(len(visited), 8)
+
+    def test_delete_empty_directories(self):
+        with patch('os.scandir', wraps=os.scandir) as scandir:
+            self.file_manager.delete_empty_directories()
+
+        self.assertEqual(self.remaining(), ['2024', '2024/2024-03', '2024/2024-03/JAM_0001.arw'])
+        # Each directory is listed once
+        self.assertEqual(scandir.call_count, 8)
+        self.assertEqual(self.file_manager.directories_deleted, 5)
+        self.assertEqual(self.file_manager.files_deleted, 2)
+
+    def test_everything_empty(self):
+        shutil.rmtree(self.root / '2024' / '2024-03')
+        self.file_manager.delete_empty_directories()
+        self.assertFalse(self.root.exists())
+
+    def test_dry_run(self):
+        self.file_manager.dry_run = True
+        self.file_manager.delete_empty_directories()
+        self.assertEqual(len(self.remaining()), 10)
+
+    def test_delete_directory_if_empty(self):
+        self.assertTrue(self.file_manager.delete_directory_if_empty(self.root / '2024' / '2024-01'))
+        self.assertFalse(self.file_manager.delete_directory_if_empty(self.root / '2024' / '2024-03'))
+        self.assertFalse((self.root / '2024' / '2024-03' / 'empty').exists())
+
+if __name__ == '__main__':
+    unittest.main()
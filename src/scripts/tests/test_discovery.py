@@ -0,0 +1,154 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_discovery.py                                                                                    *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.lib.discovery import FileDiscovery, compile_globs, parse_mount_limits
+from scripts.lib.mounts import Mount
+from scripts.lib.file_manager import FileManager
+
+class TestCompileGlobs(unittest.TestCase):
+    def test_matches_like_path_match(self):
+        patterns = ['*.jpg', 'DCIM/*.mp4', 'IMG_[0-9]*.arw']
+        regex = compile_globs(patterns)
+        cases = {
+            '/mnt/p/2024/photo.JPG': True,
+            '/mnt/p/2024/photo.jpg.xmp': False,
+            '/mnt/d/DCIM/clip.MP4': True,
+            '/mnt/d/DCIM/100MSDCF/clip.mp4': False,
+            '/mnt/d/IMG_1234.arw': True,
+            '/mnt/d/IMG_X234.arw': False,
+        }
+        for path, expected in cases.items():
+            with self.subTest(path=path):
+                self.assertEqual(bool(regex.search(path)), expected)
+                self.assertEqual(any(Path(path).match(pattern, case_sensitive=False) for pattern in patterns), expected)
+
+    def test_no_patterns(self):
+        self.assertIsNone(compile_globs([]))
+        self.assertFalse(FileDiscovery([]).matches('photo.jpg'))
+
+class TestFileDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        for relative in ['a.jpg', 'b.ARW', 'c.txt', 'sub/d.jpg', 'sub/deeper/e.arw', '.trash/0000/f.jpg', '.hidden/g.jpg', 'skip/h.jpg']:
+            path = self.temp_dir / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_bytes(b'data')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_single_walk(self):
+        discovery = FileDiscovery(['*.jpg', '*.arw'], should_ignore_directory=lambda name: name.startswith('.') or name == 'skip')
+        with patch('os.scandir', wraps=os.scandir) as scandir:
+            names = sorted(entry.name for entry in discovery.iter_files(self.temp_dir))
+
+        self.assertEqual(names, ['a.jpg', 'b.ARW', 'd.jpg', 'e.arw'])
+        # Root, sub and sub/deeper. Pruned directories are never listed.
+        self.assertEqual(scandir.call_count, 3)
+
+    def test_trash_is_always_pruned(self):
+        discovery = FileDiscovery(['*.jpg'])
+        names = sorted(entry.name for entry in discovery.iter_files(self.temp_dir))
+        self.assertEqual(names, ['a.jpg', 'd.jpg', 'g.jpg', 'h.jpg'])
+
+    def test_not_recursive(self):
+        discovery = FileDiscovery(['*.jpg', '*.arw'])
+        names = sorted(entry.name for entry in discovery.iter_files(self.temp_dir, recursive=False))
+        self.assertEqual(names, ['a.jpg', 'b.ARW'])
+
+    def test_file_manager_prunes_hidden(self):
+        file_manager = FileManager(directory=self.temp_dir, extensions=['jpg', 'arw'], use_hash_cache=False)
+        names = sorted(path.name for path in file_manager.get_all_files())
+        self.assertEqual(names, ['a.jpg', 'b.ARW', 'd.jpg', 'e.arw', 'h.jpg'])
+
+class TestParallelDiscovery(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        for year in range(2018, 2025):
+            for month in range(1, 13):
+                directory = self.temp_dir / str(year) / f'{year}-{month:02d}'
+                directory.mkdir(parents=True)
+                (directory / f'JAM_{year}{month:02d}.arw').write_bytes(b'data')
+                (directory / f'JAM_{year}{month:02d}.jpg').write_bytes(b'data')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_unordered_finds_everything(self):
+        serial = FileDiscovery(['*.arw'])
+        parallel = FileDiscovery(['*.arw'], walk_threads=4)
+        expected = {entry.path for entry in serial.iter_files(self.temp_dir)}
+
+        self.assertEqual(len(expected), 84)
+        self.assertEqual({entry.path for entry in parallel.iter_files(self.temp_dir)}, expected)
+
+    def test_ordered_matches_serial(self):
+        serial = FileDiscovery(['*.arw', '*.jpg'], ordered=True)
+        parallel = FileDiscovery(['*.arw', '*.jpg'], walk_threads=4, ordered=True)
+
+        expected = [entry.path for entry in serial.iter_files(self.temp_dir)]
+        self.assertEqual(expected, sorted(expected))
+        self.assertEqual([entry.path for entry in parallel.iter_files(self.temp_dir)], expected)
+
+    def test_mount_limit(self):
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+        real_scandir = os.scandir
+
+        def slow_scandir(path):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.005)
+            with lock:
+                active -= 1
+            return real_scandir(path)
+
+        mount = Mount('nas', self.temp_dir, 'cifs')
+        discovery = FileDiscovery(['*.arw'], walk_threads=8, mount_limits={str(self.temp_dir): 2})
+        with patch('scripts.lib.discovery.find_mount', return_value=mount), patch('os.scandir', side_effect=slow_scandir):
+            found = list(discovery.iter_files(self.temp_dir))
+
+        self.assertEqual(len(found), 84)
+        self.assertLessEqual(peak, 2)
+
+    def test_parse_mount_limits(self):
+        self.assertEqual(parse_mount_limits(['/mnt/nas=8', '/mnt/i=2']), {'/mnt/nas': 8, '/mnt/i': 2})
+        self.assertEqual(parse_mount_limits(None), {})
+        with self.assertRaises(ValueError):
+            parse_mount_limits(['/mnt/nas'])
+
+if __name__ == '__main__':
+    unittest.main()
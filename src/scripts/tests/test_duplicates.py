@@ -0,0 +1,114 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_duplicates.py                                                                                   *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.duplicates.finder import DuplicateFinder
+from scripts.lib.hashing import HashingEngine
+
+class TestDuplicateFinder(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.primary = self.temp_dir / 'primary'
+        self.backup = self.temp_dir / 'backup'
+        self.primary.mkdir()
+        (self.backup / '2024' / '2024-12').mkdir(parents=True)
+
+        self.large = os.urandom(3 * 1024 * 1024)
+        (self.primary / 'JAM_0001.arw').write_bytes(self.large)
+        (self.backup / '2024' / '2024-12' / 'JAM_0001.arw').write_bytes(self.large)
+        (self.backup / 'JAM_0001 copy.arw').write_bytes(self.large)
+        # Same size and same first/last MB, but a different middle
+        (self.backup / 'JAM_0002.arw').write_bytes(self.large[:1024 * 1024] + os.urandom(1024 * 1024) + self.large[-1024 * 1024:])
+
+        (self.primary / 'small.jpg').write_bytes(b'small photo')
+        (self.backup / 'small.jpg').write_bytes(b'small photo')
+        (self.backup / 'unique.jpg').write_bytes(b'unique photo, with a unique size')
+
+        self.finder = DuplicateFinder(
+            directory=self.primary,
+            trash_directory=self.temp_dir / '.trash',
+            hash_cache_path=self.temp_dir / 'hashes.db',
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_find_duplicates(self):
+        groups = self.finder.find_duplicates([self.primary, self.backup])
+
+        self.assertEqual(len(groups), 2)
+        large_group, small_group = groups
+        self.assertEqual(large_group.keeper, (self.primary / 'JAM_0001.arw').absolute())
+        self.assertEqual(large_group.extras, [
+            (self.backup / 'JAM_0001 copy.arw').absolute(),
+            (self.backup / '2024' / '2024-12' / 'JAM_0001.arw').absolute(),
+        ])
+        self.assertEqual(small_group.files, [(self.primary / 'small.jpg').absolute(), (self.backup / 'small.jpg').absolute()])
+        self.assertEqual(self.finder.duplicate_files, 3)
+
+    def test_unique_sizes_are_not_read(self):
+        with patch.object(HashingEngine, 'hash_file', autospec=True, side_effect=HashingEngine.hash_file) as hash_file:
+            self.finder.find_duplicates([self.primary, self.backup])
+
+        hashed = {call.args[1].name for call in hash_file.call_args_list}
+        self.assertNotIn('unique.jpg', hashed)
+        # Small files skip the partial hash, so each is read exactly once
+        self.assertEqual(sum(1 for call in hash_file.call_args_list if call.args[1].name == 'small.jpg'), 2)
+
+    def test_hard_links_are_not_duplicates(self):
+        os.link(self.primary / 'small.jpg', self.primary / 'linked.jpg')
+        groups = self.finder.find_duplicates([self.primary])
+        self.assertEqual(groups, [])
+
+    def test_write_json(self):
+        groups = self.finder.find_duplicates([self.primary, self.backup])
+        output = io.StringIO()
+        self.finder.write_json(groups, output)
+
+        data = json.loads(output.getvalue())
+        self.assertEqual(data[0]['keep'], str((self.primary / 'JAM_0001.arw').absolute()))
+        self.assertTrue(data[0]['digest'].startswith('xxhash:'))
+
+    def test_trash_duplicates(self):
+        groups = self.finder.find_duplicates([self.primary, self.backup])
+        # Changed after being found, so it must be kept
+        (self.backup / 'small.jpg').write_bytes(b'edited photo')
+
+        self.assertEqual(self.finder.trash_duplicates(groups), 2)
+
+        self.assertTrue((self.primary / 'JAM_0001.arw').exists())
+        self.assertFalse((self.backup / 'JAM_0001 copy.arw').exists())
+        self.assertTrue((self.backup / 'small.jpg').exists())
+        self.assertEqual(len(list((self.temp_dir / '.trash').rglob('*.arw'))), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_exif_reader.py                                                                                  *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from scripts.import_sd.exif import ExifTag
+from scripts.import_sd.exif_reader import HeaderWindow, last_tag, read_tags
+from scripts.import_sd.photo import KNOWN_TAGS, PhotoMetadata
+
+ASCII, SHORT, LONG, RATIONAL = 2, 3, 4, 5
+# Beyond the header window. A fast read should never get here.
+FAR = 2 * 1024 * 1024
+
+def ascii(value : str) -> bytes:
+	return value.encode() + b'\0'
+
+def build_ifd(offset : int, entries : list[tuple], next_ifd : int = 0) -> bytes:
+	"""
+	Build a little-endian IFD at offset, followed by the values that don't fit in an entry.
+
+	Entries are (tag, type, count, value bytes), or (tag, type, count, None, pointer) for a value stored elsewhere.
+	"""
+	data_offset = offset + 2 + 12 * len(entries) + 4
+	table, data = b'', b''
+	for tag, field_type, count, value, *pointer in entries:
+		if pointer:
+			field = struct.pack('<I', pointer[0])
+		elif len(value) <= 4:
+			field = value.ljust(4, b'\0')
+		else:
+			field = struct.pack('<I', data_offset + len(data))
+			data += value
+		table += struct.pack('<HHI', tag, field_type, count) + field
+	return struct.pack('<H', len(entries)) + table + struct.pack('<I', next_ifd) + data
+
+def build_raw(path : str, model : str | None = 'ILCE-7RM4') -> None:
+	"""
+	Write a minimal TIFF-based RAW file: IFD0 and an EXIF sub-IFD near the start, and image data (another IFD) far away.
+	"""
+	exif_offset = 1024
+	ifd0 = [
+		(0x100, LONG, 1, struct.pack('<I', 6000)),
+		(0x8769, LONG, 1, struct.pack('<I', exif_offset)),
+	]
+	if model:
+		ifd0.insert(1, (0x110, ASCII, len(ascii(model)), ascii(model)))
+
+	exif = [
+		(0x829a, RATIONAL, 1, struct.pack('<II', 1, 100)),
+		(0x8827, SHORT, 1, struct.pack('<H', 100)),
+		(0x9003, ASCII, 20, ascii('2023:08:05 19:27:27')),
+		(0xa434, ASCII, 13, ascii('FE 35mm F1.8')),
+		# After the last tag we need, and pointing outside the window
+		(0xa435, ASCII, 200, None, FAR),
+	]
+
+	with open(path, 'wb') as f:
+		f.write(b'II' + struct.pack('<HI', 42, 8))
+		f.write(build_ifd(8, ifd0, next_ifd=FAR))
+		f.seek(exif_offset)
+		f.write(build_ifd(exif_offset, exif))
+		f.seek(FAR)
+		f.write(build_ifd(FAR, [(0x100, LONG, 1, struct.pack('<I', 9504))]))
+		f.write(b'\0' * 1024)
+
+class TestExifReader(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.temp_dir, 'JAM_1234.arw')
+		build_raw(self.path)
+
+	def tearDown(self):
+		shutil.rmtree(self.temp_dir)
+
+	def test_read_tags(self):
+		tags = read_tags(self.path, KNOWN_TAGS)
+		self.assertEqual(tags['Image Model'].printable, 'ILCE-7RM4')
+		self.assertEqual(tags['Image ImageWidth'].values, [6000])
+		self.assertEqual(tags['EXIF ISOSpeedRatings'].values, [100])
+		self.assertEqual(tags['EXIF LensModel'].printable, 'FE 35mm F1.8')
+		# The next IFD (image data) and tags after LensModel are not read
+		self.assertNotIn('EXIF LensSerialNumber', tags)
+		self.assertFalse(any(name.startswith('Thumbnail') for name in tags))
+
+	def test_reads_one_window(self):
+		windows = []
+		original = HeaderWindow.__init__
+		def record(window, *args, **kwargs):
+			original(window, *args, **kwargs)
+			windows.append(window)
+
+		with patch.object(HeaderWindow, '__init__', autospec=True, side_effect=record), \
+			 patch('exifread.process_file') as process_file:
+			read_tags(self.path, KNOWN_TAGS, window=64 * 1024)
+
+		process_file.assert_not_called()
+		self.assertEqual(windows[0].bytes_read, 64 * 1024)
+
+	def test_stops_early(self):
+		self.assertEqual(last_tag('EXIF', {'EXIF ISOSpeedRatings', 'EXIF ExposureTime'}), 'ISOSpeedRatings')
+		self.assertEqual(last_tag('Image', {'Image Model'}, 'ExifOffset'), 'ExifOffset')
+		tags = read_tags(self.path, {ExifTag.CAMERA, ExifTag.DATE, ExifTag.ISO})
+		self.assertIn('EXIF DateTimeOriginal', tags)
+		self.assertNotIn('EXIF LensModel', tags)
+
+	def test_same_as_full_parse(self):
+		import exifread
+		with open(self.path, 'rb') as f:
+			full = PhotoMetadata.from_tags(exifread.process_file(f, details=False))
+		self.assertEqual(PhotoMetadata.from_file(self.path), full)
+
+	def test_falls_back_when_required_tags_are_missing(self):
+		build_raw(self.path, model=None)
+		with patch('exifread.process_file', return_value={'Image Model': 'fallback'}) as process_file:
+			tags = read_tags(self.path, KNOWN_TAGS)
+		process_file.assert_called_once()
+		self.assertEqual(tags, {'Image Model': 'fallback'})
+
+	def test_not_an_image(self):
+		with open(self.path, 'wb') as f:
+			f.write(b'not an image')
+		with patch('exifread.process_file') as process_file:
+			self.assertEqual(read_tags(self.path, KNOWN_TAGS), {})
+		process_file.assert_not_called()
+
+	def test_window_reads_past_itself(self):
+		with open(self.path, 'rb') as f:
+			window = HeaderWindow(f, 16)
+			window.seek(FAR)
+			self.assertEqual(len(window.read(12)), 12)
+			self.assertEqual(window.bytes_read, 28)
+			self.assertEqual(window.tell(), FAR + 12)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,172 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_exiftool.py                                                                                     *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import os
+import stat
+import sys
+import tempfile
+import textwrap
+import threading
+import unittest
+from decimal import Decimal
+from pathlib import Path
+
+from scripts.lib.exiftool import ExifToolError, ExifToolPool, ExifToolProcess, FakeExifToolPool
+from scripts.lib.geo.radius import ExifDataExtractor
+
+# Speaks the -stay_open protocol: echoes each request's arguments, and reports an error (or exits) when asked to.
+FAKE_EXIFTOOL = textwrap.dedent('''
+    import json, os, sys
+    args = []
+    for line in sys.stdin:
+        arg = line.rstrip('\\n')
+        if arg == 'False' and args[-1:] == ['-stay_open']:
+            sys.exit(0)
+        if not arg.startswith('-execute'):
+            args.append(arg)
+            continue
+        number = arg[len('-execute'):]
+        marker = args[args.index('-echo4') + 1]
+        args = args[:args.index('-echo4')]
+        if 'die' in args:
+            sys.exit(1)
+        if 'fail' in args:
+            sys.stderr.write('Error: File not found - fail\\n')
+        if 'warn' in args:
+            # More than a pipe holds, before anything is written to stdout
+            sys.stderr.write('Warning: [minor] Bad MakerNotes offset\\n' * 4096)
+        if '-j' in args:
+            sys.stdout.write(json.dumps([{'SourceFile': args[-1], 'pid': os.getpid()}]) + '\\n')
+        else:
+            sys.stdout.write(' '.join(args) + '\\n')
+        sys.stdout.write('{ready%s}\\n' % number)
+        sys.stdout.flush()
+        sys.stderr.write(marker + '\\n')
+        sys.stderr.flush()
+        args = []
+''')
+
+class TestExifToolPool(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.executable = Path(self.temp_dir.name) / 'exiftool'
+        self.executable.write_text(f'#!{sys.executable}\n{FAKE_EXIFTOOL}')
+        self.executable.chmod(self.executable.stat().st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_process_round_trip(self):
+        process = ExifToolProcess(str(self.executable))
+        try:
+            self.assertEqual(process.execute('-TagsFromFile', Path('a.arw'), '-all', 'a.tif'), ('-TagsFromFile a.arw -all a.tif\n', ''))
+            # The same process answers every request
+            self.assertEqual(process.execute('-ver'), ('-ver\n', ''))
+            self.assertTrue(process.alive)
+        finally:
+            process.close()
+        self.assertFalse(process.alive)
+
+    def test_newlines_rejected(self):
+        with ExifToolPool(size=1, executable=str(self.executable)) as exiftool:
+            with self.assertRaises(ValueError):
+                exiftool.execute('bad\nname.jpg')
+
+    def test_reuses_processes(self):
+        with ExifToolPool(size=2, executable=str(self.executable)) as exiftool:
+            pids = {exiftool.execute_json('photo.jpg')[0]['pid'] for _ in range(5)}
+            self.assertEqual(len(pids), 1)
+            self.assertEqual(len(exiftool), 1)
+
+    def test_error_keeps_process(self):
+        with ExifToolPool(size=1, executable=str(self.executable)) as exiftool:
+            with self.assertRaises(ExifToolError) as context:
+                exiftool.execute('fail')
+            self.assertIn('File not found', context.exception.message)
+            self.assertEqual(exiftool.execute('ok'), 'ok\n')
+            self.assertEqual(len(exiftool), 1)
+
+    def test_large_stderr(self):
+        results = []
+        with ExifToolPool(size=1, executable=str(self.executable)) as exiftool:
+            thread = threading.Thread(target=lambda: results.append(exiftool.execute('warn')), daemon=True)
+            thread.start()
+            thread.join(timeout=10)
+            self.assertEqual(results, ['warn\n'])
+            self.assertEqual(exiftool.execute('ok'), 'ok\n')
+
+    def test_restarts_dead_process(self):
+        with ExifToolPool(size=1, executable=str(self.executable)) as exiftool:
+            first = exiftool.execute_json('photo.jpg')[0]['pid']
+            with self.assertRaises(ExifToolError):
+                exiftool.execute('die')
+            self.assertEqual(len(exiftool), 0)
+            self.assertNotEqual(exiftool.execute_json('photo.jpg')[0]['pid'], first)
+
+    def test_concurrent_requests(self):
+        results = {}
+        with ExifToolPool(size=2, executable=str(self.executable)) as exiftool:
+            def request(i):
+                results[i] = exiftool.copy_tags(f'{i}.arw', f'{i}.tif')
+
+            threads = [threading.Thread(target=request, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertLessEqual(len(exiftool), 2)
+
+        self.assertEqual(results, {i: f'-TagsFromFile {i}.arw -all {i}.tif\n' for i in range(8)})
+
+    def test_closed(self):
+        exiftool = ExifToolPool(size=1, executable=str(self.executable))
+        exiftool.execute('ok')
+        exiftool.close()
+        self.assertEqual(len(exiftool), 0)
+        with self.assertRaises(RuntimeError):
+            exiftool.execute('ok')
+
+class TestFakeExifToolPool(unittest.TestCase):
+    def test_records_calls(self):
+        exiftool = FakeExifToolPool(lambda args: '[{"GPSLatitude": 41.5}]' if '-j' in args else '')
+        self.assertEqual(exiftool.execute_json('-GPSLatitude', Path('a.jpg')), [{'GPSLatitude': 41.5}])
+        exiftool.copy_tags('a.arw', 'a.tif')
+        self.assertEqual(exiftool.calls, [('-j', '-GPSLatitude', 'a.jpg'), ('-TagsFromFile', 'a.arw', '-all', 'a.tif')])
+
+    def test_errors(self):
+        exiftool = FakeExifToolPool(lambda args: ('', 'Error: File not found - a.jpg'))
+        with self.assertRaises(ExifToolError):
+            exiftool.execute('a.jpg')
+
+    def test_gps_data(self):
+        exiftool = FakeExifToolPool(lambda args: '[{"SourceFile": "a.jpg", "GPSLatitude": 41.5, "GPSLongitude": -73.25}]')
+        extractor = ExifDataExtractor(exiftool)
+        self.assertEqual(extractor.get_gps_data(Path('a.jpg')), (Decimal('41.5'), Decimal('-73.25')))
+
+        exiftool.handler = lambda args: ('', 'Error: File not found - b.jpg')
+        self.assertEqual(extractor.get_gps_data(Path('b.jpg')), (None, None))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_hash_cache.py                                                                                   *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from scripts.lib.file_manager import FileManager
+from scripts.lib.hash_cache import HashCache
+
+class TestHashCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.cache = HashCache(self.temp_dir / 'hashes.db')
+        self.file_path = self.temp_dir / 'photo.arw'
+        self.file_path.write_bytes(b'raw data')
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_get_and_set(self):
+        stat = self.file_path.stat()
+        self.assertIsNone(self.cache.get(stat, 'xxhash'))
+
+        self.cache.set(self.file_path, stat, 'xxhash', False, 'abc123')
+        self.assertEqual(self.cache.get(stat, 'xxhash'), 'abc123')
+        self.assertIsNone(self.cache.get(stat, 'xxhash', partial=True))
+        self.assertIsNone(self.cache.get(stat, 'sha256'))
+
+    def test_changed_fingerprint_misses(self):
+        self.cache.set(self.file_path, self.file_path.stat(), 'xxhash', False, 'abc123')
+
+        self.file_path.write_bytes(b'different raw data')
+        self.assertIsNone(self.cache.get(self.file_path.stat(), 'xxhash'))
+
+    def test_evict_missing(self):
+        other_path = self.temp_dir / 'other.arw'
+        other_path.write_bytes(b'other data')
+        self.cache.set(self.file_path, self.file_path.stat(), 'xxhash', False, 'abc123')
+        self.cache.set(other_path, other_path.stat(), 'xxhash', False, 'def456')
+
+        other_path.unlink()
+
+        self.assertEqual(self.cache.evict_missing(), 1)
+        self.assertEqual(self.cache.count(), 1)
+        self.cache.vacuum()
+
+    def test_rename_moves_entry(self):
+        self.cache.set(self.file_path, self.file_path.stat(), 'xxhash', False, 'abc123')
+        renamed = self.temp_dir / 'renamed.arw'
+        self.file_path.rename(renamed)
+
+        self.assertEqual(self.cache.get(renamed.stat(), 'xxhash', path=renamed), 'abc123')
+        self.assertEqual(self.cache.evict_missing(), 0)
+        self.assertEqual(self.cache.get(renamed.stat(), 'xxhash'), 'abc123')
+
+    def test_evict_unreachable_by_age(self):
+        self.cache.set(self.file_path, self.file_path.stat(), 'xxhash', False, 'abc123')
+
+        with patch('scripts.lib.hash_cache.os.stat', side_effect=OSError(5, 'Input/output error')):
+            self.assertEqual(self.cache.evict_missing(), 0)
+            self.assertEqual(self.cache.evict_missing(max_age=3600), 0)
+            self.assertEqual(self.cache.evict_missing(max_age=0), 1)
+        self.assertEqual(self.cache.count(), 0)
+
+    def test_evict_unmounted_drive_by_age(self):
+        # The mount point is still there, but the drive that was mounted on it (another device) isn't
+        mount_point = self.temp_dir / 'mnt' / 'i'
+        mount_point.mkdir(parents=True)
+        stat = SimpleNamespace(st_dev=self.file_path.stat().st_dev + 1, st_ino=1, st_size=8, st_mtime_ns=1)
+        self.cache.set(mount_point / 'DCIM' / 'photo.arw', stat, 'xxhash', False, 'abc123')
+
+        self.assertEqual(self.cache.evict_missing(), 0)
+        self.assertEqual(self.cache.evict_missing(max_age=3600), 0)
+        self.assertEqual(self.cache.evict_missing(max_age=0), 1)
+
+class TestFileManagerHashCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.cache_path = self.temp_dir / 'hashes.db'
+        self.file_path = self.temp_dir / 'photo.arw'
+        self.file_path.write_bytes(os.urandom(1024))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_hash_reused_across_instances(self):
+        first = FileManager(directory=self.temp_dir, hash_cache_path=self.cache_path)
+        expected = first.hash_file(self.file_path)
+
+        second = FileManager(directory=self.temp_dir, hash_cache_path=self.cache_path)
+        with patch('builtins.open', side_effect=AssertionError('File should not be read')):
+            self.assertEqual(second.hash_file(self.file_path), expected)
+
+    def test_hash_refreshed_after_change(self):
+        manager = FileManager(directory=self.temp_dir, hash_cache_path=self.cache_path)
+        original = manager.hash_file(self.file_path)
+
+        self.file_path.write_bytes(os.urandom(2048))
+        self.assertNotEqual(manager.hash_file(self.file_path), original)
+
+    def test_disabled(self):
+        manager = FileManager(directory=self.temp_dir, use_hash_cache=False, hash_cache_path=self.cache_path)
+        manager.hash_file(self.file_path)
+        self.assertIsNone(manager.hash_cache)
+        self.assertFalse(self.cache_path.exists())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_hashing.py                                                                                      *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import xxhash
+
+from scripts.lib.hashing import HashingEngine, HashStrategy, get_hasher, PARTIAL_CHUNK_SIZE
+from scripts.lib.file_manager import FileManager
+
+class TestHashingEngine(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.data = os.urandom(5 * 1024 * 1024 + 123)
+        self.file_path = self.temp_dir / 'photo.arw'
+        self.file_path.write_bytes(self.data)
+        self.engine = HashingEngine(chunk_size=1024 * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_strategies_agree(self):
+        expected = xxhash.xxh64(self.data).hexdigest()
+        for strategy in (HashStrategy.MMAP, HashStrategy.READINTO):
+            with self.subTest(strategy=strategy):
+                self.assertEqual(self.engine.hash_file(self.file_path, 'xxhash', strategy=strategy), expected)
+
+    def test_algorithms(self):
+        self.assertEqual(self.engine.hash_file(self.file_path, 'xxh3_128'), xxhash.xxh3_128(self.data).hexdigest())
+        self.assertEqual(self.engine.hash_file(self.file_path, 'sha256'), hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(get_hasher('xxhash').name, get_hasher('xxh64').name)
+
+    def test_partial(self):
+        expected = xxhash.xxh64(self.data[:PARTIAL_CHUNK_SIZE] + self.data[-PARTIAL_CHUNK_SIZE:]).hexdigest()
+        self.assertEqual(self.engine.hash_file(self.file_path, partial=True), expected)
+        # A buffer smaller than the partial chunk still hashes all of it
+        self.assertEqual(HashingEngine(chunk_size=16 * 1024).hash_file(self.file_path, partial=True), expected)
+
+    def test_empty_file(self):
+        empty = self.temp_dir / 'empty.jpg'
+        empty.touch()
+        for strategy in (HashStrategy.MMAP, HashStrategy.READINTO):
+            with self.subTest(strategy=strategy):
+                self.assertEqual(self.engine.hash_file(empty, strategy=strategy), xxhash.xxh64().hexdigest())
+
+    def test_network_paths_use_readinto(self):
+        with patch('scripts.lib.hashing.is_network_path', return_value=True):
+            self.assertEqual(self.engine.choose_strategy(self.file_path), HashStrategy.READINTO)
+        with patch('scripts.lib.hashing.is_network_path', return_value=False):
+            self.assertEqual(self.engine.choose_strategy(self.file_path), HashStrategy.MMAP)
+
+    def test_hash_many(self):
+        other = self.temp_dir / 'other.arw'
+        other.write_bytes(b'other')
+        missing = self.temp_dir / 'missing.arw'
+
+        results = self.engine.hash_many([self.file_path, other, missing])
+
+        self.assertEqual(results, {
+            self.file_path: xxhash.xxh64(self.data).hexdigest(),
+            other: xxhash.xxh64(b'other').hexdigest(),
+        })
+
+class TestFileManagerHashFiles(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.file_manager = FileManager(directory=self.temp_dir, hash_cache_path=self.temp_dir / 'hashes.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_hash_files_uses_cache(self):
+        first = self.temp_dir / 'first.jpg'
+        second = self.temp_dir / 'second.jpg'
+        first.write_bytes(b'first')
+        second.write_bytes(b'second')
+
+        self.file_manager.hash_file(first)
+        with patch.object(HashingEngine, 'hash_many', wraps=self.file_manager.hashing_engine.hash_many) as hash_many:
+            results = self.file_manager.hash_files([first, second])
+            self.assertEqual(list(hash_many.call_args.args[0]), [second])
+
+        self.assertEqual(results[first], xxhash.xxh64(b'first').hexdigest())
+        self.assertEqual(results[second], xxhash.xxh64(b'second').hexdigest())
+
+if __name__ == '__main__':
+    unittest.main()
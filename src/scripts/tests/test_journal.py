@@ -0,0 +1,270 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_journal.py                                                                                      *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.exceptions import ShouldTerminateError
+from scripts.lib.file_manager import FileManager
+from scripts.lib.journal import OperationJournal, JournalOperation, JournalState
+
+class TestOperationJournal(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.path = self.temp_dir / 'organize.journal'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_reload(self):
+        with OperationJournal(self.path) as journal:
+            moved = journal.plan(JournalOperation.MOVE, Path('/a/1.arw'), Path('/b/1.arw'))
+            journal.plan(JournalOperation.COPY, Path('/a/2.arw'), Path('/b/2.arw'))
+            journal.complete(moved, destination_digest='abc', destination_fingerprint=(1, 2, 3, 4))
+
+        journal = OperationJournal(self.path)
+        self.assertEqual(len(journal), 2)
+        self.assertEqual([entry.source.name for entry in journal.incomplete()], ['2.arw'])
+        done = journal.get(moved.id)
+        self.assertEqual(done.state, JournalState.DONE)
+        self.assertEqual(done.destination_digest, 'abc')
+        self.assertEqual(done.destination_fingerprint, (1, 2, 3, 4))
+        # Ids continue from the last run
+        self.assertEqual(journal.plan(JournalOperation.DELETE, Path('/a/3.arw')).id, 3)
+        journal.close()
+
+    def test_torn_line_is_ignored(self):
+        with OperationJournal(self.path) as journal:
+            journal.plan(JournalOperation.MOVE, Path('/a/1.arw'), Path('/b/1.arw'))
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write('{"id":1,"state":"do')
+
+        journal = OperationJournal(self.path)
+        self.assertEqual(len(journal.incomplete()), 1)
+        journal.close()
+
+    def test_checkpoint_keeps_unfinished(self):
+        with OperationJournal(self.path) as journal:
+            for i in range(3):
+                entry = journal.plan(JournalOperation.COPY, Path(f'/a/{i}.arw'), Path(f'/b/{i}.arw'))
+                if i:
+                    journal.complete(entry)
+            self.assertEqual(journal.checkpoint(), 2)
+
+        self.assertEqual(len(self.path.read_text().splitlines()), 1)
+        journal = OperationJournal(self.path)
+        self.assertEqual([entry.source.name for entry in journal.incomplete()], ['0.arw'])
+        journal.close()
+
+class TestJournalRecovery(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source = self.temp_dir / 'source'
+        self.destination = self.temp_dir / 'destination'
+        self.source.mkdir()
+        self.destination.mkdir()
+        self.journal_path = self.temp_dir / 'organize.journal'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_file_manager(self) -> FileManager:
+        return FileManager(
+            directory=self.source,
+            trash_directory=self.temp_dir / '.trash',
+            journal_path=self.journal_path,
+            use_hash_cache=False,
+            use_reflink=False,
+            use_throughput_model=False,
+        )
+
+    def plan(self, operation : JournalOperation, source : Path, destination : Path | None = None) -> None:
+        """
+        Leave an operation unfinished, as if the process had been killed while performing it.
+        """
+        with OperationJournal(self.journal_path) as journal:
+            journal.plan(operation, source, destination)
+
+    def test_operations_are_journaled(self):
+        file_manager = self.create_file_manager()
+        (self.source / 'a.arw').write_bytes(b'a')
+        (self.source / 'b.arw').write_bytes(b'b')
+        file_manager.move_file(self.source / 'a.arw', self.destination / 'a.arw')
+        file_manager.copy_file(self.source / 'b.arw', self.destination / 'b.arw')
+        file_manager.delete_file(self.source / 'b.arw')
+        file_manager.close_journal(checkpoint=False)
+
+        entries = list(OperationJournal(self.journal_path).entries())
+        self.assertEqual([entry.operation for entry in entries], [JournalOperation.MOVE, JournalOperation.COPY, JournalOperation.DELETE])
+        self.assertTrue(all(entry.state == JournalState.DONE for entry in entries))
+        self.assertIsNotNone(entries[1].destination_fingerprint)
+
+    def test_interrupted_operation_stays_planned(self):
+        file_manager = self.create_file_manager()
+        (self.source / 'a.arw').write_bytes(b'a')
+        with patch.object(file_manager, '_copy', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                file_manager.copy_file(self.source / 'a.arw', self.destination / 'a.arw')
+        with patch.object(file_manager, '_copy', side_effect=ValueError('checksum')):
+            with self.assertRaises(ValueError):
+                file_manager.copy_file(self.source / 'a.arw', self.destination / 'a.arw')
+        file_manager.close_journal(checkpoint=False)
+
+        states = [entry.state for entry in OperationJournal(self.journal_path).entries()]
+        self.assertEqual(states, [JournalState.PLANNED, JournalState.FAILED])
+
+    def test_recover_finished_rename(self):
+        (self.destination / 'a.arw').write_bytes(b'a')
+        self.plan(JournalOperation.MOVE, self.source / 'a.arw', self.destination / 'a.arw')
+
+        file_manager = self.create_file_manager()
+        entry = next(file_manager.journal.entries())
+        self.assertEqual(entry.state, JournalState.DONE)
+
+    def test_recover_partial_copy(self):
+        (self.source / 'a.arw').write_bytes(b'a' * 100)
+        (self.destination / 'a.arw').write_bytes(b'a' * 10)
+        (self.destination / '.a.arw.Xy12ab').write_bytes(b'a' * 5)
+        self.plan(JournalOperation.MOVE, self.source / 'a.arw', self.destination / 'a.arw')
+
+        file_manager = self.create_file_manager()
+        entry = next(file_manager.journal.entries())
+        self.assertEqual(entry.state, JournalState.ROLLED_BACK)
+        self.assertTrue((self.source / 'a.arw').exists())
+        self.assertEqual(list(self.destination.iterdir()), [])
+
+    def test_recover_unfinished_move(self):
+        (self.source / 'a.arw').write_bytes(b'a' * 100)
+        (self.destination / 'a.arw').write_bytes(b'a' * 100)
+        self.plan(JournalOperation.MOVE, self.source / 'a.arw', self.destination / 'a.arw')
+
+        file_manager = self.create_file_manager()
+        entry = next(file_manager.journal.entries())
+        self.assertEqual(entry.state, JournalState.DONE)
+        self.assertFalse((self.source / 'a.arw').exists())
+        self.assertTrue((self.destination / 'a.arw').exists())
+
+    def test_recover_move_when_deletes_are_refused(self):
+        # i.e. FileOrganizer, which refuses to delete anything with --copy or --skip-hash
+        class CopyOnlyFileManager(FileManager):
+            def delete_file(self, file_path, **kwargs):
+                raise ShouldTerminateError('Cannot delete files in copy mode')
+
+        (self.source / 'a.arw').write_bytes(b'a' * 100)
+        (self.destination / 'a.arw').write_bytes(b'a' * 100)
+        self.plan(JournalOperation.MOVE, self.source / 'a.arw', self.destination / 'a.arw')
+
+        file_manager = CopyOnlyFileManager(
+            directory=self.source,
+            trash_directory=self.temp_dir / '.trash',
+            journal_path=self.journal_path,
+            use_hash_cache=False,
+            use_reflink=False,
+            use_throughput_model=False,
+        )
+        entry = next(file_manager.journal.entries())
+        self.assertEqual(entry.state, JournalState.DONE)
+        self.assertFalse((self.source / 'a.arw').exists())
+
+    def test_recovery_continues_after_app_error(self):
+        for name in ('a.arw', 'b.arw'):
+            (self.source / name).write_bytes(b'a' * 100)
+            (self.destination / name).write_bytes(b'a' * 100)
+            self.plan(JournalOperation.MOVE, self.source / name, self.destination / name)
+
+        file_manager = self.create_file_manager()
+        recover_entry = FileManager._recover_journal_entry
+
+        def recover(manager, journal, entry):
+            if entry.source.name == 'a.arw':
+                raise ShouldTerminateError('refused')
+            return recover_entry(manager, journal, entry)
+
+        with patch.object(FileManager, '_recover_journal_entry', autospec=True, side_effect=recover):
+            states = [entry.state for entry in file_manager.journal.entries()]
+
+        self.assertEqual(states, [JournalState.FAILED, JournalState.DONE])
+        self.assertFalse((self.source / 'b.arw').exists())
+
+    def test_recover_delete(self):
+        (self.source / 'kept.arw').write_bytes(b'a')
+        self.plan(JournalOperation.DELETE, self.source / 'kept.arw')
+        self.plan(JournalOperation.DELETE, self.source / 'gone.arw')
+
+        file_manager = self.create_file_manager()
+        states = [entry.state for entry in file_manager.journal.entries()]
+        self.assertEqual(states, [JournalState.ROLLED_BACK, JournalState.DONE])
+
+    def test_dry_run_does_not_recover(self):
+        (self.source / 'a.arw').write_bytes(b'a' * 100)
+        (self.destination / 'a.arw').write_bytes(b'a' * 10)
+        self.plan(JournalOperation.COPY, self.source / 'a.arw', self.destination / 'a.arw')
+
+        file_manager = self.create_file_manager()
+        file_manager.dry_run = True
+        self.assertEqual(len(file_manager.journal.incomplete()), 1)
+        self.assertTrue((self.destination / 'a.arw').exists())
+
+    def test_completed_digests_are_restored(self):
+        file_manager = self.create_file_manager()
+        (self.source / 'a.arw').write_bytes(b'a' * 100)
+        digest = file_manager.hash_file(self.source / 'a.arw')
+        file_manager.copy_file(self.source / 'a.arw', self.destination / 'a.arw')
+        file_manager.close_journal(checkpoint=False)
+
+        file_manager = self.create_file_manager()
+        self.assertEqual(file_manager.journal.completed()[0].source_digest, digest)
+        with patch.object(file_manager.hashing_engine, 'hash_file', side_effect=AssertionError('re-hashed')):
+            self.assertEqual(file_manager.hash_file(self.source / 'a.arw'), digest)
+            self.assertEqual(file_manager.hash_file(self.destination / 'a.arw'), digest)
+
+    def test_journal_published_after_recovery(self):
+        self.plan(JournalOperation.MOVE, self.source / 'a.arw', self.destination / 'a.arw')
+        file_manager = self.create_file_manager()
+        published = []
+        recover_journal = FileManager.recover_journal
+
+        def recover(manager, journal=None):
+            published.append(manager._journal)
+            return recover_journal(manager, journal)
+
+        with patch.object(FileManager, 'recover_journal', autospec=True, side_effect=recover):
+            journal = file_manager.journal
+            self.assertIs(file_manager.journal, journal)
+
+        # Recovered once, before any other caller could see the journal
+        self.assertEqual(published, [None])
+        self.assertFalse(journal.incomplete())
+
+    def test_share_journal(self):
+        file_manager = self.create_file_manager()
+        other = self.create_file_manager()
+        other.share_journal(file_manager)
+        self.assertIs(other.journal, file_manager.journal)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_metrics.py                                                                                      *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from scripts.lib.file_manager import FileManager
+from scripts.lib.metrics import METRICS, MetricsRegistry, Histogram
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.registry = MetricsRegistry()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_histogram_buckets(self):
+        histogram = Histogram((0.1, 1, float('inf')))
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(0.1, 2), (1, 3), (float('inf'), 4)])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 2.65)
+        self.assertEqual(histogram.quantile(0.5), 0.1)
+        self.assertEqual(histogram.quantile(0.99), float('inf'))
+
+    def test_timer_records_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.registry.time('hash', kind='full'):
+                raise ValueError('boom')
+        self.assertEqual(self.registry.histogram('hash', kind='full').count, 1)
+        self.assertIsNone(self.registry.histogram('hash', kind='partial'))
+
+    def test_device_counters(self):
+        self.registry.record_read(2049, 100)
+        self.registry.record_read(2049, 50)
+        self.registry.record_write(2050, 10)
+        self.assertEqual(self.registry.counter('bytes_read', device=2049), 150)
+        self.assertEqual(self.registry.counter('bytes_written', device=2050), 10)
+        self.assertEqual(self.registry.counter('bytes_written', device=2049), 0)
+
+    def test_prometheus_format(self):
+        self.registry.observe('copy', 0.002, tool='native')
+        self.registry.record_write(2050, 10)
+        text = self.registry.to_prometheus({'files_copied': 3})
+
+        self.assertIn('# TYPE imageinn_copy_seconds histogram', text)
+        self.assertIn('imageinn_copy_seconds_bucket{tool="native",le="0.0025"} 1', text)
+        self.assertIn('imageinn_copy_seconds_bucket{tool="native",le="+Inf"} 1', text)
+        self.assertIn('imageinn_copy_seconds_count{tool="native"} 1', text)
+        self.assertIn('imageinn_bytes_written_total{device="2050"} 10', text)
+        self.assertIn('imageinn_files_copied_total 3', text)
+
+    def test_prometheus_large_counters(self):
+        self.registry.record_write(2050, 12_345_678_901)
+        self.assertIn('imageinn_bytes_written_total{device="2050"} 12345678901\n', self.registry.to_prometheus())
+
+    def test_json_quantiles_are_finite(self):
+        self.registry.observe('upload', 1000)
+        self.registry.write_json(self.temp_dir / 'metrics.json')
+
+        def reject(constant):
+            raise ValueError(f'{constant} is not valid JSON')
+        data = json.loads((self.temp_dir / 'metrics.json').read_text(), parse_constant=reject)
+        self.assertIsNone(data['histograms']['upload'][0]['p99'])
+
+    def test_write_files(self):
+        self.registry.observe('stat', 0.0001)
+        self.registry.write_json(self.temp_dir / 'metrics.json', {'errors': 1})
+        self.registry.write_prometheus(self.temp_dir / 'prom' / 'imageinn.prom')
+
+        data = json.loads((self.temp_dir / 'metrics.json').read_text())
+        self.assertEqual(data['histograms']['stat'][0]['count'], 1)
+        self.assertEqual(data['stats'], {'errors': 1})
+        self.assertTrue((self.temp_dir / 'prom' / 'imageinn.prom').read_text().startswith('# TYPE'))
+        # No temporary files are left behind
+        self.assertEqual(sorted(p.name for p in self.temp_dir.rglob('*')), ['imageinn.prom', 'metrics.json', 'prom'])
+
+class TestFileManagerMetrics(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source = self.temp_dir / 'source'
+        self.destination = self.temp_dir / 'destination'
+        self.source.mkdir()
+        self.file_manager = FileManager(directory=self.source, use_hash_cache=False, use_reflink=False, use_throughput_model=False)
+        METRICS.clear()
+
+    def tearDown(self):
+        METRICS.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_copy_records_metrics(self):
+        source_file = self.source / 'JAM_1234.arw'
+        source_file.write_bytes(b'x' * 4096)
+        self.file_manager.mkdir(self.destination)
+        self.file_manager.copy_file(source_file, self.destination / source_file.name)
+
+        device = source_file.stat().st_dev
+        self.assertEqual(METRICS.histogram('mkdir').count, 1)
+        self.assertEqual(METRICS.histogram('copy', tool=self.file_manager.copy_tool).count, 1)
+        self.assertGreaterEqual(METRICS.counter('bytes_read', device=device), 4096)
+        self.assertEqual(METRICS.counter('bytes_written', device=device), 4096)
+
+    def test_hash_records_kind(self):
+        source_file = self.source / 'JAM_1234.arw'
+        source_file.write_bytes(b'x' * 4096)
+        self.file_manager.hash_file(source_file, partial=True)
+        self.file_manager.hash_file(source_file)
+        self.assertEqual(METRICS.histogram('hash', kind='partial').count, 1)
+        self.assertEqual(METRICS.histogram('hash', kind='full').count, 1)
+
+    def test_dump_metrics(self):
+        self.file_manager.record_copy_file()
+        textfile = self.temp_dir / 'imageinn.prom'
+        self.file_manager.dump_metrics(textfile_path=textfile)
+        self.assertIn('imageinn_files_copied_total 1', textfile.read_text())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_multi_digest.py                                                                                 *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import hashlib
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import xxhash
+
+from scripts.lib.checksum import ChecksumService
+from scripts.lib.hash_cache import HashCache
+from scripts.lib.hashing import HashingEngine, HashStrategy, TREE_ALGORITHM
+
+class TestMultiDigest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.path = self.temp_dir / 'JAM_1234.arw'
+        # Larger than one chunk, and not a multiple of it
+        self.data = bytes(range(256)) * 5000
+        self.path.write_bytes(self.data)
+        self.expected = {
+            'xxhash': xxhash.xxh64(self.data).hexdigest(),
+            'sha256': hashlib.sha256(self.data).hexdigest(),
+            'sha1': hashlib.sha1(self.data).hexdigest(),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_engine_single_read(self):
+        for strategy in (HashStrategy.MMAP, HashStrategy.READINTO):
+            engine = HashingEngine(chunk_size=300 * 1024)
+            with patch('builtins.open', wraps=open) as opened:
+                digests = engine.hash_file_multi(self.path, list(self.expected), strategy=strategy)
+            self.assertEqual(digests, self.expected)
+            self.assertEqual(opened.call_count, 1)
+
+    def test_partial(self):
+        engine = HashingEngine()
+        digests = engine.hash_file_multi(self.path, ['xxhash', 'sha256'], partial=True)
+        self.assertEqual(digests['xxhash'], engine.hash_file(self.path, 'xxhash', partial=True))
+
+    def test_service_bundle_is_cached(self):
+        cache = HashCache(self.temp_dir / 'hash_cache.db')
+        service = ChecksumService(hash_cache=cache)
+        with patch.object(service.engine, 'hash_file_multi', wraps=service.engine.hash_file_multi) as hashed:
+            self.assertEqual(service.hexdigests(self.path, ['xxh64', 'sha256', 'sha1']), self.expected)
+            self.assertEqual(hashed.call_count, 1)
+
+        # Another tool, sharing the hash cache, gets any of them without reading the file
+        other = ChecksumService(hash_cache=cache)
+        with patch.object(other.engine, 'hash_file', side_effect=AssertionError('re-hashed')):
+            self.assertEqual(other.checksum(self.path, 'sha1'), f'sha1:{self.expected["sha1"]}')
+        cache.close()
+
+    def test_service_only_hashes_missing(self):
+        service = ChecksumService()
+        service.hexdigest(self.path, 'sha256')
+        with patch.object(service.engine, 'hash_file_multi', wraps=service.engine.hash_file_multi) as hashed:
+            service.checksums(self.path, ['sha256', 'sha1'])
+        hashed.assert_called_once_with(self.path, ['sha1'], False)
+
+    def test_service_rejects_partial_tree(self):
+        service = ChecksumService()
+        with self.assertRaisesRegex(ValueError, 'whole file'):
+            service.hexdigests(self.path, ['xxhash', TREE_ALGORITHM], partial=True)
+
+if __name__ == '__main__':
+    unittest.main()
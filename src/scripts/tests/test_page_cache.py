@@ -0,0 +1,164 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_page_cache.py                                                                                   *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import xxhash
+
+from scripts.lib.copy_engine import CopyEngine, DeviceVerifier, fadvise
+from scripts.lib.file_manager import FileManager
+from scripts.lib.hashing import HashingEngine, HashStrategy
+from scripts.exceptions import ChecksumMismatchError
+
+class TestFadvise(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source = self.temp_dir / 'source.arw'
+        self.data = os.urandom(256 * 1024)
+        self.source.write_bytes(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_missing_posix_fadvise(self):
+        with patch('scripts.lib.copy_engine.os') as mock_os:
+            del mock_os.posix_fadvise
+            fadvise(0, 'DONTNEED')
+
+    def test_errors_are_ignored(self):
+        with patch('scripts.lib.copy_engine.os.posix_fadvise', side_effect=OSError('not supported'), create=True):
+            destination = self.temp_dir / 'destination.arw'
+            CopyEngine(drop_cache=True).copy(self.source, destination)
+        self.assertEqual(destination.read_bytes(), self.data)
+
+    def test_source_is_read_sequentially(self):
+        with patch('scripts.lib.copy_engine.fadvise') as advise:
+            CopyEngine().copy(self.source, self.temp_dir / 'destination.arw', xxhash.xxh64())
+        self.assertEqual([c.args[1] for c in advise.call_args_list], ['SEQUENTIAL', 'WILLNEED'])
+
+    def test_drop_cache(self):
+        with patch('scripts.lib.copy_engine.fadvise') as advise:
+            CopyEngine(drop_cache=True).copy(self.source, self.temp_dir / 'destination.arw', xxhash.xxh64())
+        # Both the source and the destination are dropped once copied
+        self.assertEqual([c.args[1] for c in advise.call_args_list], ['SEQUENTIAL', 'WILLNEED', 'DONTNEED', 'DONTNEED'])
+
+class TestDeviceVerifier(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.files = {}
+        for i in range(5):
+            path = self.temp_dir / f'JAM_{i}.arw'
+            data = os.urandom(64 * 1024)
+            path.write_bytes(data)
+            self.files[path] = xxhash.xxh64(data).hexdigest()
+        self.verifier = DeviceVerifier(HashingEngine(), batch_size=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_verify(self):
+        path, digest = next(iter(self.files.items()))
+        with patch('scripts.lib.copy_engine.os.fsync', wraps=os.fsync) as fsync:
+            self.assertTrue(self.verifier.verify(path, digest))
+        fsync.assert_called_once()
+        self.assertFalse(self.verifier.verify(path, '0000'))
+
+    def test_rereads_without_mmap(self):
+        path, digest = next(iter(self.files.items()))
+        with patch.object(HashingEngine, 'hash_file', return_value=digest) as hash_file:
+            self.verifier.verify(path, digest)
+        self.assertEqual(hash_file.call_args.kwargs['strategy'], HashStrategy.READINTO)
+
+    def test_batches(self):
+        results = {}
+        sizes = []
+        for path, digest in self.files.items():
+            batch = self.verifier.add(path, digest)
+            sizes.append(len(batch))
+            results.update(batch)
+
+        # Nothing is verified until the batch is full
+        self.assertEqual(sizes, [0, 0, 3, 0, 0])
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(len(self.verifier), 2)
+        results.update(self.verifier.flush())
+        self.assertEqual(results, self.files)
+        self.assertEqual(self.verifier.flush(), {})
+
+    def test_missing_file(self):
+        self.verifier.add(self.temp_dir / 'missing.arw', '0000')
+        self.assertEqual(self.verifier.flush(), {self.temp_dir / 'missing.arw': None})
+
+class TestFileManagerDeviceVerification(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source = self.temp_dir / 'source.arw'
+        self.source.write_bytes(os.urandom(64 * 1024))
+        self.file_manager = FileManager(hash_cache_path=self.temp_dir / 'hashes.db', use_reflink=False, verify_on_device=True, verify_batch_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_copy_engine_drops_cache(self):
+        self.assertTrue(self.file_manager.copy_engine.drop_cache)
+        self.assertFalse(FileManager(drop_page_cache=False).copy_engine.drop_cache)
+
+    def test_copies_are_batched(self):
+        first, second = self.temp_dir / 'first.arw', self.temp_dir / 'second.arw'
+        with patch.object(DeviceVerifier, '_verify_batch', autospec=True, side_effect=lambda verifier, batch: dict(batch)) as verify:
+            self.file_manager.copy_file(self.source, first)
+            verify.assert_not_called()
+            self.file_manager.copy_file(self.source, second)
+            verify.assert_called_once()
+
+        self.assertEqual(len(self.file_manager.device_verifier), 0)
+        self.assertEqual(self.file_manager.get_cached_hash(second), self.file_manager.get_cached_hash(self.source))
+
+    def test_bad_copies_are_deleted_at_flush(self):
+        destination = self.temp_dir / 'destination.arw'
+        self.file_manager.copy_file(self.source, destination)
+        with patch.object(HashingEngine, 'hash_file', return_value='0000'):
+            with self.assertRaises(ChecksumMismatchError):
+                self.file_manager.flush_verification()
+        self.assertFalse(destination.exists())
+        self.assertEqual(self.file_manager.get_stats()['verification_failed'], 1)
+        # Failures are only reported once
+        self.file_manager.flush_verification()
+
+    def test_moves_are_verified_immediately(self):
+        destination = self.temp_dir / 'destination.arw'
+        with patch.object(HashingEngine, 'hash_file', return_value='0000'):
+            with self.assertRaises(ChecksumMismatchError):
+                self.file_manager._copy(self.source, destination)
+        self.assertFalse(destination.exists())
+        self.assertTrue(self.source.exists())
+
+if __name__ == '__main__':
+    unittest.main()
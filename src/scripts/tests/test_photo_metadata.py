@@ -0,0 +1,127 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_photo_metadata.py                                                                               *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import os
+import shutil
+import tempfile
+import unittest
+from decimal import Decimal
+from unittest.mock import patch
+
+import exifread
+
+from scripts.import_sd.exif import ExifTag
+from scripts.import_sd.photo import Photo, PhotoMetadata, FakePhoto
+
+TAGS = {
+	'EXIF MaxApertureValue': exifread.utils.Ratio(28, 10),
+	'EXIF ISOSpeedRatings': exifread.classes.IfdTag('100', 0x8827, 3, [100], 0, 2),
+	'Image Model': 'ILCE-7RM4',
+	'EXIF ExposureTime': exifread.utils.Ratio(1, 100),
+	'EXIF DateTimeOriginal': '2023:08:05 19:27:27',
+	'Thumbnail JPEGInterchangeFormat': 1234,
+}
+
+class TestPhotoMetadata(unittest.TestCase):
+	def setUp(self):
+		self.temp_dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.temp_dir, 'JAM_1234.arw')
+		with open(self.path, 'wb') as f:
+			f.write(b'raw')
+
+	def tearDown(self):
+		shutil.rmtree(self.temp_dir)
+
+	def test_from_tags(self):
+		metadata = PhotoMetadata.from_tags(TAGS)
+		self.assertEqual(metadata.get(ExifTag.ISO), 100)
+		self.assertEqual(metadata.get('Image Model'), 'ILCE-7RM4')
+		# Tags a Photo never asks for are not kept
+		self.assertNotIn('Thumbnail JPEGInterchangeFormat', metadata)
+		self.assertIsNone(metadata.get(ExifTag.LENS))
+
+	def test_invalid_tag(self):
+		# Adapted manual lenses often report an FNumber of 0/0
+		tags = dict(TAGS, **{'EXIF FNumber': exifread.classes.IfdTag('0/0', 0x829D, 5, [exifread.utils.Ratio(0, 0)], 0, 8)})
+		metadata = PhotoMetadata.from_tags(tags)
+		self.assertIn(ExifTag.F, metadata)
+		self.assertIsNone(metadata.get(ExifTag.F))
+		# The rest of the record is unaffected
+		self.assertEqual(metadata.get('Image Model'), 'ILCE-7RM4')
+		self.assertEqual(metadata.get(ExifTag.DATE), '2023:08:05 19:27:27')
+
+	def test_immutable(self):
+		metadata = PhotoMetadata.from_tags(TAGS)
+		with self.assertRaises(TypeError):
+			metadata.tags['Image Model'] = 'other'
+		with self.assertRaises(AttributeError):
+			metadata.tags = {}
+
+	@patch('scripts.import_sd.photo.read_tags', return_value=TAGS)
+	def test_parsed_once(self, process_file):
+		photo = Photo(self.path)
+		self.assertEqual(photo.camera, 'ILCE-7RM4')
+		self.assertEqual(photo.iso, 100)
+		self.assertEqual(photo.aperture, Decimal('2.8'))
+		self.assertEqual(photo.ss, Decimal('0.01'))
+		self.assertEqual(photo.date.year, 2023)
+		self.assertIsNotNone(photo.exposure_value)
+		self.assertIsNone(photo.lens)
+		process_file.assert_called_once()
+
+	@patch('scripts.import_sd.photo.read_tags', return_value=TAGS)
+	def test_refresh(self, process_file):
+		photo = Photo(self.path)
+		self.assertEqual(photo.camera, 'ILCE-7RM4')
+
+		process_file.return_value = {**TAGS, 'Image Model': 'ILCE-7M4'}
+		self.assertEqual(photo.camera, 'ILCE-7RM4')
+		photo.refresh()
+		self.assertEqual(photo.camera, 'ILCE-7M4')
+		self.assertEqual(process_file.call_count, 2)
+
+	@patch('scripts.import_sd.photo.read_tags', return_value=TAGS)
+	def test_rewrapped_photo_reuses_tags(self, process_file):
+		photo = Photo(self.path)
+		self.assertEqual(photo.camera, 'ILCE-7RM4')
+		self.assertEqual(Photo(photo).camera, 'ILCE-7RM4')
+		process_file.assert_called_once()
+
+	@patch('scripts.import_sd.photo.read_tags', return_value=TAGS)
+	def test_new_path_rereads(self, process_file):
+		other = os.path.join(self.temp_dir, 'JAM_1235.arw')
+		shutil.copy(self.path, other)
+		photo = Photo(self.path)
+		self.assertEqual(photo.camera, 'ILCE-7RM4')
+		photo.path = other
+		self.assertEqual(photo.camera, 'ILCE-7RM4')
+		self.assertEqual(process_file.call_count, 2)
+
+	def test_fake_photo(self):
+		photo = FakePhoto('/media/pi/SD_CARD/DCIM/100MSDCF/JAM_1234.arw')
+		self.assertEqual(photo.metadata, PhotoMetadata())
+		self.assertEqual(photo.iso, 100)
+
+if __name__ == '__main__':
+	unittest.main()
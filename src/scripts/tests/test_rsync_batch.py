@@ -0,0 +1,148 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_rsync_batch.py                                                                                  *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.lib.file_manager import FileManager, CopyTools
+from scripts.lib.journal import OperationJournal, JournalState
+from scripts.lib.rsync_batch import RsyncBatch
+from scripts.lib.transfer_plan import TransferPlan
+
+class FakeRsync:
+    """
+    Stands in for the rsync binary, copying files with shutil and printing itemized output.
+    """
+    def __init__(self, skip : set[str] | None = None, corrupt : set[str] | None = None, returncode : int = 0):
+        self.skip = skip or set()
+        self.corrupt = corrupt or set()
+        self.returncode = returncode
+        self.commands : list[list[str]] = []
+
+    def __call__(self, command : list[str], **kwargs) -> subprocess.CompletedProcess:
+        self.commands.append(command)
+        if '--files-from=-' not in command:
+            # A single file copy, i.e. a retry
+            shutil.copy2(command[-2], command[-1])
+            return subprocess.CompletedProcess(command, 0)
+
+        source_root, destination_root = Path(command[-2]), Path(command[-1])
+        lines = []
+        for name in kwargs['input'].split('\0'):
+            if name in self.skip:
+                continue
+            shutil.copy2(source_root / name, destination_root / name)
+            if name in self.corrupt:
+                (destination_root / name).write_bytes(b'corrupt')
+            lines.append(f'>f+++++++++ {name}')
+        return subprocess.CompletedProcess(command, self.returncode, '\n'.join(lines), '')
+
+class TestRsyncBatch(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source_dir = self.temp_dir / 'DCIM'
+        self.target_dir = self.temp_dir / 'Photos'
+        self.source_dir.mkdir()
+        self.target_dir.mkdir()
+
+        self.names = ['JAM_0001.arw', 'JAM_0002.arw', 'JAM_0003.arw']
+        for name in self.names:
+            (self.source_dir / name).write_bytes(name.encode() * 100)
+
+        self.file_manager = FileManager(directory=self.source_dir, use_hash_cache=False, copy_method=CopyTools.RSYNC, trash_directory=self.temp_dir / '.trash')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_batch(self, rsync : FakeRsync, **kwargs):
+        with patch.object(FileManager, 'subprocess', side_effect=rsync), patch('scripts.lib.file_manager.time.sleep'):
+            return self.file_manager.transfer_files_with_rsync(
+                [(self.source_dir / name, self.target_dir / name) for name in self.names], **kwargs
+            )
+
+    def test_parse_itemized(self):
+        output = 'cd+++++++++ ./\n>f+++++++++ JAM_0001.arw\n>f..t...... JAM 0002.arw\n'
+        self.assertEqual(RsyncBatch.parse_itemized(output), {'JAM_0001.arw': '>f+++++++++', 'JAM 0002.arw': '>f..t......'})
+
+    def test_one_process_per_directory(self):
+        rsync = FakeRsync()
+        results = self.run_batch(rsync)
+
+        self.assertEqual(len(rsync.commands), 1)
+        self.assertTrue(all(result.ok and not result.retried for result in results))
+        self.assertEqual([result.itemized for result in results], ['>f+++++++++'] * 3)
+        self.assertEqual(self.file_manager.files_copied, 3)
+        for name in self.names:
+            self.assertEqual((self.target_dir / name).read_bytes(), (self.source_dir / name).read_bytes())
+
+    def test_failures_are_retried_individually(self):
+        rsync = FakeRsync(skip={'JAM_0002.arw'}, corrupt={'JAM_0003.arw'}, returncode=23)
+        results = self.run_batch(rsync, move=True)
+
+        self.assertEqual(len(rsync.commands), 3)
+        self.assertEqual([result.retried for result in results], [False, True, True])
+        self.assertTrue(all(result.ok for result in results))
+        self.assertTrue((self.target_dir / 'JAM_0003-corrupt.arw').exists())
+        self.assertEqual((self.target_dir / 'JAM_0003.arw').read_bytes(), b'JAM_0003.arw' * 100)
+        self.assertEqual(list(self.source_dir.iterdir()), [])
+        self.assertEqual(self.file_manager.files_moved, 3)
+        self.assertEqual(self.file_manager.files_deleted, 0)
+
+    def test_plan_batches_are_journaled(self):
+        (self.source_dir / 'JAM_0001.xmp').write_bytes(b'sidecar')
+        journal_path = self.temp_dir / 'organize.journal'
+        self.file_manager.journal_path = journal_path
+        self.file_manager.use_reflink = False
+
+        plan = TransferPlan(self.file_manager, copy=True)
+        plan.extend((self.source_dir / name, self.target_dir / name) for name in self.names)
+        rsync = FakeRsync()
+        with patch.object(FileManager, 'subprocess', side_effect=rsync):
+            transfers = plan.execute()
+        self.file_manager.close_journal(checkpoint=False)
+
+        self.assertEqual(len(rsync.commands), 1)
+        self.assertEqual([transfer.error for transfer in transfers], [None] * 3)
+        self.assertEqual((self.target_dir / 'JAM_0001.xmp').read_bytes(), b'sidecar')
+        # The sidecar is journaled with the rest, but only the photos are counted
+        entries = list(OperationJournal(journal_path).entries())
+        self.assertEqual(sorted(entry.destination.name for entry in entries), ['JAM_0001.arw', 'JAM_0001.xmp', 'JAM_0002.arw', 'JAM_0003.arw'])
+        self.assertTrue(all(entry.state == JournalState.DONE for entry in entries))
+        self.assertEqual(self.file_manager.files_copied, 3)
+
+    def test_failed_retries_are_errors(self):
+        rsync = FakeRsync(skip={'JAM_0002.arw'})
+        (self.source_dir / 'JAM_0002.arw').unlink()
+        results = self.run_batch(rsync, move=True)
+
+        self.assertFalse(results[1].ok)
+        self.assertEqual(self.file_manager.files_moved, 2)
+        self.assertEqual(self.file_manager.errors, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_scheduler.py                                                                                    *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import tempfile
+import threading
+import time
+import unittest
+from collections import defaultdict
+from pathlib import Path
+
+from scripts.lib.file_manager import FileManager
+from scripts.lib.scheduler import DeviceScheduler, get_device
+
+def fake_device(path : Path) -> int:
+    """
+    /sd/... is device 1, /ssd/... is device 2, /nas/... is device 3.
+    """
+    return {'sd': 1, 'ssd': 2, 'nas': 3}[path.parts[1]]
+
+class TestDeviceScheduler(unittest.TestCase):
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.running : dict[str, int] = defaultdict(int)
+        self.peak : dict[str, int] = defaultdict(int)
+
+    def task(self, *devices : str) -> None:
+        with self.lock:
+            for device in devices:
+                self.running[device] += 1
+                self.peak[device] = max(self.peak[device], self.running[device])
+        time.sleep(0.02)
+        with self.lock:
+            for device in devices:
+                self.running[device] -= 1
+
+    def test_limits_per_device(self):
+        with DeviceScheduler(default_limit=4, limits={'/sd': 2, '/nas': 3}, device_of=fake_device) as scheduler:
+            for i in range(12):
+                scheduler.submit(self.task, 'sd', 'ssd', paths=[f'/sd/{i}.arw', f'/ssd/{i}.arw'])
+                scheduler.submit(self.task, 'nas', paths=[f'/nas/{i}.arw'])
+
+        self.assertEqual(self.peak['sd'], 2)
+        self.assertEqual(self.peak['ssd'], 2)
+        self.assertEqual(self.peak['nas'], 3)
+
+    def test_busy_device_does_not_block_others(self):
+        release = threading.Event()
+        with DeviceScheduler(default_limit=1, device_of=fake_device) as scheduler:
+            blocked = [scheduler.submit(release.wait, paths=['/sd/a.arw']) for _ in range(3)]
+            other = scheduler.submit(lambda: 'done', paths=['/nas/b.arw'])
+            self.assertEqual(other.result(timeout=5), 'done')
+            self.assertFalse(blocked[1].running())
+            release.set()
+
+        self.assertTrue(all(future.result() for future in blocked))
+
+    def test_max_workers(self):
+        with DeviceScheduler(default_limit=4, max_workers=1, device_of=fake_device) as scheduler:
+            for i in range(4):
+                scheduler.submit(self.task, 'all', paths=[f'/sd/{i}.arw' if i % 2 else f'/nas/{i}.arw'])
+        self.assertEqual(self.peak['all'], 1)
+
+    def test_exceptions(self):
+        with DeviceScheduler(device_of=fake_device) as scheduler:
+            future = scheduler.submit(int, 'not a number', paths=['/sd/a.arw'])
+        with self.assertRaises(ValueError):
+            future.result()
+
+    def test_devices_resolved_in_pool(self):
+        callers = set()
+
+        def device_of(path : Path) -> int:
+            callers.add(threading.current_thread())
+            return fake_device(path)
+
+        with DeviceScheduler(device_of=device_of) as scheduler:
+            futures = [scheduler.submit(self.task, 'sd', paths=[f'/sd/{i}.arw']) for i in range(4)]
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertNotIn(threading.current_thread(), callers)
+
+    def test_device_errors(self):
+        with DeviceScheduler(device_of=fake_device) as scheduler:
+            future = scheduler.submit(self.task, 'usb', paths=['/usb/a.arw'])
+        with self.assertRaises(KeyError):
+            future.result()
+
+    def test_get_device(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertEqual(get_device(Path(directory) / 'missing' / 'file.arw'), Path(directory).stat().st_dev)
+
+    def test_file_manager_limits(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_manager = FileManager(directory=directory, max_threads=3, device_limits={directory: 1}, use_hash_cache=False)
+            with file_manager.create_scheduler() as scheduler:
+                self.assertEqual(scheduler.default_limit, 3)
+                self.assertEqual(scheduler.limit_for(Path(directory).stat().st_dev), 1)
+
+if __name__ == '__main__':
+    unittest.main()
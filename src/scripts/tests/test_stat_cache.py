@@ -0,0 +1,141 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_stat_cache.py                                                                                   *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.lib.file_manager import FileManager
+from scripts.lib.stat_cache import StatCache
+
+class TestStatCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.file_path = self.temp_dir / 'photo.jpg'
+        self.file_path.write_bytes(b'photo')
+        (self.temp_dir / 'subdir').mkdir()
+        self.cache = StatCache(maxsize=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_entries_avoid_stat(self):
+        with os.scandir(self.temp_dir) as entries:
+            for entry in entries:
+                self.cache.add_entry(entry)
+
+        with patch('os.stat', side_effect=AssertionError('Should not stat')):
+            self.assertTrue(self.cache.is_file(self.file_path))
+            self.assertFalse(self.cache.is_file(self.temp_dir / 'subdir'))
+            self.assertTrue(self.cache.is_dir(self.temp_dir / 'subdir'))
+
+        self.assertEqual(self.cache.stat(self.file_path).st_size, 5)
+
+    def test_invalidate(self):
+        self.assertEqual(self.cache.stat(self.file_path).st_size, 5)
+        self.file_path.write_bytes(b'edited photo')
+        self.assertEqual(self.cache.stat(self.file_path).st_size, 5)
+
+        self.cache.invalidate(self.file_path)
+        self.assertEqual(self.cache.stat(self.file_path).st_size, 12)
+
+    def test_invalidate_tree(self):
+        nested = self.temp_dir / 'subdir' / 'nested.jpg'
+        nested.write_bytes(b'nested')
+        self.cache.stat(nested)
+        self.cache.stat(self.file_path)
+
+        self.cache.invalidate_tree(self.temp_dir / 'subdir')
+
+        self.assertEqual(len(self.cache), 1)
+
+    def test_missing_file(self):
+        self.assertFalse(self.cache.is_file(self.temp_dir / 'missing.jpg'))
+        with self.assertRaises(FileNotFoundError):
+            self.cache.stat(self.temp_dir / 'missing.jpg')
+
+    def test_bounded(self):
+        for i in range(20):
+            path = self.temp_dir / f'{i}.jpg'
+            path.touch()
+            self.cache.stat(path)
+        self.assertEqual(len(self.cache), 10)
+
+class TestFileManagerStatCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        (self.temp_dir / 'nested').mkdir()
+        (self.temp_dir / 'IMG_0001.JPG').write_bytes(b'photo')
+        (self.temp_dir / 'nested' / 'IMG_0002.jpg').write_bytes(b'photo 2')
+        (self.temp_dir / 'notes.txt').write_bytes(b'notes')
+        self.file_manager = FileManager(
+            directory=self.temp_dir,
+            extensions=['jpg'],
+            trash_directory=self.temp_dir / '.trash',
+            use_hash_cache=False,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_yield_files(self):
+        files = sorted(path.name for path in self.file_manager.yield_files(self.temp_dir))
+        self.assertEqual(files, ['IMG_0001.JPG', 'IMG_0002.jpg'])
+
+        files = [path.name for path in self.file_manager.yield_files(self.temp_dir, recursive=False)]
+        self.assertEqual(files, ['IMG_0001.JPG'])
+
+    def test_walk_fills_cache(self):
+        files = list(self.file_manager.yield_files(self.temp_dir))
+        with patch('os.stat', side_effect=AssertionError('Should not stat')):
+            for path in files:
+                self.assertTrue(self.file_manager.should_include_file(path))
+
+    def test_delete_invalidates(self):
+        file_path = self.temp_dir / 'IMG_0001.JPG'
+        self.assertEqual(self.file_manager.file_size(file_path), 5)
+
+        self.file_manager.delete_file(file_path)
+
+        with self.assertRaises(FileNotFoundError):
+            self.file_manager.file_stat(file_path)
+
+    def test_move_invalidates(self):
+        source = self.temp_dir / 'IMG_0001.JPG'
+        destination = self.temp_dir / 'nested' / 'IMG_0003.jpg'
+        self.file_manager.file_size(source)
+        with self.assertRaises(FileNotFoundError):
+            self.file_manager.file_size(destination)
+
+        self.file_manager.move_file(source, destination)
+
+        self.assertEqual(self.file_manager.file_size(destination), 5)
+        with self.assertRaises(FileNotFoundError):
+            self.file_manager.file_stat(source)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_tee.py                                                                                          *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+from __future__ import annotations
+import errno
+import hashlib
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.lib.copy_engine import CopyEngine
+from scripts.import_sd.photo import Photo
+from scripts.import_sd.queue import Queue
+from scripts.import_sd.workflows.copy import CopyWorkflow
+
+class FailingFile:
+    """
+    A destination that opens, but can't be written to.
+    """
+    def __init__(self, file):
+        self.file = file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def write(self, data):
+        raise OSError(errno.EIO, 'Input/output error')
+
+class TestTee(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        self.source = self.root / 'JAM_1234.arw'
+        # Not a multiple of the buffer size, and many times the size of the ring
+        self.data = os.urandom(100_000)
+        self.source.write_bytes(self.data)
+        self.destinations = [self.root / f'copy_{i}.arw' for i in range(3)]
+        self.engine = CopyEngine(buffer_size=1024)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_copies_everywhere(self):
+        digest = self.engine.tee(self.source, self.destinations, hashlib.sha256(), depth=2)
+        self.assertEqual(digest, hashlib.sha256(self.data).hexdigest())
+        for destination in self.destinations:
+            self.assertEqual(destination.read_bytes(), self.data)
+            self.assertEqual(destination.stat().st_mtime, self.source.stat().st_mtime)
+
+    def test_reads_source_once(self):
+        reads = []
+        original = CopyEngine._ring
+
+        def ring(engine, depth):
+            buffers = original(engine, depth)
+            reads.append(depth)
+            return buffers
+
+        with patch.object(CopyEngine, '_ring', side_effect=ring, autospec=True):
+            self.assertIsNone(self.engine.tee(self.source, self.destinations))
+        self.assertEqual(len(reads), 1)
+        for destination in self.destinations:
+            self.assertEqual(destination.read_bytes(), self.data)
+
+    def test_empty_source(self):
+        self.source.write_bytes(b'')
+        self.engine.tee(self.source, self.destinations)
+        for destination in self.destinations:
+            self.assertEqual(destination.read_bytes(), b'')
+
+    def test_existing_destination(self):
+        self.destinations[1].write_bytes(b'existing')
+        with self.assertRaises(FileExistsError):
+            self.engine.tee(self.source, self.destinations)
+        self.assertFalse(self.destinations[0].exists())
+        self.assertEqual(self.destinations[1].read_bytes(), b'existing')
+        self.assertFalse(self.destinations[2].exists())
+
+    def test_failed_writer(self):
+        failing = self.destinations[1]
+
+        def fake_open(path, mode='r', *args, **kwargs):
+            file = open(path, mode, *args, **kwargs)
+            return FailingFile(file) if Path(path) == failing else file
+
+        with patch('scripts.lib.copy_engine.open', side_effect=fake_open, create=True):
+            with self.assertRaises(OSError):
+                self.engine.tee(self.source, self.destinations, depth=2)
+
+        # All or nothing
+        for destination in self.destinations:
+            self.assertFalse(destination.exists())
+
+class TestTeeWorkflow(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = Path(self.temp_dir.name)
+        for name in ('sd/DCIM/100MSDCF', 'network', 'jpgs', 'backup'):
+            (self.root / name).mkdir(parents=True)
+        # Anything written to a relative path lands in the temporary directory, not the working tree
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(self.root)
+        self.raw = self.root / 'sd/DCIM/100MSDCF/JAM_1234.arw'
+        self.raw.write_bytes(os.urandom(50_000))
+        self.workflow = CopyWorkflow(str(self.root / 'network'), str(self.root / 'jpgs'), str(self.root / 'backup'), 'arw', str(self.root / 'sd'))
+        self.workflow.copy_engine = CopyEngine(buffer_size=4096)
+
+        self.photo = Photo(str(self.raw))
+        self.queue = Queue()
+        self.queue.append_parts(self.photo, [self.workflow.bucket_path, '100MSDCF', 'JAM_1234.arw'])
+        self.queue.append_parts(self.photo, [self.workflow.backup_path, '100MSDCF', 'JAM_1234.arw'])
+        self.copies = [self.root / 'network/Import Bucket/100MSDCF/JAM_1234.arw', self.root / 'backup/100MSDCF/JAM_1234.arw']
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_bucket_path(self):
+        self.assertEqual(self.workflow.bucket_path.path, os.path.join(self.root, 'network', 'Import Bucket', ''))
+        self.assertTrue((self.root / 'network/Import Bucket').is_dir())
+        self.assertFalse((self.root / '[').exists())
+
+    def test_tee_from_queue(self):
+        with patch.object(CopyEngine, 'tee', side_effect=CopyEngine.tee, autospec=True) as tee:
+            self.assertTrue(self.workflow.tee_from_queue(self.queue))
+
+        # One read of the card for both destinations
+        self.assertEqual(tee.call_count, 1)
+        for copy in self.copies:
+            self.assertEqual(copy.read_bytes(), self.raw.read_bytes())
+
+    def test_mismatched_destination(self):
+        # A different version already exists in the backup
+        self.copies[1].parent.mkdir(parents=True)
+        self.copies[1].write_bytes(b'older')
+        self.assertTrue(self.workflow.tee_from_queue(self.queue))
+        self.assertEqual(self.copies[1].read_bytes(), b'older')
+        self.assertEqual(self.copies[1].with_name('JAM_1234_1.arw').read_bytes(), self.raw.read_bytes())
+
+    def test_run_validates_renamed_copy(self):
+        # A different version is already in the bucket, so the copy is renamed
+        self.copies[0].parent.mkdir(parents=True)
+        self.copies[0].write_bytes(b'older')
+        renamed = str(self.copies[0].with_name('JAM_1234_1.arw'))
+
+        with patch.object(self.workflow, 'queue_files', return_value=self.queue), \
+             patch.object(self.workflow, 'organize_files', return_value={renamed: renamed}):
+            self.assertTrue(self.workflow.run())
+
+        self.assertEqual(self.workflow.copied_from[renamed], self.photo.path)
+
+    def test_changed_while_copying(self):
+        self.queue.append_checksum(self.photo, 'sha256:' + '0' * 64)
+        with patch.object(self.workflow, 'ask_user_continue', return_value=True) as ask:
+            self.assertFalse(self.workflow.tee_from_queue(self.queue))
+        ask.assert_called_once()
+        for copy in self.copies:
+            self.assertFalse(copy.exists())
+
+    def test_dry_run(self):
+        self.workflow.dry_run = True
+        self.assertTrue(self.workflow.tee_from_queue(self.queue))
+        for copy in self.copies:
+            self.assertFalse(copy.exists())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_throughput.py                                                                                   *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from scripts.lib.file_manager import FileManager
+from scripts.lib.throughput import ThroughputModel, LinkStats, Sample, get_throughput_model, MB
+
+class TestThroughputModel(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.path = self.temp_dir / 'throughput.json'
+        self.model = ThroughputModel(self.path, min_timeout=1)
+        self.key = self.model.key_for_url('https://immich.example.com/api')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def record_link(self, model : ThroughputModel, latency : float, rate : float, count : int = 20) -> None:
+        """
+        Record transfers of various sizes over a link with the given latency (seconds) and rate (bytes per second).
+        """
+        for i in range(count):
+            size = 128 * 1024 if i % 4 == 0 else (i + 1) * MB
+            model.record(self.key, size, latency + size / rate)
+
+    def test_key_for_url(self):
+        self.assertEqual(self.key, 'url:https://immich.example.com')
+
+    def test_defaults_without_history(self):
+        self.assertEqual(self.model.timeout(self.key, 5 * MB), 110)
+        self.assertEqual(self.model.retry_delay(self.key, 0), 10)
+        self.assertEqual(self.model.suggest_concurrency(self.key, 4, 8), 4)
+
+    def test_estimates(self):
+        self.record_link(self.model, latency=0.5, rate=20 * MB)
+
+        self.assertAlmostEqual(self.model.latency(self.key), 0.5, places=2)
+        self.assertAlmostEqual(self.model.rate(self.key) / MB, 20, delta=0.5)
+        # Expected 0.5 + 2.5 seconds, no slowdown, times the margin
+        self.assertAlmostEqual(self.model.timeout(self.key, 50 * MB), 6, delta=0.2)
+
+    def test_slow_transfers_raise_the_timeout(self):
+        self.record_link(self.model, latency=0.5, rate=20 * MB)
+        before = self.model.timeout(self.key, 50 * MB)
+        self.model.record(self.key, 10 * MB, 10)
+        self.assertGreater(self.model.timeout(self.key, 50 * MB), before)
+
+    def test_empty_transfers(self):
+        # Larger transfers got slower per byte, so the fit puts latency at 0
+        transfers = [(0, 0.001), (100 * MB, 1), (200 * MB, 3), (300 * MB, 5), (400 * MB, 7)]
+        for size, seconds in transfers + [(400 * MB, 7)]:
+            self.model.record(self.key, size, seconds)
+        self.assertGreater(self.model.timeout(self.key, 50 * MB), 0)
+
+        # Samples from before empty transfers were skipped
+        stats = LinkStats()
+        stats.samples.extend(Sample(size, seconds) for size, seconds in transfers)
+        self.assertEqual(stats.latency, 0)
+        self.assertGreaterEqual(stats.percentile_slowdown(99), 1)
+
+    def test_suggest_concurrency(self):
+        self.record_link(self.model, latency=2, rate=100 * MB)
+        self.assertGreater(self.model.suggest_concurrency(self.key, 2, 8), 2)
+        self.assertEqual(self.model.suggest_concurrency(self.key, 2, 3), 3)
+
+        local = ThroughputModel('')
+        for i in range(10):
+            local.record('mount:/', 25 * MB, 0.001 + 25 * MB / (50 * MB))
+        self.assertEqual(local.suggest_concurrency('mount:/', 4, 8), 1)
+
+    def test_retry_delay(self):
+        self.record_link(self.model, latency=0.5, rate=20 * MB)
+        self.assertAlmostEqual(self.model.retry_delay(self.key, 0), 2)
+        self.assertAlmostEqual(self.model.retry_delay(self.key, 2), 8)
+        self.assertEqual(self.model.retry_delay(self.key, 10), 60)
+
+    def test_persistence(self):
+        self.record_link(self.model, latency=0.5, rate=20 * MB)
+        self.model.save()
+
+        reloaded = ThroughputModel(self.path)
+        self.assertEqual(reloaded.rate(self.key), self.model.rate(self.key))
+        # The session rate is only for this run
+        self.assertEqual(reloaded.session_rate(self.key), 0)
+        self.assertGreater(self.model.session_rate(self.key), 0)
+
+    def test_save_merges_other_models(self):
+        other = ThroughputModel(self.path, min_timeout=1)
+        self.record_link(self.model, latency=0.5, rate=20 * MB, count=3)
+        self.record_link(other, latency=0.5, rate=20 * MB, count=3)
+        self.model.save()
+        other.save()
+
+        # Neither save replaced the other's samples
+        self.assertEqual(len(ThroughputModel(self.path).stats(self.key)), 6)
+        self.assertEqual(len(other.stats(self.key)), 6)
+
+    def test_shared_model(self):
+        self.assertIs(get_throughput_model(self.path), get_throughput_model(str(self.path)))
+        file_manager = FileManager(directory=self.temp_dir, throughput_path=self.path, use_hash_cache=False)
+        self.assertIs(file_manager.throughput, get_throughput_model(self.path))
+
+    def test_unreadable_history(self):
+        self.path.write_text('not json')
+        self.assertIsNone(ThroughputModel(self.path).rate(self.key))
+
+    def test_file_manager_timeout(self):
+        source = self.temp_dir / 'photo.arw'
+        source.write_bytes(b'x' * MB)
+        file_manager = FileManager(directory=self.temp_dir, throughput_path=self.path, use_hash_cache=False)
+        self.assertEqual(file_manager._calculate_timeout(source), 70)
+
+        for _ in range(10):
+            file_manager.record_transfer(source, source, 0.01)
+        self.assertLess(file_manager._calculate_timeout(source), 70)
+        self.assertEqual(file_manager._calculate_timeout(source, 5), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_transfer_plan.py                                                                                *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.lib.file_manager import FileManager
+from scripts.lib.transfer_plan import TransferPlan, TransferAction
+
+class TestTransferPlan(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source_dir = self.temp_dir / 'DCIM'
+        self.target_dir = self.temp_dir / 'Photos'
+        self.source_dir.mkdir()
+        (self.target_dir / '2024-12').mkdir(parents=True)
+
+        for name in ['JAM_0001.arw', 'JAM_0002.arw', 'JAM_0003.arw']:
+            (self.source_dir / name).write_bytes(name.encode())
+        (self.source_dir / 'JAM_0003.xmp').write_bytes(b'sidecar')
+
+        # Different contents, same name
+        (self.target_dir / '2024-12' / 'JAM_0001.arw').write_bytes(b'another photo')
+        (self.target_dir / '2024-12' / 'JAM_0001_0.arw').write_bytes(b'yet another photo')
+        # Identical contents, same name
+        (self.target_dir / '2024-12' / 'JAM_0002.arw').write_bytes(b'JAM_0002.arw')
+
+        self.file_manager = FileManager(directory=self.source_dir, use_hash_cache=False, max_threads=2, skip_mtime_compare=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def create_plan(self, **kwargs) -> TransferPlan:
+        plan = TransferPlan(self.file_manager, is_duplicate=lambda source, destination: self.file_manager.files_match(source, destination), **kwargs)
+        plan.add(self.source_dir / 'JAM_0001.arw', self.target_dir / '2024-12' / 'JAM_0001.arw')
+        plan.add(self.source_dir / 'JAM_0002.arw', self.target_dir / '2024-12' / 'JAM_0002.arw')
+        plan.add(self.source_dir / 'JAM_0003.arw', self.target_dir / '2024-12-25' / 'JAM_0003.arw')
+        return plan
+
+    def test_build_lists_each_directory_once(self):
+        plan = self.create_plan()
+        with patch('os.scandir', wraps=os.scandir) as scandir:
+            transfers = plan.build()
+
+        # Two destinations, plus the source directory (for sidecars)
+        self.assertEqual(scandir.call_count, 3)
+        self.assertEqual([transfer.action for transfer in transfers], [TransferAction.MOVE, TransferAction.DUPLICATE, TransferAction.MOVE])
+        self.assertEqual(transfers[0].destination.name, 'JAM_0001_1.arw')
+        self.assertTrue(transfers[0].renamed)
+        self.assertEqual(plan.directories_to_create, [self.target_dir / '2024-12-25'])
+
+    def test_collisions_within_the_batch(self):
+        plan = TransferPlan(self.file_manager)
+        plan.add(self.source_dir / 'JAM_0001.arw', self.target_dir / 'new' / 'photo.arw')
+        plan.add(self.source_dir / 'JAM_0002.arw', self.target_dir / 'new' / 'photo.arw')
+        plan.add(self.source_dir / 'JAM_0003.arw', self.target_dir / 'new' / 'photo.arw')
+
+        # The same names FileOrganizer.handle_collision would choose
+        names = [transfer.destination.name for transfer in plan.build()]
+        self.assertEqual(names, ['photo.arw', 'photo_0.arw', 'photo_1.arw'])
+
+    def test_no_rename(self):
+        plan = self.create_plan(rename_on_collision=False)
+        self.assertEqual(plan.build()[0].action, TransferAction.SKIP)
+
+    def test_to_json(self):
+        plan = self.create_plan()
+        plan.build()
+        data = json.loads(plan.to_json())
+
+        self.assertEqual(data['action'], 'move')
+        self.assertEqual(data['directories_to_create'], [str(self.target_dir / '2024-12-25')])
+        self.assertEqual(len(data['transfers']), 3)
+
+    def test_execute(self):
+        plan = self.create_plan(delete_duplicates=True)
+        self.file_manager.trash_directory = self.temp_dir / '.trash'
+        completed = []
+        plan.execute(on_complete=completed.append)
+
+        self.assertEqual(len(completed), 3)
+        self.assertEqual((self.target_dir / '2024-12' / 'JAM_0001_1.arw').read_bytes(), b'JAM_0001.arw')
+        self.assertEqual((self.target_dir / '2024-12-25' / 'JAM_0003.xmp').read_bytes(), b'sidecar')
+        self.assertEqual(list(self.source_dir.iterdir()), [])
+        self.assertEqual(self.file_manager.files_moved, 2)
+        self.assertEqual(self.file_manager.get_stat('duplicate_file'), 1)
+
+    def test_sidecar_listed_with_photo(self):
+        photo, sidecar = self.source_dir / 'JAM_0003.arw', self.source_dir / 'JAM_0003.xmp'
+        destination = self.target_dir / '2024-12'
+        # Different contents, same name, so the photo and its sidecar are both renamed
+        (destination / 'JAM_0003.arw').write_bytes(b'another photo')
+
+        for order in ([sidecar, photo], [photo, sidecar]):
+            with self.subTest(order=[path.name for path in order]):
+                plan = TransferPlan(self.file_manager)
+                plan.extend((path, destination / path.name) for path in order)
+                transfers = plan.execute()
+
+                self.assertEqual([transfer.source for transfer in transfers], [photo])
+                self.assertEqual([transfer.error for transfer in transfers], [None])
+                self.assertEqual((destination / 'JAM_0003_0.arw').read_bytes(), b'JAM_0003.arw')
+                self.assertEqual((destination / 'JAM_0003_0.xmp').read_bytes(), b'sidecar')
+                self.assertFalse(sidecar.exists())
+
+                # Put them back for the other order
+                (destination / 'JAM_0003_0.arw').rename(photo)
+                (destination / 'JAM_0003_0.xmp').rename(sidecar)
+
+    def test_execute_trusts_the_plan(self):
+        plan = TransferPlan(self.file_manager)
+        plan.add(self.source_dir / 'JAM_0003.arw', self.target_dir / '2024-12' / 'JAM_0003.arw')
+        plan.build()
+
+        is_dir = Path.is_dir
+        with patch.object(FileManager, 'move_file') as move_file, \
+             patch.object(Path, 'is_dir', autospec=True, side_effect=lambda path: is_dir(path)) as is_dir_mock:
+            transfers = plan.execute()
+
+        self.assertEqual([transfer.error for transfer in transfers], [None])
+        move_file.assert_not_called()
+        is_dir_mock.assert_not_called()
+        self.assertEqual((self.target_dir / '2024-12' / 'JAM_0003.xmp').read_bytes(), b'sidecar')
+
+    def test_copy_sidecar(self):
+        plan = TransferPlan(self.file_manager, copy=True)
+        plan.add(self.source_dir / 'JAM_0003.xmp', self.target_dir / 'new' / 'JAM_0003.xmp')
+        plan.add(self.source_dir / 'JAM_0003.arw', self.target_dir / 'new' / 'JAM_0003.arw')
+        transfers = plan.execute()
+
+        self.assertEqual([transfer.error for transfer in transfers], [None])
+        self.assertEqual((self.target_dir / 'new' / 'JAM_0003.xmp').read_bytes(), b'sidecar')
+        self.assertTrue((self.source_dir / 'JAM_0003.xmp').exists())
+
+    def test_dry_run(self):
+        self.file_manager.dry_run = True
+        plan = self.create_plan()
+        plan.execute()
+
+        self.assertFalse((self.target_dir / '2024-12-25').exists())
+        self.assertEqual(len(list(self.source_dir.iterdir())), 4)
+
+if __name__ == '__main__':
+    unittest.main()
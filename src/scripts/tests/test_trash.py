@@ -0,0 +1,172 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_trash.py                                                                                        *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import shutil
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from scripts.lib.file_manager import FileManager
+from scripts.lib.trash import TrashStore
+from scripts.utils.distribute_trash import distribute_trash
+
+class TestTrashStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.photos = self.temp_dir / 'DCIM'
+        self.photos.mkdir()
+        self.trash = TrashStore(self.temp_dir / '.trash', shard_size=2)
+
+    def tearDown(self):
+        self.trash.close()
+        shutil.rmtree(self.temp_dir)
+
+    def create(self, name : str, data : bytes = b'photo') -> Path:
+        path = self.photos / name
+        path.write_bytes(data)
+        return path
+
+    def test_put_names_from_counter(self):
+        entries = [self.trash.put(self.create('JAM_0001.arw')) for _ in range(3)]
+
+        self.assertEqual([entry.trash_path.name for entry in entries], ['00000001_JAM_0001.arw', '00000002_JAM_0001.arw', '00000003_JAM_0001.arw'])
+        self.assertEqual([entry.trash_path.parent.name for entry in entries], ['0000', '0001', '0001'])
+        self.assertTrue(all(entry.trash_path.exists() for entry in entries))
+        self.assertEqual(entries[0].original_path, self.photos / 'JAM_0001.arw')
+        self.assertEqual(entries[0].size, 5)
+
+    def test_put_does_not_probe(self):
+        with patch.object(Path, 'exists', side_effect=AssertionError('probed')):
+            self.trash.put(self.create('JAM_0001.arw'))
+
+    def test_failed_put_leaves_no_entry(self):
+        path = self.create('JAM_0001.arw')
+        with patch('os.rename', side_effect=OSError('cross device')):
+            with self.assertRaises(OSError):
+                self.trash.put(path)
+        self.assertEqual(self.trash.count(), 0)
+        self.assertTrue(path.exists())
+
+    def test_find_and_restore(self):
+        self.trash.put(self.create('JAM_0001.arw', b'first'), digest='abc')
+        self.trash.put(self.create('JAM_0001.arw', b'second'))
+        (self.photos / 'sub').mkdir()
+        self.trash.put(self.create('sub/JAM_0002.arw'))
+
+        entries = self.trash.find(self.photos / 'JAM_0001.arw')
+        self.assertEqual([entry.size for entry in entries], [6, 5])
+        self.assertEqual(entries[1].digest, 'abc')
+        self.assertEqual(len(self.trash.find(self.photos, recursive=True)), 3)
+
+        self.trash.restore(entries[0])
+        self.assertEqual((self.photos / 'JAM_0001.arw').read_bytes(), b'second')
+        with self.assertRaises(FileExistsError):
+            self.trash.restore(entries[1])
+        self.assertEqual(self.trash.count(), 2)
+
+    def test_purge_older_than(self):
+        old = self.trash.put(self.create('JAM_0001.arw'))
+        with self.trash.connection as conn:
+            conn.execute('UPDATE trash SET deleted_at=? WHERE id=?', (time.time() - 3600, old.id))
+        new = self.trash.put(self.create('JAM_0002.arw'))
+
+        self.assertEqual(self.trash.purge_older_than(60), 1)
+        self.assertFalse(old.trash_path.exists())
+        self.assertTrue(new.trash_path.exists())
+        # Numbers are not reused
+        self.assertEqual(self.trash.put(self.create('JAM_0003.arw')).id, 3)
+
+    def test_reopen_with_other_shard_size(self):
+        entries = [self.trash.put(self.create(f'JAM_{i:04d}.arw')) for i in range(5)]
+        self.trash.close()
+
+        # Shards were decided with shard_size=2, so each entry has to remember its own
+        trash = TrashStore(self.temp_dir / '.trash')
+        try:
+            self.assertEqual([entry.trash_path for entry in trash.entries()], [entry.trash_path for entry in entries])
+            self.assertEqual(trash.purge_older_than(-60), 5)
+        finally:
+            trash.close()
+
+        self.assertEqual(list((self.temp_dir / '.trash').rglob('*.arw')), [])
+
+    def test_distribute_legacy_shards(self):
+        tracked = self.trash.put(self.create('JAM_0001.arw'))
+        self.trash.close()
+        root = self.temp_dir / '.trash'
+        # Loose files, and the numbered directories older versions sharded the trash into
+        legacy = [root / 'loose.arw', root / '0001' / 'old.arw', root / '7' / 'older.arw']
+        for path in legacy:
+            path.parent.mkdir(exist_ok=True)
+            path.write_bytes(b'legacy')
+
+        distribute_trash(root, files_per_dir=2)
+
+        trash = TrashStore(root)
+        try:
+            entries = list(trash.entries())
+            self.assertEqual(len(entries), 4)
+            self.assertEqual(entries[0].trash_path, tracked.trash_path)
+            self.assertTrue(all(entry.trash_path.exists() for entry in entries))
+            self.assertFalse(any(path.exists() for path in legacy))
+            self.assertEqual(trash.purge_older_than(-60), 4)
+        finally:
+            trash.close()
+
+        self.assertEqual(list(root.rglob('*.arw')), [])
+
+class TestFileManagerTrash(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.file_manager = FileManager(directory=self.temp_dir, trash_directory=self.temp_dir / '.trash', use_hash_cache=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_delete_and_restore(self):
+        path = self.temp_dir / 'JAM_0001.arw'
+        path.write_bytes(b'photo')
+        digest = self.file_manager.hash_file(path)
+
+        self.assertTrue(self.file_manager.delete_file(path))
+        self.assertFalse(path.exists())
+        self.assertEqual(self.file_manager.files_deleted, 1)
+        self.assertEqual(self.file_manager.trash.find(path)[0].digest, digest)
+
+        self.assertEqual(self.file_manager.restore_from_trash(), 1)
+        self.assertEqual(path.read_bytes(), b'photo')
+
+    def test_purge_trash(self):
+        path = self.temp_dir / 'JAM_0001.arw'
+        path.write_bytes(b'photo')
+        self.file_manager.delete_file(path)
+
+        self.assertEqual(self.file_manager.purge_trash(1), 0)
+        self.assertEqual(self.file_manager.purge_trash(0), 1)
+        self.assertEqual(list((self.temp_dir / '.trash' / '0000').iterdir()), [])
+
+if __name__ == '__main__':
+    unittest.main()
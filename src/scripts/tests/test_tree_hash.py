@@ -0,0 +1,207 @@
+"""*********************************************************************************************************************
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    METADATA:                                                                                                         *
+*                                                                                                                      *
+*        File:    test_tree_hash.py                                                                                    *
+*        Project: imageinn                                                                                             *
+*        Version: 0.1.0                                                                                                *
+*        Created: 2025-01-12                                                                                           *
+*        Author:  Jess Mann                                                                                            *
+*        Email:   jess.a.mann@gmail.com                                                                                *
+*        Copyright (c) 2025 Jess Mann                                                                                  *
+*                                                                                                                      *
+* -------------------------------------------------------------------------------------------------------------------- *
+*                                                                                                                      *
+*    LAST MODIFIED:                                                                                                    *
+*                                                                                                                      *
+*        2025-01-12     By Jess Mann                                                                                   *
+*                                                                                                                      *
+*********************************************************************************************************************"""
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import xxhash
+
+from scripts.lib.checksum import ChecksumService, TREE_CHUNKS
+from scripts.lib.copy_engine import CopyEngine
+from scripts.lib.file_manager import FileManager
+from scripts.lib.hash_cache import HashCache
+from scripts.lib.hashing import HashingEngine, HashStrategy, TreeDigest, TreeHasher, TREE_ALGORITHM
+from scripts.exceptions import ChecksumMismatchError
+
+CHUNK_SIZE = 64 * 1024
+
+class TestTreeDigest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.path = self.temp_dir / 'VID_1234.mp4'
+        # Four full chunks, and a partial one
+        self.data = os.urandom(4 * CHUNK_SIZE + 100)
+        self.path.write_bytes(self.data)
+        self.engine = HashingEngine(chunk_size=16 * 1024, max_workers=3)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_chunks(self):
+        for strategy in (HashStrategy.MMAP, HashStrategy.READINTO):
+            tree = self.engine.hash_tree(self.path, CHUNK_SIZE, strategy=strategy)
+            self.assertEqual(tree.size, len(self.data))
+            self.assertEqual(len(tree.chunks), 5)
+            self.assertEqual(tree.chunks[0], xxhash.xxh3_128(self.data[:CHUNK_SIZE]).hexdigest())
+            self.assertEqual(tree.chunks[4], xxhash.xxh3_128(self.data[4 * CHUNK_SIZE:]).hexdigest())
+            self.assertEqual(tree.chunk_range(4), (4 * CHUNK_SIZE, 100))
+
+    def test_root_depends_on_chunk_size(self):
+        self.assertEqual(self.engine.hash_tree(self.path, CHUNK_SIZE).root, self.engine.hash_tree(self.path, CHUNK_SIZE).root)
+        self.assertNotEqual(self.engine.hash_tree(self.path, CHUNK_SIZE).root, self.engine.hash_tree(self.path, 2 * CHUNK_SIZE).root)
+
+    def test_hash_file(self):
+        self.assertEqual(self.engine.hash_file(self.path, TREE_ALGORITHM), self.engine.hash_tree(self.path).root)
+        with self.assertRaises(ValueError):
+            self.engine.hash_file(self.path, TREE_ALGORITHM, partial=True)
+
+    def test_tree_hasher(self):
+        hasher = TreeHasher(CHUNK_SIZE)
+        # Pieces that don't line up with the chunks
+        for offset in range(0, len(self.data), 10000):
+            hasher.update(self.data[offset:offset + 10000])
+        self.assertEqual(hasher.tree(), self.engine.hash_tree(self.path, CHUNK_SIZE))
+        self.assertEqual(TreeHasher(CHUNK_SIZE).tree().chunks, ())
+
+    def test_empty_file(self):
+        empty = self.temp_dir / 'empty.mp4'
+        empty.touch()
+        tree = self.engine.hash_tree(empty, CHUNK_SIZE)
+        self.assertEqual(tree.chunks, ())
+        self.assertEqual(TreeDigest.from_string(tree.to_string()), tree)
+
+    def test_serialize(self):
+        tree = self.engine.hash_tree(self.path, CHUNK_SIZE)
+        self.assertEqual(TreeDigest.from_string(tree.to_string()), tree)
+        with self.assertRaises(ValueError):
+            TreeDigest.from_string(tree.to_string()[:-32])
+
+    def test_damaged_chunks(self):
+        expected = self.engine.hash_tree(self.path, CHUNK_SIZE)
+        with open(self.path, 'r+b') as f:
+            f.seek(2 * CHUNK_SIZE + 5)
+            f.write(b'\0\1\2')
+
+        self.assertEqual(expected.damaged_chunks(self.engine.hash_tree(self.path, CHUNK_SIZE)), [2])
+        with patch('builtins.open', wraps=open) as opened:
+            self.assertEqual(self.engine.verify_tree(self.path, expected, [1, 2], strategy=HashStrategy.READINTO), [2])
+        # Only the chunks asked for are read again, each with its own handle
+        self.assertEqual(opened.call_count, 3)
+
+    def test_different_size(self):
+        expected = self.engine.hash_tree(self.path, CHUNK_SIZE)
+        with open(self.path, 'ab') as f:
+            f.write(b'more')
+        self.assertEqual(self.engine.verify_tree(self.path, expected), [0, 1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            expected.damaged_chunks(self.engine.hash_tree(self.path, CHUNK_SIZE))
+
+class TestChecksumServiceTree(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.path = self.temp_dir / 'VID_1234.mp4'
+        self.path.write_bytes(os.urandom(3 * CHUNK_SIZE))
+        self.hash_cache = HashCache(self.temp_dir / 'hashes.db')
+
+    def tearDown(self):
+        self.hash_cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_chunks_are_stored(self):
+        tree = ChecksumService(hash_cache=self.hash_cache).tree(self.path, CHUNK_SIZE)
+        stat = self.path.stat()
+        self.assertEqual(self.hash_cache.get(stat, TREE_ALGORITHM), tree.root)
+        self.assertEqual(self.hash_cache.get(stat, TREE_CHUNKS), tree.to_string())
+
+        # Another process reuses them, without reading the file
+        with patch.object(HashingEngine, 'hash_tree') as hash_tree:
+            self.assertEqual(ChecksumService(hash_cache=self.hash_cache).tree(self.path, CHUNK_SIZE), tree)
+        hash_tree.assert_not_called()
+
+    def test_chunks_not_stored(self):
+        service = ChecksumService(hash_cache=self.hash_cache, store_tree_chunks=False)
+        root = service.hexdigest(self.path, TREE_ALGORITHM)
+        self.assertEqual(self.hash_cache.get(self.path.stat(), TREE_ALGORITHM), root)
+        self.assertIsNone(self.hash_cache.get(self.path.stat(), TREE_CHUNKS))
+
+    def test_labelled(self):
+        service = ChecksumService(hash_cache=self.hash_cache)
+        digest = service.checksum(self.path, TREE_ALGORITHM)
+        self.assertTrue(digest.startswith('xxh3_tree:'))
+        self.assertTrue(service.verify(self.path, digest))
+
+class TestFileManagerTree(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = Path(tempfile.mkdtemp())
+        self.source = self.temp_dir / 'VID_1234.mp4'
+        self.source.write_bytes(os.urandom(200 * 1024))
+        self.destination = self.temp_dir / 'copy.mp4'
+        self.file_manager = FileManager(hash_cache_path=self.temp_dir / 'hashes.db', use_reflink=False, tree_hash_threshold=100 * 1024)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_threshold(self):
+        self.assertEqual(self.file_manager.full_hash_algorithm(100 * 1024), TREE_ALGORITHM)
+        self.assertEqual(self.file_manager.full_hash_algorithm(1024), 'xxhash')
+        self.assertEqual(FileManager().full_hash_algorithm(10 ** 12), 'xxhash')
+
+    def test_copy_is_verified_by_tree(self):
+        self.file_manager.copy_file(self.source, self.destination)
+        self.assertEqual(self.destination.read_bytes(), self.source.read_bytes())
+        self.assertEqual(
+            self.file_manager.get_cached_hash(self.destination, hashing_algorithm=TREE_ALGORITHM),
+            self.file_manager.hash_file(self.source, hashing_algorithm=TREE_ALGORITHM)
+        )
+        self.assertTrue(self.file_manager.file_hashes_match(self.source, self.destination))
+
+    def test_source_is_read_once(self):
+        # The source tree is built from the copy, not a separate read
+        with patch.object(HashingEngine, 'hash_tree', side_effect=AssertionError('source read again')):
+            self.file_manager.copy_file(self.source, self.destination)
+        self.assertEqual(
+            self.file_manager.checksums.lookup_tree(self.source.stat()).root,
+            self.file_manager.hash_file(self.source, hashing_algorithm=TREE_ALGORITHM)
+        )
+
+    def test_damaged_chunk_is_repaired(self):
+        original = CopyEngine.copy
+        def corrupt(engine, source_path, destination_path, hasher=None):
+            digest = original(engine, source_path, destination_path, hasher)
+            with open(destination_path, 'r+b') as f:
+                f.seek(10)
+                f.write(b'\0\0\0\0')
+            return digest
+
+        with patch.object(CopyEngine, 'copy', autospec=True, side_effect=corrupt), \
+             patch.object(CopyEngine, 'copy_range', autospec=True, side_effect=CopyEngine.copy_range) as copy_range:
+            self.file_manager.copy_file(self.source, self.destination)
+
+        # Only the damaged chunk (the whole file, here) is copied again
+        copy_range.assert_called_once()
+        self.assertEqual(copy_range.call_args.args[3:], (0, 200 * 1024))
+        self.assertEqual(self.destination.read_bytes(), self.source.read_bytes())
+
+    def test_unrepairable(self):
+        with patch.object(HashingEngine, 'verify_tree', return_value=[0]):
+            with self.assertRaises(ChecksumMismatchError):
+                self.file_manager.copy_file(self.source, self.destination)
+        self.assertFalse(self.destination.exists())
+
+if __name__ == '__main__':
+    unittest.main()
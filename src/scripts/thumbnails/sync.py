@@ -49,7 +49,6 @@ Examples:
 from __future__ import annotations
 import os
 import logging
-import hashlib
 from pathlib import Path
 from datetime import datetime
 import shutil
@@ -58,6 +57,8 @@ from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor
 import argparse
 
+from scripts.lib.checksum import get_checksum_service
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -112,13 +113,9 @@ class JPGSyncer:
             file (Path): File to generate the hash for.
 
         Returns:
-            str: SHA-256 hash for the
+            str: SHA-256 hash for the file, labelled with the algorithm (i.e. 'sha256:9f86d0...')
         """
-        hash_func = hashlib.sha256()
-        with file.open('rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
-                hash_func.update(chunk)
-        return hash_func.hexdigest()
+        return get_checksum_service().checksum(file, 'sha256')
 
     def should_skip_file(self, src: Path, dest: Path) -> bool:
         """
@@ -43,7 +43,6 @@ from __future__ import annotations
 import os
 import sys
 import threading
-import time
 
 # Add the root directory of the project to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..')))
@@ -82,7 +81,6 @@ class ImmichInterface(FileManager, ABC):
 
     _authenticated: bool = PrivateAttr(default=False)
     _db : ImagesDatabase | None = PrivateAttr(default=None)
-    _start_ns : int = PrivateAttr(default=0)
     _bytes_lock : threading.Lock = PrivateAttr(default_factory=lambda: threading.Lock())
     _bytes_uploaded : int = PrivateAttr(default=0)
 
@@ -161,6 +159,13 @@ class ImmichInterface(FileManager, ABC):
 
         return self._db
 
+    @property
+    def upload_key(self) -> str:
+        """
+        The key the Immich server's speeds are recorded under in the throughput model.
+        """
+        return self.throughput.key_for_url(self.url)
+
     @property
     def bytes_uploaded(self) -> int:
         with self._bytes_lock:
@@ -331,17 +336,12 @@ class ImmichInterface(FileManager, ABC):
 
     def get_upload_speed(self, decimal_places : int | None = 2) -> float:
         """
-        Calculate the upload speed in MB/s.
+        Calculate the upload speed in MB/s, for this run, from the throughput model.
 
         Returns:
             float: The upload speed in MB/s
         """
-        if not self._start_ns:
-            return 0
-        
-        time_now = time.time_ns()
-        elapsed = (time_now - self._start_ns) / 1e9
-        speed = self._bytes_uploaded / 1024 / 1024 / elapsed
+        speed = self.throughput.session_rate(self.upload_key) / 1024 / 1024
         if decimal_places is not None:
             speed = round(speed, decimal_places)
         return speed
\ No newline at end of file
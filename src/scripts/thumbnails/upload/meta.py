@@ -49,4 +49,6 @@ IGNORE_DIRS = [
 DEFAULT_DB_PATH = Path(__file__).resolve().parents[3] / 'image_search.db'
 
 MAX_RETRIES = 50
-SECONDS_PER_RETRY = 15
\ No newline at end of file
+SECONDS_PER_RETRY = 15
+# Upper bound when concurrency is derived from the observed latency of the server
+MAX_UPLOAD_THREADS = 8
\ No newline at end of file
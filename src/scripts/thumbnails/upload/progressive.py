@@ -55,7 +55,7 @@ import sys
 import threading
 import time
 import subprocess
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from pathlib import Path
 from typing import Protocol
 from dotenv import load_dotenv
@@ -74,11 +74,13 @@ from scripts import setup_logging
 from scripts.lib.types import ProgressBar, RED, CYAN, CYAN2, YELLOW, YELLOW2, BLUE, PURPLE, RESET
 from scripts.lib.utils import seconds_to_human
 from scripts.exceptions import AppError
-from scripts.thumbnails.upload.meta import MAX_RETRIES, SECONDS_PER_RETRY
+from scripts.thumbnails.upload.meta import MAX_RETRIES, MAX_UPLOAD_THREADS, SECONDS_PER_RETRY
 from scripts.thumbnails.upload.exceptions import AuthenticationError, ConfigurationError
 from scripts.thumbnails.upload.interface import ImmichInterface
 from scripts.thumbnails.upload.status import FileStatus, DirectoryStatus, StatusOptions
 from scripts.thumbnails.upload.template import PixelFiles
+from scripts.lib.discovery import parse_mount_limits
+from scripts.lib.metrics import METRICS
 
 logger = setup_logging()
 
@@ -121,15 +123,17 @@ class ImmichProgressiveUploader(ImmichInterface):
         if self.album:
             command.extend(['-A', self.album])
 
-        # Timeout is a minimum of 60 seconds, plus 10 seconds per MB
+        # Timeout is based on the speeds previously seen uploading to this server (or 60 seconds + 10 seconds per MB)
         filesize = self.file_size(image_path)
-        extra_timeout = filesize * 10 / (1024 * 1024)
-        timeout = 60 + extra_timeout
+        # Taken now, so recording metrics after the upload can't raise inside the retry loop
+        device = self.file_stat(image_path).st_dev
+        timeout = self.throughput.timeout(self.upload_key, filesize)
         logger.debug("Setting upload timeout to %s", seconds_to_human(timeout))
         
         attempt = 0
         while attempt <= retries:
             try:
+                started = time.monotonic()
                 result = subprocess.run(
                     command,
                     check=True,
@@ -139,7 +143,11 @@ class ImmichProgressiveUploader(ImmichInterface):
                     text=True
                 )
                 output = result.stdout + result.stderr
+                elapsed = time.monotonic() - started
                 self.record_bytes_uploaded(filesize)
+                self.throughput.record(self.upload_key, filesize, elapsed)
+                METRICS.observe('upload', elapsed, status='ok')
+                METRICS.record_read(device, filesize)
                 
                 # Analyze the output
                 if "All assets were already uploaded" in output:
@@ -158,6 +166,7 @@ class ImmichProgressiveUploader(ImmichInterface):
 
             except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
                 output = f'{e.stdout} + {e.stderr}'
+                METRICS.observe('upload', time.monotonic() - started, status='failed')
 
                 reason = ''
                 if 'ETIMEDOUT' in output or isinstance(e, subprocess.TimeoutExpired):
@@ -172,8 +181,9 @@ class ImmichProgressiveUploader(ImmichInterface):
                     logger.error('%s - Failed to upload %s', reason, image_path.name)
                     attempt += 1
                     if attempt <= retries:
-                        logger.debug(f"Retrying upload in 10 seconds... (Attempt {attempt}/{retries})")
-                        time.sleep(10)
+                        delay = self.throughput.retry_delay(self.upload_key, attempt - 1)
+                        logger.debug(f"Retrying upload in {delay:.0f} seconds... (Attempt {attempt}/{retries})")
+                        time.sleep(delay)
                         continue
 
                     logger.error("Max retries reached for %s.", image_path)
@@ -322,13 +332,13 @@ class ImmichProgressiveUploader(ImmichInterface):
                 if (pruned_count := file_count - files_to_upload_count) > 0:
                     logger.info('Pruned %d files from %s', pruned_count, subdir)
 
-                with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
-                    # initialize the start time for calculating upload speed
-                    self._start_ns = time.time_ns()
-                    
+                # Reads are limited per source device. Uploads all go to the same server, so the total is set by
+                # how much of each upload to it is spent waiting, rather than transferring.
+                max_workers = self.throughput.suggest_concurrency(self.upload_key, self.max_threads, max(self.max_threads, MAX_UPLOAD_THREADS))
+                with self.create_scheduler(max_workers=max_workers, thread_name_prefix='upload') as scheduler:
                     futures = []
                     for filepath in files_to_upload:
-                        future = executor.submit(self.upload_file_threadsafe, filepath)
+                        future = scheduler.submit(self.upload_file_threadsafe, filepath, paths=(filepath,))
                         futures.append(future)
 
                     for future in as_completed(futures):
@@ -369,7 +379,7 @@ class ImmichProgressiveUploader(ImmichInterface):
         with alive_bar(total=total, title=f"{CYAN2}Uploading from db{RESET}", unit='files', dual_line=True, unknown='waves') as self._progress_bar:
             self.progress_message('Searching DB...')
             
-            with ThreadPoolExecutor(max_workers=self.max_threads) as executor:
+            with self.create_scheduler(max_workers=self.max_threads, thread_name_prefix='upload') as scheduler:
                 futures = []
                 for image_path in self.db.get_images(uploaded=False):
                     # Ensure the image still exists
@@ -377,7 +387,7 @@ class ImmichProgressiveUploader(ImmichInterface):
                         logger.warning("File %s no longer exists.", image_path)
                         continue
 
-                    future = executor.submit(self.upload_file_threadsafe, image_path)
+                    future = scheduler.submit(self.upload_file_threadsafe, image_path, paths=(image_path,))
                     futures.append(future)
 
                 for future in as_completed(futures):
@@ -514,6 +524,12 @@ class ArgNamespace(argparse.Namespace):
     album : str
     skip : bool
     move_after_upload : str | None = None
+    no_hash_cache : bool
+    walk_threads : int
+    walk_mount_limit : list[str] | None
+    device_limit : list[str] | None
+    metrics_json : str | None
+    metrics_textfile : str | None
     
 def validate_args(args: ArgNamespace) -> bool:
     """
@@ -564,6 +580,12 @@ def main():
         parser.add_argument('--album', '-A', help='Immich album to upload files to')
         parser.add_argument('--skip', help='Skip assets that were previously uploaded.', action='store_true')
         parser.add_argument('--move-after-upload', help='Move files to this directory after uploading', default=None)
+        parser.add_argument('--no-hash-cache', action='store_true', help='Do not read or write the persistent hash cache')
+        parser.add_argument('--walk-threads', type=int, default=1, help='Number of directories to list at once while searching for files. Helps on network mounts.')
+        parser.add_argument('--walk-mount-limit', action='append', metavar='MOUNT=N', help='Limit concurrent directory listings on a mount, i.e. /mnt/nas=8. May be repeated.')
+        parser.add_argument('--device-limit', action='append', metavar='PATH=N', help='Number of files to upload at once from the device holding PATH, i.e. /mnt/d=2. Others use --max-threads. May be repeated.')
+        parser.add_argument('--metrics-json', default=None, help='Write timings and byte counts for the run to this file as JSON')
+        parser.add_argument('--metrics-textfile', default=None, help='Write timings and byte counts for the run to this file, for the Prometheus node_exporter textfile collector')
         parser.add_argument("import_path", nargs='?', default=thumbnails_dir, help="Path to import files from")
         args = parser.parse_args(namespace=ArgNamespace())
 
@@ -573,6 +595,12 @@ def main():
         if not validate_args(args):
             sys.exit(1)
 
+        try:
+            walk_mount_limits = parse_mount_limits(args.walk_mount_limit)
+            device_limits = parse_mount_limits(args.device_limit)
+        except ValueError as ve:
+            parser.error(str(ve))
+
         templates = []
         if args.templates:
             template : str
@@ -601,7 +629,13 @@ def main():
             # ...On the local network, disable skipping large files.
             # ...Everywhere else, use the default large file size of 100MB.
             large_file_size = 0 if home_network else (1024 * 1024 * 100),
-            move_after_upload=args.move_after_upload
+            move_after_upload=args.move_after_upload,
+            use_hash_cache=not args.no_hash_cache,
+            walk_threads=args.walk_threads,
+            walk_mount_limits=walk_mount_limits,
+            device_limits=device_limits,
+            metrics_json=args.metrics_json,
+            metrics_textfile=args.metrics_textfile,
         )
 
         try:
@@ -624,6 +658,7 @@ def main():
                 immich.files_duplicated,
                 immich.errors
             )
+            immich.dump_metrics()
     except KeyboardInterrupt:
         logger.info("Upload cancelled by user.")
 
@@ -27,33 +27,23 @@ import logging
 from pathlib import Path
 import sys
 from alive_progress import alive_it, alive_bar
+from scripts.lib.trash import TrashStore, MANIFEST_NAME
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-def get_last_trash_dir(base_dir : Path) -> int:
+def distribute_trash(base_dir: Path, files_per_dir: int = 1000):
     """
-    Get the last used subdirectory number in the given directory.
-
-    Args:
-        base_dir (Path): The base directory to scan for subdirectories.
+    Moves loose files in the given directory and its subdirectories into the shards of a TrashStore, containing at
+    most `files_per_dir` files each.
 
-    Returns:
-        int: The last used subdirectory as a number.
-    """
-    if not base_dir.is_dir():
-        logger.error(f"{base_dir} is not a valid directory.")
-        return 0
+    Files deleted by FileManager are sharded and recorded in the manifest as they are deleted, so this is only needed
+    once, for files that were put in the trash by hand, or by older versions. Their original path is not known, so the
+    manifest records where they were found instead.
 
-    logger.debug('Counting already existing subdirs from previous run.')
-    subdirs = [int(d.name) for d in base_dir.iterdir() if d.is_dir() and d.name.isdigit()]
-    return max(subdirs, default=0)
-
-def distribute_trash(base_dir: Path, files_per_dir: int = 1000):
-    """
-    Organizes files in the given directory and its subdirectories into
-    subdirectories containing at most `files_per_dir` files each.
+    Older versions also sharded the trash into numbered directories (0000/, or 1/, 2/...), so files are migrated
+    wherever they are, unless the manifest already tracks them.
 
     Args:
         base_dir (Path): The base directory to scan for files.
@@ -64,44 +54,23 @@ def distribute_trash(base_dir: Path, files_per_dir: int = 1000):
         return
 
     logger.info('Distributing files in %s into groups of %d', base_dir, files_per_dir)
-
-    # Create subdirectories and distribute files
-    dir_counter = get_last_trash_dir(base_dir) + 1
-    file_counter = 0
-    current_subdir = base_dir / str(dir_counter)
-    current_subdir.mkdir(exist_ok=True)
+    store = TrashStore(base_dir, shard_size=files_per_dir)
+    tracked = {entry.trash_path for entry in store.entries()}
 
     with alive_bar(title="Distributing files", unit='files', unknown='waves') as progress_bar:
-        for file in base_dir.rglob("*"):
-            if not file.is_file():
+        for file in list(base_dir.rglob("*")):
+            if not file.is_file() or file.name.startswith(MANIFEST_NAME):
                 continue
 
-            # Skip files in a numbered subdir
-            if file.parent.name.isdigit():
+            # Already in the store
+            if file in tracked:
                 continue
-            
-            if file_counter >= files_per_dir:
-                # Start a new subdirectory
-                dir_counter += 1
-                logger.info('Starting new subdir: %d', dir_counter)
-                current_subdir = base_dir / str(dir_counter)
-                current_subdir.mkdir(exist_ok=True)
-                file_counter = 0
-
-            # Resolve naming conflicts by appending a number if needed
-            destination = current_subdir / file.name
-            counter = 1
-            while destination.exists():
-                destination = current_subdir / f"{file.stem}_{counter}{file.suffix}"
-                counter += 1
 
-            # Move the file to the current subdirectory
             try:
-                file.rename(destination)
-                file_counter += 1
+                store.put(file)
                 progress_bar()
             except Exception as e:
-                logger.error(f"Failed to move {file} to {destination}: {e}")
+                logger.error(f"Failed to move {file} into the trash store: {e}")
 
     logger.info("File distribution complete.")
 